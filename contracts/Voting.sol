@@ -6,6 +6,7 @@ import "@openzeppelin/contracts/utils/Pausable.sol";
 import "@openzeppelin/contracts/utils/ReentrancyGuard.sol";
 import "@openzeppelin/contracts/utils/cryptography/ECDSA.sol";
 import "@openzeppelin/contracts/utils/cryptography/MessageHashUtils.sol";
+import "@openzeppelin/contracts/utils/cryptography/MerkleProof.sol";
 
 contract Voting is AccessControl, Pausable, ReentrancyGuard {
     using ECDSA for bytes32;
@@ -31,6 +32,9 @@ contract Voting is AccessControl, Pausable, ReentrancyGuard {
     // Address of the authorized face verification server
     address public verificationSigner;
 
+    // Merkle root over every face-verified wallet (batch mode, published by the service)
+    bytes32 public verifiedVotersRoot;
+
     // Events for audit trail
     event VoteCast(address indexed voter, uint256 indexed candidateIndex, uint256 timestamp);
     event CandidateAdded(string name, uint256 candidateIndex, uint256 timestamp);
@@ -40,6 +44,7 @@ contract Voting is AccessControl, Pausable, ReentrancyGuard {
     event VotingUnpaused(address indexed admin, uint256 timestamp);
     event VotingTimesUpdated(uint256 newStart, uint256 newEnd, uint256 timestamp);
     event VerificationSignerUpdated(address indexed newSigner, uint256 timestamp);
+    event VerifiedVotersRootUpdated(bytes32 indexed root, uint256 leafCount, uint256 timestamp);
 
     constructor(string[] memory _candidateNames, uint256 _durationInMinutes) {
         for (uint256 i = 0; i < _candidateNames.length; i++) {
@@ -75,6 +80,13 @@ contract Voting is AccessControl, Pausable, ReentrancyGuard {
         emit VerificationSignerUpdated(_signer, block.timestamp);
     }
 
+    // Batch mode: the service (or an admin) publishes a root over the verified wallets
+    function setVerifiedVotersRoot(bytes32 _root, uint256 _leafCount) public {
+        require(msg.sender == verificationSigner || hasRole(ADMIN_ROLE, msg.sender), "Caller cannot publish the voters root");
+        verifiedVotersRoot = _root;
+        emit VerifiedVotersRootUpdated(_root, _leafCount, block.timestamp);
+    }
+
     // Voter registration functions
     function enableVoterRegistration(bool _required) public onlyAdmin {
         voterRegistrationRequired = _required;
@@ -113,13 +125,7 @@ contract Voting is AccessControl, Pausable, ReentrancyGuard {
     // Modified vote function with Signature Verification
     // Provide "0x" as signature if verificationSigner is not set (legacy mode)
     function vote(uint256 _candidateIndex, bytes calldata signature) public whenNotPaused nonReentrant {
-        require(!voters[msg.sender], "You have already voted");
-        require(_candidateIndex < candidates.length, "Invalid candidate index");
-        require(block.timestamp >= votingStart && block.timestamp < votingEnd, "Voting is not active");
-        
-        if (voterRegistrationRequired) {
-            require(registeredVoters[msg.sender], "You are not registered to vote");
-        }
+        _checkCanVote(_candidateIndex);
 
         // --- FACE VERIFICATION CHECK ---
         if (verificationSigner != address(0)) {
@@ -134,6 +140,32 @@ contract Voting is AccessControl, Pausable, ReentrancyGuard {
         }
         // -------------------------------
 
+        _castVote(_candidateIndex);
+    }
+
+    // Batch-mode vote: proof that keccak256(msg.sender) is a leaf of verifiedVotersRoot
+    // (from the face service's /allowlist/proof) instead of a per-voter signature
+    function voteWithProof(uint256 _candidateIndex, bytes32[] calldata proof) public whenNotPaused nonReentrant {
+        _checkCanVote(_candidateIndex);
+
+        require(verifiedVotersRoot != bytes32(0), "Voters root not published");
+        bytes32 leaf = keccak256(abi.encodePacked(msg.sender));
+        require(MerkleProof.verifyCalldata(proof, verifiedVotersRoot, leaf), "Invalid allowlist proof");
+
+        _castVote(_candidateIndex);
+    }
+
+    function _checkCanVote(uint256 _candidateIndex) internal view {
+        require(!voters[msg.sender], "You have already voted");
+        require(_candidateIndex < candidates.length, "Invalid candidate index");
+        require(block.timestamp >= votingStart && block.timestamp < votingEnd, "Voting is not active");
+        
+        if (voterRegistrationRequired) {
+            require(registeredVoters[msg.sender], "You are not registered to vote");
+        }
+    }
+
+    function _castVote(uint256 _candidateIndex) internal {
         candidates[_candidateIndex].voteCount++;
         voters[msg.sender] = true;
         totalVotes++;
@@ -0,0 +1,237 @@
+"""
+Face Verification Service - Admission Control
+Priority admission and adaptive concurrency for the inference path
+
+Model and heavy DB work takes a slot from a shared controller first. Free
+slots go to the highest-priority waiter (verify > status > enroll > batch),
+and the lower classes may only fill a share of the concurrency limit, so
+under overload they queue briefly and are then shed with 503 while verify
+keeps its latency. The limit adapts with AIMD: it creeps up while the
+controller is saturated and completions stay under the latency target, and
+is cut multiplicatively when they do not. During a voting window the shares
+of the lower classes shrink further.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+from fastapi import HTTPException
+
+from config import settings
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most important first
+VERIFY, STATUS, ENROLL, BATCH = range(4)
+CLASS_NAMES = ("verify", "status", "enroll", "batch")
+
+
+class AdmissionRejected(HTTPException):
+    """Request shed by admission control (503 with Retry-After)"""
+
+    def __init__(self, priority: int, reason: str, retry_after: int = 1):
+        super().__init__(
+            status_code=503,
+            detail=f"Service busy ({reason}) - please retry",
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.priority = priority
+
+
+class AdmissionController:
+    """
+    Priority queue of waiters in front of a concurrency limit
+
+    Runs on the event loop only (no locking); the work inside a slot may
+    still run in a worker thread.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 4,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        target_latency_ms: float = 1000.0,
+        backoff: float = 0.75,
+        shares: List[float] = (1.0, 1.0, 0.5, 0.25),
+        voting_share_scale: float = 0.5,
+        queue_timeouts_ms: List[float] = (10000, 2000, 2000, 2000),
+        voting_window_active: bool = False,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency_ms = target_latency_ms
+        self.backoff = backoff
+        self.shares = list(shares)
+        self.voting_share_scale = voting_share_scale
+        self.queue_timeouts_ms = list(queue_timeouts_ms)
+        self.voting_window_active = voting_window_active
+
+        self.in_flight = 0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "AdmissionController":
+        return cls(
+            initial_limit=settings.admission_initial_limit,
+            min_limit=settings.admission_min_limit,
+            max_limit=settings.admission_max_limit,
+            target_latency_ms=settings.admission_target_latency_ms,
+            shares=(1.0, 1.0, settings.admission_enroll_share, settings.admission_batch_share),
+            voting_share_scale=settings.admission_voting_share_scale,
+            queue_timeouts_ms=(settings.admission_verify_queue_timeout_ms,) + (settings.admission_queue_timeout_ms,) * 3,
+            voting_window_active=settings.voting_window_active,
+        )
+
+    # ---- capacity ----
+
+    def capacity(self, priority: int) -> int:
+        """Slots a class may occupy; 0 means only when the controller is idle"""
+        limit = max(int(self.limit), self.min_limit)
+        if priority <= STATUS:
+            return limit
+        share = self.shares[priority]
+        if self.voting_window_active:
+            share *= self.voting_share_scale
+        return int(limit * share)
+
+    def _can_admit(self, priority: int) -> bool:
+        capacity = self.capacity(priority)
+        if capacity == 0:
+            return self.in_flight == 0
+        return self.in_flight < capacity
+
+    def _grant_waiters(self):
+        # The heap head is the most important waiter; if it cannot run, nothing behind it can
+        while self._waiters:
+            priority, _seq, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_admit(priority):
+                break
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _waiting(self, max_priority: int) -> bool:
+        """Is anything at least as important as max_priority queued?"""
+        return any(p <= max_priority and not f.done() for p, _s, f in self._waiters)
+
+    # ---- acquire / release ----
+
+    async def acquire(self, priority: int):
+        name = CLASS_NAMES[priority]
+        if not self._waiting(priority) and self._can_admit(priority):
+            self.in_flight += 1
+            metrics.increment(f"admission.{name}.admitted")
+            return
+
+        # Shed low-priority work at once when verify is already queueing
+        if priority >= ENROLL and self._waiting(VERIFY):
+            self._shed(priority, "verification traffic has priority")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeouts_ms[priority] / 1000.0)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self._shed(priority, "queue timeout")
+        except asyncio.CancelledError:
+            # Client went away; give back a slot that was granted meanwhile
+            if future.done() and not future.cancelled():
+                self.in_flight -= 1
+                self._grant_waiters()
+            else:
+                future.cancel()
+            raise
+
+        metrics.increment(f"admission.{name}.admitted")
+        metrics.observe(f"admission.{name}.queue_wait", (time.perf_counter() - start) * 1000)
+
+    def _shed(self, priority: int, reason: str):
+        metrics.increment(f"admission.{CLASS_NAMES[priority]}.shed")
+        raise AdmissionRejected(priority, reason)
+
+    def release(self, service_ms: float = None):
+        self.in_flight -= 1
+        if service_ms is not None:
+            self._adapt(service_ms)
+        self._grant_waiters()
+
+    def _adapt(self, service_ms: float):
+        now = time.monotonic()
+        if service_ms > self.target_latency_ms:
+            # At most one multiplicative decrease per target interval
+            if now - self._last_decrease >= self.target_latency_ms / 1000.0:
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_decrease = now
+        elif self.in_flight + 1 >= int(self.limit):
+            # Only grow while the limit is actually the bottleneck
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+    @asynccontextmanager
+    async def slot(self, priority: int, feedback: bool = True):
+        """
+        Hold an admission slot for the duration of the block
+        `feedback` feeds the block's duration into the adaptive limit; leave
+        it off for classes whose latency says nothing about model load.
+        """
+        if not settings.admission_enabled:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                if feedback:
+                    self._observe(priority, (time.perf_counter() - start) * 1000)
+            return
+
+        await self.acquire(priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            service_ms = (time.perf_counter() - start) * 1000
+            if feedback:
+                self._observe(priority, service_ms)
+            self.release(service_ms if feedback else None)
+
+    @staticmethod
+    def _observe(priority: int, service_ms: float):
+        # Recorded with admission off too: background jobs throttle on admission.verify.service
+        metrics.observe(f"admission.{CLASS_NAMES[priority]}.service", service_ms)
+
+    # ---- hooks ----
+
+    def set_voting_window(self, active: bool):
+        """Called when the contract's voting window opens or closes"""
+        if active != self.voting_window_active:
+            logger.info(f"🗳️  Voting window {'opened' if active else 'closed'} - admission shares {'tightened' if active else 'restored'}")
+        self.voting_window_active = active
+        self._grant_waiters()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": settings.admission_enabled,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": sum(1 for _p, _s, f in self._waiters if not f.done()),
+            "voting_window_active": self.voting_window_active,
+            "capacity": {name: self.capacity(p) for p, name in enumerate(CLASS_NAMES)},
+        }
+
+
+# Global instance
+controller = AdmissionController.from_settings()
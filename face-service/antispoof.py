@@ -0,0 +1,206 @@
+"""
+Face Verification Service - Anti-Spoofing Model
+Optional learned presentation-attack detector, run on the aligned face crop
+
+The heuristics in liveness.py (sharpness, colour variance, bright pixels)
+are cheap but weak, and genuine users who fail them retry. When
+ANTISPOOF_MODEL_PATH points to an ONNX classifier (for example a
+MiniFASNet export), detect_liveness also scores the aligned crop that
+recognition consumes: there is no second detection, the crop is only
+resized to the model's input, and several crops run as one batch. In
+the verify pipeline the infer stage scores through score_crop: while one
+model run is in progress, crops from other infer threads queue up and the
+next run takes all of them, so concurrent requests share runs without
+waiting on a timer.
+
+The model outputs either one live score per crop, or one per class with
+the live class at ANTISPOOF_LIVE_INDEX. ANTISPOOF_OUTPUT says whether
+those are probabilities (used as they are) or logits (sigmoid for one
+score, softmax across classes); it is not guessed from the values, so a
+crop scores the same whatever else shares its batch.
+Without a model (or if it fails to load) liveness stays heuristic-only.
+"""
+
+import logging
+import threading
+import time
+from typing import List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from config import settings
+from metrics import metrics
+import memory
+
+logger = logging.getLogger(__name__)
+
+# Loaded once per process; None when disabled or unloadable
+_model = None
+_load_attempted = False
+_load_lock = threading.Lock()
+
+OUTPUTS = ("probability", "logits")
+
+
+class AntiSpoofModel:
+    """ONNX Runtime session plus the crop preprocessing its input expects"""
+
+    def __init__(self, session, live_index: int = 1, input_scale: float = 1.0, input_rgb: bool = False,
+                 output: str = "logits"):
+        if output not in OUTPUTS:
+            raise ValueError(f"Unknown anti-spoof output '{output}' (expected one of {', '.join(OUTPUTS)})")
+        self.session = session
+        self.live_index = live_index
+        self.output = output
+        self.input_scale = input_scale
+        self.input_rgb = input_rgb
+
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _channels, height, width = model_input.shape
+        # Symbolic dims are strings; a fixed batch of 1 means one run per crop
+        self.max_batch = batch if isinstance(batch, int) and batch > 0 else None
+        self.size = (width, height) if isinstance(width, int) and isinstance(height, int) else None
+
+    @classmethod
+    def load(cls, path: str) -> "AntiSpoofModel":
+        import onnxruntime
+
+        options = memory.session_options()
+        options.intra_op_num_threads = settings.antispoof_threads
+        session = onnxruntime.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        memory.bound_session(session)
+        return cls(
+            session, settings.antispoof_live_index, settings.antispoof_input_scale, settings.antispoof_input_rgb,
+            settings.antispoof_output,
+        )
+
+    def preprocess(self, crops: Sequence[np.ndarray]) -> np.ndarray:
+        """BGR HxWx3 crops -> float32 NCHW batch at the model's input size"""
+        batch = []
+        for crop in crops:
+            if self.size and (crop.shape[1], crop.shape[0]) != self.size:
+                crop = cv2.resize(crop, self.size, interpolation=cv2.INTER_LINEAR)
+            if self.input_rgb:
+                crop = crop[:, :, ::-1]
+            batch.append(crop.transpose(2, 0, 1))
+        return np.stack(batch).astype(np.float32) * np.float32(self.input_scale)
+
+    def _live_probability(self, output: np.ndarray) -> np.ndarray:
+        if output.shape[1] == 1:
+            scores = output[:, 0]
+            return scores if self.output == "probability" else 1 / (1 + np.exp(-scores))
+
+        if self.output == "logits":
+            shifted = np.exp(output - output.max(axis=1, keepdims=True))
+            output = shifted / shifted.sum(axis=1, keepdims=True)
+        return output[:, self.live_index]
+
+    def score(self, crops: Sequence[np.ndarray]) -> np.ndarray:
+        """Live probability per crop"""
+        if not len(crops):
+            return np.zeros(0, dtype=np.float32)
+
+        start = time.perf_counter()
+        step = self.max_batch or len(crops)
+        outputs = []
+        for offset in range(0, len(crops), step):
+            batch = self.preprocess(crops[offset:offset + step])
+            output = np.asarray(self.session.run(None, {self.input_name: batch})[0], dtype=np.float32)
+            outputs.append(output.reshape(len(batch), -1))
+        scores = self._live_probability(np.concatenate(outputs))
+
+        metrics.observe("antispoof.latency", (time.perf_counter() - start) * 1000)
+        metrics.increment("antispoof.crops", len(crops))
+        return scores.astype(np.float32)
+
+
+def get_model() -> Optional[AntiSpoofModel]:
+    """The configured model, loaded on first use; None when disabled"""
+    global _model, _load_attempted
+
+    if _load_attempted or not settings.antispoof_model_path:
+        return _model
+    with _load_lock:
+        if not _load_attempted:
+            try:
+                _model = AntiSpoofModel.load(settings.antispoof_model_path)
+                logger.info(f"✅ Anti-spoof model loaded from {settings.antispoof_model_path}")
+            except Exception as e:
+                logger.error(f"❌ Anti-spoof model failed to load, liveness stays heuristic-only: {e}")
+            _load_attempted = True
+    return _model
+
+
+def install_model(model: Optional[AntiSpoofModel]):
+    """Replace the process-wide model (None disables it)"""
+    global _model, _load_attempted
+    _model = model
+    _load_attempted = True
+
+
+def score_crops(crops: List[np.ndarray]) -> Optional[np.ndarray]:
+    """Live probabilities for a batch of aligned crops, or None without a model"""
+    model = get_model()
+    return model.score(crops) if model is not None else None
+
+
+class _Pending:
+    __slots__ = ("crop", "score", "error", "done")
+
+    def __init__(self, crop: np.ndarray):
+        self.crop = crop
+        self.score = None
+        self.error = None
+        self.done = False
+
+
+class CropBatcher:
+    """
+    Scores crops submitted from several threads in shared model runs
+
+    One run at a time: a thread that gets the run lock scores every crop
+    queued so far, including those of threads still waiting for the lock,
+    which then find their result ready.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._queue: List[_Pending] = []
+
+    def score(self, model: AntiSpoofModel, crop: np.ndarray) -> float:
+        pending = _Pending(crop)
+        with self._lock:
+            self._queue.append(pending)
+
+        with self._run_lock:
+            if not pending.done:
+                with self._lock:
+                    batch, self._queue = self._queue, []
+                try:
+                    scores = model.score([item.crop for item in batch])
+                except Exception as e:
+                    scores = None
+                    for item in batch:
+                        item.error = e
+                metrics.observe("antispoof.batch_size", len(batch))
+                for i, item in enumerate(batch):
+                    if scores is not None:
+                        item.score = float(scores[i])
+                    item.done = True
+
+        if pending.error is not None:
+            raise pending.error
+        return pending.score
+
+
+def score_crop(crop: np.ndarray) -> Optional[float]:
+    """Live probability of one aligned crop, batched with other threads' crops; None without a model"""
+    model = get_model()
+    return batcher.score(model, crop) if model is not None else None
+
+
+# Global instance
+batcher = CropBatcher()
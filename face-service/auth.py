@@ -5,9 +5,12 @@ Handles token creation and validation for verified users
 
 from datetime import datetime, timedelta
 from typing import Optional, Dict
+from fastapi import Header, HTTPException
 from jose import jwt, JWTError
 from config import settings
+import hmac
 import logging
+import secrets
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +29,7 @@ def create_verification_token(
     - score: similarity score
     - exp: expiration time
     - iat: issued at
+    - jti: random token id (lets /validate-token accept it only once)
     """
     now = datetime.utcnow()
     expire = now + timedelta(minutes=settings.jwt_expiry_minutes)
@@ -36,6 +40,7 @@ def create_verification_token(
         "score": round(similarity_score, 4),
         "iat": now,
         "exp": expire,
+        "jti": secrets.token_urlsafe(12),
         "type": "face_verification"
     }
     
@@ -49,7 +54,8 @@ def create_verification_token(
         algorithm=settings.jwt_algorithm
     )
     
-    logger.info(f"✅ Created verification token for user {user_id[:10]}... expires in {settings.jwt_expiry_minutes} min")
+    logger.info("✅ Created verification token for user %s... expires in %d min", user_id[:10], settings.jwt_expiry_minutes,
+                extra={"event": "token.created", "user": user_id[:10]})
     
     return token
 
@@ -69,18 +75,18 @@ def verify_token(token: str) -> Optional[Dict]:
         
         # Check if it's a face verification token
         if payload.get("type") != "face_verification":
-            logger.warning("Invalid token type")
+            logger.warning("Invalid token type", extra={"event": "token.invalid", "reason": "type"})
             return None
         
         # Check if verified flag is True
         if not payload.get("verified"):
-            logger.warning("Token not marked as verified")
+            logger.warning("Token not marked as verified", extra={"event": "token.invalid", "reason": "not_verified"})
             return None
         
         return payload
         
     except JWTError as e:
-        logger.warning(f"Token verification failed: {e}")
+        logger.warning("Token verification failed: %s", e, extra={"event": "token.invalid", "reason": "signature"})
         return None
 
 
@@ -110,3 +116,15 @@ def get_token_expiry(token: str) -> Optional[datetime]:
 def is_token_valid(token: str) -> bool:
     """Quick check if token is valid"""
     return verify_token(token) is not None
+
+
+def require_admin(x_admin_key: str = Header(None)):
+    """
+    FastAPI dependency guarding /admin endpoints
+    Expects the ADMIN_API_KEY value in the X-Admin-Key header
+    """
+    if not settings.admin_api_key:
+        raise HTTPException(status_code=403, detail="Admin API disabled. Set ADMIN_API_KEY to enable it.")
+    
+    if not x_admin_key or not hmac.compare_digest(x_admin_key, settings.admin_api_key):
+        raise HTTPException(status_code=401, detail="Invalid admin key")
@@ -0,0 +1,439 @@
+"""
+Face Verification Service - Inference Backends
+Face detection, alignment and recognition on a choice of CPU inference engines
+
+face_processor makes every model call through an InferenceBackend:
+detect(image, size), align(image, kps), embed(crops) and embed_face(image,
+face). INFERENCE_BACKEND picks the engine:
+
+    insightface  insightface's FaceAnalysis on ONNX Runtime, as before; it
+                 loads and prepares every model of the pack, including the
+                 landmark and gender/age models the service never runs
+    onnxruntime  ONNX Runtime sessions created here for the pack's
+                 detection and recognition models only
+    opencv       the same two models on OpenCV's DNN module
+    openvino     the same two models on the OpenVINO CPU runtime
+                 (optional: pip install openvino)
+    auto         load each of INFERENCE_BACKEND_CANDIDATES, check that its
+                 embeddings agree with the first one, time it on this host
+                 and keep the fastest
+
+The direct backends put an engine session under insightface's RetinaFace
+and ArcFaceONNX classes, so pre- and post-processing are the same code on
+every engine and results differ only by the engines' arithmetic, which
+conformance() measures. Threads are set per engine: ORT_INTRA_OP_THREADS
+(insightface, onnxruntime), OPENCV_DNN_THREADS (process-wide in OpenCV)
+and OPENVINO_THREADS. The direct backends read the pack from
+FACE_MODEL_ROOT/models/<pack> and do not download it.
+"""
+
+import glob
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import settings
+from metrics import metrics
+import memory
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("insightface", "onnxruntime", "opencv", "openvino")
+
+
+class BackendError(Exception):
+    """An inference backend that cannot be used on this host"""
+
+
+class InferenceBackend:
+    """
+    Face models behind the calls face_processor makes
+    det_model and models["recognition"] follow insightface's model classes
+    (detect / get / get_feat), which memory.bound_analyzer and the
+    benchmark stubs rely on as well.
+    """
+
+    name = "base"
+    threads_setting = "ort_intra_op_threads"
+
+    def __init__(self, det_model, rec_model, threads: int = 0):
+        self.det_model = det_model
+        self.models = {"detection": det_model, "recognition": rec_model}
+        self.threads = threads
+        # Startup timings when INFERENCE_BACKEND=auto picked this backend
+        self.selection: Optional[Dict] = None
+
+    def prepare(self, det_size: int):
+        self.det_model.prepare(ctx_id=0, input_size=(det_size, det_size))
+
+    def detect(self, image: np.ndarray, size: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Boxes with scores (N x 5) and five keypoints per face (N x 5 x 2) at a square input size"""
+        return self.det_model.detect(image, input_size=(size, size), max_num=0, metric='default')
+
+    def align(self, image: np.ndarray, kps: np.ndarray, size: int = 112) -> np.ndarray:
+        """The similarity-transformed crop recognition consumes"""
+        from insightface.utils import face_align
+        return face_align.norm_crop(image, landmark=kps, image_size=size)
+
+    def embed(self, crops: Sequence[np.ndarray]) -> np.ndarray:
+        """Embeddings of aligned crops in one batch (one row per crop)"""
+        return self.models["recognition"].get_feat(list(crops))
+
+    def embed_face(self, image: np.ndarray, face) -> np.ndarray:
+        """Align and embed one detected face"""
+        return self.models["recognition"].get(image, face)
+
+    def describe(self) -> Dict:
+        return {"backend": self.name, "threads": self.threads or None, "selection": self.selection}
+
+
+class InsightFaceBackend(InferenceBackend):
+    """insightface's FaceAnalysis (every model of the pack) on ONNX Runtime"""
+
+    name = "insightface"
+
+    def __init__(self, analyzer, threads: int = 0):
+        super().__init__(analyzer.det_model, analyzer.models["recognition"], threads)
+        self.analyzer = analyzer
+
+    @classmethod
+    def load(cls, model_name: str) -> "InsightFaceBackend":
+        try:
+            from insightface.app import FaceAnalysis
+        except ImportError:
+            raise BackendError("InsightFace library not found. Please install it with: pip install insightface")
+
+        # Arena / memory-pattern / thread settings from memory.py
+        analyzer = FaceAnalysis(
+            name=model_name,
+            root=settings.face_model_root,
+            providers=['CPUExecutionProvider'],
+            sess_options=memory.session_options()
+        )
+        memory.bound_analyzer(analyzer)
+        return cls(analyzer, settings.ort_intra_op_threads)
+
+    def prepare(self, det_size: int):
+        self.analyzer.prepare(ctx_id=0, det_size=(det_size, det_size))
+
+
+# ---- Engine sessions ----
+
+class ModelPort:
+    """Name and shape of a model input or output, as onnxruntime reports them"""
+
+    def __init__(self, name: str, shape: List):
+        self.name = name
+        self.shape = shape
+
+
+def graph_ports(path: str) -> Tuple[List[ModelPort], List[ModelPort]]:
+    """Inputs (without initializers) and outputs of an ONNX file; symbolic dims are strings"""
+    import onnx
+
+    graph = onnx.load(path, load_external_data=False).graph
+    initializers = {tensor.name for tensor in graph.initializer}
+
+    def port(value) -> ModelPort:
+        dims = value.type.tensor_type.shape.dim
+        return ModelPort(value.name, [dim.dim_value if dim.HasField("dim_value") else (dim.dim_param or "?") for dim in dims])
+
+    return [port(value) for value in graph.input if value.name not in initializers], [port(value) for value in graph.output]
+
+
+class OpenCVSession:
+    """A cv2.dnn network behind the session calls insightface's model classes make"""
+
+    def __init__(self, path: str):
+        import cv2
+
+        self.inputs, self.outputs = graph_ports(path)
+        # OpenCV's own CPU implementation is the default backend and target
+        self.net = cv2.dnn.readNetFromONNX(path)
+        # A Net holds its input and output blobs, so it runs one inference at a time
+        self._lock = threading.Lock()
+
+    def get_inputs(self) -> List[ModelPort]:
+        return self.inputs
+
+    def get_outputs(self) -> List[ModelPort]:
+        return self.outputs
+
+    def run(self, output_names, input_feed) -> List[np.ndarray]:
+        names = output_names or [port.name for port in self.outputs]
+        with self._lock:
+            for name, blob in input_feed.items():
+                self.net.setInput(blob, name)
+            return list(self.net.forward(names))
+
+
+class OpenVINOSession:
+    """An OpenVINO CPU compiled model behind the same session calls"""
+
+    def __init__(self, path: str, threads: int = 0, performance_hint: str = "LATENCY"):
+        try:
+            import openvino
+        except ImportError:
+            raise BackendError("OpenVINO is not installed. Install it with: pip install openvino")
+
+        core = openvino.Core()
+        config = {"PERFORMANCE_HINT": performance_hint}
+        if threads > 0:
+            config["INFERENCE_NUM_THREADS"] = threads
+        self.inputs, self.outputs = graph_ports(path)
+        self.model = core.compile_model(core.read_model(path), "CPU", config)
+        # An infer request runs one inference at a time: one per stage thread
+        self._requests = threading.local()
+
+    def get_inputs(self) -> List[ModelPort]:
+        return self.inputs
+
+    def get_outputs(self) -> List[ModelPort]:
+        return self.outputs
+
+    def run(self, output_names, input_feed) -> List[np.ndarray]:
+        request = getattr(self._requests, "request", None)
+        if request is None:
+            request = self._requests.request = self.model.create_infer_request()
+        results = request.infer(input_feed)
+        names = output_names or [port.name for port in self.outputs]
+        return [results[self.model.output(name)] for name in names]
+
+
+def model_pack_path(model_name: str) -> str:
+    """Directory of an insightface model pack (where FaceAnalysis downloads it)"""
+    return os.path.join(os.path.expanduser(settings.face_model_root), "models", model_name)
+
+
+def model_pack_files(directory: str) -> Tuple[str, str]:
+    """
+    (detection, recognition) ONNX files of an insightface model pack
+    Told apart by their inputs and outputs, like insightface's model router.
+    """
+    detection = recognition = None
+    for path in sorted(glob.glob(os.path.join(directory, "*.onnx"))):
+        inputs, outputs = graph_ports(path)
+        shape = inputs[0].shape if inputs else []
+        if len(outputs) >= 5:
+            detection = detection or path
+        elif (len(outputs) == 1 and len(shape) == 4 and isinstance(shape[2], int) and shape[2] == shape[3]
+              and shape[2] >= 112 and shape[2] % 16 == 0 and shape[2] != 192):  # 192 = landmark models
+            recognition = recognition or path
+
+    if detection is None or recognition is None:
+        raise BackendError(
+            f"No detection and recognition models in {directory} "
+            "(start once with INFERENCE_BACKEND=insightface to download the pack)"
+        )
+    return detection, recognition
+
+
+class EngineBackend(InferenceBackend):
+    """A pack's detection and recognition models on an engine's sessions, without FaceAnalysis"""
+
+    def __init__(self, pack_dir: str, threads: int = 0):
+        from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+        from insightface.model_zoo.retinaface import RetinaFace
+
+        self.threads = threads
+        self.pack_dir = pack_dir
+        detection, recognition = model_pack_files(pack_dir)
+        super().__init__(
+            RetinaFace(detection, session=self.session(detection)),
+            ArcFaceONNX(recognition, session=self.session(recognition)),
+            threads,
+        )
+
+    def session(self, path: str):
+        raise NotImplementedError
+
+    @classmethod
+    def load(cls, model_name: str) -> "EngineBackend":
+        return cls(model_pack_path(model_name), getattr(settings, cls.threads_setting))
+
+
+class OnnxRuntimeBackend(EngineBackend):
+    """ONNX Runtime sessions for the detection and recognition models only"""
+
+    name = "onnxruntime"
+
+    def session(self, path: str):
+        import onnxruntime
+
+        options = memory.session_options()
+        if self.threads > 0:
+            options.intra_op_num_threads = self.threads
+        session = onnxruntime.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        return memory.bound_session(session)
+
+
+class OpenCVBackend(EngineBackend):
+    """OpenCV DNN networks; OPENCV_DNN_THREADS applies to all of OpenCV in this process"""
+
+    name = "opencv"
+    threads_setting = "opencv_dnn_threads"
+
+    def session(self, path: str):
+        import cv2
+
+        if self.threads > 0:
+            cv2.setNumThreads(self.threads)
+        return OpenCVSession(path)
+
+
+class OpenVINOBackend(EngineBackend):
+    """OpenVINO CPU runtime (optional dependency)"""
+
+    name = "openvino"
+    threads_setting = "openvino_threads"
+
+    def session(self, path: str):
+        return OpenVINOSession(path, self.threads, settings.openvino_performance_hint)
+
+
+def backend_class(name: str) -> type:
+    classes = {cls.name: cls for cls in (InsightFaceBackend, OnnxRuntimeBackend, OpenCVBackend, OpenVINOBackend)}
+    if name not in classes:
+        raise BackendError(f"Unknown inference backend {name!r} (one of {', '.join(BACKENDS)} or auto)")
+    return classes[name]
+
+
+def configured_threads(name: str) -> int:
+    """Threads one inference on backend `name` uses (0 = the engine's default, usually every core)"""
+    setting = backend_class(name).threads_setting if name in BACKENDS else InferenceBackend.threads_setting
+    return getattr(settings, setting)
+
+
+def load_backend(name: str, model_name: str, det_size: int) -> InferenceBackend:
+    """Load and prepare model pack `model_name` on backend `name`"""
+    backend = backend_class(name).load(model_name)
+    backend.prepare(det_size)
+    return backend
+
+
+# ---- Comparison and selection ----
+
+def sample_inputs() -> Tuple[np.ndarray, np.ndarray]:
+    """
+    A fixed frame and aligned crop, the same for every backend
+    The frame is the group photo bundled with insightface, so detection is
+    compared on real faces; the crop only has to be the same on each engine.
+    """
+    from insightface.data import get_image
+
+    frame = get_image("t1")
+    crop = np.random.default_rng(0).integers(0, 256, (112, 112, 3), dtype=np.uint8)
+    return frame, crop
+
+
+def time_backend(backend: InferenceBackend, frame: np.ndarray, crop: np.ndarray, size: int, runs: int = 5) -> Dict:
+    """Median detection and recognition latency of `backend` after one untimed run"""
+    backend.detect(frame, size)
+    backend.embed([crop])
+
+    detect, embed = [], []
+    for _ in range(max(1, runs)):
+        start = time.perf_counter()
+        backend.detect(frame, size)
+        detected = time.perf_counter()
+        backend.embed([crop])
+        detect.append((detected - start) * 1000)
+        embed.append((time.perf_counter() - detected) * 1000)
+
+    detect_ms, embed_ms = float(np.median(detect)), float(np.median(embed))
+    return {"detect_ms": round(detect_ms, 3), "embed_ms": round(embed_ms, 3), "total_ms": round(detect_ms + embed_ms, 3)}
+
+
+def conformance(backend: InferenceBackend, reference: InferenceBackend, frame: np.ndarray, crop: np.ndarray,
+                size: int, min_cosine: Optional[float] = None) -> Dict:
+    """
+    How closely `backend` reproduces `reference` on the same inputs
+    Embedding cosine similarity, and the face count and largest box
+    coordinate difference of the detections. Boxes are matched to the
+    nearest reference box: equal scores may come out in another order. A
+    frame in which the reference finds no face does not conform, since it
+    would not check detection at all.
+    """
+    min_cosine = settings.inference_conformance_min_cosine if min_cosine is None else min_cosine
+    embedding, expected = backend.embed([crop])[0], reference.embed([crop])[0]
+    cosine = float(np.dot(embedding, expected) / (np.linalg.norm(embedding) * np.linalg.norm(expected)))
+
+    boxes, _ = backend.detect(frame, size)
+    expected_boxes, _ = reference.detect(frame, size)
+    same_faces = boxes.shape[0] == expected_boxes.shape[0]
+    box_error = 0.0
+    if same_faces and boxes.shape[0]:
+        distances = np.abs(boxes[:, np.newaxis, :4] - expected_boxes[np.newaxis, :, :4]).max(axis=2)
+        box_error = float(distances.min(axis=1).max())
+
+    return {
+        "reference": reference.name,
+        "cosine": round(cosine, 6),
+        "faces": int(boxes.shape[0]),
+        "max_box_error_px": round(box_error, 3) if same_faces else None,
+        "conforms": cosine >= min_cosine and same_faces and expected_boxes.shape[0] > 0,
+    }
+
+
+def compare_backends(names: Sequence[str], model_name: str, det_size: int, runs: int = 5,
+                     frame: Optional[np.ndarray] = None, crop: Optional[np.ndarray] = None
+                     ) -> Tuple[Dict[str, InferenceBackend], Dict[str, Dict]]:
+    """
+    Load, check and time each backend in `names` on model pack `model_name`
+    The first one that loads is the conformance reference. Returns the
+    loaded backends and per-backend results ({"error": ...} if it did not load).
+    """
+    sample_frame, sample_crop = sample_inputs()
+    frame = sample_frame if frame is None else frame
+    crop = sample_crop if crop is None else crop
+
+    loaded, results, reference = {}, {}, None
+    for name in names:
+        try:
+            backend = load_backend(name, model_name, det_size)
+        except Exception as e:
+            results[name] = {"error": str(e)}
+            logger.info(f"ℹ️ Inference backend {name} not available: {e}")
+            continue
+
+        reference = reference or backend
+        results[name] = time_backend(backend, frame, crop, det_size, runs)
+        results[name].update(conformance(backend, reference, frame, crop, det_size))
+        loaded[name] = backend
+    return loaded, results
+
+
+def candidate_names() -> List[str]:
+    return [name.strip() for name in settings.inference_backend_candidates.split(",") if name.strip()]
+
+
+def select_backend(model_name: str, det_size: int, candidates: Optional[Sequence[str]] = None,
+                   runs: Optional[int] = None) -> InferenceBackend:
+    """INFERENCE_BACKEND=auto: the fastest candidate whose results match the reference"""
+    candidates = list(candidates or candidate_names())
+    runs = settings.inference_benchmark_runs if runs is None else runs
+    loaded, results = compare_backends(candidates, model_name, det_size, runs)
+
+    for name, backend in loaded.items():
+        if not results[name]["conforms"]:
+            metrics.increment("inference.nonconforming")
+            logger.warning(
+                f"⚠️ Inference backend {name} skipped: cosine {results[name]['cosine']:.4f} "
+                f"and {results[name]['faces']} face(s) vs {results[name]['reference']}"
+            )
+
+    conforming = [name for name in loaded if results[name]["conforms"]]
+    if not conforming:
+        errors = "; ".join(f"{name}: {result['error']}" for name, result in results.items() if "error" in result)
+        raise BackendError(f"No usable inference backend among {', '.join(candidates)} ({errors})")
+
+    chosen = min(conforming, key=lambda name: results[name]["total_ms"])
+    backend = loaded[chosen]
+    backend.selection = {"candidates": results, "runs": runs}
+    timings = ", ".join(f"{name} {results[name]['total_ms']:.1f} ms" for name in conforming)
+    logger.info(f"✅ Inference backend {chosen} selected ({timings})")
+    return backend
@@ -0,0 +1,11 @@
+"""
+Face Verification Service - Benchmark Suite
+Load-test and latency benchmarks for the FastAPI service
+
+Run from the face-service directory:
+    python -m benchmarks run --requests 200 --concurrency 8 --stub-analyzer
+    python -m benchmarks run --url http://localhost:8000 --save baselines/http.json
+    python -m benchmarks compare baselines/old.json baselines/new.json
+    python -m benchmarks detector --fixtures selfies/ --save baselines/detector.json
+    python -m benchmarks overload --flood-concurrency 32
+"""
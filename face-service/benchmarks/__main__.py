@@ -0,0 +1,483 @@
+"""
+Face Verification Service - Benchmark CLI
+Usage: python -m benchmarks <command> [options]   (run from face-service/)
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+# Service modules use flat imports (config, database, ...)
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+
+def cmd_run(args) -> int:
+    # Configure logging before the service modules do, so per-request logs stay quiet
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    from benchmarks import load_test
+    from benchmarks.baseline import build_baseline, format_results, save_baseline
+    from benchmarks.synthetic import build_image_set
+
+    endpoints = tuple(args.endpoints.split(",")) if args.endpoints else load_test.ENDPOINTS
+    images = build_image_set(args.users, fixture_dir=args.fixtures)
+
+    if args.url:
+        results = asyncio.run(load_test.run_over_http(
+            args.url, images, args.requests, args.concurrency, endpoints,
+            skip_liveness=args.skip_liveness, server_pid=args.server_pid,
+        ))
+    else:
+        load_test.prepare_environment(args.db)
+        results = asyncio.run(load_test.run_in_process(
+            images, args.requests, args.concurrency, endpoints,
+            stub_analyzer=args.stub_analyzer,
+            stub_latency_ms=args.stub_latency_ms,
+            skip_liveness=args.skip_liveness,
+        ))
+
+    print(format_results(results))
+
+    if args.save:
+        run_config = {
+            "transport": "http" if args.url else "in-process",
+            "analyzer": "stub" if args.stub_analyzer and not args.url else "insightface",
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "fixtures": bool(args.fixtures),
+            "skip_liveness": args.skip_liveness,
+        }
+        save_baseline(build_baseline(results, run_config), args.save)
+        print(f"\nBaseline saved to {args.save}")
+    return 0
+
+
+def cmd_compare(args) -> int:
+    from benchmarks.baseline import compare_baselines, format_comparison, load_baseline
+
+    old, new = load_baseline(args.old), load_baseline(args.new)
+    rows = compare_baselines(old, new, tolerance=args.tolerance)
+    print(f"{old.get('git_commit')} -> {new.get('git_commit')}")
+    print(format_comparison(rows))
+
+    if old.get("config") != new.get("config"):
+        print("\nWarning: run configurations differ:")
+        print(json.dumps({"old": old.get("config"), "new": new.get("config")}, indent=2))
+
+    return 1 if any(row["regressions"] for row in rows) else 0
+
+
+def cmd_payload(args) -> int:
+    from benchmarks.payload import format_payload_results, run_payload_benchmark
+
+    sizes = [int(x) for x in args.sizes_kb.split(",")]
+    rows = run_payload_benchmark(sizes, repeat=args.repeat)
+    print(format_payload_results(rows))
+
+    if args.save:
+        from benchmarks.baseline import build_baseline, save_baseline
+        save_baseline(build_baseline({"payload": rows}, {"benchmark": "payload", "repeat": args.repeat}), args.save)
+        print(f"\nResults saved to {args.save}")
+    return 0
+
+
+def cmd_detector(args) -> int:
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    from benchmarks.detector import format_detector_results, load_frames, run_detector_benchmark
+
+    if args.stub_analyzer:
+        from benchmarks.stub_analyzer import install_stub_analyzer
+        install_stub_analyzer(latency_ms=args.stub_latency_ms)
+
+    frames = load_frames(args.frames, fixture_dir=args.fixtures)
+    rows = run_detector_benchmark(frames, repeat=args.repeat)
+    print(format_detector_results(rows))
+
+    if args.save:
+        from benchmarks.baseline import build_baseline, save_baseline
+        run_config = {
+            "benchmark": "detector",
+            "analyzer": "stub" if args.stub_analyzer else "insightface",
+            "frames": len(frames),
+            "fixtures": bool(args.fixtures),
+            "repeat": args.repeat,
+        }
+        save_baseline(build_baseline({"detector": rows}, run_config), args.save)
+        print(f"\nResults saved to {args.save}")
+    return 0
+
+
+def cmd_antispoof(args) -> int:
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    from benchmarks.antispoof import format_antispoof_results, recapture, run_antispoof_benchmark
+    from benchmarks.detector import load_frames
+
+    if args.stub_analyzer:
+        from benchmarks.stub_analyzer import install_stub_analyzer
+        install_stub_analyzer()
+
+    from antispoof import AntiSpoofModel
+    if args.model:
+        model = AntiSpoofModel.load(args.model)
+    else:
+        from benchmarks.stub_analyzer import StubAntiSpoofSession
+        model = AntiSpoofModel(StubAntiSpoofSession(latency_ms=args.stub_latency_ms))
+
+    live = load_frames(args.frames, fixture_dir=args.fixtures)
+    if args.spoof_fixtures:
+        spoof = load_frames(args.frames, fixture_dir=args.spoof_fixtures)
+    else:
+        spoof = [recapture(frame) for frame in live]
+
+    rows = run_antispoof_benchmark(live, spoof, model, repeat=args.repeat)
+    print(format_antispoof_results(rows))
+
+    if args.save:
+        from benchmarks.baseline import build_baseline, save_baseline
+        run_config = {
+            "benchmark": "antispoof",
+            "analyzer": "stub" if args.stub_analyzer else "insightface",
+            "model": args.model or "stub",
+            "frames": len(live),
+            "fixtures": bool(args.fixtures),
+            "spoof_fixtures": bool(args.spoof_fixtures),
+            "repeat": args.repeat,
+        }
+        save_baseline(build_baseline({"antispoof": rows}, run_config), args.save)
+        print(f"\nResults saved to {args.save}")
+    return 0
+
+
+def cmd_overload(args) -> int:
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    from benchmarks import load_test
+    from benchmarks.overload import format_overload_results, run_overload_benchmark
+    from benchmarks.synthetic import build_image_set
+
+    load_test.prepare_environment(args.db)
+    images = build_image_set(args.users, fixture_dir=args.fixtures)
+    results = asyncio.run(run_overload_benchmark(
+        images,
+        verify_requests=args.verify_requests,
+        verify_concurrency=args.verify_concurrency,
+        flood_requests=args.flood_requests,
+        flood_concurrency=args.flood_concurrency,
+        stub_latency_ms=args.stub_latency_ms,
+        target_latency_ms=args.target_latency_ms,
+    ))
+    print(format_overload_results(results))
+
+    if args.save:
+        from benchmarks.baseline import build_baseline, save_baseline
+        run_config = {key: getattr(args, key) for key in (
+            "users", "verify_requests", "verify_concurrency", "flood_requests",
+            "flood_concurrency", "stub_latency_ms", "target_latency_ms",
+        )}
+        run_config["benchmark"] = "overload"
+        save_baseline(build_baseline(results, run_config), args.save)
+        print(f"\nResults saved to {args.save}")
+    return 0
+
+
+def cmd_pipeline(args) -> int:
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    from benchmarks import load_test
+    from benchmarks.stages import format_stage_results, run_stage_benchmark
+    from benchmarks.synthetic import build_image_set
+
+    load_test.prepare_environment(args.db)
+    images = build_image_set(args.users, fixture_dir=args.fixtures)
+    results = asyncio.run(run_stage_benchmark(
+        images, args.requests, args.concurrency, args.allocations.split(),
+        stub_analyzer=args.stub_analyzer, stub_latency_ms=args.stub_latency_ms,
+    ))
+    print(format_stage_results(results))
+
+    if args.save:
+        from benchmarks.baseline import build_baseline, save_baseline
+        run_config = {key: getattr(args, key) for key in (
+            "users", "requests", "concurrency", "allocations", "stub_analyzer", "stub_latency_ms",
+        )}
+        run_config["benchmark"] = "pipeline"
+        save_baseline(build_baseline(results, run_config), args.save)
+        print(f"\nResults saved to {args.save}")
+    return 0
+
+
+def cmd_engines(args) -> int:
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    from benchmarks import load_test
+    from benchmarks.engines import format_engine_results, run_engine_benchmark
+
+    load_test.prepare_environment(None)
+    results = run_engine_benchmark(
+        args.backends.split(","), args.model, runs=args.runs, synthetic_pack=args.synthetic_pack,
+    )
+    print(format_engine_results(results))
+
+    if args.save:
+        from benchmarks.baseline import build_baseline, save_baseline
+        run_config = {key: getattr(args, key) for key in ("backends", "model", "runs", "synthetic_pack")}
+        run_config["benchmark"] = "engines"
+        save_baseline(build_baseline(results, run_config), args.save)
+        print(f"\nResults saved to {args.save}")
+    return 0
+
+
+def cmd_merkle(args) -> int:
+    logging.basicConfig(level=logging.WARNING)
+
+    from benchmarks import load_test
+    from benchmarks.merkle import format_merkle_results, run_merkle_benchmark
+
+    load_test.prepare_environment(None)
+    results = run_merkle_benchmark(
+        args.leaves, batch=args.batch, batches=args.batches, proofs=args.proofs,
+        workers=args.workers, directory=args.dir,
+    )
+    print(format_merkle_results(results))
+
+    if args.save:
+        from benchmarks.baseline import build_baseline, save_baseline
+        run_config = {
+            "benchmark": "merkle",
+            "leaves": args.leaves,
+            "batch": args.batch,
+            "batches": args.batches,
+            "workers": args.workers,
+        }
+        save_baseline(build_baseline(results, run_config), args.save)
+        print(f"\nResults saved to {args.save}")
+    return 0
+
+
+def cmd_tokens(args) -> int:
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    from benchmarks import load_test
+    from benchmarks.tokens import format_token_results, run_token_benchmark
+
+    load_test.prepare_environment(args.db)
+    results = asyncio.run(run_token_benchmark(
+        args.requests, args.concurrency, store_url=args.store_url or "", rounds=args.rounds,
+    ))
+    print(format_token_results(results))
+
+    if args.save:
+        from benchmarks.baseline import build_baseline, save_baseline
+        run_config = {
+            "benchmark": "tokens",
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "rounds": args.rounds,
+            "store": "redis" if args.store_url else "memory",
+        }
+        save_baseline(build_baseline(results, run_config), args.save)
+        print(f"\nResults saved to {args.save}")
+    return 0
+
+
+def cmd_replay(args) -> int:
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    from benchmarks import load_test
+    from benchmarks.replay import captured_stats, copy_database, format_replay, replay_in_process
+
+    # Settings are read when config is first imported, so the environment comes first
+    load_test.prepare_environment(copy_database(args.db) if args.db else None)
+    from capture import read_trace
+
+    records = read_trace(args.traces)
+    if not records:
+        print("No captured requests found")
+        return 1
+
+    result = asyncio.run(replay_in_process(
+        records, speed=args.speed, concurrency=args.concurrency,
+        stub_analyzer=args.stub_analyzer, stub_latency_ms=args.stub_latency_ms,
+    ))
+    print(format_replay(result, captured_stats(records)))
+
+    if args.save:
+        from benchmarks.baseline import build_baseline, save_baseline
+        run_config = {
+            "benchmark": "replay",
+            "analyzer": "stub" if args.stub_analyzer else "insightface",
+            "requests": len(records),
+            "speed": args.speed,
+            "concurrency": args.concurrency,
+            "database_copy": bool(args.db),
+        }
+        baseline = build_baseline(result["endpoints"], run_config)
+        baseline["outcomes"] = result["outcomes"]
+        save_baseline(baseline, args.save)
+        print(f"\nResults saved to {args.save}")
+    return 0
+
+
+def cmd_replay_diff(args) -> int:
+    from benchmarks.baseline import compare_baselines, format_comparison, load_baseline
+    from benchmarks.replay import diff_outcomes, format_outcome_diff
+
+    old, new = load_baseline(args.old), load_baseline(args.new)
+    rows = compare_baselines(old, new, tolerance=args.tolerance)
+    diff = diff_outcomes(old["outcomes"], new["outcomes"])
+    print(f"{old.get('git_commit')} -> {new.get('git_commit')}")
+    print(format_comparison(rows))
+    print()
+    print(format_outcome_diff(diff))
+
+    return 1 if diff["changed"] or any(row["regressions"] for row in rows) else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Load-test the service endpoints")
+    run.add_argument("--url", help="Benchmark a running server over HTTP instead of in-process")
+    run.add_argument("--server-pid", type=int, help="PID of the server to sample RSS from (HTTP mode, needs psutil)")
+    run.add_argument("--requests", type=int, default=100, help="Requests per endpoint")
+    run.add_argument("--concurrency", type=int, default=4, help="Requests in flight per endpoint")
+    run.add_argument("--users", type=int, default=20, help="Distinct users/images")
+    run.add_argument("--endpoints", help="Comma-separated subset of: enroll,status,verify,validate-token")
+    run.add_argument("--fixtures", help="Directory of face photos to use instead of synthetic images")
+    run.add_argument("--stub-analyzer", action="store_true", help="Replace InsightFace with a no-model stub (in-process only)")
+    run.add_argument("--stub-latency-ms", type=float, default=0.0, help="Simulated model latency for the stub analyzer")
+    run.add_argument("--skip-liveness", action="store_true", help="Send skip_liveness=true with /verify")
+    run.add_argument("--db", help="SQLite file for in-process runs (default: temporary file)")
+    run.add_argument("--save", help="Write results to this JSON baseline file")
+    run.add_argument("--verbose", action="store_true", help="Show service and HTTP client logs")
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser("compare", help="Compare two saved baselines")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative change (default 0.10)")
+    compare.set_defaults(func=cmd_compare)
+
+    payload = sub.add_parser("payload", help="Request body parse overhead per MB, before/after streaming")
+    payload.add_argument("--sizes-kb", default="100,250,500,1000", help="Comma-separated decoded image sizes in KB")
+    payload.add_argument("--repeat", type=int, default=20)
+    payload.add_argument("--save", help="Write results to this JSON file")
+    payload.set_defaults(func=cmd_payload)
+
+    detector = sub.add_parser("detector", help="Detection latency, fixed 640 vs adaptive 320 -> 640 input size")
+    detector.add_argument("--fixtures", help="Directory of webcam selfies (recommended with the real model)")
+    detector.add_argument("--frames", type=int, default=50, help="Number of frames")
+    detector.add_argument("--repeat", type=int, default=3, help="Passes over the frame set per mode")
+    detector.add_argument("--stub-analyzer", action="store_true", help="Replace InsightFace with a no-model stub")
+    detector.add_argument("--stub-latency-ms", type=float, default=20.0, help="Simulated 640x640 detector latency for the stub")
+    detector.add_argument("--save", help="Write results to this JSON file")
+    detector.add_argument("--verbose", action="store_true", help="Show service logs")
+    detector.set_defaults(func=cmd_detector)
+
+    antispoof = sub.add_parser("antispoof", help="Latency and false-reject rate of liveness with vs without the anti-spoof model")
+    antispoof.add_argument("--model", help="ONNX anti-spoof model (default: a stub model)")
+    antispoof.add_argument("--fixtures", help="Directory of genuine webcam selfies")
+    antispoof.add_argument("--spoof-fixtures", help="Directory of presentation attacks (default: recaptured live frames)")
+    antispoof.add_argument("--frames", type=int, default=50, help="Number of frames per set")
+    antispoof.add_argument("--repeat", type=int, default=3, help="Passes over the live set per mode")
+    antispoof.add_argument("--stub-analyzer", action="store_true", help="Replace InsightFace with a no-model stub")
+    antispoof.add_argument("--stub-latency-ms", type=float, default=5.0, help="Simulated per-batch latency of the stub model")
+    antispoof.add_argument("--save", help="Write results to this JSON file")
+    antispoof.add_argument("--verbose", action="store_true", help="Show service logs")
+    antispoof.set_defaults(func=cmd_antispoof)
+
+    overload = sub.add_parser("overload", help="Verify latency under an enroll flood, admission control off vs on")
+    overload.add_argument("--users", type=int, default=10, help="Enrolled users driven by /verify")
+    overload.add_argument("--verify-requests", type=int, default=60)
+    overload.add_argument("--verify-concurrency", type=int, default=2)
+    overload.add_argument("--flood-requests", type=int, default=200)
+    overload.add_argument("--flood-concurrency", type=int, default=16)
+    overload.add_argument("--stub-latency-ms", type=float, default=10.0, help="Simulated per-model-call latency (serialized)")
+    overload.add_argument("--target-latency-ms", type=float, help="Admission latency target (default 4x stub latency)")
+    overload.add_argument("--fixtures", help="Directory of face photos to use instead of synthetic images")
+    overload.add_argument("--db", help="SQLite file (default: temporary file)")
+    overload.add_argument("--save", help="Write results to this JSON file")
+    overload.add_argument("--verbose", action="store_true", help="Show service logs")
+    overload.set_defaults(func=cmd_overload)
+
+    tokens = sub.add_parser("tokens", help="/validate-token throughput with single-use tokens off vs on")
+    tokens.add_argument("--requests", type=int, default=2000, help="Validations per scenario (one fresh token each)")
+    tokens.add_argument("--concurrency", type=int, default=8)
+    tokens.add_argument("--rounds", type=int, default=3, help="Alternating rounds per scenario (best one is reported)")
+    tokens.add_argument("--store-url", help="redis:// URL to measure the shared store instead of the in-memory one")
+    tokens.add_argument("--db", help="SQLite file (default: temporary file)")
+    tokens.add_argument("--save", help="Write results to this JSON file")
+    tokens.add_argument("--verbose", action="store_true", help="Show service logs")
+    tokens.set_defaults(func=cmd_tokens)
+
+    stages = sub.add_parser("pipeline", help="/verify throughput and per-stage utilization for pipeline worker allocations")
+    stages.add_argument("--allocations", default="1,1,1,1 2,1,1,1 2,2,1,1",
+                        help="Space-separated decode,infer,score,persist worker counts to compare")
+    stages.add_argument("--requests", type=int, default=200, help="Verifications per allocation")
+    stages.add_argument("--concurrency", type=int, default=8)
+    stages.add_argument("--users", type=int, default=8)
+    stages.add_argument("--stub-analyzer", action="store_true", help="Replace InsightFace with a no-model stub")
+    stages.add_argument("--stub-latency-ms", type=float, default=10.0, help="Simulated model latency for the stub analyzer")
+    stages.add_argument("--fixtures", help="Directory of face photos to use instead of synthetic images")
+    stages.add_argument("--db", help="SQLite file (default: temporary file)")
+    stages.add_argument("--save", help="Write results to this JSON file")
+    stages.add_argument("--verbose", action="store_true", help="Show service logs")
+    stages.set_defaults(func=cmd_pipeline)
+
+    engines = sub.add_parser("engines", help="Detection / recognition latency and conformance per inference backend")
+    engines.add_argument("--backends", default="insightface,onnxruntime,opencv,openvino",
+                         help="Comma-separated backends; the first that loads is the conformance reference")
+    engines.add_argument("--model", help="Model pack (default: FACE_MODEL_NAME)")
+    engines.add_argument("--runs", type=int, default=20, help="Timed runs per backend (median reported)")
+    engines.add_argument("--synthetic-pack", action="store_true",
+                         help="Use a small generated pack instead of downloaded models (engine overhead only)")
+    engines.add_argument("--save", help="Write results to this JSON file")
+    engines.add_argument("--verbose", action="store_true", help="Show service logs")
+    engines.set_defaults(func=cmd_engines)
+
+    merkle = sub.add_parser("merkle", help="Merkle allowlist build, incremental append and proof timings")
+    merkle.add_argument("--leaves", type=int, default=1_000_000, help="Wallets in the initial build")
+    merkle.add_argument("--batch", type=int, default=100, help="Wallets per incremental append")
+    merkle.add_argument("--batches", type=int, default=50)
+    merkle.add_argument("--proofs", type=int, default=1000)
+    merkle.add_argument("--workers", type=int, default=1, help="Hashing processes for the initial build")
+    merkle.add_argument("--dir", help="Keep the tree files here (default: temporary directory)")
+    merkle.add_argument("--save", help="Write results to this JSON file")
+    merkle.set_defaults(func=cmd_merkle)
+
+    replay = sub.add_parser("replay", help="Replay captured production traffic (see capture.py) in-process")
+    replay.add_argument("traces", nargs="+", help="Trace files or directories (CAPTURE_DIR)")
+    replay.add_argument("--speed", type=float, default=1.0, help="Arrival rate multiplier (0 = as fast as possible)")
+    replay.add_argument("--concurrency", type=int, default=64, help="Maximum requests in flight")
+    replay.add_argument("--db", help="SQLite database to replay against (a copy is used)")
+    replay.add_argument("--stub-analyzer", action="store_true", help="Replace InsightFace with a no-model stub")
+    replay.add_argument("--stub-latency-ms", type=float, default=0.0, help="Simulated model latency for the stub analyzer")
+    replay.add_argument("--save", help="Write latencies and per-request outcomes to this JSON file")
+    replay.add_argument("--verbose", action="store_true", help="Show service logs")
+    replay.set_defaults(func=cmd_replay)
+
+    replay_diff = sub.add_parser("replay-diff", help="Latency and outcome differences between two saved replays")
+    replay_diff.add_argument("old")
+    replay_diff.add_argument("new")
+    replay_diff.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative latency change (default 0.10)")
+    replay_diff.set_defaults(func=cmd_replay_diff)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Face Verification Service - Anti-Spoof Model Benchmark
+Measures what the optional anti-spoof model adds to liveness: latency per
+check, and how the false-reject rate on genuine selfies changes
+
+Use --fixtures with real webcam selfies (and --spoof-fixtures with photos of
+printed or on-screen faces) together with --model for meaningful numbers.
+Without them, synthetic frames and their "recaptured" copies (downscaled and
+re-sharpened, like a photo of a screen) are scored by a stub model.
+"""
+
+import time
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from benchmarks.load_test import percentile
+
+MODES = ("heuristic", "model")
+
+
+def recapture(frame: np.ndarray) -> np.ndarray:
+    """Simulate a photo of a screen showing `frame`: lost texture, lifted blacks"""
+    height, width = frame.shape[:2]
+    small = cv2.resize(frame, (width // 4, height // 4), interpolation=cv2.INTER_AREA)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    return cv2.convertScaleAbs(image, alpha=0.85, beta=30)
+
+
+def detect_faces(frames: List[np.ndarray]) -> List[tuple]:
+    """(frame, face) pairs, dropping frames without a face"""
+    from face_processor import detect_target_face
+
+    pairs = []
+    for frame in frames:
+        face, _quality = detect_target_face(frame)
+        if face is not None:
+            pairs.append((frame, face))
+    return pairs
+
+
+def time_liveness(pairs: List[tuple], repeat: int) -> Dict:
+    from config import settings
+    from liveness import detect_liveness
+
+    latencies = []
+    passed = 0
+    for _ in range(repeat):
+        for frame, face in pairs:
+            start = time.perf_counter()
+            result = detect_liveness(frame, settings.blink_threshold, face=face)
+            latencies.append((time.perf_counter() - start) * 1000)
+            passed += bool(result["is_live"])
+
+    return {
+        "checks": len(latencies),
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "pass_rate": round(passed / len(latencies), 4) if latencies else 0.0,
+    }
+
+
+def time_batch(pairs: List[tuple]) -> float:
+    """Model time per crop when all crops are scored as one batch"""
+    import antispoof
+    from face_processor import align_face_crop
+
+    crops = [align_face_crop(frame, face) for frame, face in pairs]
+    if not crops:
+        return 0.0
+    start = time.perf_counter()
+    antispoof.score_crops(crops)
+    return round((time.perf_counter() - start) * 1000 / len(crops), 3)
+
+
+def run_antispoof_benchmark(live: List[np.ndarray], spoof: Optional[List[np.ndarray]] = None,
+                            model=None, repeat: int = 3) -> List[Dict]:
+    """Run liveness with heuristics only, then with `model`; one row per mode"""
+    import antispoof
+
+    live_pairs = detect_faces(live)
+    spoof_pairs = detect_faces(spoof) if spoof else []
+
+    saved = antispoof._model, antispoof._load_attempted
+    rows = []
+    try:
+        for mode in MODES:
+            antispoof.install_model(model if mode == "model" else None)
+            if live_pairs:
+                time_liveness(live_pairs[:1], 1)  # warm up
+            live_stats = time_liveness(live_pairs, repeat)
+            row = {
+                "mode": mode,
+                "frames": len(live_pairs),
+                "mean_ms": live_stats["mean_ms"],
+                "p95_ms": live_stats["p95_ms"],
+                "false_reject_rate": round(1 - live_stats["pass_rate"], 4) if live_pairs else 0.0,
+                "spoof_accept_rate": time_liveness(spoof_pairs, 1)["pass_rate"] if spoof_pairs else None,
+            }
+            if mode == "model":
+                row["batch_ms_per_crop"] = time_batch(live_pairs)
+            rows.append(row)
+    finally:
+        antispoof._model, antispoof._load_attempted = saved
+
+    heuristic, learned = rows
+    learned["added_ms"] = round(learned["mean_ms"] - heuristic["mean_ms"], 3)
+    learned["frr_change"] = round(learned["false_reject_rate"] - heuristic["false_reject_rate"], 4)
+    heuristic["added_ms"], heuristic["frr_change"] = 0.0, 0.0
+    return rows
+
+
+def format_antispoof_results(rows: List[Dict]) -> str:
+    lines = [
+        f"{'mode':<11}{'frames':>8}{'mean ms':>10}{'p95 ms':>10}{'added':>9}{'FRR':>8}{'dFRR':>8}{'spoof ok':>10}",
+        "-" * 74,
+    ]
+    for row in rows:
+        spoof = f"{row['spoof_accept_rate']:.1%}" if row["spoof_accept_rate"] is not None else "-"
+        lines.append(
+            f"{row['mode']:<11}{row['frames']:>8}{row['mean_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['added_ms']:>9.2f}"
+            f"{row['false_reject_rate']:>8.1%}{row['frr_change']:>+8.1%}{spoof:>10}"
+        )
+    if "batch_ms_per_crop" in rows[-1]:
+        lines.append(f"\nbatched model time per crop: {rows[-1]['batch_ms_per_crop']:.2f} ms")
+    return "\n".join(lines)
@@ -0,0 +1,99 @@
+"""
+Face Verification Service - Benchmark Baselines
+Saves benchmark results as JSON and compares them between commits
+"""
+
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime
+from typing import Dict, List
+
+
+def git_commit() -> str:
+    """Short hash of the current commit, or 'unknown' outside a git checkout"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def build_baseline(results: Dict[str, Dict], run_config: Dict) -> Dict:
+    """Wrap endpoint stats with the information needed to compare runs"""
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": run_config,
+        "endpoints": results,
+    }
+
+
+def save_baseline(baseline: Dict, path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_baselines(old: Dict, new: Dict, tolerance: float = 0.10) -> List[Dict]:
+    """
+    Compare two baselines endpoint by endpoint
+
+    A regression is a p95/p99 latency increase or an rps drop larger than
+    `tolerance` (0.10 = 10%). Returns one row per endpoint present in both.
+    """
+    rows = []
+    for name, new_stats in new.get("endpoints", {}).items():
+        old_stats = old.get("endpoints", {}).get(name)
+        if not old_stats or "skipped" in old_stats or "skipped" in new_stats:
+            continue
+
+        row = {"endpoint": name, "regressions": []}
+        for metric, higher_is_worse in (("p50_ms", True), ("p95_ms", True), ("p99_ms", True), ("rps", False)):
+            before, after = old_stats.get(metric, 0.0), new_stats.get(metric, 0.0)
+            change = (after - before) / before if before else 0.0
+            row[metric] = {"old": before, "new": after, "change": round(change, 4)}
+
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            if worse and metric != "p50_ms":
+                row["regressions"].append(metric)
+        rows.append(row)
+    return rows
+
+
+def format_results(results: Dict[str, Dict]) -> str:
+    """Render endpoint stats as a text table"""
+    header = f"{'endpoint':<16}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'peak RSS MB':>13}"
+    lines = [header, "-" * len(header)]
+    for name, stats in results.items():
+        if "skipped" in stats:
+            lines.append(f"{name:<16}skipped: {stats['skipped']}")
+            continue
+        lines.append(
+            f"{name:<16}{stats['count']:>7}{stats['errors']:>8}{stats['p50_ms']:>10.2f}"
+            f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['rps']:>10.1f}{stats['peak_rss_mb']:>13.1f}"
+        )
+    return "\n".join(lines)
+
+
+def format_comparison(rows: List[Dict]) -> str:
+    """Render a baseline comparison as a text table"""
+    lines = [f"{'endpoint':<16}{'p50':>10}{'p95':>10}{'p99':>10}{'req/s':>10}  status", "-" * 66]
+    for row in rows:
+        changes = "".join(f"{row[m]['change']:>+10.1%}" for m in ("p50_ms", "p95_ms", "p99_ms", "rps"))
+        status = "REGRESSION: " + ", ".join(row["regressions"]) if row["regressions"] else "ok"
+        lines.append(f"{row['endpoint']:<16}{changes}  {status}")
+    return "\n".join(lines)
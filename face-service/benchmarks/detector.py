@@ -0,0 +1,89 @@
+"""
+Face Verification Service - Detector Input Size Benchmark
+Measures detection latency with a fixed 640x640 detector vs the adaptive
+320 -> 640 two-stage detector on a selfie set
+
+Use --fixtures with real webcam selfies (640x480, face filling much of the
+frame) for meaningful numbers; the synthetic frames are only recognised by
+the stub analyzer.
+"""
+
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.load_test import percentile
+from benchmarks.synthetic import build_image_set
+
+MODES = ("fixed", "adaptive")
+
+
+def load_frames(count: int, fixture_dir: str = None) -> List[np.ndarray]:
+    """Decode the benchmark images the same way /verify does"""
+    from face_processor import decode_image
+    return [decode_image(url) for url in build_image_set(count, fixture_dir=fixture_dir)]
+
+
+def time_detection(frames: List[np.ndarray], repeat: int) -> Dict:
+    from face_processor import detect_target_face
+    from metrics import metrics
+
+    detect_target_face(frames[0])  # warm up
+
+    requests_before = metrics.counter("detector.requests")
+    escalations_before = metrics.counter("detector.escalations")
+    latencies = []
+    faces_found = 0
+    for _ in range(repeat):
+        for frame in frames:
+            start = time.perf_counter()
+            face, _quality = detect_target_face(frame)
+            latencies.append((time.perf_counter() - start) * 1000)
+            faces_found += face is not None
+
+    requests = metrics.counter("detector.requests") - requests_before
+    escalations = metrics.counter("detector.escalations") - escalations_before
+    return {
+        "detections": len(latencies),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "face_rate": round(faces_found / len(latencies), 4),
+        "escalation_rate": round(escalations / requests, 4) if requests else 0.0,
+    }
+
+
+def run_detector_benchmark(frames: List[np.ndarray], repeat: int = 3) -> List[Dict]:
+    """Time detect_target_face in both modes; returns one row per mode"""
+    from config import settings
+
+    original = settings.detector_fast_input_size
+    fast_size = original or 320
+    rows = []
+    try:
+        for mode in MODES:
+            settings.detector_fast_input_size = 0 if mode == "fixed" else fast_size
+            row = {"mode": mode}
+            row.update(time_detection(frames, repeat))
+            rows.append(row)
+    finally:
+        settings.detector_fast_input_size = original
+
+    fixed, adaptive = rows
+    adaptive["saving_pct"] = round(100 * (1 - adaptive["mean_ms"] / fixed["mean_ms"]), 1) if fixed["mean_ms"] else 0.0
+    fixed["saving_pct"] = 0.0
+    return rows
+
+
+def format_detector_results(rows: List[Dict]) -> str:
+    lines = [
+        f"{'mode':<10}{'frames':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'faces':>8}{'escalated':>11}{'saving':>9}",
+        "-" * 76,
+    ]
+    for row in rows:
+        lines.append(
+            f"{row['mode']:<10}{row['detections']:>8}{row['mean_ms']:>10.2f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+            f"{row['face_rate']:>8.0%}{row['escalation_rate']:>11.1%}{row['saving_pct']:>8.1f}%"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,151 @@
+"""
+Face Verification Service - Inference Engine Benchmark
+Detection and recognition latency plus conformance for each inference backend
+
+Loads one model pack on every requested backend (see backends.py), checks
+each against the first that loads - embedding cosine similarity and the
+detected boxes on the same frame - and times detect and embed. The
+fastest conforming backend is what INFERENCE_BACKEND=auto would choose on
+this host.
+
+Without downloaded models, --synthetic-pack builds a small random pack
+with the same input and output layout as SCRFD and ArcFace (nine detector
+outputs, 112x112 recognition input). Its numbers only reflect each
+engine's per-call overhead, not real model cost, but it exercises the
+same sessions and conformance checks.
+"""
+
+import os
+import tempfile
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+SYNTHETIC_PACK = "synthetic"
+
+# Detector strides with two anchors each: the det_500m / det_2.5g layout
+DETECTOR_STRIDES = (8, 16, 32)
+
+
+def _detector_graph(rng: np.random.Generator):
+    """
+    Nine outputs like SCRFD: per stride, scores (N x 1), box distances (N x 4)
+    and keypoint distances (N x 10) for two anchors per position. The score
+    is the brightness of the stride x stride patch, so bright squares on a
+    dark frame come out as faces.
+    """
+    from onnx import TensorProto, helper, numpy_helper
+
+    nodes, initializers, outputs = [], [], {"score": [], "bbox": [], "kps": []}
+    for stride in DETECTOR_STRIDES:
+        patch = 3 * stride * stride
+        for kind, channels in (("score", 1), ("bbox", 4), ("kps", 10)):
+            name = f"{kind}_{stride}"
+            if kind == "score":
+                weight = np.full((2 * channels, 3, stride, stride), 12.0 / patch, dtype=np.float32)
+                bias = np.full(2 * channels, -9.0, dtype=np.float32)
+            else:
+                weight = rng.normal(0, 1.0 / patch, (2 * channels, 3, stride, stride)).astype(np.float32)
+                bias = np.zeros(2 * channels, dtype=np.float32)
+            initializers += [
+                numpy_helper.from_array(weight, f"{name}_weight"),
+                numpy_helper.from_array(bias, f"{name}_bias"),
+                numpy_helper.from_array(np.array([-1, channels], dtype=np.int64), f"{name}_shape"),
+            ]
+            nodes += [
+                helper.make_node("Conv", ["input.1", f"{name}_weight", f"{name}_bias"], [f"{name}_conv"],
+                                 kernel_shape=[stride, stride], strides=[stride, stride], name=f"{name}_conv"),
+                helper.make_node("Sigmoid", [f"{name}_conv"], [f"{name}_sigmoid"], name=f"{name}_sigmoid"),
+                helper.make_node("Transpose", [f"{name}_sigmoid"], [f"{name}_nhwc"], perm=[0, 2, 3, 1], name=f"{name}_nhwc"),
+                helper.make_node("Reshape", [f"{name}_nhwc", f"{name}_shape"], [name], name=f"{name}_reshape"),
+            ]
+            outputs[kind].append(helper.make_tensor_value_info(name, TensorProto.FLOAT, ["anchors", channels]))
+
+    return helper.make_graph(
+        nodes, "detector",
+        [helper.make_tensor_value_info("input.1", TensorProto.FLOAT, [1, 3, "height", "width"])],
+        outputs["score"] + outputs["bbox"] + outputs["kps"], initializers,
+    )
+
+
+def _recognition_graph(rng: np.random.Generator):
+    """112x112 crops -> 512-d embeddings through one strided convolution and a projection"""
+    from onnx import TensorProto, helper, numpy_helper
+
+    conv = rng.normal(0, 0.05, (8, 3, 8, 8)).astype(np.float32)
+    projection = rng.normal(0, 0.05, (8 * 14 * 14, 512)).astype(np.float32)
+    return helper.make_graph(
+        [
+            helper.make_node("Conv", ["data", "conv_weight"], ["features"], kernel_shape=[8, 8], strides=[8, 8], name="conv"),
+            helper.make_node("Flatten", ["features"], ["flat"], axis=1, name="flatten"),
+            helper.make_node("MatMul", ["flat", "projection"], ["fc1"], name="fc1"),
+        ],
+        "recognition",
+        [helper.make_tensor_value_info("data", TensorProto.FLOAT, ["batch", 3, 112, 112])],
+        [helper.make_tensor_value_info("fc1", TensorProto.FLOAT, ["batch", 512])],
+        [numpy_helper.from_array(conv, "conv_weight"), numpy_helper.from_array(projection, "projection")],
+    )
+
+
+def build_synthetic_pack(root: str, name: str = SYNTHETIC_PACK, seed: int = 0) -> str:
+    """Write a detector and a recognizer to root/models/name (FACE_MODEL_ROOT layout); returns the pack directory"""
+    import onnx
+    from onnx import helper
+
+    directory = os.path.join(root, "models", name)
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for filename, graph in (("det_synthetic.onnx", _detector_graph(rng)), ("w600k_synthetic.onnx", _recognition_graph(rng))):
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+        model.ir_version = 8
+        onnx.save(model, os.path.join(directory, filename))
+    return directory
+
+
+def synthetic_frame() -> np.ndarray:
+    """A dark frame with one bright square, which the synthetic detector reports as faces"""
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    frame[176:304, 256:384] = 255
+    return frame
+
+
+def run_engine_benchmark(backend_names: Sequence[str], model_name: Optional[str] = None, runs: int = 20,
+                         synthetic_pack: bool = False) -> Dict[str, Dict]:
+    """Per-backend timings and conformance; {"error": ...} for backends that did not load"""
+    import backends
+    from config import settings
+
+    saved_root = settings.face_model_root
+    frame = None
+    if synthetic_pack:
+        settings.face_model_root = tempfile.mkdtemp(prefix="faceservice-pack-")
+        build_synthetic_pack(settings.face_model_root)
+        model_name, frame = SYNTHETIC_PACK, synthetic_frame()
+    try:
+        _loaded, results = backends.compare_backends(
+            backend_names, model_name or settings.face_model_name, settings.detector_input_size, runs, frame=frame,
+        )
+    finally:
+        settings.face_model_root = saved_root
+    return results
+
+
+def fastest(results: Dict[str, Dict]):
+    conforming = [name for name, row in results.items() if row.get("conforms")]
+    return min(conforming, key=lambda name: results[name]["total_ms"]) if conforming else None
+
+
+def format_engine_results(results: Dict[str, Dict]) -> str:
+    header = f"{'backend':<14}{'detect ms':>11}{'embed ms':>10}{'total ms':>10}{'cosine':>10}{'faces':>7}{'box err':>9}  conforms"
+    lines = [header, "-" * len(header)]
+    for name, row in results.items():
+        if "error" in row:
+            lines.append(f"{name:<14}  not available: {row['error']}")
+            continue
+        box_error = "-" if row["max_box_error_px"] is None else f"{row['max_box_error_px']:.3f}"
+        lines.append(
+            f"{name:<14}{row['detect_ms']:>11.2f}{row['embed_ms']:>10.2f}{row['total_ms']:>10.2f}"
+            f"{row['cosine']:>10.5f}{row['faces']:>7}{box_error:>9}  {'yes' if row['conforms'] else 'NO'}"
+        )
+    lines.append(f"\nfastest conforming backend: {fastest(results) or 'none'}")
+    return "\n".join(lines)
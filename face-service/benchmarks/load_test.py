@@ -0,0 +1,287 @@
+"""
+Face Verification Service - Load Test Driver
+Drives the service endpoints at a fixed concurrency and collects latency stats
+
+Two transports are supported:
+- in-process: the ASGI app is called directly through httpx.ASGITransport
+- http: requests go over the network to a running server
+"""
+
+import asyncio
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+ENDPOINTS = ("enroll", "status", "verify", "validate-token")
+
+
+def prepare_environment(db_path: Optional[str] = None) -> str:
+    """
+    Point the service at a throwaway database before `main` is imported
+    Settings and the DB engine are created at import time, so this must run first
+    """
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="faceservice-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ["DEBUG"] = "false"
+    return db_path
+
+
+async def load_app(stub_analyzer: bool = False, stub_latency_ms: float = 0.0):
+    """Import the FastAPI app, create tables and disable per-IP rate limiting"""
+    import main
+    from database import init_db
+
+    await init_db()
+    main.limiter.enabled = False
+
+    if stub_analyzer:
+        from benchmarks.stub_analyzer import install_stub_analyzer
+        install_stub_analyzer(latency_ms=stub_latency_ms)
+
+    return main.app
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Linear-interpolated percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class RssSampler:
+    """
+    Samples resident set size in a background thread and keeps the peak
+    Uses psutil when available (required for sampling another process)
+    """
+
+    def __init__(self, pid: Optional[int] = None, interval: float = 0.01):
+        self.pid = pid
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._read = self._make_reader()
+
+    def _make_reader(self) -> Callable[[], int]:
+        try:
+            import psutil
+            process = psutil.Process(self.pid)
+            return lambda: process.memory_info().rss
+        except ImportError:
+            pass
+
+        if self.pid is not None:
+            raise RuntimeError("psutil is required to sample another process: pip install psutil")
+
+        if os.path.exists("/proc/self/statm"):
+            page_size = os.sysconf("SC_PAGE_SIZE")
+
+            def read_statm():
+                with open("/proc/self/statm") as f:
+                    return int(f.read().split()[1]) * page_size
+            return read_statm
+
+        # Last resort: lifetime peak of this process (macOS reports bytes, Linux KiB)
+        scale = 1 if sys.platform == "darwin" else 1024
+        return lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, self._read())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_bytes = self._read()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, self._read())
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float, peak_rss: int) -> Dict:
+    """Reduce raw per-request timings (seconds) to a stats dict"""
+    ms = [x * 1000 for x in latencies]
+    count = len(latencies) + errors
+    return {
+        "count": count,
+        "errors": errors,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "rps": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+        "peak_rss_mb": round(peak_rss / (1024 * 1024), 1),
+    }
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    make_request: Callable[[int], Dict],
+    total: int,
+    concurrency: int,
+    on_response: Optional[Callable[[int, httpx.Response], None]] = None,
+    server_pid: Optional[int] = None,
+) -> Dict:
+    """
+    Send `total` requests with at most `concurrency` in flight
+    `make_request(i)` returns keyword arguments for client.request()
+    A response counts as an error when it is not a 2xx
+    """
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            kwargs = make_request(i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(**kwargs)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            elapsed = time.perf_counter() - start
+            if response.is_success:
+                latencies.append(elapsed)
+                if on_response:
+                    on_response(i, response)
+            else:
+                errors += 1
+
+    with RssSampler(pid=server_pid) as sampler:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        wall = time.perf_counter() - start
+
+    return summarize(latencies, errors, wall, sampler.peak_bytes)
+
+
+async def run_benchmark(
+    client: httpx.AsyncClient,
+    images: List[str],
+    requests: int,
+    concurrency: int,
+    endpoints=ENDPOINTS,
+    skip_liveness: bool = False,
+    server_pid: Optional[int] = None,
+    token_factory: Optional[Callable[[str], str]] = None,
+) -> Dict[str, Dict]:
+    """
+    Run each endpoint in turn and return per-endpoint stats
+
+    One benchmark user is enrolled per image; later endpoints cycle over
+    those users. Tokens for /validate-token come from successful /verify
+    responses, falling back to `token_factory` when none were issued.
+    """
+    users = [f"0x{i:040x}" for i in range(len(images))]
+    tokens: List[str] = []
+    results = {}
+
+    def collect_token(i, response):
+        token = response.json().get("token")
+        if token:
+            tokens.append(token)
+
+    plans = {
+        "enroll": lambda i: {
+            "method": "POST", "url": "/enroll",
+            "json": {"user_id": users[i % len(users)], "image": images[i % len(images)]},
+        },
+        "status": lambda i: {
+            "method": "GET", "url": f"/status/{users[i % len(users)]}",
+        },
+        "verify": lambda i: {
+            "method": "POST", "url": "/verify",
+            "json": {
+                "user_id": users[i % len(users)],
+                "image": images[i % len(images)],
+                "skip_liveness": skip_liveness,
+            },
+        },
+        "validate-token": lambda i: {
+            "method": "POST", "url": "/validate-token",
+            "headers": {"Authorization": f"Bearer {tokens[i % len(tokens)]}"},
+        },
+    }
+
+    for name in ENDPOINTS:
+        if name not in endpoints:
+            continue
+
+        if name == "validate-token" and not tokens:
+            if token_factory is None:
+                results[name] = {"skipped": "no verification tokens were issued"}
+                continue
+            tokens.extend(token_factory(user) for user in users)
+
+        # Enrollment must cover every user before the lookups run
+        total = max(requests, len(users)) if name == "enroll" else requests
+        results[name] = await drive(
+            client,
+            plans[name],
+            total,
+            concurrency,
+            on_response=collect_token if name == "verify" else None,
+            server_pid=server_pid,
+        )
+
+    return results
+
+
+async def run_in_process(
+    images: List[str],
+    requests: int,
+    concurrency: int,
+    endpoints=ENDPOINTS,
+    stub_analyzer: bool = False,
+    stub_latency_ms: float = 0.0,
+    skip_liveness: bool = False,
+) -> Dict[str, Dict]:
+    """Benchmark the ASGI app inside this process"""
+    app = await load_app(stub_analyzer=stub_analyzer, stub_latency_ms=stub_latency_ms)
+    from auth import create_verification_token
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        return await run_benchmark(
+            client, images, requests, concurrency, endpoints,
+            skip_liveness=skip_liveness,
+            token_factory=lambda user: create_verification_token(user, 1.0),
+        )
+
+
+async def run_over_http(
+    base_url: str,
+    images: List[str],
+    requests: int,
+    concurrency: int,
+    endpoints=ENDPOINTS,
+    skip_liveness: bool = False,
+    server_pid: Optional[int] = None,
+) -> Dict[str, Dict]:
+    """Benchmark a running server; RSS is sampled from `server_pid` if given"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+        return await run_benchmark(
+            client, images, requests, concurrency, endpoints,
+            skip_liveness=skip_liveness,
+            server_pid=server_pid,
+        )
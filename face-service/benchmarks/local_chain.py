@@ -0,0 +1,342 @@
+"""
+Face Verification Service - Local Chain Stand-in
+In-memory node running a model of Voting.sol, for indexer tests and benchmarks
+
+Answers the JSON-RPC subset chain_rpc.ChainRpc uses (eth_blockNumber,
+eth_getBlockByNumber, eth_getLogs, eth_call, and legacy signed transactions
+through eth_sendRawTransaction) via an httpx transport, with real
+ABI-encoded logs. Every transaction is mined into its own block (like
+Hardhat's automine; a reverting one is refused with a JSON-RPC error), and
+reorg(depth) drops recent blocks so a test can mine a competing fork.
+"""
+
+import copy
+import json
+from typing import Dict, List, Optional
+
+import httpx
+import rlp
+from eth_abi import decode, encode
+from eth_account import Account
+from eth_utils import keccak
+
+from chain_rpc import EVENTS, VOTERS_ROOT_EVENT, selector
+
+CONTRACT_ADDRESS = "0x" + "5a" * 20
+CHAIN_ID = 31337
+BLOCK_TIME = 12
+
+_EVENTS = {event["name"]: event for event in EVENTS + [VOTERS_ROOT_EVENT]}
+
+# Deployer: holds ADMIN_ROLE and ELECTION_MANAGER_ROLE
+ADMIN_ADDRESS = "0x" + "ad" * 20
+
+
+
+class Revert(Exception):
+    """A transaction the contract would reject"""
+
+
+class LocalChain:
+    """Voting.sol on an in-memory chain; state changes are snapshotted per block"""
+
+    def __init__(self, candidates: List[str], voting_minutes: int = 60,
+                 genesis_time: int = 1_700_000_000, address: str = CONTRACT_ADDRESS):
+        self.address = address.lower()
+        self.blocks: List[Dict] = []
+        self._fork = 0
+        self._next_timestamp = genesis_time
+        self.calls = 0
+        self.nonces: Dict[str, int] = {}
+        self.receipts: Dict[str, Dict] = {}
+        self.state = {
+            "candidates": [],
+            "registered": set(),
+            "voted": set(),
+            "voting_start": 0,
+            "voting_end": 0,
+            "paused": False,
+            "registration_required": False,
+            "total_votes": 0,
+            "verification_signer": None,
+            "voters_root": b"\x00" * 32,
+        }
+        self._mine([])  # genesis
+
+        # Deployment: constructor pushes candidates and opens the voting window
+        logs = []
+        timestamp = self._next_timestamp
+        for index, name in enumerate(candidates):
+            self.state["candidates"].append([name, 0])
+            logs.append(self._log("CandidateAdded", [], [name, index, timestamp]))
+        self.state["voting_start"] = timestamp
+        self.state["voting_end"] = timestamp + voting_minutes * 60
+        self._mine(logs)
+
+    # ---- blocks ----
+
+    @property
+    def head(self) -> int:
+        return len(self.blocks) - 1
+
+    def _mine(self, logs: List[Dict]) -> Dict:
+        number = len(self.blocks)
+        parent = self.blocks[-1]["hash"] if self.blocks else "0x" + "00" * 32
+        timestamp = self._next_timestamp
+        block_hash = "0x" + keccak(text=f"{self._fork}:{number}:{parent}:{timestamp}:{json.dumps(logs)}").hex()
+        for index, log in enumerate(logs):
+            log.update({
+                "blockNumber": hex(number),
+                "blockHash": block_hash,
+                "logIndex": hex(index),
+                "transactionHash": "0x" + keccak(text=f"{block_hash}:{index}").hex(),
+                "transactionIndex": hex(index),
+                "removed": False,
+            })
+        block = {
+            "number": number, "hash": block_hash, "parent_hash": parent,
+            "timestamp": timestamp, "logs": logs, "state": copy.deepcopy(self.state),
+        }
+        self.blocks.append(block)
+        self._next_timestamp = timestamp + BLOCK_TIME
+        return block
+
+    def mine(self, count: int = 1):
+        """Mine empty blocks"""
+        for _ in range(count):
+            self._mine([])
+
+    def advance_time(self, seconds: int):
+        """Move the next block's timestamp forward"""
+        self._next_timestamp += seconds
+
+    @property
+    def now(self) -> int:
+        """Timestamp the next transaction executes at"""
+        return self._next_timestamp
+
+    def reorg(self, depth: int):
+        """Drop the last `depth` blocks; blocks mined afterwards form a new fork"""
+        del self.blocks[len(self.blocks) - depth:]
+        self.state = copy.deepcopy(self.blocks[-1]["state"])
+        self._next_timestamp = self.blocks[-1]["timestamp"] + BLOCK_TIME
+        self._fork += 1
+
+    def _log(self, name: str, indexed: List, data: List) -> Dict:
+        event = _EVENTS[name]
+        topics = [event["topic"]] + [
+            "0x" + encode([abi_type], [value]).hex() for abi_type, value in zip(event["indexed"], indexed)
+        ]
+        return {"address": self.address, "topics": topics, "data": "0x" + encode(event["data"], data).hex()}
+
+    # ---- contract ----
+
+    def _voting_active(self, timestamp: int) -> bool:
+        state = self.state
+        return state["voting_start"] <= timestamp < state["voting_end"] and not state["paused"]
+
+    def register_voters(self, voters: List[str]):
+        """registerVotersBatch(): one block, a VoterRegistered log per new voter"""
+        logs = []
+        for voter in voters:
+            voter = voter.lower()
+            if voter not in self.state["registered"]:
+                self.state["registered"].add(voter)
+                logs.append(self._log("VoterRegistered", [voter], [self.now]))
+        return self._mine(logs)
+
+    def register_voter(self, voter: str):
+        if voter.lower() in self.state["registered"]:
+            raise Revert("Voter already registered")
+        return self.register_voters([voter])
+
+    def unregister_voter(self, voter: str):
+        voter = voter.lower()
+        if voter not in self.state["registered"]:
+            raise Revert("Voter not registered")
+        self.state["registered"].discard(voter)
+        return self._mine([self._log("VoterUnregistered", [voter], [self.now])])
+
+    def set_registration_required(self, required: bool):
+        self.state["registration_required"] = required
+        return self._mine([])
+
+    def _cast_vote(self, voter: str, candidate_index: int):
+        state = self.state
+        if state["paused"]:
+            raise Revert("Pausable: paused")
+        if voter in state["voted"]:
+            raise Revert("You have already voted")
+        if candidate_index >= len(state["candidates"]):
+            raise Revert("Invalid candidate index")
+        if not self._voting_active(self.now):
+            raise Revert("Voting is not active")
+        if state["registration_required"] and voter not in state["registered"]:
+            raise Revert("You are not registered to vote")
+
+        state["candidates"][candidate_index][1] += 1
+        state["voted"].add(voter)
+        state["total_votes"] += 1
+        return self._mine([self._log("VoteCast", [voter, candidate_index], [self.now])])
+
+    def vote(self, voter: str, candidate_index: int):
+        """vote() with the face verification signature taken as valid"""
+        return self._cast_vote(voter.lower(), candidate_index)
+
+    def set_verification_signer(self, signer: str):
+        self.state["verification_signer"] = signer.lower()
+        return self._mine([])
+
+    def set_verified_voters_root(self, sender: str, root: bytes, leaf_count: int):
+        """setVerifiedVotersRoot(): the verification signer or an admin"""
+        if sender.lower() not in (self.state["verification_signer"], ADMIN_ADDRESS):
+            raise Revert("Caller cannot publish the voters root")
+        self.state["voters_root"] = root
+        return self._mine([self._log("VerifiedVotersRootUpdated", [root], [leaf_count, self.now])])
+
+    def vote_with_proof(self, voter: str, candidate_index: int, proof: List[bytes]):
+        """voteWithProof(): MerkleProof.verify(proof, verifiedVotersRoot, keccak256(abi.encodePacked(msg.sender)))"""
+        voter = voter.lower()
+        root = self.state["voters_root"]
+        if root == b"\x00" * 32:
+            raise Revert("Voters root not published")
+        computed = keccak(bytes.fromhex(voter[2:]))
+        for sibling in proof:
+            computed = keccak(computed + sibling) if computed < sibling else keccak(sibling + computed)
+        if computed != root:
+            raise Revert("Invalid allowlist proof")
+        return self._cast_vote(voter, candidate_index)
+
+    def add_candidate(self, name: str):
+        if self._voting_active(self.now):
+            raise Revert("Cannot add candidates during active voting")
+        self.state["candidates"].append([name, 0])
+        index = len(self.state["candidates"]) - 1
+        return self._mine([self._log("CandidateAdded", [], [name, index, self.now])])
+
+    def update_voting_period(self, start: int, end: int):
+        if start >= end:
+            raise Revert("Invalid time period")
+        self.state["voting_start"], self.state["voting_end"] = start, end
+        return self._mine([self._log("VotingTimesUpdated", [], [start, end, self.now])])
+
+    def pause(self, admin: str = ADMIN_ADDRESS):
+        self.state["paused"] = True
+        return self._mine([self._log("VotingPaused", [admin], [self.now])])
+
+    def unpause(self, admin: str = ADMIN_ADDRESS):
+        self.state["paused"] = False
+        return self._mine([self._log("VotingUnpaused", [admin], [self.now])])
+
+    # ---- JSON-RPC ----
+
+    def _block(self, tag) -> Optional[Dict]:
+        number = self.head if tag in ("latest", "pending", "safe", "finalized") else int(tag, 16)
+        return self.blocks[number] if 0 <= number <= self.head else None
+
+    def _eth_call(self, data: str) -> str:
+        raw = bytes.fromhex(data[2:])
+        state = self.state
+        views = {
+            selector("votingStart()"): lambda _args: (["uint256"], [state["voting_start"]]),
+            selector("votingEnd()"): lambda _args: (["uint256"], [state["voting_end"]]),
+            selector("paused()"): lambda _args: (["bool"], [state["paused"]]),
+            selector("totalVotes()"): lambda _args: (["uint256"], [state["total_votes"]]),
+            selector("voterRegistrationRequired()"): lambda _args: (["bool"], [state["registration_required"]]),
+            selector("getVotingStatus()"): lambda _args: (["bool"], [self._voting_active(self.blocks[-1]["timestamp"])]),
+            selector("hasVoted(address)"): lambda args: (["bool"], [args[0].lower() in state["voted"]]),
+            selector("registeredVoters(address)"): lambda args: (["bool"], [args[0].lower() in state["registered"]]),
+            selector("verifiedVotersRoot()"): lambda _args: (["bytes32"], [state["voters_root"]]),
+        }
+        address_arg = {selector("hasVoted(address)"), selector("registeredVoters(address)")}
+        view = views.get(raw[:4])
+        if view is None:
+            raise Revert("Unknown function selector")
+        args = decode(["address"], raw[4:]) if raw[:4] in address_arg else ()
+        types, values = view(args)
+        return "0x" + encode(types, values).hex()
+
+    def _send_raw(self, raw_hex: str) -> str:
+        """Execute a signed legacy transaction to the contract; returns its hash"""
+        raw = bytes.fromhex(raw_hex[2:])
+        fields = rlp.decode(raw)
+        if not isinstance(fields, list) or len(fields) != 9:
+            raise NotImplementedError("Only legacy transactions are supported")
+        nonce, to, data = int.from_bytes(fields[0], "big"), "0x" + fields[3].hex(), fields[5]
+        sender = Account.recover_transaction(raw).lower()
+        if nonce != self.nonces.get(sender, 0):
+            raise Revert(f"Invalid nonce {nonce} for {sender}")
+        if to != self.address:
+            raise Revert("Unknown contract")
+
+        functions = {
+            selector("setVerifiedVotersRoot(bytes32,uint256)"): (
+                ["bytes32", "uint256"], lambda args: self.set_verified_voters_root(sender, *args)),
+            selector("voteWithProof(uint256,bytes32[])"): (
+                ["uint256", "bytes32[]"], lambda args: self.vote_with_proof(sender, args[0], list(args[1]))),
+        }
+        if data[:4] not in functions:
+            raise Revert("Unknown function selector")
+        types, run = functions[data[:4]]
+        block = run(decode(types, data[4:]))
+
+        self.nonces[sender] = nonce + 1
+        tx_hash = "0x" + keccak(raw).hex()
+        self.receipts[tx_hash] = {
+            "transactionHash": tx_hash, "blockNumber": hex(block["number"]), "blockHash": block["hash"],
+            "from": sender, "to": to, "status": "0x1", "logs": [dict(log) for log in block["logs"]],
+        }
+        return tx_hash
+
+    def handle(self, method: str, params: List):
+        self.calls += 1
+        if method == "eth_chainId":
+            return hex(CHAIN_ID)
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method == "eth_getBlockByNumber":
+            block = self._block(params[0])
+            if block is None:
+                return None
+            return {
+                "number": hex(block["number"]), "hash": block["hash"],
+                "parentHash": block["parent_hash"], "timestamp": hex(block["timestamp"]),
+            }
+        if method == "eth_getLogs":
+            query = params[0]
+            start = int(query.get("fromBlock", "0x0"), 16)
+            end = min(int(query.get("toBlock", hex(self.head)), 16), self.head)
+            address = (query.get("address") or "").lower()
+            wanted = (query.get("topics") or [None])[0]
+            wanted = {wanted} if isinstance(wanted, str) else set(wanted or [])
+            return [
+                dict(log)
+                for block in self.blocks[start:end + 1]
+                for log in block["logs"]
+                if (not address or log["address"] == address) and (not wanted or log["topics"][0] in wanted)
+            ]
+        if method == "eth_gasPrice":
+            return hex(1_000_000_000)
+        if method == "eth_getTransactionCount":
+            return hex(self.nonces.get(params[0].lower(), 0))
+        if method == "eth_sendRawTransaction":
+            return self._send_raw(params[0])
+        if method == "eth_getTransactionReceipt":
+            return self.receipts.get(params[0])
+        if method == "eth_call":
+            if params[0].get("to", "").lower() != self.address:
+                return "0x"
+            return self._eth_call(params[0]["data"])
+        raise NotImplementedError(method)
+
+    def _respond(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        try:
+            result = {"jsonrpc": "2.0", "id": body.get("id"), "result": self.handle(body["method"], body.get("params", []))}
+        except (Revert, NotImplementedError) as e:
+            result = {"jsonrpc": "2.0", "id": body.get("id"), "error": {"code": -32000, "message": str(e)}}
+        return httpx.Response(200, json=result)
+
+    def transport(self) -> httpx.MockTransport:
+        """httpx transport answering JSON-RPC from this chain (ChainRpc(url, transport=...))"""
+        return httpx.MockTransport(self._respond)
@@ -0,0 +1,115 @@
+"""
+Face Verification Service - Merkle Allowlist Benchmark
+Builds, grows and proves a merkle_allowlist tree of synthetic wallets
+
+Times the initial build of `leaves` wallets (one append, hashed on
+`workers` processes), incremental appends of `batch` wallets on top of it
+(what each periodic build does as verifications arrive), and proofs for
+random voters against the root of the initial tree after it has grown,
+so the recomputed right edge is included. Only the tree files are timed;
+the database rows a build commits per batch do not depend on tree size.
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.load_test import percentile
+
+
+def synthetic_addresses(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [f"0x{rng.getrandbits(160):040x}" for _ in range(count)]
+
+
+def disk_mb(directory: str) -> float:
+    total = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith(".bin"))
+    return round(total / (1024 * 1024), 2)
+
+
+def run_merkle_benchmark(leaves: int = 1_000_000, batch: int = 100, batches: int = 50, proofs: int = 1000,
+                         workers: int = 1, directory: Optional[str] = None, seed: int = 0) -> Dict[str, Dict]:
+    from merkle_allowlist import MerkleStore, leaf_hash, verify_proof
+
+    owned = directory is None
+    directory = directory or tempfile.mkdtemp(prefix="faceservice-merkle-")
+    addresses = synthetic_addresses(leaves + batch * batches, seed)
+    store = MerkleStore(directory, workers)
+    try:
+        start = time.perf_counter()
+        store.append_addresses(addresses[:leaves])
+        store.flush()
+        build_seconds = time.perf_counter() - start
+        root = store.root(leaves)
+
+        append_ms = []
+        for i in range(batches):
+            chunk = addresses[leaves + i * batch:leaves + (i + 1) * batch]
+            start = time.perf_counter()
+            store.append_addresses(chunk)
+            store.flush()
+            append_ms.append((time.perf_counter() - start) * 1000)
+
+        rng = random.Random(seed + 1)
+        proof_us, lengths, verified = [], [], 0
+        for index in (rng.randrange(leaves) for _ in range(proofs)):
+            start = time.perf_counter()
+            proof = store.proof(index, leaves)
+            proof_us.append((time.perf_counter() - start) * 1e6)
+            lengths.append(len(proof))
+            verified += verify_proof(proof, root, leaf_hash(addresses[index]))
+
+        start = time.perf_counter()
+        root_stable = store.root(leaves) == root
+        root_ms = (time.perf_counter() - start) * 1000
+        size_mb = disk_mb(directory)
+    finally:
+        store.close()
+        if owned:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        "build": {
+            "leaves": leaves,
+            "workers": workers,
+            "seconds": round(build_seconds, 3),
+            "leaves_per_second": round(leaves / build_seconds, 1) if build_seconds else 0.0,
+            "disk_mb": size_mb,
+            "root": "0x" + root.hex(),
+        },
+        "append": {
+            "batch": batch,
+            "batches": batches,
+            "p50_ms": round(percentile(append_ms, 50), 3),
+            "p95_ms": round(percentile(append_ms, 95), 3),
+            "us_per_leaf": round(sum(append_ms) * 1000 / (batch * batches), 2) if batch * batches else 0.0,
+        },
+        "proof": {
+            "count": proofs,
+            "verified": verified,
+            "nodes": round(sum(lengths) / len(lengths), 2) if lengths else 0.0,
+            "p50_us": round(percentile(proof_us, 50), 1),
+            "p95_us": round(percentile(proof_us, 95), 1),
+            "p99_us": round(percentile(proof_us, 99), 1),
+            "old_root_ms": round(root_ms, 3),
+            "old_root_stable": root_stable,
+        },
+    }
+
+
+def format_merkle_results(results: Dict[str, Dict]) -> str:
+    build, append, proof = results["build"], results["append"], results["proof"]
+    return "\n".join([
+        f"build      {build['leaves']:,} leaves in {build['seconds']:.2f} s on {build['workers']} worker(s)"
+        f" ({build['leaves_per_second']:,.0f} leaves/s, {build['disk_mb']:.1f} MB on disk)",
+        f"append     {append['batches']} x {append['batch']} leaves: p50 {append['p50_ms']:.2f} ms,"
+        f" p95 {append['p95_ms']:.2f} ms ({append['us_per_leaf']:.1f} µs per leaf)",
+        f"proof      {proof['count']} proofs of {proof['nodes']:.1f} nodes against the pre-append root:"
+        f" p50 {proof['p50_us']:.0f} µs, p95 {proof['p95_us']:.0f} µs, p99 {proof['p99_us']:.0f} µs"
+        f" ({proof['verified']}/{proof['count']} verified)",
+        f"old root   recomputed in {proof['old_root_ms']:.2f} ms"
+        f" ({'unchanged' if proof['old_root_stable'] else 'MISMATCH'} after the appends)",
+    ])
@@ -0,0 +1,107 @@
+"""
+Face Verification Service - Overload Benchmark
+Verify latency while an enroll flood competes for the same model
+
+The stub analyzer runs in exclusive mode: one model call at a time, like a
+CPU already saturated by a single inference. Each scenario enrolls the
+verify users first, then drives steady /verify traffic alongside a flood
+of /enroll requests, once with admission control disabled and once with
+it enabled (plus an unloaded reference run). With admission control the
+flood is held to its share of the limit, and shed with 503 once it queues
+behind verify, so verify p99 stays close to its unloaded latency.
+"""
+
+import asyncio
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.load_test import drive, load_app
+
+# "unloaded" runs verify alone, as the reference for the other two
+SCENARIOS = ("unloaded", "admission_off", "admission_on")
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    images: List[str],
+    verify_requests: int,
+    verify_concurrency: int,
+    flood_requests: int,
+    flood_concurrency: int,
+    scenario: str,
+) -> Dict[str, Dict]:
+    users = [f"0x{scenario[:2].encode().hex()}{i:036x}" for i in range(len(images))]
+    flood_users = [f"0xf{i:039x}" for i in range(flood_requests)]
+
+    for user, image in zip(users, images):
+        await client.post("/enroll", json={"user_id": user, "image": image})
+
+    verify = drive(client, lambda i: {
+        "method": "POST", "url": "/verify",
+        "json": {"user_id": users[i % len(users)], "image": images[i % len(images)], "skip_liveness": True},
+    }, verify_requests, verify_concurrency)
+    flood = drive(client, lambda i: {
+        "method": "POST", "url": "/enroll",
+        "json": {"user_id": flood_users[i], "image": images[i % len(images)]},
+    }, flood_requests if scenario != "unloaded" else 0, flood_concurrency)
+
+    verify_stats, flood_stats = await asyncio.gather(verify, flood)
+    return {"verify": verify_stats, "enroll_flood": flood_stats}
+
+
+async def run_overload_benchmark(
+    images: List[str],
+    verify_requests: int = 60,
+    verify_concurrency: int = 2,
+    flood_requests: int = 200,
+    flood_concurrency: int = 16,
+    stub_latency_ms: float = 10.0,
+    target_latency_ms: float = None,
+) -> Dict[str, Dict]:
+    """Run the overload mix with admission control off and on; returns stats per scenario"""
+    import admission
+    from config import settings
+    from benchmarks.stub_analyzer import install_stub_analyzer
+
+    app = await load_app()
+    install_stub_analyzer(latency_ms=stub_latency_ms, exclusive=True)
+
+    saved = (settings.admission_enabled, settings.admission_target_latency_ms,
+             settings.verify_cache_enabled, admission.controller)
+    # Every verify must reach the model
+    settings.verify_cache_enabled = False
+    settings.admission_target_latency_ms = target_latency_ms or stub_latency_ms * 4
+
+    results = {}
+    try:
+        for scenario in SCENARIOS:
+            settings.admission_enabled = scenario != "admission_off"
+            admission.controller = admission.AdmissionController.from_settings()
+
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                results[scenario] = await run_scenario(
+                    client, images, verify_requests, verify_concurrency,
+                    flood_requests, flood_concurrency, scenario,
+                )
+            results[scenario]["final_limit"] = round(admission.controller.limit, 2)
+    finally:
+        (settings.admission_enabled, settings.admission_target_latency_ms,
+         settings.verify_cache_enabled, admission.controller) = saved
+
+    return results
+
+
+def format_overload_results(results: Dict[str, Dict]) -> str:
+    lines = [
+        f"{'scenario':<15}{'verify p50':>12}{'verify p99':>12}{'verify err':>12}{'enroll ok':>11}{'enroll shed':>13}{'limit':>7}",
+        "-" * 82,
+    ]
+    for scenario, row in results.items():
+        verify, flood = row["verify"], row["enroll_flood"]
+        lines.append(
+            f"{scenario:<15}{verify['p50_ms']:>12.1f}{verify['p99_ms']:>12.1f}{verify['errors']:>12}"
+            f"{flood['count'] - flood['errors']:>11}{flood['errors']:>13}{row['final_limit']:>7}"
+        )
+    return "\n".join(lines)
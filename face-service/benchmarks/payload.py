@@ -0,0 +1,101 @@
+"""
+Face Verification Service - Request Body Parse Benchmark
+Measures JSON + base64 parse overhead per MB of image payload
+
+"before" is the previous path: buffer the body, json.loads it into a str,
+validate with a pydantic model, then split the data URL and b64decode.
+"after" is request_body.ImagePayloadParser fed in ASGI-sized chunks.
+"""
+
+import base64
+import json
+import os
+import time
+from typing import Dict, List
+
+from pydantic import BaseModel, field_validator
+
+from request_body import ImagePayloadParser
+
+# Typical ASGI server read size
+CHUNK_SIZE = 64 * 1024
+
+
+class LegacyVerifyRequest(BaseModel):
+    """The request model as it was before streaming bodies"""
+    user_id: str
+    image: str
+    skip_liveness: bool = False
+
+    @field_validator('user_id')
+    @classmethod
+    def validate_user_id(cls, v):
+        return v.strip().lower()
+
+    @field_validator('image')
+    @classmethod
+    def validate_image(cls, v):
+        if not v or len(v) < 100:
+            raise ValueError("Invalid image data")
+        return v
+
+
+def make_body(image_bytes: int) -> bytes:
+    image = base64.b64encode(os.urandom(image_bytes)).decode()
+    return json.dumps({
+        "user_id": "0x71C7656EC7ab88b098defB751B7401B5f6d8976F",
+        "image": "data:image/jpeg;base64," + image,
+        "skip_liveness": False,
+    }).encode()
+
+
+def parse_legacy(body: bytes) -> bytes:
+    data = LegacyVerifyRequest.model_validate(json.loads(body))
+    image = data.image.split(",")[1] if "," in data.image else data.image
+    return base64.b64decode(image)
+
+
+def parse_streaming(body: bytes) -> memoryview:
+    parser = ImagePayloadParser(size_hint=len(body))
+    view = memoryview(body)
+    for start in range(0, len(body), CHUNK_SIZE):
+        parser.feed(bytes(view[start:start + CHUNK_SIZE]))
+    return parser.close()[1]
+
+
+def time_per_call(fn, body: bytes, repeat: int) -> float:
+    fn(body)  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(body)
+    return (time.perf_counter() - start) / repeat
+
+
+def run_payload_benchmark(sizes_kb: List[int], repeat: int = 20) -> List[Dict]:
+    """Time both parse paths for each decoded image size; returns one row per size"""
+    rows = []
+    for size_kb in sizes_kb:
+        body = make_body(size_kb * 1024)
+        assert bytes(parse_streaming(body)) == parse_legacy(body)
+
+        body_mb = len(body) / (1024 * 1024)
+        before = time_per_call(parse_legacy, body, repeat)
+        after = time_per_call(parse_streaming, body, repeat)
+        rows.append({
+            "image_kb": size_kb,
+            "body_mb": round(body_mb, 3),
+            "before_ms_per_mb": round(before * 1000 / body_mb, 3),
+            "after_ms_per_mb": round(after * 1000 / body_mb, 3),
+            "speedup": round(before / after, 2) if after else None,
+        })
+    return rows
+
+
+def format_payload_results(rows: List[Dict]) -> str:
+    lines = [f"{'image KB':>9}{'body MB':>9}{'before ms/MB':>14}{'after ms/MB':>13}{'speedup':>9}", "-" * 54]
+    for row in rows:
+        lines.append(
+            f"{row['image_kb']:>9}{row['body_mb']:>9.2f}{row['before_ms_per_mb']:>14.3f}"
+            f"{row['after_ms_per_mb']:>13.3f}{row['speedup']:>8.2f}x"
+        )
+    return "\n".join(lines)
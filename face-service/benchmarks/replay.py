@@ -0,0 +1,266 @@
+"""
+Face Verification Service - Trace Replay
+Drives the app in-process with traffic recorded by capture.py
+
+Requests are sent at their original arrival offsets, divided by `speed`
+(2.0 = twice the production rate, 0 = as fast as `concurrency` allows).
+Requests of the same user always run in their original order, so the
+outcomes are deterministic however much the timing is compressed.
+
+Each pseudonymous user gets a fixed wallet address and a synthetic face
+with the dimensions and format of the captured upload; an upload that
+originally did not match gets a different face, so mismatches replay as
+mismatches. Users whose first captured request found them already
+enrolled are enrolled before the replay starts. Run against a copy of a
+production database (--db) to keep its size and shape.
+
+Save a run per code version and diff them:
+
+    python -m benchmarks replay traces/ --stub-analyzer --save old.json
+    git checkout <new> && python -m benchmarks replay traces/ --stub-analyzer --save new.json
+    python -m benchmarks replay-diff old.json new.json
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import cv2
+import httpx
+
+from benchmarks.load_test import RssSampler, percentile, summarize
+from benchmarks.synthetic import generate_face_image
+
+# Outcomes showing the user already had an enrollment
+ENROLLED_OUTCOMES = ("verified", "rejected:liveness", "rejected:mismatch", "enrolled")
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open
+HISTOGRAM_BOUNDS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+DEFAULT_SIZE = (640, 480)
+
+
+def user_address(user: str) -> str:
+    """Deterministic fake wallet address for a trace pseudonym"""
+    return "0x" + hashlib.sha256(f"replay:{user}".encode()).hexdigest()[:40]
+
+
+class SyntheticUploads:
+    """Data URLs standing in for captured images (cached per user/size/format/variant)"""
+
+    def __init__(self):
+        self._cache: Dict[tuple, str] = {}
+
+    def image(self, user: str, image: Optional[Dict] = None, impostor: bool = False) -> str:
+        image = image or {}
+        width, height = image.get("w") or DEFAULT_SIZE[0], image.get("h") or DEFAULT_SIZE[1]
+        kind = "png" if (image.get("format") or "").upper() == "PNG" else "jpeg"
+        key = (user, width, height, kind, impostor)
+        if key not in self._cache:
+            seed = int(hashlib.sha256(f"{user}:{impostor}".encode()).hexdigest()[:8], 16)
+            frame = generate_face_image(seed, width, height)
+            ok, encoded = cv2.imencode(".png" if kind == "png" else ".jpg", frame)
+            self._cache[key] = f"data:image/{kind};base64," + base64.b64encode(encoded.tobytes()).decode()
+        return self._cache[key]
+
+
+def request_for(record: Dict, uploads: SyntheticUploads) -> Dict:
+    """httpx request arguments for one trace record"""
+    user = record.get("user") or "anonymous"
+    if record["endpoint"] == "status":
+        return {"method": "GET", "url": f"/status/{user_address(user)}"}
+
+    if record.get("malformed"):
+        return {"method": "POST", "url": f"/{record['endpoint']}", "content": b"{", "headers": {"Content-Type": "application/json"}}
+    body = {
+        "user_id": user_address(user),
+        "image": uploads.image(user, record.get("image"), impostor=record.get("outcome") == "rejected:mismatch"),
+    }
+    if record["endpoint"] == "verify":
+        body["skip_liveness"] = record.get("skip_liveness", False)
+    return {"method": "POST", "url": f"/{record['endpoint']}", "json": body}
+
+
+def users_to_seed(records: List[Dict]) -> Dict[str, Optional[Dict]]:
+    """
+    Users that were enrolled before their first captured request, mapped to
+    the first image they uploaded (so the seeded face has the same size)
+    """
+    first: Dict[str, Dict] = {}
+    images: Dict[str, Dict] = {}
+    for record in records:
+        if record.get("user"):
+            first.setdefault(record["user"], record)
+            if record.get("image"):
+                images.setdefault(record["user"], record["image"])
+    return {
+        user: images.get(user) for user, record in first.items()
+        if record["endpoint"] != "enroll" and record.get("outcome") in ENROLLED_OUTCOMES
+    }
+
+
+def histogram(latencies_ms: List[float]) -> Dict[str, int]:
+    buckets = Counter()
+    for value in latencies_ms:
+        bound = next((b for b in HISTOGRAM_BOUNDS_MS if value <= b), None)
+        buckets[f"<={bound}" if bound else f">{HISTOGRAM_BOUNDS_MS[-1]}"] += 1
+    labels = [f"<={b}" for b in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}"]
+    return {label: buckets[label] for label in labels if buckets[label]}
+
+
+def summarize_endpoint(results: List[Dict], elapsed: float, peak_rss: int) -> Dict:
+    """load_test-style stats plus histogram and outcome counts; 5xx count as errors"""
+    ok = [r["latency_ms"] / 1000 for r in results if r["status"] < 500]
+    stats = summarize(ok, len(results) - len(ok), elapsed, peak_rss)
+    stats["histogram"] = histogram([r["latency_ms"] for r in results])
+    stats["outcomes"] = dict(Counter(r["outcome"] for r in results))
+    stats["max_lag_ms"] = round(max((r["lag_ms"] for r in results), default=0.0), 3)
+    return stats
+
+
+def captured_stats(records: List[Dict]) -> Dict[str, Dict]:
+    """Latency distribution of the trace itself, as production saw it"""
+    by_endpoint = defaultdict(list)
+    for record in records:
+        by_endpoint[record["endpoint"]].append(record.get("latency_ms", 0.0))
+    return {
+        name: {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+        }
+        for name, values in by_endpoint.items()
+    }
+
+
+def copy_database(source: str) -> str:
+    """Copy a SQLite database into a temp dir so the replay never writes to the original"""
+    target = os.path.join(tempfile.mkdtemp(prefix="faceservice-replay-"), os.path.basename(source))
+    shutil.copy2(source, target)
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(source + suffix):
+            shutil.copy2(source + suffix, target + suffix)
+    return target
+
+
+async def replay(
+    client: httpx.AsyncClient,
+    records: List[Dict],
+    speed: float = 1.0,
+    concurrency: int = 64,
+    server_pid: Optional[int] = None,
+) -> Dict:
+    """
+    Seed the users that already existed, then replay `records`
+
+    Returns {"endpoints": stats per endpoint, "outcomes": [outcome per record]}
+    """
+    from capture import outcome_of
+
+    uploads = SyntheticUploads()
+    for user, image in users_to_seed(records).items():
+        response = await client.post("/enroll", json={"user_id": user_address(user), "image": uploads.image(user, image)})
+        if not response.is_success:
+            raise RuntimeError(f"Seeding user {user} failed: {response.status_code} {response.text[:200]}")
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    previous: Dict[str, asyncio.Task] = {}
+    results: List[Optional[Dict]] = [None] * len(records)
+    origin = records[0]["ts"] if records else 0.0
+
+    async def send(i: int, record: Dict, after: Optional[asyncio.Task], due: float):
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if after is not None:
+            await asyncio.wait([after])
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.request(**request_for(record, uploads))
+                status, body = response.status_code, response.content
+            except httpx.HTTPError as e:
+                status, body = 599, str(e).encode()
+            latency_ms = (time.perf_counter() - started) * 1000
+        results[i] = {
+            "endpoint": record["endpoint"],
+            "status": status,
+            "outcome": outcome_of(record["endpoint"], status, body),
+            "latency_ms": latency_ms,
+            "lag_ms": max(0.0, (started - due) * 1000),
+        }
+
+    with RssSampler(pid=server_pid) as sampler:
+        start = time.perf_counter()
+        tasks = []
+        for i, record in enumerate(records):
+            due = start + ((record["ts"] - origin) / speed if speed > 0 else 0.0)
+            user = record.get("user") or f"anonymous-{i}"
+            task = asyncio.create_task(send(i, record, previous.get(user), due))
+            previous[user] = task
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    by_endpoint = defaultdict(list)
+    for result in results:
+        by_endpoint[result["endpoint"]].append(result)
+    return {
+        "endpoints": {name: summarize_endpoint(rows, elapsed, sampler.peak_bytes) for name, rows in by_endpoint.items()},
+        "outcomes": [result["outcome"] for result in results],
+    }
+
+
+async def replay_in_process(records: List[Dict], speed: float = 1.0, concurrency: int = 64,
+                            stub_analyzer: bool = False, stub_latency_ms: float = 0.0) -> Dict:
+    """Replay against the ASGI app in this process (call prepare_environment first)"""
+    from benchmarks.load_test import load_app
+
+    app = await load_app(stub_analyzer=stub_analyzer, stub_latency_ms=stub_latency_ms)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=120.0) as client:
+        return await replay(client, records, speed=speed, concurrency=concurrency)
+
+
+def diff_outcomes(old: List[str], new: List[str]) -> Dict:
+    """Per-request outcome changes between two replays of the same trace"""
+    if len(old) != len(new):
+        raise ValueError(f"Replays cover different traces ({len(old)} vs {len(new)} requests)")
+    changes = Counter(f"{a} -> {b}" for a, b in zip(old, new) if a != b)
+    return {
+        "requests": len(old),
+        "changed": sum(changes.values()),
+        "transitions": dict(changes.most_common()),
+    }
+
+
+def format_replay(result: Dict, captured: Optional[Dict] = None) -> str:
+    lines = [
+        f"{'endpoint':<10}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'max lag':>10}",
+        "-" * 74,
+    ]
+    for name, stats in result["endpoints"].items():
+        lines.append(
+            f"{name:<10}{stats['count']:>7}{stats['errors']:>8}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+            f"{stats['p99_ms']:>10.2f}{stats['rps']:>9.1f}{stats['max_lag_ms']:>10.1f}"
+        )
+    for name, stats in result["endpoints"].items():
+        lines.append(f"\n{name} latency: " + "  ".join(f"{k} ms: {v}" for k, v in stats["histogram"].items()))
+        lines.append(f"{name} outcomes: " + ", ".join(f"{k} {v}" for k, v in sorted(stats["outcomes"].items())))
+        if captured and name in captured:
+            c = captured[name]
+            lines.append(f"{name} as captured: p50 {c['p50_ms']:.1f} ms, p95 {c['p95_ms']:.1f} ms, p99 {c['p99_ms']:.1f} ms")
+    return "\n".join(lines)
+
+
+def format_outcome_diff(diff: Dict) -> str:
+    lines = [f"{diff['changed']} of {diff['requests']} requests changed outcome"]
+    lines.extend(f"  {count:>6}  {transition}" for transition, count in diff["transitions"].items())
+    return "\n".join(lines)
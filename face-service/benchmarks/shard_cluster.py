@@ -0,0 +1,143 @@
+"""
+Face Verification Service - Local Shard Cluster
+Runs several face-service nodes as local processes, each with its own SQLite file
+
+Every node is a real uvicorn server with the stub face analyzer, configured
+through the SHARD_* settings like a deployed node, so routing between nodes
+and rebalancing go over actual HTTP.
+
+    cluster = LocalCluster()
+    cluster.start({"a": cluster.free_url(), "b": cluster.free_url()})
+    ...
+    cluster.stop()
+
+One node on its own: python -m benchmarks.shard_cluster --node a --nodes a=http://127.0.0.1:8101,... --db a.db
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_KEY = "local-cluster-admin"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def format_nodes(nodes: Dict[str, str]) -> str:
+    return ",".join(f"{name}={url}" for name, url in nodes.items())
+
+
+class LocalCluster:
+    """Shard nodes as child processes; node name -> base URL"""
+
+    def __init__(self, workdir: Optional[str] = None, admin_key: str = ADMIN_KEY, routing: str = "proxy"):
+        self.workdir = workdir or tempfile.mkdtemp(prefix="faceservice-shards-")
+        self.admin_key = admin_key
+        self.routing = routing
+        self.urls: Dict[str, str] = {}
+        self._processes: Dict[str, subprocess.Popen] = {}
+
+    @staticmethod
+    def free_url() -> str:
+        return f"http://127.0.0.1:{free_port()}"
+
+    def db_path(self, node: str) -> str:
+        return os.path.join(self.workdir, f"{node}.db")
+
+    def start(self, nodes: Dict[str, str], previous: Optional[Dict[str, str]] = None,
+              only: Optional[list] = None, timeout: float = 60.0):
+        """Start the nodes of `nodes` (or just `only`) and wait until they answer /health"""
+        names = only or list(nodes)
+        for name in names:
+            command = [
+                sys.executable, "-m", "benchmarks.shard_cluster",
+                "--node", name, "--nodes", format_nodes(nodes), "--db", self.db_path(name),
+                "--admin-key", self.admin_key, "--routing", self.routing,
+            ]
+            if previous:
+                command += ["--previous", format_nodes(previous)]
+            self._processes[name] = subprocess.Popen(
+                command, cwd=SERVICE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+            self.urls[name] = nodes[name]
+
+        deadline = time.monotonic() + timeout
+        for name in names:
+            while True:
+                if self._processes[name].poll() is not None:
+                    raise RuntimeError(f"Node {name} exited: {self._processes[name].stderr.read().decode()[-2000:]}")
+                try:
+                    if httpx.get(f"{self.urls[name]}/health", timeout=1.0).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Node {name} did not start within {timeout}s")
+                time.sleep(0.1)
+
+    def admin_headers(self) -> Dict[str, str]:
+        return {"X-Admin-Key": self.admin_key}
+
+    def stop(self):
+        for process in self._processes.values():
+            process.terminate()
+        for process in self._processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            if process.stderr:
+                process.stderr.close()
+        self._processes.clear()
+
+
+def serve(args):
+    """Run one node in this process"""
+    os.environ.update({
+        "SHARD_NODE_ID": args.node,
+        "SHARD_NODES": args.nodes,
+        "SHARD_PREVIOUS_NODES": args.previous or "",
+        "SHARD_ROUTING": args.routing,
+        "ADMIN_API_KEY": args.admin_key,
+        "ENROLLED_FILTER_REFRESH_SECONDS": "0",
+        "LOG_COMPACTION_INTERVAL_MINUTES": "0",
+    })
+    from benchmarks.load_test import prepare_environment
+    prepare_environment(args.db)
+
+    import asyncio
+    import uvicorn
+    from benchmarks.load_test import load_app
+
+    port = urlparse(dict(part.split("=", 1) for part in args.nodes.split(","))[args.node]).port
+
+    async def run():
+        app = await load_app(stub_analyzer=True)
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        await server.serve()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.shard_cluster", description=__doc__)
+    parser.add_argument("--node", required=True, help="This node's name")
+    parser.add_argument("--nodes", required=True, help="Shard map: name=url,name=url,...")
+    parser.add_argument("--previous", help="Previous shard map while rebalancing")
+    parser.add_argument("--db", required=True, help="SQLite file of this node")
+    parser.add_argument("--admin-key", default=ADMIN_KEY)
+    parser.add_argument("--routing", default="proxy", choices=("proxy", "redirect"))
+    serve(parser.parse_args())
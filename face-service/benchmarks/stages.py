@@ -0,0 +1,90 @@
+"""
+Face Verification Service - Pipeline Stage Benchmark
+/verify throughput and per-stage utilization for several worker allocations
+
+Each allocation ("decode,infer,score,persist" worker counts) reconfigures
+the pipeline stages, then drives the same verify load through the
+in-process app. Next to throughput and latency the table shows how busy
+each stage's threads were and how long items waited in its queue, which
+is what to look at when deciding how many cores inference gets: a stage
+near 100% utilization with growing waits is the bottleneck, one near 0%
+has threads to spare. The result cache is off so every request runs the
+stages; with the stub analyzer only model time is simulated (decode,
+scoring and signing are real).
+"""
+
+from typing import Dict, List, Sequence
+
+import httpx
+
+from benchmarks.load_test import drive, load_app
+
+DEFAULT_ALLOCATIONS = ("1,1,1,1", "2,1,1,1", "2,2,1,1")
+
+
+def parse_allocation(spec: str) -> List[int]:
+    workers = [int(part) for part in spec.split(",")]
+    if len(workers) != 4 or min(workers) < 1:
+        raise ValueError(f"Allocation must be four positive worker counts (decode,infer,score,persist): {spec!r}")
+    return workers
+
+
+async def run_stage_benchmark(
+    images: List[str],
+    requests: int = 200,
+    concurrency: int = 8,
+    allocations: Sequence[str] = DEFAULT_ALLOCATIONS,
+    stub_analyzer: bool = True,
+    stub_latency_ms: float = 10.0,
+) -> Dict[str, Dict]:
+    """Verify load per allocation; returns {allocation: {"verify": stats, "stages": per-stage stats}}"""
+    from metrics import metrics
+    from pipeline import Pipeline, pipeline
+    from verification_cache import verification_cache
+
+    app = await load_app(stub_analyzer=stub_analyzer, stub_latency_ms=stub_latency_ms)
+    users = [f"0x57a9e{i:035x}" for i in range(len(images))]
+
+    # The cache size is fixed when it is created, so switch it off directly
+    saved = verification_cache.max_entries
+    verification_cache.max_entries = 0
+    verification_cache.clear()
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for user, image in zip(users, images):
+                await client.post("/enroll", json={"user_id": user, "image": image})
+
+            for spec in allocations:
+                decode, infer, score, persist = parse_allocation(spec)
+                pipeline.configure(**dict(
+                    Pipeline.settings_kwargs(), decode_workers=decode, infer_workers=infer,
+                    score_workers=score, persist_workers=persist,
+                ))
+                metrics.reset()
+                verify = await drive(client, lambda i: {
+                    "method": "POST", "url": "/verify",
+                    "json": {"user_id": users[i % len(users)], "image": images[i % len(images)], "skip_liveness": True},
+                }, requests, concurrency)
+                results[spec] = {"verify": verify, "stages": pipeline.stats()}
+    finally:
+        verification_cache.max_entries = saved
+        pipeline.configure(**Pipeline.settings_kwargs())
+
+    return results
+
+
+def format_stage_results(results: Dict[str, Dict]) -> str:
+    stage_names = next(iter(results.values()))["stages"].keys() if results else ()
+    header = f"{'allocation':<12}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'err':>5}"
+    header += "".join(f"{name + ' util/wait':>22}" for name in stage_names)
+    lines = [header, "-" * len(header)]
+    for spec, row in results.items():
+        verify = row["verify"]
+        line = f"{spec:<12}{verify['rps']:>8.1f}{verify['p50_ms']:>9.1f}{verify['p95_ms']:>9.1f}{verify['errors']:>5}"
+        for stats in row["stages"].values():
+            wait = stats["wait_p50_ms"] or 0.0
+            line += f"{stats['utilization'] * 100:>12.0f}% {wait:>7.2f} ms"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,169 @@
+"""
+Face Verification Service - Stub Face Analyzer
+Drop-in replacement for InsightFace so benchmarks can isolate framework overhead
+"""
+
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from backends import InferenceBackend
+from benchmarks.synthetic import face_bbox
+
+
+class StubFace:
+    """Minimal stand-in for insightface.app.common.Face"""
+
+    def __init__(self, bbox, kps, det_score, embedding):
+        self.bbox = bbox
+        self.kps = kps
+        self.det_score = det_score
+        self.embedding = embedding
+
+
+class StubDetector:
+    """Mimics RetinaFace.detect(): one face at the synthetic face position"""
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.calls = 0
+
+    def detect(self, img, input_size=None, max_num=0, metric='default'):
+        self.calls += 1
+        # Detector cost grows with the input area; latency_ms is the 640x640 cost
+        width, height = input_size or (640, 640)
+        self.owner.sleep(width * height / (640 * 640))
+
+        height, width = img.shape[:2]
+        x1, y1, x2, y2 = face_bbox(width, height)
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        dx, dy = (x2 - x1) / 5, (y2 - y1) / 8
+        kps = np.array([
+            [cx - dx, cy - dy], [cx + dx, cy - dy], [cx, cy],
+            [cx - dx, cy + 2 * dy], [cx + dx, cy + 2 * dy],
+        ], dtype=np.float32)
+
+        bboxes = np.array([[x1, y1, x2, y2, 0.95]], dtype=np.float32)
+        return bboxes, kps[np.newaxis]
+
+
+class StubRecognizer:
+    """
+    Mimics ArcFaceONNX.get(): the embedding is derived from the pixel data,
+    so the same image always produces the same embedding and different
+    images produce unrelated ones
+    """
+
+    def __init__(self, owner, embedding_size: int):
+        self.owner = owner
+        self.embedding_size = embedding_size
+        self.calls = 0
+        # Changing the salt simulates switching to a different recognition model
+        self.seed_salt = 0
+
+    def get(self, img, face):
+        self.calls += 1
+        self.owner.sleep()
+
+        seed = zlib.crc32(np.ascontiguousarray(img[::8, ::8]).tobytes()) ^ self.seed_salt
+        face.embedding = np.random.default_rng(seed).standard_normal(self.embedding_size).astype(np.float32)
+        return face.embedding
+
+    def get_feat(self, imgs):
+        """Embeddings of aligned crops, one row per crop"""
+        if not isinstance(imgs, list):
+            imgs = [imgs]
+        self.calls += 1
+        self.owner.sleep()
+
+        rows = []
+        for img in imgs:
+            seed = zlib.crc32(np.ascontiguousarray(img).tobytes()) ^ self.seed_salt
+            rows.append(np.random.default_rng(seed).standard_normal(self.embedding_size).astype(np.float32))
+        return np.stack(rows)
+
+
+class StubFaceAnalysis(InferenceBackend):
+    """
+    Mimics FaceAnalysis without running any model
+
+    An InferenceBackend whose det_model and models['recognition'] are
+    stubs, so the cascaded pipeline in face_processor runs unchanged. Each
+    stage counts its calls. `latency_ms` optionally simulates the cost of
+    each model call with a blocking sleep.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms: float = 0.0, embedding_size: int = 512, exclusive: bool = False):
+        self.latency_ms = latency_ms
+        # Exclusive stubs serialize model calls, like a CPU already saturated by one inference
+        self._device = threading.Lock() if exclusive else None
+        super().__init__(StubDetector(self), StubRecognizer(self, embedding_size))
+
+    def sleep(self, scale: float = 1.0):
+        if not self.latency_ms:
+            return
+        if self._device is None:
+            time.sleep(self.latency_ms * scale / 1000.0)
+            return
+        with self._device:
+            time.sleep(self.latency_ms * scale / 1000.0)
+
+    def prepare(self, det_size: int = 640):
+        pass
+
+    def get(self, img, max_num=0):
+        bboxes, kpss = self.det_model.detect(img, max_num=max_num)
+        faces = []
+        for bbox, kps in zip(bboxes, kpss):
+            face = StubFace(bbox=bbox[0:4], kps=kps, det_score=bbox[4], embedding=None)
+            self.models["recognition"].get(img, face)
+            faces.append(face)
+        return faces
+
+
+def install_stub_analyzer(latency_ms: float = 0.0, exclusive: bool = False) -> StubFaceAnalysis:
+    """Replace the process-wide face analyzer with a stub"""
+    import face_processor
+
+    stub = StubFaceAnalysis(latency_ms=latency_ms, exclusive=exclusive)
+    face_processor._face_analyzer = stub
+    return stub
+
+
+class StubModelInput:
+    def __init__(self, name, shape):
+        self.name = name
+        self.shape = shape
+
+
+class StubAntiSpoofSession:
+    """
+    Mimics an onnxruntime.InferenceSession for a two-class anti-spoof model
+
+    The live logit grows with the fine texture of the crop, which a
+    recaptured photo or screen loses; `latency_ms` simulates the model cost
+    per run (one run per batch, not per crop).
+    """
+
+    def __init__(self, latency_ms: float = 0.0, size: int = 80, pivot: float = 6.0):
+        self.latency_ms = latency_ms
+        self.size = size
+        self.pivot = pivot
+        self.runs = 0
+
+    def get_inputs(self):
+        return [StubModelInput("input", ["batch", 3, self.size, self.size])]
+
+    def run(self, output_names, feeds):
+        self.runs += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+        batch = next(iter(feeds.values()))
+        texture = np.abs(np.diff(batch, axis=3)).mean(axis=(1, 2, 3))
+        live = (texture - self.pivot) / 2.0
+        return [np.stack([-live, live], axis=1).astype(np.float32)]
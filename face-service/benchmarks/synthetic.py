@@ -0,0 +1,91 @@
+"""
+Face Verification Service - Synthetic Face Images
+Generates deterministic webcam-like frames for load testing
+"""
+
+import base64
+import os
+from typing import List
+
+import cv2
+import numpy as np
+
+# Geometry of the drawn face, relative to the frame size.
+# The stub analyzer reports a bounding box built from the same values.
+FACE_CENTER = (0.5, 0.48)
+FACE_AXES = (0.18, 0.30)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def face_bbox(width: int, height: int) -> List[float]:
+    """Bounding box [x1, y1, x2, y2] of the synthetic face in a frame"""
+    cx, cy = FACE_CENTER[0] * width, FACE_CENTER[1] * height
+    ax, ay = FACE_AXES[0] * width, FACE_AXES[1] * height
+    return [cx - ax, cy - ay, cx + ax, cy + ay]
+
+
+def generate_face_image(seed: int, width: int = 640, height: int = 480) -> np.ndarray:
+    """
+    Draw a synthetic face (BGR) with a textured background
+    The same seed always produces the same frame, so enroll/verify pairs match
+    """
+    rng = np.random.default_rng(seed)
+
+    # Noisy background keeps JPEG sizes close to a real webcam capture
+    image = rng.integers(40, 200, size=(height, width, 3), dtype=np.uint8)
+    image = cv2.GaussianBlur(image, (5, 5), 0)
+
+    cx, cy = int(FACE_CENTER[0] * width), int(FACE_CENTER[1] * height)
+    ax, ay = int(FACE_AXES[0] * width), int(FACE_AXES[1] * height)
+
+    # Skin tone varies per identity
+    skin = tuple(int(c) for c in rng.integers([90, 120, 160], [150, 180, 230]))
+    cv2.ellipse(image, (cx, cy), (ax, ay), 0, 0, 360, skin, -1)
+
+    # Eyes, nose and mouth
+    eye_dy = int(ay * 0.25)
+    eye_dx = int(ax * 0.4)
+    eye_r = max(3, int(ax * 0.12))
+    for side in (-1, 1):
+        cv2.circle(image, (cx + side * eye_dx, cy - eye_dy), eye_r, (255, 255, 255), -1)
+        cv2.circle(image, (cx + side * eye_dx, cy - eye_dy), eye_r // 2, (40, 30, 20), -1)
+    cv2.line(image, (cx, cy - eye_dy // 2), (cx, cy + eye_dy), (60, 80, 120), 2)
+    cv2.ellipse(image, (cx, cy + int(ay * 0.45)), (int(ax * 0.35), int(ay * 0.1)),
+                0, 0, 180, (50, 50, 150), 3)
+
+    # Skin texture so sharpness and color-variance checks behave like a camera
+    noise = rng.normal(0, 12, size=image.shape)
+    return np.clip(image.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+
+def encode_data_url(image: np.ndarray, quality: int = 90) -> str:
+    """Encode a BGR frame the way face-verification.js does (JPEG data URL)"""
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.tobytes()).decode()
+
+
+def load_fixture_images(directory: str) -> List[str]:
+    """Load a fixture set of real face photos as data URLs (sorted by filename)"""
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(directory, name), "rb") as f:
+                mime = "png" if name.lower().endswith(".png") else "jpeg"
+                images.append(f"data:image/{mime};base64," + base64.b64encode(f.read()).decode())
+    if not images:
+        raise ValueError(f"No images found in {directory}")
+    return images
+
+
+def build_image_set(count: int, fixture_dir: str = None, width: int = 640, height: int = 480) -> List[str]:
+    """
+    Return `count` data URLs, one per benchmark user
+    Fixture images are reused round-robin when there are fewer than `count`
+    """
+    if fixture_dir:
+        fixtures = load_fixture_images(fixture_dir)
+        return [fixtures[i % len(fixtures)] for i in range(count)]
+    return [encode_data_url(generate_face_image(i, width, height)) for i in range(count)]
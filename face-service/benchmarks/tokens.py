@@ -0,0 +1,104 @@
+"""
+Face Verification Service - Token Validation Benchmark
+/validate-token throughput with multi-use tokens vs single-use tokens
+
+Every request carries a fresh token in both scenarios, so the only
+difference is the consumed-token check. The scenarios alternate for a few
+rounds and the best round of each is kept, which evens out warm-up and
+noise from the rest of the machine. A replay pass then re-sends
+already used tokens to confirm they are refused. The raw store is timed
+too (consumes per second, without HTTP), and with --store-url the shared
+Redis store is measured instead of the in-memory one.
+"""
+
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.load_test import drive, load_app
+
+SCENARIOS = ("multi_use", "single_use")
+
+
+def issue_tokens(count: int) -> List[str]:
+    from auth import create_verification_token
+
+    return [create_verification_token(f"0x{i:040x}", 0.9) for i in range(count)]
+
+
+async def time_store(store, count: int) -> Dict:
+    """Consumes per second straight against the store"""
+    import secrets
+
+    exp = time.time() + 600
+    ids = [secrets.token_urlsafe(12) for _ in range(count)]
+    start = time.perf_counter()
+    for jti in ids:
+        await store.consume(jti, exp)
+    elapsed = time.perf_counter() - start
+    return {
+        "consumes": count,
+        "ops_per_second": round(count / elapsed, 1) if elapsed else 0.0,
+        "us_per_op": round(elapsed * 1e6 / count, 2) if count else 0.0,
+    }
+
+
+async def run_token_benchmark(requests: int = 2000, concurrency: int = 8, store_url: str = "",
+                              rounds: int = 3) -> Dict[str, Dict]:
+    import token_store
+    from config import settings
+
+    app = await load_app()
+    saved = settings.single_use_tokens, token_store.store
+    results = {}
+    try:
+        token_store.store = token_store.create_store(store_url, settings.token_store_bucket_seconds)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for _ in range(rounds):
+                for scenario in SCENARIOS:
+                    settings.single_use_tokens = scenario == "single_use"
+                    tokens = issue_tokens(requests)
+                    stats = await drive(client, lambda i: {
+                        "method": "POST", "url": "/validate-token",
+                        "headers": {"Authorization": f"Bearer {tokens[i]}"},
+                    }, requests, concurrency)
+                    if scenario not in results or stats["rps"] > results[scenario]["rps"]:
+                        results[scenario] = stats
+
+            # Every token was consumed above; all of these must be refused
+            replayed = await drive(client, lambda i: {
+                "method": "POST", "url": "/validate-token",
+                "headers": {"Authorization": f"Bearer {tokens[i]}"},
+            }, min(requests, 200), concurrency)
+            results["single_use"]["replays_refused"] = replayed["errors"]
+            results["single_use"]["replays_sent"] = replayed["count"]
+
+        results["store"] = await time_store(token_store.store, requests)
+        results["store"].update(token_store.store.stats())
+        await token_store.store.aclose()
+    finally:
+        settings.single_use_tokens, token_store.store = saved
+
+    multi, single = results["multi_use"], results["single_use"]
+    single["rps_change"] = round(single["rps"] / multi["rps"] - 1, 4) if multi["rps"] else 0.0
+    return results
+
+
+def format_token_results(results: Dict[str, Dict]) -> str:
+    lines = [
+        f"{'scenario':<12}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}",
+        "-" * 67,
+    ]
+    for name in SCENARIOS:
+        stats = results[name]
+        lines.append(
+            f"{name:<12}{stats['count']:>7}{stats['errors']:>8}{stats['p50_ms']:>10.2f}"
+            f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['rps']:>10.1f}"
+        )
+    single, store = results["single_use"], results["store"]
+    lines.append(f"\nsingle-use throughput change: {single['rps_change']:+.1%}")
+    lines.append(f"replayed tokens refused: {single['replays_refused']}/{single['replays_sent']}")
+    lines.append(f"{store['backend']} store: {store['ops_per_second']:.0f} consumes/s ({store['us_per_op']:.1f} µs each)")
+    return "\n".join(lines)
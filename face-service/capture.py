@@ -0,0 +1,273 @@
+"""
+Face Verification Service - Traffic Capture
+Opt-in recording of /enroll, /verify and /status traffic for replay
+
+A sampled fraction of requests (CAPTURE_SAMPLE_RATE) is recorded as one
+JSON line each: arrival time, endpoint, a keyed pseudonym of the user id,
+the size, dimensions and format of the uploaded image, and the status,
+outcome (verified, liveness rejection, not enrolled, ...) and latency of
+the response. No image or wallet address is stored: replay substitutes a
+synthetic face with the same dimensions, the same one for every request of
+a pseudonym, so retries and enroll -> verify sequences keep their shape.
+
+Each worker appends to its own gzip trace in CAPTURE_DIR; records are
+buffered and written in batches off the event loop. `python -m benchmarks
+replay` drives the app from these files.
+"""
+
+import asyncio
+import base64
+import binascii
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+TRACE_VERSION = 1
+TRACE_SUFFIX = ".jsonl.gz"
+
+# Buffered records are written when either limit is reached
+FLUSH_RECORDS = 50
+FLUSH_SECONDS = 10.0
+
+# Response bodies longer than this are not kept for outcome parsing
+MAX_RESPONSE_BYTES = 64 * 1024
+
+ADDRESS_PATTERN = re.compile(r"0x[0-9a-fA-F]{6,}")
+
+
+def is_enabled() -> bool:
+    return settings.capture_sample_rate > 0
+
+
+def endpoint_of(scope) -> Optional[str]:
+    """Captured endpoint name for an ASGI scope, or None"""
+    method, path = scope["method"], scope["path"]
+    if method == "POST" and path in ("/enroll", "/verify"):
+        return path[1:]
+    if method == "GET" and path.startswith("/status/") and "/" not in path[len("/status/"):] and path != "/status/batch":
+        return "status"
+    return None
+
+
+def _secret() -> bytes:
+    if settings.capture_secret:
+        return settings.capture_secret.encode()
+    return hmac.new(settings.jwt_secret_key.encode(), b"traffic-capture", hashlib.sha256).digest()
+
+
+def pseudonym(user_id: str) -> str:
+    """Stable, keyed stand-in for a user id (same normalization as the API)"""
+    return hmac.new(_secret(), user_id.strip().lower().encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def describe_image(data: bytes) -> Dict:
+    """Size, dimensions and format of an encoded image, without decoding the pixels"""
+    from PIL import Image
+
+    info = {"bytes": len(data), "w": None, "h": None, "format": None}
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            info["w"], info["h"] = image.size
+            info["format"] = image.format
+    except Exception:
+        pass
+    return info
+
+
+def describe_upload(body: bytes) -> Dict:
+    """user pseudonym, image description and flags of an /enroll or /verify body"""
+    try:
+        payload = json.loads(body)
+        image = payload.get("image") or ""
+        if image.startswith("data:"):
+            image = image.split(",", 1)[-1]
+        return {
+            "user": pseudonym(str(payload.get("user_id", ""))),
+            "image": describe_image(base64.b64decode(image)),
+            "skip_liveness": bool(payload.get("skip_liveness", False)),
+        }
+    except (ValueError, TypeError, AttributeError, binascii.Error):
+        return {"user": None, "image": {"bytes": len(body), "w": None, "h": None, "format": None}, "malformed": True}
+
+
+def outcome_of(endpoint: str, status: int, body: bytes) -> str:
+    """Short, address-free description of what a response meant"""
+    try:
+        payload = json.loads(body) if body else {}
+    except ValueError:
+        payload = {}
+    if not isinstance(payload, dict):
+        payload = {}
+
+    if status == 200:
+        if endpoint == "verify":
+            if payload.get("verified"):
+                return "verified"
+            return "rejected:liveness" if not payload.get("liveness_passed", True) else "rejected:mismatch"
+        if endpoint == "status":
+            return "enrolled" if payload.get("enrolled") else "not_enrolled"
+        return "enrolled" if payload.get("success", True) else "failed"
+
+    detail = payload.get("detail", "")
+    if isinstance(detail, dict):
+        detail = detail.get("failure_reason") or detail.get("message") or ""
+    elif not isinstance(detail, str):
+        detail = "validation"
+    return f"http_{status}:{ADDRESS_PATTERN.sub('0x…', detail)[:80]}".rstrip(":")
+
+
+class TraceWriter:
+    """Buffered, size-rotated gzip JSON-lines trace of this process"""
+
+    def __init__(self, directory: str, max_file_mb: float):
+        self.directory = directory
+        self.max_file_bytes = max_file_mb * 1024 * 1024
+        self.path: Optional[str] = None
+        self.recorded = 0
+        self._buffer: List[Dict] = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _new_path(self) -> str:
+        return os.path.join(self.directory, f"trace-{int(time.time() * 1000):013d}-{os.getpid()}{TRACE_SUFFIX}")
+
+    def record(self, entry: Dict):
+        with self._lock:
+            self._buffer.append(entry)
+            self.recorded += 1
+            due = len(self._buffer) >= FLUSH_RECORDS or time.monotonic() - self._last_flush >= FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+            if not entries:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            if self.path is None or (os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_file_bytes):
+                self.path = self._new_path()
+                entries.insert(0, {"trace_version": TRACE_VERSION, "pid": os.getpid()})
+            # Every flush appends one gzip member; gzip readers see a single stream
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+def trace_files(paths: Iterable[str]) -> List[str]:
+    """Expand directories into the trace files they contain"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path) if name.endswith(TRACE_SUFFIX)
+            ))
+        else:
+            files.append(path)
+    return files
+
+
+def read_trace(paths: Iterable[str]) -> List[Dict]:
+    """Records of one or more trace files (or directories), in arrival order"""
+    records = []
+    for path in trace_files(paths):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if "endpoint" in entry:
+                    records.append(entry)
+    records.sort(key=lambda entry: entry["ts"])
+    return records
+
+
+class CaptureMiddleware:
+    """
+    ASGI middleware that records a sample of /enroll, /verify and /status
+
+    The request body is teed as the app reads it and the response is
+    watched as it is sent; describing the upload and writing the record
+    happen in a worker thread after the response. Only installed when
+    capture is enabled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._pending = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        endpoint = endpoint_of(scope)
+        if endpoint is None or random.random() >= settings.capture_sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        request_body = bytearray()
+        response_body = bytearray()
+        status = 500
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request" and len(request_body) <= settings.max_request_body_bytes:
+                request_body.extend(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and len(response_body) <= MAX_RESPONSE_BYTES:
+                response_body.extend(message.get("body", b""))
+            await send(message)
+
+        arrived = time.time()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            latency_ms = (time.perf_counter() - start) * 1000
+            task = asyncio.get_running_loop().create_task(asyncio.to_thread(
+                self._record, scope["path"], endpoint, arrived, latency_ms,
+                status, bytes(request_body), bytes(response_body),
+            ))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    @staticmethod
+    def _record(path: str, endpoint: str, arrived: float, latency_ms: float,
+                status: int, request_body: bytes, response_body: bytes):
+        entry = {"ts": round(arrived, 4), "endpoint": endpoint}
+        if endpoint == "status":
+            entry["user"] = pseudonym(path[len("/status/"):])
+        else:
+            entry.update(describe_upload(request_body))
+            entry["request_bytes"] = len(request_body)
+        entry.update({
+            "status": status,
+            "outcome": outcome_of(endpoint, status, response_body),
+            "latency_ms": round(latency_ms, 2),
+            "response_bytes": len(response_body),
+        })
+        try:
+            writer.record(entry)
+        except OSError as e:
+            logger.warning(f"Failed to write capture trace: {e}")
+
+
+# Global instance
+writer = TraceWriter(settings.capture_dir, settings.capture_max_file_mb)
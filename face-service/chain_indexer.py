@@ -0,0 +1,490 @@
+"""
+Face Verification Service - Chain Indexer
+Follows Voting.sol events and keeps compact local tallies
+
+Each sync step fetches one block range with eth_getLogs and applies it in
+a single transaction together with the new cursor, so the tables always
+reflect a prefix of the chain. The transaction starts by moving the cursor
+from the block the step read to the end of its range (compare-and-set): if
+another indexer process got there first, the step applies nothing, so no
+range is ever counted twice. Events from the last INDEXER_REORG_DEPTH
+blocks are journaled with what is needed to undo them. Before every step
+the stored hash of the last indexed block is compared with the node's; on
+a mismatch the indexer walks back to the fork point, undoes the orphaned
+events and re-indexes from there. A reorg deeper than the journal (no
+stored hash matches any more) resets the tables and re-indexes.
+
+Only one process writes the index: run_loop (in indexer_main.py or in
+any API worker) first takes or renews a lease row, the same way jobs.py
+leases background jobs, and every other process follows read-only until
+the holder stops heartbeating for INDEXER_LEASE_SECONDS. The writer
+records in chain_state when it last caught up with the head and bumps a
+generation counter whenever indexed rows are undone, so readers (the
+voter registry) can judge freshness and know when to reload.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from chain_rpc import ChainRpc, decode_log
+from config import settings
+from database import async_session
+from metrics import metrics
+from models import CandidateTally, ChainBlock, ChainEvent, ChainIndexerLease, ChainState, ChainVoter, VoteInterval
+
+logger = logging.getLogger(__name__)
+
+# Row of chain_indexer_lease guarding the tables below
+WRITER_LEASE = "chain_index"
+
+# Keeps IN (...) lists well under SQLite's bound-parameter limit
+QUERY_CHUNK = 500
+
+
+def _chunks(values: Iterable) -> Iterable[List]:
+    values = list(values)
+    for start in range(0, len(values), QUERY_CHUNK):
+        yield values[start:start + QUERY_CHUNK]
+
+
+class _Rows:
+    """The tally, interval, voter and state rows one transaction touches, loaded in bulk"""
+
+    def __init__(self, db, interval_seconds: int):
+        self.db = db
+        self.interval_seconds = interval_seconds
+        self.tallies: Dict[int, CandidateTally] = {}
+        self.intervals: Dict[tuple, VoteInterval] = {}
+        self.voters: Dict[str, ChainVoter] = {}
+        self.state: Dict[str, ChainState] = {}
+
+    def bucket(self, timestamp: int) -> int:
+        return timestamp - timestamp % self.interval_seconds
+
+    async def load(self, events: List[Dict]):
+        db = self.db
+        for row in (await db.execute(select(CandidateTally))).scalars():
+            self.tallies[row.candidate_index] = row
+        for row in (await db.execute(select(ChainState))).scalars():
+            self.state[row.key] = row
+
+        voters = {event["voter"] for event in events if "voter" in event}
+        for chunk in _chunks(voters):
+            for row in (await db.execute(select(ChainVoter).where(ChainVoter.address.in_(chunk)))).scalars():
+                self.voters[row.address] = row
+
+        buckets = {self.bucket(event["timestamp"]) for event in events if event["kind"] == "VoteCast"}
+        for chunk in _chunks(buckets):
+            result = await db.execute(select(VoteInterval).where(VoteInterval.interval_start.in_(chunk)))
+            for row in result.scalars():
+                self.intervals[(row.interval_start, row.candidate_index)] = row
+
+    def tally(self, index: int) -> CandidateTally:
+        row = self.tallies.get(index)
+        if row is None:
+            row = self.tallies[index] = CandidateTally(candidate_index=index, votes=0)
+            self.db.add(row)
+        return row
+
+    def interval(self, timestamp: int, index: int) -> VoteInterval:
+        key = (self.bucket(timestamp), index)
+        row = self.intervals.get(key)
+        if row is None:
+            row = self.intervals[key] = VoteInterval(interval_start=key[0], candidate_index=index, votes=0)
+            self.db.add(row)
+        return row
+
+    def voter(self, address: str) -> ChainVoter:
+        row = self.voters.get(address)
+        if row is None:
+            row = self.voters[address] = ChainVoter(address=address, registered=False, has_voted=False)
+            self.db.add(row)
+        return row
+
+    def get(self, key: str):
+        row = self.state.get(key)
+        return json.loads(row.value) if row is not None else None
+
+    def set(self, key: str, value):
+        row = self.state.get(key)
+        if row is None:
+            row = self.state[key] = ChainState(key=key)
+            self.db.add(row)
+        row.value = json.dumps(value)
+
+
+class ChainIndexer:
+    """Incremental, reorg-aware indexer for one Voting contract"""
+
+    def __init__(self, rpc: ChainRpc, address: str, start_block: int = 0, reorg_depth: int = 12,
+                 max_block_range: int = 2000, interval_seconds: int = 3600):
+        self.rpc = rpc
+        self.address = address.lower()
+        self.start_block = start_block
+        self.reorg_depth = reorg_depth
+        self.max_block_range = max_block_range
+        self.interval_seconds = interval_seconds
+        self.head: Optional[int] = None
+        self.writer_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.is_writer: Optional[bool] = None  # unknown until the first claim
+
+    @classmethod
+    def from_settings(cls, transport=None) -> "ChainIndexer":
+        return cls(
+            ChainRpc(settings.chain_rpc_url, transport=transport),
+            settings.voting_contract_address,
+            start_block=settings.indexer_start_block,
+            reorg_depth=settings.indexer_reorg_depth,
+            max_block_range=settings.indexer_max_block_range,
+            interval_seconds=settings.indexer_interval_seconds,
+        )
+
+    # ---- event effects ----
+
+    def _apply(self, rows: _Rows, event: Dict) -> Dict:
+        """Apply one event; returns what _undo needs to revert it"""
+        kind = event["kind"]
+        if kind == "VoteCast":
+            rows.tally(event["candidate_index"]).votes += 1
+            rows.interval(event["timestamp"], event["candidate_index"]).votes += 1
+            voter = rows.voter(event["voter"])
+            undo = {"had_voted": bool(voter.has_voted)}
+            voter.has_voted = True
+            voter.updated_block = event["block_number"]
+            return undo
+        if kind == "CandidateAdded":
+            existing = rows.tallies.get(event["candidate_index"])
+            undo = {"existed": existing is not None, "name": existing.name if existing else None}
+            rows.tally(event["candidate_index"]).name = event["name"]
+            return undo
+        if kind in ("VoterRegistered", "VoterUnregistered"):
+            voter = rows.voter(event["voter"])
+            undo = {"registered": bool(voter.registered)}
+            voter.registered = kind == "VoterRegistered"
+            voter.updated_block = event["block_number"]
+            return undo
+        if kind == "VotingTimesUpdated":
+            undo = {"voting_start": rows.get("voting_start"), "voting_end": rows.get("voting_end")}
+            rows.set("voting_start", event["voting_start"])
+            rows.set("voting_end", event["voting_end"])
+            return undo
+        if kind in ("VotingPaused", "VotingUnpaused"):
+            undo = {"paused": rows.get("paused")}
+            rows.set("paused", kind == "VotingPaused")
+            return undo
+        return {}
+
+    async def _undo(self, rows: _Rows, event: Dict, undo: Dict):
+        kind = event["kind"]
+        if kind == "VoteCast":
+            rows.tally(event["candidate_index"]).votes -= 1
+            rows.interval(event["timestamp"], event["candidate_index"]).votes -= 1
+            rows.voter(event["voter"]).has_voted = undo["had_voted"]
+        elif kind == "CandidateAdded":
+            if undo["existed"]:
+                rows.tally(event["candidate_index"]).name = undo["name"]
+            elif event["candidate_index"] in rows.tallies:
+                await rows.db.delete(rows.tallies.pop(event["candidate_index"]))
+        elif kind in ("VoterRegistered", "VoterUnregistered"):
+            rows.voter(event["voter"]).registered = undo["registered"]
+        elif kind == "VotingTimesUpdated":
+            rows.set("voting_start", undo["voting_start"])
+            rows.set("voting_end", undo["voting_end"])
+        elif kind in ("VotingPaused", "VotingUnpaused"):
+            rows.set("paused", undo["paused"])
+
+    # ---- reorgs ----
+
+    async def _find_fork_point(self, last: int, head: int) -> Optional[int]:
+        """Highest stored block still on the canonical chain (None: no stored block is)"""
+        async with async_session() as db:
+            stored = (await db.execute(select(ChainBlock).order_by(ChainBlock.number.desc()))).scalars().all()
+        if not stored:
+            return last
+        for block in stored:
+            if block.number > head:
+                continue
+            if (await self.rpc.get_block(block.number))["hash"] == block.hash:
+                return block.number
+        return None
+
+    async def _move_cursor(self, db, expected: int, new: int, initial: bool) -> bool:
+        """
+        Move last_block from `expected` to `new` as the first write of `db`'s transaction
+        False if another indexer moved it since this one read it (nothing is written then).
+        """
+        if initial:
+            db.add(ChainState(key="last_block", value=json.dumps(new)))
+            try:
+                await db.flush()
+            except IntegrityError:
+                return False
+            return True
+        result = await db.execute(
+            update(ChainState)
+            .where(ChainState.key == "last_block", ChainState.value == json.dumps(expected))
+            .values(value=json.dumps(new))
+        )
+        return result.rowcount == 1
+
+    def _conflict(self, last: int, to: int):
+        metrics.increment("indexer.cursor_conflicts")
+        logger.warning(f"⛓️  Blocks after {last} were indexed by another process meanwhile; skipped (to {to})")
+
+    async def _rollback(self, last: int, fork: int) -> bool:
+        """Undo journaled events above `fork` and move the cursor back to it"""
+        async with async_session() as db:
+            if not await self._move_cursor(db, last, fork, initial=False):
+                await db.rollback()
+                self._conflict(last, fork)
+                return False
+            journal = (await db.execute(
+                select(ChainEvent)
+                .where(ChainEvent.block_number > fork)
+                .order_by(ChainEvent.block_number.desc(), ChainEvent.log_index.desc())
+            )).scalars().all()
+            entries = [json.loads(entry.payload) for entry in journal]
+
+            rows = _Rows(db, self.interval_seconds)
+            await rows.load([entry["event"] for entry in entries])
+            for entry in entries:
+                await self._undo(rows, entry["event"], entry["undo"])
+
+            await db.execute(delete(ChainEvent).where(ChainEvent.block_number > fork))
+            await db.execute(delete(ChainBlock).where(ChainBlock.number > fork))
+            rows.set("last_block", fork)
+            rows.set("generation", (rows.get("generation") or 0) + 1)
+            await db.commit()
+        metrics.increment("indexer.reorgs")
+        logger.warning(f"⛓️  Reorg: undid {len(entries)} event(s), resuming after block {fork}")
+        return True
+
+    async def reset(self):
+        """Forget everything indexed (reorg deeper than the journal, or a new contract)"""
+        async with async_session() as db:
+            generation = await db.get(ChainState, "generation")
+            generation = json.loads(generation.value) if generation is not None else 0
+            for model in (ChainEvent, ChainBlock, VoteInterval, CandidateTally, ChainVoter, ChainState):
+                await db.execute(delete(model))
+            db.add(ChainState(key="generation", value=json.dumps(generation + 1)))
+            await db.commit()
+        logger.warning("⛓️  Index reset; re-indexing from the start block")
+
+    # ---- writer lease ----
+
+    async def claim_writer(self) -> bool:
+        """Take or renew the single-writer lease; False while another live process holds it"""
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=settings.indexer_lease_seconds)
+        async with async_session() as db:
+            result = await db.execute(
+                update(ChainIndexerLease)
+                .where(
+                    ChainIndexerLease.name == WRITER_LEASE,
+                    or_(ChainIndexerLease.owner == self.writer_id, ChainIndexerLease.heartbeat_at < stale),
+                )
+                .values(owner=self.writer_id, heartbeat_at=now)
+            )
+            claimed = result.rowcount == 1
+            if not claimed:
+                db.add(ChainIndexerLease(name=WRITER_LEASE, owner=self.writer_id, heartbeat_at=now))
+                try:
+                    await db.flush()
+                    claimed = True
+                except IntegrityError:
+                    await db.rollback()
+            if claimed:
+                await db.commit()
+                holder = self.writer_id
+            else:
+                holder = await db.scalar(select(ChainIndexerLease.owner).where(ChainIndexerLease.name == WRITER_LEASE))
+
+        if claimed != self.is_writer:
+            if claimed:
+                logger.info(f"⛓️  Writing the chain index as {self.writer_id}")
+            else:
+                logger.warning(f"⚠️ Chain index is written by {holder}; following read-only until its lease lapses")
+        self.is_writer = claimed
+        return claimed
+
+    async def step(self) -> Optional[Dict]:
+        """sync_once if this process holds the writer lease, else None"""
+        if not await self.claim_writer():
+            return None
+        return await self.sync_once()
+
+    # ---- sync ----
+
+    async def _state(self) -> Dict:
+        async with async_session() as db:
+            return {row.key: json.loads(row.value) for row in (await db.execute(select(ChainState))).scalars()}
+
+    async def _read_contract_state(self, block: int) -> Dict:
+        """Voting window and pause flag at `block` (the constructor sets them without events)"""
+        tag = hex(block)
+        return {
+            "voting_start": await self.rpc.call(self.address, "votingStart()", returns=("uint256",), block=tag),
+            "voting_end": await self.rpc.call(self.address, "votingEnd()", returns=("uint256",), block=tag),
+            "paused": await self.rpc.call(self.address, "paused()", returns=("bool",), block=tag),
+        }
+
+    async def sync_once(self) -> Dict:
+        """Index the next block range (at most INDEXER_MAX_BLOCK_RANGE blocks)"""
+        head = self.head = await self.rpc.block_number()
+        state = await self._state()
+        last = state.get("last_block", self.start_block - 1)
+        reorged = 0
+
+        if last >= self.start_block:
+            fork = await self._find_fork_point(last, head)
+            if fork is None:
+                await self.reset()
+                return {"head": head, "last_block": self.start_block - 1, "events": 0, "reorged": last}
+            if fork < last:
+                if not await self._rollback(last, fork):
+                    return {"head": head, "last_block": last, "events": 0, "reorged": 0}
+                reorged, last = last - fork, fork
+
+        to = min(head, last + self.max_block_range)
+        if to <= last:
+            await self._mark_caught_up()
+            return {"head": head, "last_block": last, "events": 0, "reorged": reorged}
+
+        end = await self.rpc.get_block(to)
+        logs = await self.rpc.get_logs(self.address, last + 1, to)
+        events = sorted(
+            filter(None, (decode_log(log) for log in logs if not log.get("removed"))),
+            key=lambda event: (event["block_number"], event["log_index"]),
+        )
+        if (await self.rpc.get_block(to))["hash"] != end["hash"] or any(
+            event["block_number"] == to and event["block_hash"] != end["hash"] for event in events
+        ):
+            # The range changed while we read it; try again on the next poll
+            return {"head": head, "last_block": last, "events": 0, "reorged": reorged}
+
+        contract_state = None
+        if "voting_start" not in state:
+            contract_state = await self._read_contract_state(to)
+
+        finality = head - self.reorg_depth
+        hashes = {to: end["hash"]}
+        async with async_session() as db:
+            if not await self._move_cursor(db, last, to, initial="last_block" not in state):
+                await db.rollback()
+                self._conflict(last, to)
+                return {"head": head, "last_block": last, "events": 0, "reorged": reorged}
+
+            rows = _Rows(db, self.interval_seconds)
+            await rows.load(events)
+            if contract_state is not None:
+                for key, value in contract_state.items():
+                    rows.set(key, value)
+
+            for event in events:
+                undo = self._apply(rows, event)
+                if event["block_number"] > finality:
+                    db.add(ChainEvent(
+                        block_number=event["block_number"], log_index=event["log_index"], kind=event["kind"],
+                        payload=json.dumps({"event": event, "undo": undo}),
+                    ))
+                    hashes[event["block_number"]] = event["block_hash"]
+
+            for number, block_hash in hashes.items():
+                await db.merge(ChainBlock(number=number, hash=block_hash))
+            await db.execute(delete(ChainBlock).where(ChainBlock.number <= finality, ChainBlock.number < to))
+            await db.execute(delete(ChainEvent).where(ChainEvent.block_number <= finality))
+
+            rows.set("last_block", to)
+            rows.set("last_block_time", end["timestamp"])
+            if to >= head:
+                rows.set("caught_up_at", time.time())
+            await db.commit()
+
+        metrics.increment("indexer.events", len(events))
+        metrics.increment("indexer.blocks", to - last)
+        return {"head": head, "last_block": to, "events": len(events), "reorged": reorged}
+
+    async def _mark_caught_up(self):
+        async with async_session() as db:
+            await db.merge(ChainState(key="caught_up_at", value=json.dumps(time.time())))
+            await db.commit()
+
+    async def sync(self) -> Dict:
+        """Sync until caught up with the head seen at the start"""
+        result = await self.sync_once()
+        while result["last_block"] < result["head"]:
+            result = await self.sync_once()
+        return result
+
+    async def run_loop(self):
+        """Follow the chain until cancelled, writing only while this process holds the lease"""
+        logger.info(f"⛓️  Indexing {self.address} from block {self.start_block} via {self.rpc.url}")
+        while True:
+            try:
+                result = await self.step()
+                if result is not None and result["last_block"] < result["head"]:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Chain sync failed: {e}")
+            await asyncio.sleep(settings.indexer_poll_seconds)
+
+
+# ---- queries ----
+
+def voting_window(state: Dict) -> Dict:
+    """Voting window as of the last indexed block"""
+    start, end, now = state.get("voting_start"), state.get("voting_end"), state.get("last_block_time")
+    paused = bool(state.get("paused"))
+    active = None not in (start, end, now) and start <= now < end and not paused
+    return {"start": start, "end": end, "paused": paused, "active": active, "as_of": now}
+
+
+async def get_tallies() -> Dict:
+    async with async_session() as db:
+        state = {row.key: json.loads(row.value) for row in (await db.execute(select(ChainState))).scalars()}
+        tallies = (await db.execute(
+            select(CandidateTally).order_by(CandidateTally.candidate_index)
+        )).scalars().all()
+    return {
+        "last_block": state.get("last_block"),
+        "total_votes": sum(row.votes for row in tallies),
+        "candidates": [{"index": row.candidate_index, "name": row.name, "votes": row.votes} for row in tallies],
+        "voting": voting_window(state),
+    }
+
+
+async def get_intervals(since: Optional[int] = None, until: Optional[int] = None) -> List[Dict]:
+    """Per-interval vote counts, oldest first: [{"interval_start", "total", "candidates": {index: votes}}]"""
+    query = select(VoteInterval).where(VoteInterval.votes > 0).order_by(VoteInterval.interval_start)
+    if since is not None:
+        query = query.where(VoteInterval.interval_start >= since)
+    if until is not None:
+        query = query.where(VoteInterval.interval_start < until)
+    async with async_session() as db:
+        rows = (await db.execute(query)).scalars().all()
+
+    intervals: Dict[int, Dict] = {}
+    for row in rows:
+        entry = intervals.setdefault(row.interval_start, {"interval_start": row.interval_start, "total": 0, "candidates": {}})
+        entry["candidates"][row.candidate_index] = row.votes
+        entry["total"] += row.votes
+    return list(intervals.values())
+
+
+async def get_voter(address: str) -> Optional[Dict]:
+    async with async_session() as db:
+        row = await db.get(ChainVoter, address.lower())
+    if row is None:
+        return None
+    return {"address": row.address, "registered": row.registered, "has_voted": row.has_voted, "updated_block": row.updated_block}
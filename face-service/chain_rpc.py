@@ -0,0 +1,178 @@
+"""
+Face Verification Service - Chain RPC
+Minimal async JSON-RPC client and Voting.sol event/ABI decoding
+
+Speaks plain Ethereum JSON-RPC (eth_blockNumber, eth_getBlockByNumber,
+eth_getLogs, eth_call, and eth_sendRawTransaction for the few transactions
+the service sends itself), so it works against Sepolia, a local Hardhat
+node or the in-process stand-in in benchmarks/local_chain.py.
+"""
+
+import asyncio
+import itertools
+import time
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+from eth_abi import decode, encode
+from eth_utils import keccak, to_checksum_address
+
+
+class RpcError(RuntimeError):
+    """The node returned a JSON-RPC error or an unusable response"""
+
+
+def _event(signature: str, indexed: Sequence[str], data: Sequence[str], fields: Sequence[str]) -> Dict:
+    return {
+        "name": signature[:signature.index("(")],
+        "topic": "0x" + keccak(text=signature).hex(),
+        "indexed": list(indexed),
+        "data": list(data),
+        "fields": list(fields),
+    }
+
+
+# Voting.sol events the indexer follows (field order = indexed fields, then data fields)
+EVENTS = [
+    _event("VoteCast(address,uint256,uint256)", ["address", "uint256"], ["uint256"],
+           ["voter", "candidate_index", "timestamp"]),
+    _event("CandidateAdded(string,uint256,uint256)", [], ["string", "uint256", "uint256"],
+           ["name", "candidate_index", "timestamp"]),
+    _event("VoterRegistered(address,uint256)", ["address"], ["uint256"], ["voter", "timestamp"]),
+    _event("VoterUnregistered(address,uint256)", ["address"], ["uint256"], ["voter", "timestamp"]),
+    _event("VotingTimesUpdated(uint256,uint256,uint256)", [], ["uint256", "uint256", "uint256"],
+           ["voting_start", "voting_end", "timestamp"]),
+    _event("VotingPaused(address,uint256)", ["address"], ["uint256"], ["admin", "timestamp"]),
+    _event("VotingUnpaused(address,uint256)", ["address"], ["uint256"], ["admin", "timestamp"]),
+]
+EVENTS_BY_TOPIC = {event["topic"]: event for event in EVENTS}
+
+# Emitted when the service publishes a Merkle allowlist root (not indexed)
+VOTERS_ROOT_EVENT = _event("VerifiedVotersRootUpdated(bytes32,uint256,uint256)", ["bytes32"], ["uint256", "uint256"],
+                           ["root", "leaf_count", "timestamp"])
+EVENT_TOPICS = [event["topic"] for event in EVENTS]
+
+
+def selector(signature: str) -> bytes:
+    return keccak(text=signature)[:4]
+
+
+def encode_call(signature: str, *args) -> str:
+    """Calldata for a contract function, e.g. encode_call("hasVoted(address)", voter)"""
+    types = [t for t in signature[signature.index("(") + 1:-1].split(",") if t]
+    return "0x" + (selector(signature) + encode(types, list(args))).hex()
+
+
+def _hex_bytes(value: str) -> bytes:
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+
+def _decode_topic(abi_type: str, topic: str):
+    value = _hex_bytes(topic)
+    return decode([abi_type], value)[0]
+
+
+def decode_log(log: Dict) -> Optional[Dict]:
+    """
+    Decode a Voting.sol log into {"kind", "block_number", "block_hash",
+    "log_index", "tx_hash", <event fields>}; None for unknown events
+    """
+    topics = log.get("topics") or []
+    event = EVENTS_BY_TOPIC.get(topics[0].lower()) if topics else None
+    if event is None:
+        return None
+
+    values = [_decode_topic(t, topic) for t, topic in zip(event["indexed"], topics[1:])]
+    values += list(decode(event["data"], _hex_bytes(log.get("data") or "0x")))
+
+    record = {
+        "kind": event["name"],
+        "block_number": int(log["blockNumber"], 16),
+        "block_hash": log["blockHash"],
+        "log_index": int(log["logIndex"], 16),
+        "tx_hash": log.get("transactionHash"),
+    }
+    for field, value in zip(event["fields"], values):
+        record[field] = value.lower() if isinstance(value, str) and value.startswith("0x") else value
+    return record
+
+
+class ChainRpc:
+    """Async JSON-RPC client; `transport` lets tests plug in a local chain"""
+
+    def __init__(self, url: str, transport: Optional[httpx.AsyncBaseTransport] = None, timeout: float = 10.0):
+        self.url = url
+        self._client = httpx.AsyncClient(transport=transport, timeout=timeout)
+        self._ids = itertools.count(1)
+
+    async def request(self, method: str, params: List):
+        response = await self._client.post(self.url, json={
+            "jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params,
+        })
+        response.raise_for_status()
+        body = response.json()
+        if body.get("error"):
+            raise RpcError(f"{method}: {body['error'].get('message', body['error'])}")
+        if "result" not in body:
+            raise RpcError(f"{method}: response without result")
+        return body["result"]
+
+    async def block_number(self) -> int:
+        return int(await self.request("eth_blockNumber", []), 16)
+
+    async def get_block(self, number: int) -> Dict:
+        """Header fields the indexer needs: number, hash, parent_hash, timestamp"""
+        block = await self.request("eth_getBlockByNumber", [hex(number), False])
+        if block is None:
+            raise RpcError(f"Block {number} not found")
+        return {
+            "number": int(block["number"], 16),
+            "hash": block["hash"],
+            "parent_hash": block["parentHash"],
+            "timestamp": int(block["timestamp"], 16),
+        }
+
+    async def get_logs(self, address: str, from_block: int, to_block: int,
+                       topics: Optional[List[str]] = None) -> List[Dict]:
+        return await self.request("eth_getLogs", [{
+            "address": address,
+            "fromBlock": hex(from_block),
+            "toBlock": hex(to_block),
+            "topics": [topics or EVENT_TOPICS],
+        }])
+
+    async def call(self, address: str, signature: str, *args, returns: Sequence[str] = ("bool",),
+                   block: str = "latest"):
+        """eth_call a view function; returns the decoded tuple (or the single value)"""
+        result = await self.request("eth_call", [{"to": address, "data": encode_call(signature, *args)}, block])
+        values = decode(list(returns), _hex_bytes(result))
+        return values[0] if len(values) == 1 else values
+
+    async def send_transaction(self, account, address: str, signature: str, *args, gas: int = 200_000) -> str:
+        """Sign a contract call with `account` (eth_account LocalAccount) and send it; returns the tx hash"""
+        nonce = int(await self.request("eth_getTransactionCount", [account.address, "pending"]), 16)
+        gas_price = int(await self.request("eth_gasPrice", []), 16)
+        chain_id = int(await self.request("eth_chainId", []), 16)
+        signed = account.sign_transaction({
+            "to": to_checksum_address(address),
+            "data": encode_call(signature, *args),
+            "value": 0,
+            "gas": gas,
+            "gasPrice": gas_price,
+            "nonce": nonce,
+            "chainId": chain_id,
+        })
+        return await self.request("eth_sendRawTransaction", ["0x" + bytes(signed.raw_transaction).hex()])
+
+    async def wait_for_receipt(self, tx_hash: str, timeout: float = 180.0, poll_seconds: float = 2.0) -> Dict:
+        deadline = time.monotonic() + timeout
+        while True:
+            receipt = await self.request("eth_getTransactionReceipt", [tx_hash])
+            if receipt is not None:
+                return receipt
+            if time.monotonic() >= deadline:
+                raise RpcError(f"No receipt for {tx_hash} after {timeout:.0f}s")
+            await asyncio.sleep(poll_seconds)
+
+    async def close(self):
+        await self._client.aclose()
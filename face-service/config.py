@@ -18,29 +18,183 @@ class Settings(BaseSettings):
     jwt_secret_key: str = "change-this-secret-key-in-production-use-long-random-string"
     jwt_algorithm: str = "HS256"
     jwt_expiry_minutes: int = 10
+    single_use_tokens: bool = False  # /validate-token accepts each token once (see token_store.py)
+    token_store_url: str = ""  # redis://... to share consumed tokens between workers/instances
+    token_store_bucket_seconds: int = 60  # expiry granularity of the in-memory store
     
     # Database
     database_url: str = "sqlite+aiosqlite:///./face_data.db"
     
     # Face Verification
     similarity_threshold: float = 0.70  # 70% match required
+    face_model_name: str = "buffalo_l"  # InsightFace model pack; POST /admin/models/reload can switch it at runtime
+    model_reload_poll_seconds: float = 5.0  # how often each worker looks for a reload requested through another one
+    face_model_root: str = "~/.insightface"  # packs live in <root>/models/<name>
+    inference_backend: str = "insightface"  # insightface | onnxruntime | opencv | openvino | auto (see backends.py)
+    inference_backend_candidates: str = "onnxruntime,opencv,openvino"  # engines INFERENCE_BACKEND=auto compares
+    inference_benchmark_runs: int = 5  # timed detect + embed runs per candidate at startup
+    inference_conformance_min_cosine: float = 0.995  # candidates whose embeddings differ more are never chosen
+    min_detection_score: float = 0.5  # faces below this det_score are ignored before recognition
+    detector_input_size: int = 640  # full detector input (square)
+    detector_fast_input_size: int = 320  # first pass for selfies; 0 = always use the full size
+    detector_escalation_score: float = 0.6  # rerun at full size unless the fast pass finds a face this confident
     max_enrollment_images: int = 3
+    retain_enrollment_crops: bool = False  # keep the encrypted aligned face crop so embeddings can be recomputed
+    
+    # Request bodies (base64 image payloads are streamed and decoded incrementally)
+    max_request_body_bytes: int = 5 * 1024 * 1024
     
     # Rate Limiting
     rate_limit_requests: int = 10
     rate_limit_period: int = 60  # seconds
     
+    # Admission control (priority classes: verify > status > enroll > batch)
+    admission_enabled: bool = True
+    admission_initial_limit: int = 4  # concurrent slots before adaptation
+    admission_min_limit: int = 1
+    admission_max_limit: int = 32
+    admission_target_latency_ms: float = 1000.0  # AIMD backs off when a slot is held longer
+    admission_enroll_share: float = 0.5  # fraction of the limit enroll may occupy
+    admission_batch_share: float = 0.25  # fraction for batch/admin work
+    admission_voting_share_scale: float = 0.5  # enroll/batch shares are scaled by this during a voting window
+    admission_verify_queue_timeout_ms: float = 10000.0
+    admission_queue_timeout_ms: float = 2000.0  # other classes are shed after waiting this long
+    voting_window_active: bool = False  # initial state; updated at runtime via POST /admin/voting-window
+    
+    # Staged pipeline (see pipeline.py): threads per stage and the queue in front of each
+    pipeline_decode_workers: int = 2  # JPEG/PNG decoding
+    pipeline_infer_workers: int = 0  # detection + liveness + embedding; 0 = cores / the backend's threads (1 with the engine default)
+    pipeline_score_workers: int = 1  # template decryption + similarity, or template encryption
+    pipeline_persist_workers: int = 1  # JWT + permit signing
+    pipeline_queue_size: int = 64  # items waiting per stage; more are shed with 503
+    pipeline_utilization_window_seconds: float = 60.0  # window of the utilization in /admin/metrics
+    
     # Server
     host: str = "0.0.0.0"
     port: int = 8000
+    web_concurrency: int = 1  # worker processes serving the app (serve.py sets it from --workers; set it for uvicorn --workers)
     debug: bool = True
     
+    # Memory (see memory.py; serve.py preloads models and forks the workers)
+    ort_cpu_mem_arena: bool = True  # ONNX Runtime CPU arena; off = plain malloc/free per run
+    ort_mem_pattern: bool = True  # preplanned buffers per input shape (kept per shape seen)
+    ort_arena_shrinkage: bool = False  # return arena chunks to the OS after every run
+    ort_intra_op_threads: int = 0  # 0 = ONNX Runtime default (serve.py uses 1 with several workers)
+    opencv_dnn_threads: int = 0  # opencv backend; cv2.setNumThreads is process-wide, 0 = OpenCV default
+    openvino_threads: int = 0  # openvino backend INFERENCE_NUM_THREADS; 0 = OpenVINO default
+    openvino_performance_hint: str = "LATENCY"  # LATENCY or THROUGHPUT
+    worker_max_rss_mb: int = 0  # recycle a worker above this RSS after it drains; 0 = off
+    memory_check_interval_seconds: float = 30.0
+    worker_drain_timeout_seconds: int = 30  # in-flight requests (and then their inference) get this long before a worker exits
+    
+    # Readiness (see lifecycle.py)
+    readiness_db_connections: int = 2  # pool connections opened before /health/ready reports ready
+    readiness_retry_seconds: float = 10.0  # pause before retrying a failed model load / DB warm-up
+    
     # CORS
     allowed_origins: str = "http://localhost:3000,http://127.0.0.1:3000,http://localhost:8080,http://127.0.0.1:8080"
     
     # Liveness
     enable_liveness: bool = True
     blink_threshold: float = 0.25
+    antispoof_model_path: str = ""  # optional ONNX anti-spoof classifier run on the aligned crop (see antispoof.py)
+    antispoof_threshold: float = 0.5  # live probability needed to pass
+    antispoof_live_index: int = 1  # index of the "live" class in multi-class outputs
+    antispoof_output: str = "logits"  # "logits" or "probability": what the model's output holds
+    antispoof_input_scale: float = 1.0  # pixel multiplier (1/255 for models trained on [0, 1] input)
+    antispoof_input_rgb: bool = False  # feed RGB instead of OpenCV's BGR
+    antispoof_threads: int = 1  # ONNX Runtime intra-op threads for the model
+    antispoof_min_heuristic_checks: int = 3  # of the 6 heuristic checks, required alongside a passing model
+    
+    # Enrollment status lookups
+    status_batch_max_ids: int = 1000  # ids per POST /status/batch request
+    enrolled_filter_enabled: bool = True  # in-memory filter answers "not enrolled" without per-id DB lookups
+    enrolled_filter_capacity: int = 100000  # grows to 2x the enrolled count on rebuild
+    enrolled_filter_error_rate: float = 0.01
+    enrolled_filter_refresh_seconds: int = 300  # periodic rebuild from the DB (0 = startup only)
+    enrolled_filter_sync_seconds: float = 5.0  # picks up other workers' enrolls; max staleness of a "not enrolled"
+    
+    # Verification result cache (identical resubmitted frames skip inference)
+    verify_cache_enabled: bool = True
+    verify_cache_ttl_seconds: int = 60
+    verify_cache_max_entries: int = 2048
+    
+    # Verification log retention and hourly rollups
+    log_retention_days: int = 30  # raw rows older than this are deleted once aggregated (0 = keep forever)
+    log_compaction_interval_minutes: int = 60  # background job period (0 = disabled)
+    log_compaction_batch_size: int = 500  # rows per delete transaction
+    
+    # Background jobs (erase, key rotation, re-embedding) and data export
+    job_lease_seconds: int = 120  # a running job whose heartbeat is older than this can be taken over
+    job_pause_ms: float = 10.0  # pause between chunks so live requests get the write lock
+    job_max_pause_ms: float = 5000.0  # upper bound while throttled
+    job_throttle_latency_ms: float = 500.0  # pauses grow while recent verify p95 is above this
+    job_throttle_window_seconds: float = 10.0  # how recent "recent" is
+    job_workers: int = 2  # threads for CPU-bound job work (crypto, inference)
+    maintenance_chunk_size: int = 100  # users per key-rotation / re-embedding transaction
+    erase_chunk_size: int = 200  # users per erase transaction (and per checkpoint)
+    erase_log_batch_size: int = 500  # verification log rows per delete transaction
+    export_page_size: int = 500  # log rows per read transaction in /admin/users/{id}/export
+    
+    # Chain indexer (Voting.sol events -> local tallies, served by indexer_main.py)
+    chain_rpc_url: str = ""  # e.g. http://127.0.0.1:8545 (Hardhat) or a Sepolia endpoint; empty = disabled
+    voting_contract_address: str = ""
+    indexer_start_block: int = 0  # deployment block of the contract
+    indexer_reorg_depth: int = 12  # blocks kept undoable; deeper reorgs trigger a full re-index
+    indexer_max_block_range: int = 2000  # blocks per eth_getLogs request
+    indexer_poll_seconds: float = 5.0
+    indexer_interval_seconds: int = 3600  # bucket size of per-interval tallies
+    indexer_cache_seconds: float = 5.0  # max-age of cached API responses
+    indexer_port: int = 8001
+    indexer_lease_seconds: float = 30.0  # a writer silent this long loses the single-writer lease to another process
+    voter_registry_enabled: bool = True  # refuse already-voted / unregistered wallets before inference (needs the two settings above)
+    voter_registry_max_staleness_seconds: float = 60.0  # older views are ignored (requests go through to inference)
+    
+    # Merkle allowlist of verified wallets for voteWithProof (see merkle_allowlist.py)
+    allowlist_enabled: bool = False  # serve /allowlist/proof and the /admin/allowlist endpoints
+    allowlist_dir: str = os.path.join(BASE_DIR, "allowlist")  # one node file per tree level
+    allowlist_build_interval_seconds: float = 0.0  # append new verifications periodically; 0 = only via /admin/allowlist/build
+    allowlist_publish: bool = False  # the periodic build also publishes new roots (signer key pays gas; needs the chain settings above)
+    allowlist_batch_size: int = 1000  # verification log rows per build transaction
+    allowlist_build_workers: int = 1  # processes hashing large appends (initial builds of many wallets)
+    allowlist_publish_timeout_seconds: float = 180.0  # wait for the setVerifiedVotersRoot receipt
+    
+    # Sharding (see sharding.py; off while shard_node_id is empty)
+    shard_node_id: str = ""  # this node's name in shard_nodes
+    shard_nodes: str = ""  # comma-separated name=base_url, e.g. a=http://10.0.0.1:8000,b=http://10.0.0.2:8000
+    shard_previous_nodes: str = ""  # map being migrated away from; misses are pulled from it
+    shard_vnodes: int = 128  # ring points per node
+    shard_routing: str = "proxy"  # proxy: forward to the owner; redirect: 307 to the owner
+    shard_forward_timeout_seconds: float = 30.0
+    shard_peer_signature_max_age_seconds: float = 60.0  # older (or clock-skewed) peer signatures are ignored
+    shard_rebalance_chunk_size: int = 100  # users moved per transaction
+    
+    # Logging (see logging_setup.py)
+    log_level: str = "INFO"
+    log_format: str = "json"  # json: one object per line; text: the classic "time - logger - level - message"
+    log_file: str = ""  # also write here (besides stderr)
+    log_queue_size: int = 10000  # records waiting for the writer thread; more are dropped and counted
+    log_sample_rates: str = ""  # e.g. INFO=0.1 keeps 10% of per-request info events (levels not listed are kept)
+    
+    # Admin API (endpoints under /admin are disabled while this is empty)
+    admin_api_key: str = ""
+    
+    # Request profiling (opt-in, off when both triggers are 0)
+    profiling_sample_rate: float = 0.0  # fraction of requests to profile
+    # Keep profiles of requests slower than this. Every request is profiled up front, but only
+    # profiling_max_concurrent at a time, so under load most slow requests go unprofiled
+    profiling_slow_threshold_ms: float = 0.0
+    profiling_interval_ms: float = 5.0  # stack sampling interval
+    profiling_max_samples: int = 2000  # per request
+    profiling_max_concurrent: int = 4  # requests profiled at the same time
+    profiling_dir: str = os.path.join(BASE_DIR, "profiles")
+    profiling_max_profiles: int = 50  # ring size on disk
+    
+    # Traffic capture for replay (opt-in; see capture.py)
+    capture_sample_rate: float = 0.0  # fraction of /enroll, /verify and /status requests recorded
+    capture_dir: str = os.path.join(BASE_DIR, "traces")
+    capture_secret: str = ""  # key for user pseudonyms; empty = derived from jwt_secret_key
+    capture_max_file_mb: float = 64.0  # start a new trace file past this size
     
     @property
     def cors_origins(self) -> List[str]:
@@ -0,0 +1,24 @@
+"""
+Face Verification Service - Test Setup
+Shared environment and helpers for the unittest suites run through pytest
+
+pytest imports this file before collecting any test module, so the
+service directory is importable and DATABASE_URL points at a throwaway
+SQLite file before `config` or `database` are imported by a test.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
+os.environ.setdefault("DEBUG", "false")
+
+import httpx
+
+
+def asgi_client(app, base_url: str = "http://test") -> httpx.AsyncClient:
+    """An in-process client for an ASGI app, e.g. the one from benchmarks.load_test.load_app()"""
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=base_url)
@@ -0,0 +1,169 @@
+const API_URL = 'http://localhost:8000';
+let stream = null;
+let capturedImageData = null;
+
+// Check service status on load
+window.onload = async function() {
+    await checkServiceStatus();
+};
+
+async function checkServiceStatus() {
+    const statusEl = document.getElementById('serviceStatus');
+    try {
+        const response = await fetch(`${API_URL}/health`, {
+            method: 'GET',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            mode: 'cors'
+        });
+
+        if (response.ok) {
+            const data = await response.json();
+            if (data.status === 'healthy') {
+                statusEl.className = 'service-status service-online';
+                statusEl.innerHTML = '✅ Face Service Online - Ready to enroll';
+            } else {
+                throw new Error('Service unhealthy');
+            }
+        } else {
+            throw new Error(`HTTP ${response.status}`);
+        }
+    } catch (error) {
+        console.error('Health check failed:', error);
+        statusEl.className = 'service-status service-offline';
+        statusEl.innerHTML = '❌ Face Service Offline - Start the service first';
+        // Retry after 3 seconds
+        setTimeout(checkServiceStatus, 3000);
+    }
+}
+
+async function startCamera() {
+    try {
+        stream = await navigator.mediaDevices.getUserMedia({
+            video: {
+                width: { ideal: 640 },
+                height: { ideal: 480 },
+                facingMode: 'user'
+            }
+        });
+
+        const video = document.getElementById('video');
+        video.srcObject = stream;
+        video.style.display = 'block';
+
+        document.getElementById('capturedImage').style.display = 'none';
+        document.getElementById('startCameraBtn').disabled = true;
+        document.getElementById('captureBtn').disabled = false;
+        document.getElementById('retakeBtn').style.display = 'none';
+        document.getElementById('enrollBtn').disabled = true;
+
+        showStatus('Camera started. Position your face and click Capture.', 'info');
+    } catch (error) {
+        showStatus('Error accessing camera: ' + error.message, 'error');
+    }
+}
+
+function captureImage() {
+    const video = document.getElementById('video');
+    const canvas = document.getElementById('canvas');
+    const capturedImage = document.getElementById('capturedImage');
+
+    canvas.width = video.videoWidth;
+    canvas.height = video.videoHeight;
+
+    const ctx = canvas.getContext('2d');
+    // Flip horizontally to match mirrored video
+    ctx.translate(canvas.width, 0);
+    ctx.scale(-1, 1);
+    ctx.drawImage(video, 0, 0);
+
+    capturedImageData = canvas.toDataURL('image/jpeg', 0.9);
+    capturedImage.src = capturedImageData;
+
+    // Stop video and show captured image
+    video.style.display = 'none';
+    capturedImage.style.display = 'block';
+
+    if (stream) {
+        stream.getTracks().forEach(track => track.stop());
+        stream = null;
+    }
+
+    document.getElementById('captureBtn').disabled = true;
+    document.getElementById('retakeBtn').style.display = 'block';
+    document.getElementById('enrollBtn').disabled = false;
+    document.getElementById('startCameraBtn').disabled = false;
+
+    showStatus('Image captured! Enter Voter ID and click Enroll.', 'success');
+}
+
+function retakePhoto() {
+    capturedImageData = null;
+    document.getElementById('capturedImage').style.display = 'none';
+    document.getElementById('enrollBtn').disabled = true;
+    document.getElementById('retakeBtn').style.display = 'none';
+    startCamera();
+}
+
+async function enrollUser() {
+    const userId = document.getElementById('userId').value.trim();
+
+    if (!userId) {
+        showStatus('Please enter a Voter ID', 'error');
+        return;
+    }
+
+    if (!capturedImageData) {
+        showStatus('Please capture a face image first', 'error');
+        return;
+    }
+
+    const enrollBtn = document.getElementById('enrollBtn');
+    enrollBtn.disabled = true;
+    enrollBtn.innerHTML = '⏳ Enrolling...';
+
+    try {
+        const response = await fetch(`${API_URL}/enroll`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                user_id: userId,
+                image: capturedImageData
+            })
+        });
+
+        const data = await response.json();
+
+        if (response.ok && data.success) {
+            showStatus(`✅ Successfully enrolled: ${userId}`, 'success');
+            document.getElementById('userId').value = '';
+            capturedImageData = null;
+            document.getElementById('capturedImage').style.display = 'none';
+            document.getElementById('retakeBtn').style.display = 'none';
+            // Refresh can start camera again
+        } else {
+            throw new Error(data.detail || data.message || 'Enrollment failed');
+        }
+    } catch (error) {
+        showStatus('Enrollment failed: ' + error.message, 'error');
+    } finally {
+        enrollBtn.disabled = false;
+        enrollBtn.innerHTML = '✅ Enroll Face';
+    }
+}
+
+function showStatus(message, type) {
+    const statusEl = document.getElementById('status');
+    statusEl.className = `status ${type}`;
+    statusEl.innerHTML = message;
+}
+
+// Cleanup on page unload
+window.onbeforeunload = function() {
+    if (stream) {
+        stream.getTracks().forEach(track => track.stop());
+    }
+};
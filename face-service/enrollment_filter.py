@@ -0,0 +1,206 @@
+"""
+Face Verification Service - Enrolled-ID Filter
+In-memory counting Bloom filter of enrolled user ids
+
+Answers "definitely not enrolled" for every id enrolled before the last
+sync; a positive answer still needs a DB lookup. Counters (instead of
+bits) let deletes remove ids. The filter is rebuilt from the users table
+at startup and periodically.
+
+Each worker process keeps its own copy and only sees its own enrolls.
+Every ENROLLED_FILTER_SYNC_SECONDS a background catch-up adds the ids
+enrolled since the last sync (updated_at at or after it, one indexed
+range query, usually empty); requests never query on a miss. An id
+enrolled through another worker therefore reads as not enrolled for up to
+one sync interval.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import select
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_COUNTER = 255
+
+# Sync points are moved back by this much, so an enroll whose transaction
+# committed just after a sync (with an earlier updated_at) is not missed
+SYNC_MARGIN = timedelta(seconds=5)
+
+
+class CountingBloomFilter:
+    """Bloom filter with 8-bit counters, sized for `capacity` items at `error_rate`"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.capacity = capacity
+        self.counters = bytearray(self.size)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing (Kirsch-Mitzenmacher) from one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item: str):
+        counters = self.counters
+        for pos in self._positions(item):
+            if counters[pos] < MAX_COUNTER:
+                counters[pos] += 1
+        self.count += 1
+
+    def remove(self, item: str):
+        """Remove an item previously added (removing unknown items corrupts the filter)"""
+        counters = self.counters
+        positions = self._positions(item)
+        if not all(counters[pos] for pos in positions):
+            return
+        for pos in positions:
+            # Saturated counters have lost their true count; leave them set
+            if counters[pos] < MAX_COUNTER:
+                counters[pos] -= 1
+        self.count -= 1
+
+    def __contains__(self, item: str) -> bool:
+        counters = self.counters
+        return all(counters[pos] for pos in self._positions(item))
+
+
+class EnrolledFilter:
+    """
+    Process-wide filter of enrolled ids, kept in step with enroll/delete
+
+    Until the first build completes every id "might be enrolled", so
+    callers fall back to the database.
+    """
+
+    def __init__(self):
+        self._filter: Optional[CountingBloomFilter] = None
+        self._pending: Optional[list] = None  # changes made while a rebuild runs
+        self.synced_at: Optional[datetime] = None  # enrolls changed before this are in the filter
+
+    @property
+    def ready(self) -> bool:
+        return self._filter is not None
+
+    def might_be_enrolled(self, user_id: str) -> bool:
+        if not settings.enrolled_filter_enabled or self._filter is None:
+            return True
+        return user_id in self._filter
+
+    def add(self, user_id: str):
+        self._apply("add", user_id)
+
+    def remove(self, user_id: str):
+        self._apply("remove", user_id)
+
+    def _apply(self, op: str, user_id: str):
+        if self._pending is not None:
+            self._pending.append((op, user_id))
+        if self._filter is not None:
+            getattr(self._filter, op)(user_id)
+
+    def build(self, user_ids: Iterable[str], count: int) -> CountingBloomFilter:
+        capacity = max(settings.enrolled_filter_capacity, count * 2)
+        bloom = CountingBloomFilter(capacity, settings.enrolled_filter_error_rate)
+        for user_id in user_ids:
+            bloom.add(user_id)
+        return bloom
+
+    async def rebuild(self):
+        """Reload enrolled ids from the users table and swap the filter in"""
+        from database import async_session
+        from models import User
+
+        self._pending = []
+        started = datetime.utcnow()
+        try:
+            async with async_session() as db:
+                ids = (await db.execute(
+                    select(User.id).where(User.embedding.isnot(None))
+                )).scalars().all()
+            bloom = self.build(ids, len(ids))
+
+            # Replay enrolls/deletes that committed while the ids were loading
+            for op, user_id in self._pending:
+                if op == "add" and user_id not in bloom:
+                    bloom.add(user_id)
+                elif op == "remove" and user_id in bloom:
+                    bloom.remove(user_id)
+            self._filter = bloom
+            self.synced_at = self._sync_point(started)
+        finally:
+            self._pending = None
+
+        logger.info(f"🧮 Enrolled-id filter built: {bloom.count} ids, {bloom.size // 1024} KB")
+
+    @staticmethod
+    def _sync_point(moment: datetime) -> datetime:
+        # func.now() stamps whole seconds on SQLite
+        return moment.replace(microsecond=0) - SYNC_MARGIN
+
+    async def catch_up(self) -> int:
+        """Add ids enrolled since the last sync (including other workers' enrolls); returns how many were new"""
+        import repository
+        from database import async_session
+
+        if self._filter is None or self.synced_at is None:
+            return 0
+        started = datetime.utcnow()
+        async with async_session() as db:
+            enrollments = await repository.get_enrollments_since(db, self.synced_at)
+        added = 0
+        for user_id in enrollments:
+            if user_id not in self._filter:
+                self.add(user_id)
+                added += 1
+        self.synced_at = max(self.synced_at, self._sync_point(started))
+        return added
+
+    async def refresh_loop(self):
+        """
+        Background task: catch up every ENROLLED_FILTER_SYNC_SECONDS and rebuild
+        (which also drops deleted ids) every ENROLLED_FILTER_REFRESH_SECONDS
+        """
+        sync_seconds = settings.enrolled_filter_sync_seconds
+        refresh_seconds = settings.enrolled_filter_refresh_seconds
+        interval = min(s for s in (sync_seconds, refresh_seconds) if s > 0)
+        rebuilt = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if refresh_seconds > 0 and time.monotonic() - rebuilt >= refresh_seconds:
+                    await self.rebuild()
+                    rebuilt = time.monotonic()
+                else:
+                    await self.catch_up()
+            except Exception as e:
+                logger.error(f"❌ Enrolled-id filter refresh failed: {e}")
+
+    def stats(self) -> dict:
+        if self._filter is None:
+            return {"enabled": settings.enrolled_filter_enabled, "ready": False}
+        return {
+            "enabled": settings.enrolled_filter_enabled,
+            "ready": True,
+            "ids": self._filter.count,
+            "capacity": self._filter.capacity,
+            "counters": self._filter.size,
+            "hash_count": self._filter.hash_count,
+        }
+
+
+# Global instance
+enrolled_filter = EnrolledFilter()
@@ -0,0 +1,243 @@
+"""
+Face Verification Service - Bulk Erasure and Data Export
+Right-to-erasure batches and per-user NDJSON exports
+
+Erase jobs walk their user ids in sorted order, ERASE_CHUNK_SIZE users per
+step: the users rows are deleted first, so no new verification can log
+against them, then their verification_logs rows go in small delete
+batches, and only then are their Merkle allowlist entries deleted
+(merkle_allowlist.revoke) along with the job checkpoint (the last id
+done). With the logs gone no allowlist build can add the wallets back.
+Every step is idempotent, so a job resumed after a crash redoes at most
+the chunk in flight. A purge of all users instead sweeps verification_logs
+by id range once the users are gone, which also catches rows whose user
+row had already been deleted, and then empties the allowlist.
+
+Exports page through the audit trail by log id in short read transactions,
+so a long export never holds a lock or the whole history in memory, and an
+interrupted download can resume with ?after=<last log id>.
+"""
+
+import base64
+import bisect
+import json
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import delete, func, select
+
+import jobs
+import merkle_allowlist
+import repository
+from config import settings
+from database import async_session
+from enrollment_filter import enrolled_filter
+from models import User, VerificationLog, decrypt_blob, decrypt_embedding
+from verification_cache import verification_cache
+
+ERASE_KIND = "erase_users"
+
+# Cursor prefix of the verification_logs sweep that ends an all-users purge
+LOG_SWEEP_CURSOR = "logs:"
+
+# Progress records are emitted every this many exported log rows
+EXPORT_PROGRESS_EVERY = 1000
+
+
+# ---- erase ----
+
+async def delete_verification_logs(user_ids: List[str]) -> int:
+    """Delete the audit rows of user_ids in small batches, each its own transaction"""
+    deleted = 0
+    while True:
+        async with async_session() as db:
+            ids = (await db.execute(
+                select(VerificationLog.id)
+                .where(VerificationLog.user_id.in_(user_ids))
+                .limit(settings.erase_log_batch_size)
+            )).scalars().all()
+            if not ids:
+                return deleted
+            await db.execute(delete(VerificationLog).where(VerificationLog.id.in_(ids)))
+            await db.commit()
+        deleted += len(ids)
+
+
+def forget_users(deleted: Dict[str, bool]):
+    """Drop erased users from in-memory state once their delete committed"""
+    for user_id, was_enrolled in deleted.items():
+        verification_cache.invalidate_user(user_id)
+        if was_enrolled:
+            enrolled_filter.remove(user_id)
+
+
+async def create_erase_job(user_ids: Optional[List[str]] = None, all_users: bool = False) -> Dict:
+    """Queue an erase job for explicit ids, or for every user (post-election purge)"""
+    if all_users:
+        async with async_session() as db:
+            total = await db.scalar(select(func.count()).select_from(User))
+        job = await jobs.create_job(ERASE_KIND, {"all_users": True}, total=total)
+    else:
+        ids = sorted({user_id.strip().lower() for user_id in user_ids or []})
+        job = await jobs.create_job(ERASE_KIND, {"user_ids": ids}, total=len(ids))
+    jobs.start_job(job["id"])
+    return job
+
+
+async def _next_chunk(params: Dict, cursor: Optional[str], size: int) -> List[str]:
+    if params.get("all_users"):
+        query = select(User.id).order_by(User.id).limit(size)
+        if cursor is not None:
+            query = query.where(User.id > cursor)
+        async with async_session() as db:
+            return list((await db.execute(query)).scalars().all())
+
+    ids = params.get("user_ids", [])
+    start = bisect.bisect_right(ids, cursor) if cursor is not None else 0
+    return ids[start:start + size]
+
+
+async def _sweep_logs(ctx: "jobs.JobContext"):
+    """Delete every verification_logs row by id range, with or without a users row"""
+    cursor = ctx.cursor or ""
+    after = int(cursor[len(LOG_SWEEP_CURSOR):]) if cursor.startswith(LOG_SWEEP_CURSOR) else 0
+    while True:
+        async with ctx.batch_slot():
+            async with async_session() as db:
+                ids = (await db.execute(
+                    select(VerificationLog.id)
+                    .where(VerificationLog.id > after)
+                    .order_by(VerificationLog.id)
+                    .limit(settings.erase_log_batch_size)
+                )).scalars().all()
+                if not ids:
+                    return
+                await db.execute(delete(VerificationLog).where(VerificationLog.id > after, VerificationLog.id <= ids[-1]))
+                await ctx.checkpoint(db, cursor=f"{LOG_SWEEP_CURSOR}{ids[-1]}", logs_deleted=len(ids))
+                await db.commit()
+        after = ids[-1]
+        await ctx.throttle()
+
+
+@jobs.register(ERASE_KIND)
+async def erase_users(ctx: "jobs.JobContext"):
+    all_users = bool(ctx.params.get("all_users"))
+    while not (ctx.cursor or "").startswith(LOG_SWEEP_CURSOR):
+        chunk = await _next_chunk(ctx.params, ctx.cursor, settings.erase_chunk_size)
+        if not chunk:
+            break
+
+        async with ctx.batch_slot():
+            # Users first: once their row is gone no verification can add a log for them
+            async with async_session() as db:
+                deleted = await repository.delete_users(db, chunk)
+                await db.commit()
+            forget_users(deleted)
+
+            logs_deleted = 0 if all_users else await delete_verification_logs(chunk)
+            async with async_session() as db:
+                await merkle_allowlist.revoke(db, chunk)
+                await ctx.checkpoint(
+                    db, cursor=chunk[-1], processed=len(chunk),
+                    users_deleted=len(deleted), logs_deleted=logs_deleted,
+                )
+                await db.commit()
+
+        await ctx.throttle()
+
+    if all_users:
+        await _sweep_logs(ctx)
+        async with async_session() as db:
+            await merkle_allowlist.revoke(db)
+            await db.commit()
+
+
+# ---- export ----
+
+def _line(record: Dict) -> bytes:
+    return (json.dumps(record, default=str) + "\n").encode()
+
+
+def _log_record(log: VerificationLog) -> Dict:
+    return {
+        "type": "verification_log",
+        "id": log.id,
+        "timestamp": log.timestamp.isoformat() if log.timestamp else None,
+        "success": log.success,
+        "similarity_score": log.similarity_score,
+        "liveness_passed": log.liveness_passed,
+        "ip_address": log.ip_address,
+        "user_agent": log.user_agent,
+        "failure_reason": log.failure_reason,
+    }
+
+
+async def _user_record(user_id: str) -> Dict:
+    async with async_session() as db:
+        row = (await db.execute(
+            select(
+                User.created_at, User.updated_at, User.is_active,
+                User.enrollment_count, User.metadata_json, User.embedding, User.face_crop,
+            ).where(User.id == user_id)
+        )).first()
+
+    if row is None:
+        return {"type": "user", "user_id": user_id, "found": False}
+
+    embedding = decrypt_embedding(row.embedding)
+    return {
+        "type": "user",
+        "user_id": user_id,
+        "found": True,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+        "is_active": row.is_active,
+        "enrollment_count": row.enrollment_count,
+        "metadata": json.loads(row.metadata_json or "{}"),
+        # The face template, decrypted, as a list of float32 values
+        "embedding": embedding.tolist() if embedding is not None else None,
+        # Retained aligned face crop (RETAIN_ENROLLMENT_CROPS), base64 PNG
+        "face_crop_png": base64.b64encode(decrypt_blob(row.face_crop)).decode() if row.face_crop else None,
+    }
+
+
+async def export_user_ndjson(user_id: str, after_log_id: int = 0) -> AsyncIterator[bytes]:
+    """
+    Stream a user's stored data and audit trail as NDJSON lines
+    Record types: "user" (first page only), "verification_log", "progress"
+    and a final "summary" with throughput and the last exported log id
+    """
+    start = time.perf_counter()
+    if after_log_id == 0:
+        yield _line(await _user_record(user_id))
+
+    rows = 0
+    last_id = after_log_id
+    while True:
+        async with async_session() as db:
+            page = (await db.execute(
+                select(VerificationLog)
+                .where(VerificationLog.user_id == user_id, VerificationLog.id > last_id)
+                .order_by(VerificationLog.id)
+                .limit(settings.export_page_size)
+            )).scalars().all()
+        if not page:
+            break
+
+        for log in page:
+            yield _line(_log_record(log))
+            rows += 1
+            if rows % EXPORT_PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - start
+                yield _line({"type": "progress", "log_rows": rows, "rows_per_second": round(rows / elapsed, 1)})
+        last_id = page[-1].id
+
+    elapsed = time.perf_counter() - start
+    yield _line({
+        "type": "summary",
+        "user_id": user_id,
+        "log_rows": rows,
+        "last_log_id": last_id,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else None,
+    })
@@ -1,6 +1,6 @@
 """
 Face Verification Service - Face Processing Module
-Uses InsightFace for face detection and embedding extraction
+Face detection and embedding extraction on the configured inference backend (backends.py)
 """
 
 import numpy as np
@@ -8,64 +8,142 @@ import cv2
 from PIL import Image
 import io
 import base64
-from typing import Optional, Tuple, List
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional, Tuple, List
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from config import settings
+from metrics import metrics
+import backends
+
 logger = logging.getLogger(__name__)
 
-# Global model instance (loaded once)
+# Global model instance (loaded once, replaced by a hot reload - see lifecycle.py)
 _face_analyzer = None
+_load_lock = threading.Lock()
+
+# Analyzer a worker thread keeps using for the request it is running
+_pinned = threading.local()
+
+# Faces smaller than this fraction of the frame are rejected before recognition
+MIN_FACE_SIZE_RATIO = 0.05
+
+# Side of the aligned face crop the recognition model consumes
+ALIGNED_CROP_SIZE = 112
+
+
+def load_face_analyzer(model_name: Optional[str] = None):
+    """
+    Load, prepare and warm up new face models on INFERENCE_BACKEND
+    Uses FACE_MODEL_NAME (buffalo_l, the most accurate pack) unless another
+    model pack is named; does not touch the one currently serving. With
+    INFERENCE_BACKEND=auto the fastest conforming engine on this host is
+    picked (see backends.py).
+    """
+    model_name = model_name or settings.face_model_name
+    try:
+        logger.info(f"🔄 Loading model pack {model_name} on {settings.inference_backend} (first time may take a moment)...")
+        
+        # Prepared for the full detector input size (640x640 by default)
+        full_size = settings.detector_input_size
+        if settings.inference_backend == "auto":
+            analyzer = backends.select_backend(model_name, full_size)
+        else:
+            analyzer = backends.load_backend(settings.inference_backend, model_name, full_size)
+        warm_up_detector(analyzer)
+        warm_up_recognition(analyzer)
+        
+        logger.info(f"✅ Model pack {model_name} loaded on {analyzer.name}")
+        return analyzer
+        
+    except Exception as e:
+        logger.error(f"❌ Failed to load face models: {e}")
+        raise RuntimeError(f"Failed to initialize face analyzer: {e}")
 
 
-def get_face_analyzer():
+def get_face_analyzer(loader: Optional[Callable] = None):
     """
-    Get or initialize the InsightFace analyzer
-    Uses buffalo_l model for high accuracy
+    Get or initialize the face models (an InferenceBackend)
+    Inside pinned_analyzer() this is the analyzer the block started with.
+    `loader(model_name)` replaces load_face_analyzer for the first load.
     """
     global _face_analyzer
     
+    analyzer = getattr(_pinned, "analyzer", None)
+    if analyzer is not None:
+        return analyzer
+    
     if _face_analyzer is None:
-        try:
-            from insightface.app import FaceAnalysis
-            
-            logger.info("🔄 Loading InsightFace model (first time may take a moment)...")
-            
-            # Initialize with buffalo_l model (best accuracy)
-            _face_analyzer = FaceAnalysis(
-                name='buffalo_l',
-                providers=['CPUExecutionProvider']  # Use CPU (GPU optional)
-            )
-            
-            # Prepare for 640x640 input
-            _face_analyzer.prepare(ctx_id=0, det_size=(640, 640))
-            
-            logger.info("✅ InsightFace model loaded successfully")
-            
-        except ImportError:
-            logger.error("❌ InsightFace library not found. Please install it with: pip install insightface")
-            raise RuntimeError("InsightFace library not found. Please install it with: pip install insightface")
-        except Exception as e:
-            logger.error(f"❌ Failed to load InsightFace model: {e}")
-            raise RuntimeError(f"Failed to initialize face analyzer: {e}")
+        # Startup warm-up and the first requests may get here at the same time
+        with _load_lock:
+            if _face_analyzer is None:
+                _face_analyzer = (loader or load_face_analyzer)(settings.face_model_name)
     
     return _face_analyzer
 
 
+def install_face_analyzer(analyzer):
+    """Make `analyzer` the one new requests use; returns the one it replaces"""
+    global _face_analyzer
+    
+    with _load_lock:
+        previous, _face_analyzer = _face_analyzer, analyzer
+    return previous
+
+
+@contextmanager
+def pinned_analyzer():
+    """
+    Keep using the current analyzer for everything this thread runs in the block
+    A reload that swaps models meanwhile only affects later requests, so
+    detection and recognition of one frame always come from the same model set.
+    """
+    previous = getattr(_pinned, "analyzer", None)
+    _pinned.analyzer = previous if previous is not None else _face_analyzer
+    try:
+        yield
+    finally:
+        _pinned.analyzer = previous
+
+
+def describe_backend() -> Optional[dict]:
+    """Engine and threads of the serving models (with INFERENCE_BACKEND=auto, also the startup timings)"""
+    analyzer = _face_analyzer
+    return analyzer.describe() if analyzer is not None else None
+
+
 def decode_image(image_data: str) -> np.ndarray:
     """
     Decode base64 image string to numpy array (BGR format for OpenCV)
     Handles both data URL format and raw base64
     """
+    return decode_image_bytes(decode_base64_image(image_data))
+
+
+def decode_base64_image(image_data: str) -> bytes:
+    """
+    Decode a base64 image string (data URL or raw base64) to encoded image bytes
+    Cheap compared to decode_image_bytes, so callers can hash the result first
+    """
     try:
         # Handle data URL format (e.g., "data:image/jpeg;base64,...")
         if "," in image_data:
             image_data = image_data.split(",")[1]
         
-        # Decode base64
-        image_bytes = base64.b64decode(image_data)
+        return base64.b64decode(image_data)
         
+    except Exception as e:
+        logger.error(f"Failed to decode image: {e}")
+        raise ValueError(f"Invalid image data: {e}")
+
+
+def decode_image_bytes(image_bytes: bytes) -> np.ndarray:
+    """
+    Decode encoded image bytes (JPEG/PNG) to numpy array (BGR format for OpenCV)
+    """
+    try:
         # Convert to PIL Image
         pil_image = Image.open(io.BytesIO(image_bytes))
         
@@ -86,37 +164,217 @@ def decode_image(image_data: str) -> np.ndarray:
         raise ValueError(f"Invalid image data: {e}")
 
 
+def detector_sizes() -> List[int]:
+    """Detector input sizes in the order they are tried"""
+    full_size = settings.detector_input_size
+    fast_size = settings.detector_fast_input_size
+    if 0 < fast_size < full_size:
+        return [fast_size, full_size]
+    return [full_size]
+
+
+def _run_detector(analyzer, image: np.ndarray, size: int):
+    start = time.perf_counter()
+    bboxes, kpss = analyzer.detect(image, size)
+    metrics.observe(f"detector.{size}.latency", (time.perf_counter() - start) * 1000)
+    return bboxes, kpss
+
+
+def warm_up_detector(analyzer):
+    """
+    Run a blank frame through the detector at every configured input size
+    so the first real request at either size does not pay for allocation
+    """
+    blank = np.zeros((480, 640, 3), dtype=np.uint8)
+    for size in detector_sizes():
+        analyzer.detect(blank, size)
+
+
+def warm_up_recognition(analyzer):
+    """Embed one blank aligned crop so the first enrollment does not pay for allocation"""
+    blank = np.zeros((ALIGNED_CROP_SIZE, ALIGNED_CROP_SIZE, 3), dtype=np.uint8)
+    analyzer.embed([blank])
+
+
 def detect_faces(image: np.ndarray) -> List:
     """
-    Detect all faces in an image
-    Returns list of face objects with bounding boxes and embeddings
+    Detect all faces in an image (detection model only)
+    Returns list of face objects with bounding boxes, keypoints and det_score;
+    embeddings are computed separately for the chosen face by embed_face()
+    
+    Webcam selfies are tried at the small input size first; the full size
+    is used only when that pass finds no confident face.
     """
+    from insightface.app.common import Face
+    
     analyzer = get_face_analyzer()
-    faces = analyzer.get(image)
+    sizes = detector_sizes()
+    metrics.increment("detector.requests")
+    
+    for size in sizes:
+        bboxes, kpss = _run_detector(analyzer, image, size)
+        if size == sizes[-1]:
+            break
+        if bboxes.shape[0] and float(bboxes[:, 4].max()) >= settings.detector_escalation_score:
+            metrics.increment("detector.fast_pass_hits")
+            break
+        metrics.increment("detector.escalations")
+    
+    faces = []
+    for i in range(bboxes.shape[0]):
+        faces.append(Face(
+            bbox=bboxes[i, 0:4],
+            kps=kpss[i] if kpss is not None else None,
+            det_score=bboxes[i, 4],
+            det_input_size=size
+        ))
     return faces
 
 
-def extract_embedding(image: np.ndarray) -> Tuple[Optional[np.ndarray], str]:
+def _face_area(face) -> float:
+    return float((face.bbox[2] - face.bbox[0]) * (face.bbox[3] - face.bbox[1]))
+
+
+def measure_face(image: np.ndarray, face, face_count: int = 1) -> dict:
+    """
+    Cheap geometry checks for one detected face (no model inference)
+    Returns the quality dict used by get_face_quality()
+    """
+    bbox = face.bbox
+    
+    # Calculate face size relative to image
+    img_height, img_width = image.shape[:2]
+    face_width = bbox[2] - bbox[0]
+    face_height = bbox[3] - bbox[1]
+    face_area_ratio = (face_width * face_height) / (img_width * img_height)
+    
+    # Quality checks
+    quality = {
+        "valid": True,
+        "face_count": face_count,
+        "face_size_ratio": round(float(face_area_ratio), 3),
+        "face_width": int(face_width),
+        "face_height": int(face_height),
+        "bbox": [int(x) for x in bbox],
+        "det_score": round(float(face.det_score), 3),
+        "det_input_size": face.det_input_size,
+    }
+    
+    # Minimum face size check (at least 5% of image)
+    if face_area_ratio < MIN_FACE_SIZE_RATIO:
+        quality["valid"] = False
+        quality["reason"] = "Face too small - move closer to camera"
+    
+    # Check if face is centered (roughly)
+    face_center_x = (bbox[0] + bbox[2]) / 2
+    face_center_y = (bbox[1] + bbox[3]) / 2
+    
+    center_offset_x = abs(face_center_x - img_width / 2) / img_width
+    center_offset_y = abs(face_center_y - img_height / 2) / img_height
+    
+    quality["center_offset_x"] = round(float(center_offset_x), 3)
+    quality["center_offset_y"] = round(float(center_offset_y), 3)
+    
+    if center_offset_x > 0.3 or center_offset_y > 0.3:
+        quality["warning"] = "Face not centered - please look at camera"
+    
+    return quality
+
+
+def detect_target_face(image: np.ndarray) -> Tuple[Optional[object], dict]:
+    """
+    Stages 1-2 of the cascade: detection, then geometry checks
+    Picks the target face (largest confident face) without running
+    recognition, so crowded frames only pay for one embedding.
+    Returns (face or None, quality dict)
+    """
+    faces = [f for f in detect_faces(image) if float(f.det_score) >= settings.min_detection_score]
+    
+    if len(faces) == 0:
+        return None, {"valid": False, "reason": "No face detected", "status": "no_face"}
+    
+    # Use the largest face (by bounding box area)
+    face = max(faces, key=_face_area)
+    if len(faces) > 1:
+        logger.warning("Multiple faces detected (%d), using largest face", len(faces),
+                       extra={"event": "face.multiple", "faces": len(faces)})
+    
+    quality = measure_face(image, face, face_count=len(faces))
+    quality["status"] = "success" if quality["valid"] else "face_too_small"
+    return face, quality
+
+
+def embed_face(image: np.ndarray, face) -> np.ndarray:
+    """
+    Stage 3 of the cascade: align and run recognition on one face only
+    """
+    return get_face_analyzer().embed_face(image, face)
+
+
+
+def align_face_crop(image: np.ndarray, face) -> np.ndarray:
+    """The aligned crop recognition sees for this face (retained for re-embedding)"""
+    return get_face_analyzer().align(image, face.kps, ALIGNED_CROP_SIZE)
+
+
+def embed_aligned_crops(crops: List[np.ndarray]) -> np.ndarray:
+    """Run recognition on already aligned crops in one batch (one embedding per row)"""
+    return get_face_analyzer().embed(crops)
+
+
+def encode_face_crop(crop: np.ndarray) -> bytes:
+    """Lossless PNG, so a re-embedded crop matches what the model saw at enrollment"""
+    ok, buffer = cv2.imencode(".png", crop)
+    if not ok:
+        raise ValueError("Could not encode face crop")
+    return buffer.tobytes()
+
+
+def decode_face_crop(data: bytes) -> np.ndarray:
+    crop = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if crop is None:
+        raise ValueError("Could not decode face crop")
+    return crop
+
+
+def analyze_face(image: np.ndarray) -> dict:
+    """
+    Full cascade for enrollment: detect, gate on geometry, then embed
+    Frames that fail the geometry checks never reach the recognition model.
+    Returns the quality dict plus "face" and "embedding" (None when rejected)
+    """
+    try:
+        face, quality = detect_target_face(image)
+        quality["face"] = face
+        quality["embedding"] = None
+        
+        if face is not None and quality["valid"]:
+            quality["embedding"] = embed_face(image, face)
+        return quality
+        
+    except Exception as e:
+        logger.error(f"Face analysis failed: {e}", exc_info=True)
+        return {
+            "valid": False, "reason": f"Quality check failed: {str(e)}", "status": f"error: {str(e)}",
+            "face": None, "embedding": None
+        }
+
+
+def extract_embedding(image: np.ndarray, face=None) -> Tuple[Optional[np.ndarray], str]:
     """
     Extract face embedding from image
     Returns (embedding, status_message)
     - embedding: 512-dimensional numpy array or None
-    - status: "success", "no_face", "multiple_faces", or error message
+    - status: "success", "no_face", or error message
+    Pass `face` (e.g. from detect_target_face) to skip detection.
     """
     try:
-        faces = detect_faces(image)
+        if face is None:
+            face, _ = detect_target_face(image)
+            if face is None:
+                return None, "no_face"
         
-        if len(faces) == 0:
-            return None, "no_face"
-        
-        if len(faces) > 1:
-            # Use the largest face (by bounding box area)
-            largest_face = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
-            logger.warning("Multiple faces detected, using largest face")
-            return largest_face.embedding, "success"
-        
-        # Single face found
-        return faces[0].embedding, "success"
+        return embed_face(image, face), "success"
         
     except Exception as e:
         logger.error(f"Embedding extraction failed: {e}", exc_info=True)
@@ -148,51 +406,10 @@ def compare_embeddings(embedding1: np.ndarray, embedding2: np.ndarray) -> float:
 def get_face_quality(image: np.ndarray) -> dict:
     """
     Assess face image quality
-    Returns quality metrics for validation
+    Returns quality metrics for validation (detection only, no recognition)
     """
     try:
-        faces = detect_faces(image)
-        
-        if len(faces) == 0:
-            return {"valid": False, "reason": "No face detected"}
-        
-        face = faces[0]
-        bbox = face.bbox
-        
-        # Calculate face size relative to image
-        img_height, img_width = image.shape[:2]
-        face_width = bbox[2] - bbox[0]
-        face_height = bbox[3] - bbox[1]
-        face_area_ratio = (face_width * face_height) / (img_width * img_height)
-        
-        # Quality checks
-        quality = {
-            "valid": True,
-            "face_count": len(faces),
-            "face_size_ratio": round(face_area_ratio, 3),
-            "face_width": int(face_width),
-            "face_height": int(face_height),
-            "bbox": [int(x) for x in bbox],
-        }
-        
-        # Minimum face size check (at least 5% of image)
-        if face_area_ratio < 0.05:
-            quality["valid"] = False
-            quality["reason"] = "Face too small - move closer to camera"
-        
-        # Check if face is centered (roughly)
-        face_center_x = (bbox[0] + bbox[2]) / 2
-        face_center_y = (bbox[1] + bbox[3]) / 2
-        
-        center_offset_x = abs(face_center_x - img_width / 2) / img_width
-        center_offset_y = abs(face_center_y - img_height / 2) / img_height
-        
-        quality["center_offset_x"] = round(center_offset_x, 3)
-        quality["center_offset_y"] = round(center_offset_y, 3)
-        
-        if center_offset_x > 0.3 or center_offset_y > 0.3:
-            quality["warning"] = "Face not centered - please look at camera"
-        
+        face, quality = detect_target_face(image)
         return quality
         
     except Exception as e:
@@ -0,0 +1,167 @@
+"""
+Face Verification Service - Chain Indexer API
+Cached HTTP API over the tallies chain_indexer.py keeps from Voting.sol events
+
+Dashboards poll this instead of calling getAllVotesOfCandidates /
+getTotalVotes on the RPC node. Responses are cached in memory for
+INDEXER_CACHE_SECONDS and carry an ETag of the last indexed block, so a
+poll with If-None-Match gets a 304 until a new block is indexed. Only
+the process holding the indexer's writer lease (this one or an API worker,
+see chain_indexer.py) writes the tables; /health reports which.
+
+Run: python indexer_main.py  (or uvicorn indexer_main:app --port 8001)
+"""
+
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+
+import chain_indexer
+from config import settings
+from database import init_db
+from logging_setup import configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+app = FastAPI(
+    title="VotEth Chain Indexer",
+    description="Vote tallies indexed from Voting.sol events",
+    version="1.0.0",
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=settings.cors_origins,
+    allow_credentials=True,
+    allow_methods=["GET", "OPTIONS"],
+    allow_headers=["*"],
+    expose_headers=["ETag"],
+)
+
+
+class ResponseCache:
+    """Query results keyed by request, reused while fresh and tagged with the indexed block"""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, tuple] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str, load: Callable) -> Dict:
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl_seconds:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        body = await load()
+        self._entries[key] = (time.monotonic(), body)
+        return body
+
+    def clear(self):
+        self._entries.clear()
+
+
+cache = ResponseCache(settings.indexer_cache_seconds)
+
+
+def cached_response(request: Request, body: Dict, block: Optional[int]) -> Response:
+    etag = f'W/"{block}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={int(settings.indexer_cache_seconds)}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(body, headers=headers)
+
+
+# ============== Startup/Shutdown Events ==============
+
+@app.on_event("startup")
+async def startup_event():
+    await init_db()
+    app.state.indexer_task = None
+    if settings.chain_rpc_url and settings.voting_contract_address:
+        app.state.indexer = chain_indexer.ChainIndexer.from_settings()
+        app.state.indexer_task = asyncio.create_task(app.state.indexer.run_loop())
+    else:
+        logger.warning("⚠️ CHAIN_RPC_URL / VOTING_CONTRACT_ADDRESS not set; serving the existing index only")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    task = getattr(app.state, "indexer_task", None)
+    if task:
+        task.cancel()
+
+
+# ============== Endpoints ==============
+
+@app.get("/health")
+async def health():
+    indexer = getattr(app.state, "indexer", None)
+    tallies = await chain_indexer.get_tallies()
+    head = indexer.head if indexer else None
+    last_block = tallies["last_block"]
+    return {
+        "status": "healthy",
+        "last_block": last_block,
+        "head": head,
+        "lag_blocks": head - last_block if head is not None and last_block is not None else None,
+        "writer": indexer.is_writer if indexer else False,
+        "cache": {"hits": cache.hits, "misses": cache.misses},
+    }
+
+
+@app.get("/tallies")
+async def tallies(request: Request):
+    """Per-candidate vote counts, total votes and the voting window"""
+    body = await cache.get("tallies", chain_indexer.get_tallies)
+    return cached_response(request, body, body["last_block"])
+
+
+@app.get("/tallies/intervals")
+async def tally_intervals(
+    request: Request,
+    since: Optional[int] = Query(None, description="Unix seconds, inclusive"),
+    until: Optional[int] = Query(None, description="Unix seconds, exclusive"),
+):
+    """Votes per INDEXER_INTERVAL_SECONDS bucket, per candidate"""
+    async def load():
+        tallies = await chain_indexer.get_tallies()
+        return {
+            "last_block": tallies["last_block"],
+            "interval_seconds": settings.indexer_interval_seconds,
+            "intervals": await chain_indexer.get_intervals(since, until),
+        }
+
+    body = await cache.get(f"intervals:{since}:{until}", load)
+    return cached_response(request, body, body["last_block"])
+
+
+@app.get("/voters/{address}")
+async def voter(address: str):
+    """Registration and voted flags of one wallet as indexed"""
+    record = await chain_indexer.get_voter(address)
+    if record is None:
+        raise HTTPException(status_code=404, detail="No events for this address")
+    return record
+
+
+# ============== Run Server ==============
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "indexer_main:app",
+        host=settings.host,
+        port=settings.indexer_port,
+        reload=False,
+        log_level="info",
+        log_config=None
+    )
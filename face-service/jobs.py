@@ -0,0 +1,349 @@
+"""
+Face Verification Service - Background Jobs
+Persistent, resumable admin jobs (bulk erase, key rotation, re-embedding)
+
+A job row in background_jobs records its parameters, a handler-defined
+cursor and progress counters. Handlers work in chunks and commit each
+chunk's changes together with the new cursor, so a crash loses at most
+the chunk in flight and the job resumes from the last checkpoint on the
+next startup. A lease (owner + heartbeat) keeps two worker processes from
+running the same job.
+
+Jobs yield to live traffic: the pause between chunks grows while recent
+verify latency is above JOB_THROTTLE_LATENCY_MS, and parallel work holds
+batch-class admission slots. Pausing a job is a status change in the row,
+noticed at the handler's next checkpoint.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
+
+import admission
+from config import settings
+from database import async_session
+from metrics import metrics
+from models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, PAUSED, COMPLETED, FAILED = "pending", "running", "paused", "completed", "failed"
+
+# Identifies this process in job leases
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+# kind -> async handler(JobContext)
+HANDLERS: Dict[str, Callable[["JobContext"], Awaitable[None]]] = {}
+
+# Running tasks, so they are not garbage collected
+_tasks = set()
+
+
+def register(kind: str):
+    """Decorator registering a job handler for `kind`"""
+    def decorator(handler):
+        HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+
+class LeaseLost(RuntimeError):
+    """Another worker took over the job (this one stalled past the lease)"""
+
+
+class JobPaused(RuntimeError):
+    """An admin paused the job; the chunk in flight is rolled back"""
+
+
+class JobContext:
+    """What a handler sees of its job: params, resume cursor and checkpointing"""
+
+    def __init__(self, job: BackgroundJob, params: Dict):
+        self.job_id = job.id
+        self.kind = job.kind
+        self.params = params
+        self.cursor = job.cursor
+        self.total = job.total
+        self.processed = job.processed or 0
+        self.counters = json.loads(job.counters or "{}")
+        self.delay_ms = settings.job_pause_ms
+        self._last_checkpoint = time.perf_counter()
+
+    async def checkpoint(self, db: AsyncSession, cursor: Optional[str], processed: int = 0, **counts):
+        """
+        Record progress in the caller's transaction (the caller commits)
+        Committing the chunk's changes and its checkpoint together is what
+        makes resuming exact.
+        """
+        now = time.perf_counter()
+        self.cursor = cursor
+        self.processed += processed
+        for name, value in counts.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+        result = await db.execute(
+            update(BackgroundJob)
+            .where(
+                BackgroundJob.id == self.job_id,
+                BackgroundJob.owner == WORKER_ID,
+                BackgroundJob.status == RUNNING,
+            )
+            .values(
+                cursor=cursor,
+                processed=self.processed,
+                counters=json.dumps(self.counters),
+                active_seconds=BackgroundJob.active_seconds + (now - self._last_checkpoint),
+                heartbeat_at=datetime.utcnow(),
+            )
+        )
+        if result.rowcount != 1:
+            status = await db.scalar(select(BackgroundJob.status).where(BackgroundJob.id == self.job_id))
+            if status == PAUSED:
+                raise JobPaused(f"Job {self.job_id} paused")
+            raise LeaseLost(f"Job {self.job_id} is no longer owned by this worker")
+        self._last_checkpoint = now
+
+    async def set_total(self, total: int):
+        self.total = total
+        async with async_session() as db:
+            await db.execute(update(BackgroundJob).where(BackgroundJob.id == self.job_id).values(total=total))
+            await db.commit()
+
+    async def throttle(self):
+        """
+        Sleep between chunks so live requests get the DB write lock and CPU
+        The sleep doubles (up to JOB_MAX_PAUSE_MS) while recent verify p95 is
+        above JOB_THROTTLE_LATENCY_MS and halves back once it recovers.
+        """
+        live_p95 = metrics.percentile(
+            "admission.verify.service", 0.95, within_seconds=settings.job_throttle_window_seconds
+        )
+        if live_p95 is not None and live_p95 > settings.job_throttle_latency_ms:
+            self.delay_ms = min(settings.job_max_pause_ms, max(self.delay_ms, 1.0) * 2)
+            metrics.increment("jobs.throttled")
+        else:
+            self.delay_ms = max(settings.job_pause_ms, self.delay_ms / 2)
+        await asyncio.sleep(self.delay_ms / 1000.0)
+
+    async def map(self, fn: Callable[[Sequence], List], items: Sequence) -> List:
+        """
+        Run a blocking fn(slice) -> list over items on up to JOB_WORKERS threads
+        Each worker holds its own batch admission slot, so parallelism shrinks
+        along with everything else when the service is loaded.
+        """
+        if not items:
+            return []
+        workers = max(1, min(settings.job_workers, len(items)))
+        size = -(-len(items) // workers)
+
+        async def work(part):
+            async with self.batch_slot():
+                return await asyncio.to_thread(fn, part)
+
+        parts = await asyncio.gather(*(work(items[i:i + size]) for i in range(0, len(items), size)))
+        return [result for part in parts for result in part]
+
+    @asynccontextmanager
+    async def batch_slot(self):
+        """Admission slot in the batch class; waits and retries instead of failing when shed"""
+        if not settings.admission_enabled:
+            yield
+            return
+        while True:
+            try:
+                await admission.controller.acquire(admission.BATCH)
+                break
+            except admission.AdmissionRejected:
+                await asyncio.sleep(1.0)
+        try:
+            yield
+        finally:
+            admission.controller.release()
+
+
+# ---- job lifecycle ----
+
+async def create_job(kind: str, params: Dict, total: Optional[int] = None) -> Dict:
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    job = BackgroundJob(
+        id=uuid.uuid4().hex,
+        kind=kind,
+        status=PENDING,
+        params=json.dumps(params),
+        total=total,
+        processed=0,
+        counters="{}",
+        active_seconds=0.0,
+    )
+    async with async_session() as db:
+        db.add(job)
+        await db.commit()
+    logger.info(f"🧾 Created {kind} job {job.id}")
+    return job.to_dict()
+
+
+async def get_job(job_id: str) -> Optional[Dict]:
+    async with async_session() as db:
+        job = await db.get(BackgroundJob, job_id)
+        return job.to_dict() if job else None
+
+
+async def list_jobs(limit: int = 50) -> List[Dict]:
+    async with async_session() as db:
+        jobs = (await db.execute(
+            select(BackgroundJob).order_by(BackgroundJob.created_at.desc()).limit(limit)
+        )).scalars().all()
+        return [job.to_dict() for job in jobs]
+
+
+async def _claim(job_id: str) -> bool:
+    """Take the lease on a pending job, or a running one whose owner stopped heartbeating"""
+    stale = datetime.utcnow() - timedelta(seconds=settings.job_lease_seconds)
+    now = datetime.utcnow()
+    async with async_session() as db:
+        result = await db.execute(
+            update(BackgroundJob)
+            .where(
+                BackgroundJob.id == job_id,
+                or_(
+                    BackgroundJob.status == PENDING,
+                    (BackgroundJob.status == RUNNING) & or_(
+                        BackgroundJob.owner == WORKER_ID,
+                        BackgroundJob.heartbeat_at.is_(None),
+                        BackgroundJob.heartbeat_at < stale,
+                    ),
+                ),
+            )
+            .values(status=RUNNING, owner=WORKER_ID, heartbeat_at=now)
+        )
+        claimed = result.rowcount == 1
+        if claimed:
+            await db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == job_id, BackgroundJob.started_at.is_(None))
+                .values(started_at=now)
+            )
+        await db.commit()
+        return claimed
+
+
+async def pause_job(job_id: str) -> Optional[Dict]:
+    """Ask a pending or running job to stop at its next checkpoint"""
+    async with async_session() as db:
+        await db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.status.in_((PENDING, RUNNING)))
+            .values(status=PAUSED)
+        )
+        await db.commit()
+    return await get_job(job_id)
+
+
+async def resume_job(job_id: str) -> Optional[Dict]:
+    """Continue a paused job from its last checkpoint"""
+    async with async_session() as db:
+        result = await db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.status == PAUSED)
+            .values(status=PENDING, owner=None)
+        )
+        await db.commit()
+    if result.rowcount == 1:
+        start_job(job_id)
+    return await get_job(job_id)
+
+
+async def _finish(job_id: str, status: str, error: Optional[str] = None):
+    async with async_session() as db:
+        await db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.owner == WORKER_ID)
+            .values(status=status, error=error, finished_at=datetime.utcnow(), owner=None)
+        )
+        await db.commit()
+
+
+async def _release(job_id: str):
+    async with async_session() as db:
+        await db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.owner == WORKER_ID)
+            .values(owner=None)
+        )
+        await db.commit()
+
+
+async def run_job(job_id: str):
+    """Claim and run one job to completion (or failure)"""
+    if not await _claim(job_id):
+        logger.info(f"⏭️  Job {job_id} is paused, finished or owned by another worker")
+        return
+
+    async with async_session() as db:
+        job = await db.get(BackgroundJob, job_id, options=[undefer(BackgroundJob.params)])
+        params = json.loads(job.params or "{}")
+        context = JobContext(job, params)
+
+    handler = HANDLERS.get(context.kind)
+    if handler is None:
+        await _finish(job_id, FAILED, f"No handler for job kind '{context.kind}'")
+        return
+
+    logger.info(f"▶️  Running {context.kind} job {job_id} from cursor {context.cursor!r}")
+    try:
+        await handler(context)
+    except asyncio.CancelledError:
+        # Shutdown: leave the job running; it resumes from its last checkpoint
+        raise
+    except LeaseLost as e:
+        logger.warning(f"⚠️ {e}; stopping")
+        return
+    except JobPaused:
+        await _release(job_id)
+        logger.info(f"⏸️  Job {job_id} paused at cursor {context.cursor!r} ({context.processed} items done)")
+        return
+    except Exception as e:
+        logger.error(f"❌ Job {job_id} failed: {e}", exc_info=True)
+        await _finish(job_id, FAILED, str(e)[:1000])
+        return
+
+    await _finish(job_id, COMPLETED)
+    logger.info(f"✅ Job {job_id} completed: {context.processed} items, {context.counters}")
+
+
+def start_job(job_id: str) -> asyncio.Task:
+    task = asyncio.create_task(run_job(job_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def resume_incomplete_jobs() -> int:
+    """Restart jobs left pending or running (e.g. by a crash); returns jobs started"""
+    async with async_session() as db:
+        ids = (await db.execute(
+            select(BackgroundJob.id).where(BackgroundJob.status.in_((PENDING, RUNNING)))
+        )).scalars().all()
+    for job_id in ids:
+        start_job(job_id)
+    if ids:
+        logger.info(f"🔁 Resuming {len(ids)} background job(s)")
+    return len(ids)
+
+
+def cancel_running_tasks():
+    """Stop job tasks at shutdown; their rows stay 'running' and are resumed later"""
+    for task in list(_tasks):
+        task.cancel()
@@ -0,0 +1,307 @@
+"""
+Face Verification Service - Lifecycle
+Readiness, graceful drain and hot model reload for one worker
+
+Liveness (/health/live) only says the process answers. Readiness
+(/health/ready) turns true once the face models are loaded and warmed and
+READINESS_DB_CONNECTIONS pool connections are open; until then - including
+while a failed model load is being retried - it answers 503, so a rolling
+deploy does not send traffic to a cold worker. A worker the memory
+watchdog is recycling reports not ready as well.
+
+Verify and enroll run their pipeline (pipeline.py) through track(), which
+counts it in flight until its last stage returns. On shutdown the worker
+stops admitting new inference (503 with Retry-After) and waits up to
+WORKER_DRAIN_TIMEOUT_SECONDS for the counted runs before the background
+tasks are cancelled and the pools closed.
+
+POST /admin/models/reload loads a model set (another FACE_MODEL_NAME, or the
+same pack re-read from disk) in a background thread while the current one
+keeps serving, then installs it with one reference swap. Each inference
+pins the analyzer it started with (face_processor.pinned_analyzer), so no
+request is dropped or sees two model sets; the old set is freed once the
+last of them finishes. Both sets are in memory during the reload.
+
+The request is recorded as a new model generation (model_generations), and
+every worker polls for it every MODEL_RELOAD_POLL_SECONDS and runs the same
+reload, so with WEB_CONCURRENCY > 1 all of them switch within one poll. A
+worker that starts later adopts the last generation once warm, unless
+FACE_MODEL_NAME was changed since it was requested (the restart then wins).
+
+A different recognition model changes every embedding, so a pack change is
+refused unless it asks for reembed: the worker that took the request then
+queues a reembed_users job once it has switched. Until that job finishes,
+users it has not reached yet fail verification, and users enrolled without
+a retained face crop have to enroll again; the 202 response says so.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select, text
+
+import antispoof
+import face_processor
+import maintenance
+import memory
+from config import settings
+from database import async_session, engine
+from metrics import metrics
+from models import ModelGeneration
+from verification_cache import verification_cache
+
+logger = logging.getLogger(__name__)
+
+STARTING, READY, DRAINING, STOPPED = "starting", "ready", "draining", "stopped"
+
+
+class LifecycleError(Exception):
+    """A model reload that cannot start now"""
+
+
+class Lifecycle:
+    """Warm-up, in-flight inference tracking and model swaps for this worker"""
+
+    def __init__(self, loader: Optional[Callable] = None, db_connections: int = 2, retry_seconds: float = 10.0):
+        # loader(model_name) -> prepared and warmed analyzer
+        self.loader = loader or face_processor.load_face_analyzer
+        self.db_connections = db_connections
+        self.retry_seconds = retry_seconds
+        self.state = STARTING
+        self.models_ready = False
+        self.db_ready = False
+        self.error: Optional[str] = None
+        self.started_at = time.monotonic()
+        self.ready_after_seconds: Optional[float] = None
+        self.in_flight = 0
+        self.model_name = settings.face_model_name
+        self.generation = 0  # last model generation this worker applied
+        self.reload: Dict = {"state": "idle"}
+        self._reload_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_settings(cls) -> "Lifecycle":
+        return cls(db_connections=settings.readiness_db_connections, retry_seconds=settings.readiness_retry_seconds)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY and not memory.watchdog.draining
+
+    @property
+    def draining(self) -> bool:
+        """Shutting down, or about to be recycled by the memory watchdog"""
+        return self.state in (DRAINING, STOPPED) or memory.watchdog.draining
+
+    # ---- Warm-up ----
+
+    def _warm_models(self):
+        face_processor.get_face_analyzer(self.loader)
+        antispoof.get_model()
+
+    async def _warm_db(self):
+        async def ping():
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+
+        # Held at the same time, so the pool really opens that many connections
+        await asyncio.gather(*(ping() for _ in range(max(1, self.db_connections))))
+
+    async def warm_up(self):
+        """Load and warm the models and the DB pool, retrying until both succeed"""
+        while self.state == STARTING:
+            try:
+                if not self.models_ready:
+                    await asyncio.to_thread(self._warm_models)
+                    self.models_ready = True
+                if not self.db_ready:
+                    await self._warm_db()
+                    self.db_ready = True
+            except Exception as e:
+                self.error = str(e)
+                metrics.increment("lifecycle.warm_up_failures")
+                logger.warning(f"⚠️ Warm-up failed, not ready (retrying in {self.retry_seconds:g}s): {e}")
+                await asyncio.sleep(self.retry_seconds)
+                continue
+
+            self.error = None
+            self.state = READY
+            self.ready_after_seconds = round(time.monotonic() - self.started_at, 3)
+            logger.info(f"✅ Worker ready after {self.ready_after_seconds:.1f}s (models warm, DB pool open)")
+
+    # ---- Inference ----
+
+    def _finished(self, task: asyncio.Task):
+        self.in_flight -= 1
+        if not task.cancelled():
+            task.exception()  # retrieved here when the request that started it went away
+
+    async def track(self, work: Awaitable):
+        """
+        Await inference work, counting it until it completes
+        It keeps running (and counted) if the request is cancelled first,
+        so a drain never exits while a stage thread is still busy.
+        """
+        if self.state in (DRAINING, STOPPED):
+            if asyncio.iscoroutine(work):
+                work.close()
+            metrics.increment("lifecycle.refused")
+            raise HTTPException(
+                status_code=503,
+                detail="Service is shutting down - please retry",
+                headers={"Retry-After": "1"}
+            )
+        self.in_flight += 1
+        task = asyncio.ensure_future(work)
+        task.add_done_callback(self._finished)
+        return await asyncio.shield(task)
+
+    async def drain(self, timeout: float) -> bool:
+        """Refuse new inference and wait for the runs in flight; False if some outlived the timeout"""
+        self.state = DRAINING
+        deadline = time.monotonic() + timeout
+        if self.in_flight:
+            logger.info(f"⏳ Draining {self.in_flight} in-flight inference(s) (up to {timeout:g}s)...")
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        drained = self.in_flight == 0
+        if not drained:
+            metrics.increment("lifecycle.drain_timeouts")
+            logger.warning(f"⚠️ {self.in_flight} inference(s) still running after {timeout:g}s, shutting down anyway")
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+        self.state = STOPPED
+        return drained
+
+    # ---- Model reload ----
+
+    def _load(self, model_name: str):
+        analyzer = self.loader(model_name)
+        spoof_model = antispoof.AntiSpoofModel.load(settings.antispoof_model_path) if settings.antispoof_model_path else None
+        return analyzer, spoof_model
+
+    async def _reload(self, model_name: str, reembed: bool = False):
+        started = time.perf_counter()
+        try:
+            analyzer, spoof_model = await asyncio.to_thread(self._load, model_name)
+        except Exception as e:
+            self.reload.update(state="failed", error=str(e))
+            metrics.increment("lifecycle.reload_failures")
+            logger.error(f"❌ Model reload failed, {self.model_name} keeps serving: {e}")
+            return
+
+        face_processor.install_face_analyzer(analyzer)
+        if spoof_model is not None:
+            antispoof.install_model(spoof_model)
+        previous, self.model_name = self.model_name, model_name
+        # Cached outcomes hold similarities computed by the replaced models
+        verification_cache.clear()
+
+        seconds = time.perf_counter() - started
+        self.reload.update(state="done", finished_at=datetime.utcnow().isoformat(), load_seconds=round(seconds, 3))
+        metrics.increment("lifecycle.reloads")
+        logger.info(f"✅ Switched models {previous} -> {model_name} after a {seconds:.1f}s background load")
+
+        if reembed:
+            try:
+                job = await maintenance.create_maintenance_job(maintenance.REEMBED_KIND)
+                self.reload["reembed_job"] = job["id"]
+                logger.info(f"🔁 Queued re-embedding job {job['id']} for {job['total']} user(s)")
+            except Exception as e:
+                self.reload["reembed_error"] = str(e)
+                logger.error(f"❌ Could not queue the re-embedding job, run reembed_users by hand: {e}")
+
+    def _check_idle(self):
+        if self._reload_task is not None and not self._reload_task.done():
+            raise LifecycleError(f"A reload of {self.reload['model_name']} is already running")
+        if self.state in (DRAINING, STOPPED):
+            raise LifecycleError("Worker is shutting down")
+
+    def start_reload(self, model_name: Optional[str] = None, reembed: bool = False) -> asyncio.Task:
+        """Load `model_name` (default: the current pack) in this worker in the background and switch to it"""
+        self._check_idle()
+
+        model_name = model_name or self.model_name
+        self.reload = {"state": "loading", "model_name": model_name, "started_at": datetime.utcnow().isoformat()}
+        self._reload_task = asyncio.create_task(self._reload(model_name, reembed))
+        return self._reload_task
+
+    async def request_reload(self, model_name: Optional[str] = None, reembed: bool = False) -> Dict:
+        """
+        Reload in every worker: record a new model generation, then start it here
+        The other workers pick it up on their next poll (follow_generations).
+        """
+        model_name = model_name or self.model_name
+        if model_name != self.model_name and not reembed:
+            raise LifecycleError(
+                f"Switching {self.model_name} -> {model_name} changes every embedding; "
+                "pass reembed=true to re-embed the stored templates after the switch"
+            )
+        self._check_idle()
+
+        async with async_session() as db:
+            row = ModelGeneration(model_name=model_name, configured_model=settings.face_model_name)
+            db.add(row)
+            await db.commit()
+            generation = row.id
+
+        self.start_reload(model_name, reembed=reembed)
+        self.generation = generation
+        if reembed:
+            self.reload["warning"] = (
+                "Users are re-embedded by a reembed_users job after the switch; until it reaches them their "
+                "verifications fail, and users enrolled without a retained face crop must enroll again"
+            )
+        return self.stats()
+
+    async def check_generation(self) -> bool:
+        """Start the reload another worker recorded, if there is a newer one; True when one started"""
+        async with async_session() as db:
+            latest = await db.scalar(select(ModelGeneration).order_by(ModelGeneration.id.desc()).limit(1))
+        if latest is None or latest.id <= self.generation:
+            return False
+        if self._reload_task is not None and not self._reload_task.done():
+            return False  # applied on a later poll
+
+        first, self.generation = self.generation == 0, latest.id
+        if first and (latest.configured_model != settings.face_model_name or latest.model_name == self.model_name):
+            # Just started: either already on that pack, or restarted with another FACE_MODEL_NAME since
+            return False
+
+        logger.info(f"🔄 Model generation {latest.id}: reloading {latest.model_name} as requested through another worker")
+        self.start_reload(latest.model_name)
+        return True
+
+    async def follow_generations(self):
+        """Apply reloads requested through any worker, every MODEL_RELOAD_POLL_SECONDS once ready"""
+        while True:
+            if self.state == READY:
+                try:
+                    await self.check_generation()
+                except Exception as e:
+                    logger.warning(f"⚠️ Model generation check failed: {e}")
+            await asyncio.sleep(settings.model_reload_poll_seconds)
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "draining": self.draining,
+            "models_ready": self.models_ready,
+            "db_ready": self.db_ready,
+            "error": self.error,
+            "ready_after_seconds": self.ready_after_seconds,
+            "in_flight": self.in_flight,
+            "model_name": self.model_name,
+            "generation": self.generation,
+            "backend": face_processor.describe_backend(),
+            "reload": dict(self.reload),
+        }
+
+
+# Global instance
+lifecycle = Lifecycle.from_settings()
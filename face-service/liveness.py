@@ -6,13 +6,17 @@ Compatible with InsightFace
 
 import numpy as np
 import cv2
-from typing import Dict
+from typing import Dict, Optional
 import logging
 
+import antispoof
+from config import settings
+
 logger = logging.getLogger(__name__)
 
 
-def detect_liveness(image: np.ndarray, blink_threshold: float = 0.25) -> Dict:
+def detect_liveness(image: np.ndarray, blink_threshold: float = 0.25, face=None, crop=None,
+                    spoof_score: Optional[float] = None) -> Dict:
     """
     Perform liveness detection on an image
     
@@ -22,6 +26,15 @@ def detect_liveness(image: np.ndarray, blink_threshold: float = 0.25) -> Dict:
     3. Color distribution (screens have limited color range)
     4. Face landmark analysis
     
+    Pass `face` (from face_processor.detect_target_face) to reuse an
+    existing detection instead of running the detector again.
+    
+    With an anti-spoof model configured (antispoof.py), the aligned crop of
+    `face` (or `crop`, if already aligned) is scored too; the model then
+    decides and the heuristics only need ANTISPOOF_MIN_HEURISTIC_CHECKS.
+    Pass `spoof_score` when the caller already scored the crop (the verify
+    pipeline batches it with other requests' crops).
+    
     Returns dict with liveness results
     """
     result = {
@@ -32,17 +45,18 @@ def detect_liveness(image: np.ndarray, blink_threshold: float = 0.25) -> Dict:
     }
     
     try:
-        # Import face detection from face_processor
-        from face_processor import detect_faces
-        
         # Check 1: Face detection
-        faces = detect_faces(image)
-        
-        if len(faces) == 0:
-            result["reason"] = "No face detected"
-            return result
-        
-        face = faces[0]
+        if face is None:
+            # Import face detection from face_processor
+            from face_processor import detect_faces
+            
+            faces = detect_faces(image)
+            
+            if len(faces) == 0:
+                result["reason"] = "No face detected"
+                return result
+            
+            face = faces[0]
         result["checks"]["face_detected"] = True
         
         # Get face bounding box
@@ -103,6 +117,14 @@ def detect_liveness(image: np.ndarray, blink_threshold: float = 0.25) -> Dict:
         high_confidence = det_score > 0.7
         result["checks"]["high_confidence"] = high_confidence
         
+        # Check 8 (optional): learned anti-spoof model on the aligned crop
+        if spoof_score is None and antispoof.get_model() is not None:
+            if crop is None and getattr(face, "kps", None) is not None:
+                from face_processor import align_face_crop
+                crop = align_face_crop(image, face)
+            if crop is not None:
+                spoof_score = float(antispoof.score_crops([crop])[0])
+        
         # Calculate overall liveness score
         checks_passed = sum([
             is_sharp,
@@ -113,11 +135,19 @@ def detect_liveness(image: np.ndarray, blink_threshold: float = 0.25) -> Dict:
             high_confidence
         ])
         
-        confidence = checks_passed / 6.0
-        result["confidence"] = round(confidence, 2)
+        if spoof_score is None:
+            confidence = checks_passed / 6.0
+            # Liveness passes if confidence >= 66% (4/6 checks)
+            result["is_live"] = confidence >= 0.66
+        else:
+            model_live = spoof_score >= settings.antispoof_threshold
+            result["checks"]["antispoof_score"] = round(spoof_score, 4)
+            result["checks"]["antispoof_live"] = model_live
+            # The model's live probability counts as a seventh, soft check
+            confidence = (checks_passed + spoof_score) / 7.0
+            result["is_live"] = model_live and checks_passed >= settings.antispoof_min_heuristic_checks
         
-        # Liveness passes if confidence >= 66% (4/6 checks)
-        result["is_live"] = confidence >= 0.66
+        result["confidence"] = round(confidence, 2)
         
         if not result["is_live"]:
             failed_checks = []
@@ -131,6 +161,8 @@ def detect_liveness(image: np.ndarray, blink_threshold: float = 0.25) -> Dict:
                 failed_checks.append("possible_reflection")
             if not high_confidence:
                 failed_checks.append("low_detection_confidence")
+            if spoof_score is not None and not result["checks"]["antispoof_live"]:
+                failed_checks.append("spoof_suspected")
             result["reason"] = f"Failed checks: {', '.join(failed_checks)}"
         
         return result
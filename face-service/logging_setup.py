@@ -0,0 +1,197 @@
+"""
+Face Verification Service - Logging Setup
+Queue-based logging: request handlers only enqueue, a thread formats and writes
+
+configure_logging() is the one place logging gets configured (the entry
+points call it instead of basicConfig). The root logger gets a single
+handler that puts records on a bounded queue; a listener thread formats
+them - JSON lines by default, text with LOG_FORMAT=text - and writes them
+to stderr and LOG_FILE, so no log I/O runs on the event loop.
+
+Records are queued unformatted and only %-interpolated in the writer
+thread, which is why hot-path calls pass arguments rather than f-strings.
+They also name an `event` and pass fields through `extra`, which become
+keys of the JSON line.
+
+A full queue (the writer cannot keep up with stderr or the disk) drops the
+record and counts it (logging.dropped in /admin/metrics) instead of
+blocking the request. LOG_SAMPLE_RATES (e.g. INFO=0.1) keeps only a
+fraction of the high-volume records at the listed levels: structured
+events and uvicorn access lines. Startup messages, tracebacks and other
+unstructured records are always written.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from config import settings
+from metrics import metrics
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Loggers whose records are sampled even without an `event`
+SAMPLED_LOGGERS = ("uvicorn.access",)
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_handler: Optional["DroppingQueueHandler"] = None
+_listener: Optional["QueueWriter"] = None
+_outputs: List[logging.Handler] = []
+
+
+def parse_sample_rates(spec: str) -> Dict[int, float]:
+    """'INFO=0.1,DEBUG=0' -> {logging.INFO: 0.1, logging.DEBUG: 0.0}"""
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = part.partition("=")
+        level = logging.getLevelName(name.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f"Unknown log level in LOG_SAMPLE_RATES: {name!r}")
+        rates[level] = min(1.0, max(0.0, float(value)))
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, msg, pid, `extra` fields and exc"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and key not in entry:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the structured events (and access lines) at each listed level"""
+
+    def __init__(self, rates: Dict[int, float], rng: Callable[[], float] = random.random):
+        super().__init__()
+        self.rates = rates
+        self.rng = rng
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno)
+        if rate is None or rate >= 1.0:
+            return True
+        if not hasattr(record, "event") and record.name not in SAMPLED_LOGGERS:
+            return True
+        if rate > 0.0 and self.rng() < rate:
+            return True
+        metrics.increment("logging.sampled_out")
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records that do not fit are counted and dropped"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock handler formats here, on the caller's thread; the writer does it instead
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment("logging.dropped")
+
+
+class QueueWriter(logging.handlers.QueueListener):
+    """Writer thread; waits briefly for room for its stop sentinel instead of failing on a full queue"""
+
+    def enqueue_sentinel(self):
+        try:
+            self.queue.put(self._sentinel, timeout=5.0)
+        except queue.Full:
+            pass
+
+
+def _start_writer():
+    global _listener
+    _handler.queue = queue.Queue(max(1, settings.log_queue_size))
+    _listener = QueueWriter(_handler.queue, *_outputs, respect_handler_level=True)
+    _listener.start()
+
+
+def configure_logging(force: bool = False) -> bool:
+    """
+    Route the root logger through the queue
+    Like basicConfig, does nothing (returns False) when the root logger
+    already has handlers - e.g. the benchmark CLI or a test runner set it up.
+    """
+    global _handler, _outputs
+    root = logging.getLogger()
+    if root.handlers and not force:
+        return False
+
+    stop_logging()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+
+    formatter = JsonFormatter() if settings.log_format.lower() == "json" else logging.Formatter(TEXT_FORMAT)
+    _outputs = [logging.StreamHandler(sys.stderr)]
+    if settings.log_file:
+        _outputs.append(logging.FileHandler(settings.log_file, encoding="utf-8"))
+    for output in _outputs:
+        output.setFormatter(formatter)
+
+    _handler = DroppingQueueHandler(None)
+    rates = parse_sample_rates(settings.log_sample_rates)
+    if rates:
+        _handler.addFilter(SamplingFilter(rates))
+    _start_writer()
+    root.addHandler(_handler)
+    root.setLevel(settings.log_level.upper())
+    return True
+
+
+def stop_logging():
+    """Write out what is queued and stop the writer thread (records after this go to stderr)"""
+    global _handler, _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    for output in _outputs:
+        output.close()
+
+
+def _after_fork():
+    # The writer thread does not survive fork (serve.py workers); give the child its own
+    if _handler is not None:
+        _start_writer()
+
+
+def stats() -> Dict:
+    return {
+        "queued": _handler.queue.qsize() if _handler is not None else 0,
+        "capacity": settings.log_queue_size,
+        "dropped": metrics.counter("logging.dropped"),
+        "sampled_out": metrics.counter("logging.sampled_out"),
+    }
+
+
+atexit.register(stop_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -7,38 +7,62 @@ Endpoints:
 - POST /enroll      - Register a user's face
 - POST /verify      - Verify a user's face and get JWT
 - GET  /health      - Health check
+- GET  /health/live, /health/ready - Liveness / readiness probes
 - GET  /status/{id} - Check if user is enrolled
+- GET  /allowlist/proof/{id} - Merkle proof for voteWithProof (batch mode)
 
 Author: VotEth Team
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Request, Header
+from fastapi import FastAPI, HTTPException, Depends, Request, Header, Query
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field, validator
-from typing import Optional, List
-from datetime import datetime
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator, model_validator
+from typing import Dict, Optional, List, Literal
+from datetime import datetime, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+import asyncio
+import base64
+import json
 import logging
+import os
 import re
 
 # Local imports
 from config import settings
-from database import init_db, get_db
-from models import User, VerificationLog
-from face_processor import decode_image, extract_embedding, compare_embeddings, get_face_quality
-from liveness import detect_liveness
-from auth import create_verification_token, verify_token
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from database import engine, init_db, get_db
+from models import VerificationLog
+import repository
+from face_processor import detector_sizes
+from auth import create_verification_token, verify_token, require_admin
+import token_store
+import profiling
+import capture
+import retention
+from request_body import read_image_payload
+from verification_cache import verification_cache
+from metrics import metrics
+import admission
+from enrollment_filter import enrolled_filter
+import erasure
+import jobs
+import maintenance
+import sharding
+from sharding import router as shard_router
+import static_assets
+import memory
+import logging_setup
+import merkle_allowlist
+from merkle_allowlist import allowlist, AllowlistError
+from lifecycle import lifecycle, LifecycleError
+from pipeline import pipeline
+from voter_registry import registry as voter_registry, ALREADY_VOTED
+
+# Configure logging (queue + writer thread; no-op if the host process already did)
+logging_setup.configure_logging()
 logger = logging.getLogger(__name__)
 
 # Initialize Signer
@@ -66,8 +90,24 @@ except Exception as e:
     signer_account = None
     SIGNER_ADDRESS = None
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
+# Initialize rate limiter (keyed on the client's IP, also for requests a shard peer forwarded)
+limiter = Limiter(key_func=shard_router.client_address)
+
+def _fast_json_response_class() -> dict:
+    """
+    Pick the fastest JSON response path for this FastAPI version
+    Newer FastAPI serializes response models straight to JSON bytes with
+    pydantic-core (and deprecates ORJSONResponse); older versions go through
+    jsonable_encoder + json.dumps, so use orjson there when it is installed.
+    """
+    if getattr(ORJSONResponse, "__deprecated__", None):
+        return {}
+    try:
+        import orjson  # noqa: F401
+        return {"default_response_class": ORJSONResponse}
+    except ImportError:
+        return {}
+
 
 # Create FastAPI app
 app = FastAPI(
@@ -75,13 +115,10 @@ app = FastAPI(
     description="Secure face verification for blockchain voting",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    **_fast_json_response_class()
 )
 
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-import os
-
 # CORS configuration - MUST be added FIRST before other middleware
 app.add_middleware(
     CORSMiddleware,
@@ -92,14 +129,24 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-# Serve static files (enroll.html)
-# This assumes enroll.html is in the same directory as main.py
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-app.mount("/static", StaticFiles(directory=BASE_DIR), name="static")
+# Opt-in request profiling (not installed at all when disabled)
+if profiling.is_enabled():
+    app.add_middleware(profiling.ProfilingMiddleware)
+    logger.info(f"🔬 Request profiling enabled (sample rate {settings.profiling_sample_rate}, slow threshold {settings.profiling_slow_threshold_ms} ms)")
+
+# Opt-in traffic capture for replay (not installed at all when disabled)
+if capture.is_enabled():
+    app.add_middleware(capture.CaptureMiddleware)
+    logger.info(f"🎞️ Traffic capture enabled (sample rate {settings.capture_sample_rate}) into {settings.capture_dir}")
+
+# Serve static files (the enroll page) - allowlisted, precompressed and fingerprinted, see static_assets.py
+@app.api_route("/static/{name}", methods=["GET", "HEAD"], include_in_schema=False)
+async def get_static_asset(name: str, request: Request):
+    return static_assets.assets.response(name, request)
 
-@app.get("/enroll.html")
-async def get_enroll_page():
-    return FileResponse(os.path.join(BASE_DIR, "enroll.html"))
+@app.api_route("/enroll.html", methods=["GET", "HEAD"], include_in_schema=False)
+async def get_enroll_page(request: Request):
+    return static_assets.assets.response("enroll.html", request)
 
 # Add rate limiter AFTER CORS
 app.state.limiter = limiter
@@ -108,19 +155,30 @@ app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 # ============== Request/Response Models ==============
 
+# Smallest accepted decoded image (100 base64 characters)
+MIN_IMAGE_BYTES = 75
+
+
+def normalize_user_id(v: str) -> str:
+    """Validate and normalize a user ID (wallet address or other ID)"""
+    if not v or len(v) < 3:
+        raise ValueError("User ID must be at least 3 characters")
+    return v.strip().lower()
+
+
 class EnrollRequest(BaseModel):
-    """Request to enroll a user's face"""
+    """Request to enroll a user's face (documents the /enroll body)"""
     user_id: str = Field(..., description="Unique user ID (wallet address)")
     image: str = Field(..., description="Base64 encoded face image")
     
-    @validator('user_id')
+    @field_validator('user_id')
+    @classmethod
     def validate_user_id(cls, v):
         # Allow wallet addresses (0x...) or other IDs
-        if not v or len(v) < 3:
-            raise ValueError("User ID must be at least 3 characters")
-        return v.strip().lower()
+        return normalize_user_id(v)
     
-    @validator('image')
+    @field_validator('image')
+    @classmethod
     def validate_image(cls, v):
         if not v or len(v) < 100:
             raise ValueError("Invalid image data")
@@ -128,16 +186,73 @@ class EnrollRequest(BaseModel):
 
 
 class VerifyRequest(BaseModel):
-    """Request to verify a user's face"""
+    """Request to verify a user's face (documents the /verify body)"""
     user_id: str = Field(..., description="User ID to verify against")
     image: str = Field(..., description="Base64 encoded face image")
     skip_liveness: bool = Field(False, description="Skip liveness check (for testing only)")
     
-    @validator('user_id')
+    @field_validator('user_id')
+    @classmethod
     def validate_user_id(cls, v):
-        if not v or len(v) < 3:
-            raise ValueError("User ID must be at least 3 characters")
-        return v.strip().lower()
+        return normalize_user_id(v)
+
+
+class ImageUpload(BaseModel):
+    """
+    Streamed /enroll or /verify body
+    `image` holds the already base64-decoded image bytes (see request_body.py)
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    
+    user_id: str
+    image: memoryview
+    skip_liveness: bool = False
+    
+    @field_validator('user_id')
+    @classmethod
+    def validate_user_id(cls, v):
+        return normalize_user_id(v)
+    
+    @field_validator('image')
+    @classmethod
+    def validate_image(cls, v):
+        if len(v) < MIN_IMAGE_BYTES:
+            raise ValueError("Invalid image data")
+        return v
+
+
+async def read_image_upload(request: Request) -> ImageUpload:
+    """Dependency: stream, size-check and validate an image request body"""
+    fields, image = await read_image_payload(request, settings.max_request_body_bytes)
+    if image is not None:
+        fields["image"] = image
+    
+    try:
+        return ImageUpload.model_validate(fields)
+    except ValidationError as e:
+        raise RequestValidationError([
+            {"loc": ("body", *err["loc"]), "msg": err["msg"], "type": err["type"]}
+            for err in e.errors()
+        ])
+
+
+def image_upload_body(data: ImageUpload) -> bytes:
+    """JSON body of an already-read image upload, for forwarding it to its shard node"""
+    return json.dumps({
+        "user_id": data.user_id,
+        "image": base64.b64encode(data.image).decode(),
+        "skip_liveness": data.skip_liveness,
+    }).encode()
+
+
+def json_body_schema(model) -> dict:
+    """OpenAPI requestBody for endpoints that read their body with read_image_upload"""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": model.model_json_schema()}}
+        }
+    }
 
 
 class EnrollResponse(BaseModel):
@@ -168,6 +283,17 @@ class HealthResponse(BaseModel):
     timestamp: str
     version: str
     signer_address: Optional[str] = None
+    ready: Optional[bool] = None  # models warm and DB pool open (see /health/ready)
+    worker: Optional[Dict] = None  # this worker's pid and memory (see memory.py)
+
+
+class TokenValidationResponse(BaseModel):
+    """Decoded claims of a valid verification token"""
+    valid: bool
+    user_id: Optional[str] = None
+    verified: Optional[bool] = None
+    score: Optional[float] = None
+    expires: Optional[int] = None
 
 
 class UserStatusResponse(BaseModel):
@@ -177,6 +303,77 @@ class UserStatusResponse(BaseModel):
     enrollment_date: Optional[str] = None
 
 
+class AllowlistProofResponse(BaseModel):
+    """Merkle proof of a verified wallet against the published allowlist root (for voteWithProof)"""
+    address: str
+    leaf: str
+    index: int
+    proof: List[str]
+    root: str
+    leaf_count: int
+    tx_hash: Optional[str] = None
+
+
+class ModelReloadRequest(BaseModel):
+    """Model pack to load and switch to (default: reload the current one)"""
+    model_name: Optional[str] = None
+    reembed: bool = False  # required for a different pack: queue a reembed_users job after the switch
+
+
+class StatusBatchRequest(BaseModel):
+    """Enrollment status lookup for many ids"""
+    user_ids: List[str] = Field(..., min_length=1, max_length=settings.status_batch_max_ids)
+
+
+class StatusBatchResponse(BaseModel):
+    """Per-id status, in request order"""
+    results: List[UserStatusResponse]
+    enrolled_count: int
+
+
+class VotingWindowRequest(BaseModel):
+    """Voting window state from the contract (getVotingStatus)"""
+    active: bool
+
+
+class MaintenanceJobRequest(BaseModel):
+    """Job that rewrites every stored template"""
+    kind: Literal["rotate_encryption_key", "reembed_users"]
+
+
+class EraseJobRequest(BaseModel):
+    """Bulk erase: explicit user ids, or every user (post-election purge)"""
+    user_ids: List[str] = Field(default_factory=list)
+    all_users: bool = False
+    
+    @field_validator('user_ids')
+    @classmethod
+    def validate_user_ids(cls, v):
+        return [normalize_user_id(user_id) for user_id in v]
+    
+    @model_validator(mode='after')
+    def require_one_target(self):
+        if self.all_users == bool(self.user_ids):
+            raise ValueError("Pass either user_ids or all_users=true")
+        return self
+
+
+class ShardRingRequest(BaseModel):
+    """New shard map: node name -> base URL"""
+    nodes: Dict[str, str] = Field(..., min_length=1)
+    previous: Optional[Dict[str, str]] = Field(None, description="Map being migrated away from, until every node finished rebalancing")
+    rebalance: bool = True
+
+
+class ShardUsersRequest(BaseModel):
+    user_ids: List[str] = Field(..., min_length=1, max_length=settings.status_batch_max_ids)
+
+
+class ShardImportRequest(BaseModel):
+    """Rows as returned by /admin/shard/export"""
+    users: List[dict] = Field(..., max_length=settings.status_batch_max_ids)
+
+
 # ============== Startup/Shutdown Events ==============
 
 @app.on_event("startup")
@@ -185,21 +382,76 @@ async def startup_event():
     logger.info("🚀 Starting Face Verification Service...")
     await init_db()
     
-    # Pre-load face models (warmup)
+    # Fingerprint + precompress static assets (no-op when `python static_assets.py` already ran)
     try:
-        from face_processor import get_face_analyzer
-        get_face_analyzer()
-        logger.info("✅ Face models loaded")
+        static_assets.assets.load()
     except Exception as e:
-        logger.warning(f"⚠️ Face model preload failed (will load on first request): {e}")
+        logger.warning(f"⚠️ Static asset build failed: {e}")
+    
+    # Load and warm the models and DB pool in the background; /health/ready flips when done
+    app.state.warm_up_task = asyncio.create_task(lifecycle.warm_up())
+    # Pick up model reloads requested through any worker
+    app.state.generation_task = asyncio.create_task(lifecycle.follow_generations())
+    
+    # In-memory filter of enrolled ids for fast "not enrolled" answers
+    app.state.filter_task = None
+    if settings.enrolled_filter_enabled:
+        try:
+            await enrolled_filter.rebuild()
+        except Exception as e:
+            logger.warning(f"⚠️ Enrolled-id filter build failed (status lookups use the DB): {e}")
+        if settings.enrolled_filter_sync_seconds > 0 or settings.enrolled_filter_refresh_seconds > 0:
+            app.state.filter_task = asyncio.create_task(enrolled_filter.refresh_loop())
     
-    logger.info("✅ Face Verification Service ready!")
+    # Periodic verification log rollup + retention
+    app.state.compaction_task = None
+    if settings.log_compaction_interval_minutes > 0:
+        app.state.compaction_task = asyncio.create_task(retention.compaction_loop())
+    
+    # Pick up erase jobs interrupted by a restart
+    await jobs.resume_incomplete_jobs()
+    
+    # On-chain registration / voted flags, checked before inference. The indexer loop only
+    # writes while this worker holds its lease (one writer across workers and indexer_main.py)
+    app.state.registry_task = app.state.indexer_task = None
+    if settings.voter_registry_enabled and settings.chain_rpc_url and settings.voting_contract_address:
+        from chain_indexer import ChainIndexer
+        indexer = ChainIndexer.from_settings()
+        app.state.indexer_task = asyncio.create_task(indexer.run_loop())
+        app.state.registry_task = asyncio.create_task(voter_registry.follow(indexer))
+    
+    # Recycle this worker once it outgrows WORKER_MAX_RSS_MB
+    app.state.memory_task = None
+    if memory.watchdog.max_rss_mb > 0:
+        app.state.memory_task = asyncio.create_task(memory.watchdog.run())
+    
+    # Periodic Merkle allowlist build (and root publishing) from verification logs
+    app.state.allowlist_task = None
+    if settings.allowlist_enabled and settings.allowlist_build_interval_seconds > 0:
+        app.state.allowlist_task = asyncio.create_task(merkle_allowlist.build_loop(signer_account))
+    
+    logger.info("✅ Face Verification Service started (ready once models are warm)")
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("👋 Shutting down Face Verification Service...")
+    
+    # Let running verifications finish before anything they use is torn down
+    await lifecycle.drain(settings.worker_drain_timeout_seconds)
+    
+    for name in ("warm_up_task", "generation_task", "compaction_task", "filter_task", "registry_task", "indexer_task",
+                 "memory_task", "allowlist_task"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    jobs.cancel_running_tasks()
+    await shard_router.aclose()
+    await token_store.store.aclose()
+    if capture.is_enabled():
+        await asyncio.to_thread(capture.writer.flush)
+    await engine.dispose()
 
 
 # ============== Endpoints ==============
@@ -217,26 +469,45 @@ async def root():
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (answered by whichever worker got the connection)"""
+    if lifecycle.draining:
+        status = "draining"
+    else:
+        status = "healthy" if lifecycle.ready else "starting"
     return {
-        "status": "healthy",
+        "status": status,
         "timestamp": datetime.utcnow().isoformat(),
         "version": "1.0.0", 
-        "signer_address": SIGNER_ADDRESS
+        "signer_address": SIGNER_ADDRESS,
+        "ready": lifecycle.ready,
+        "worker": memory.watchdog.stats()
     }
 
 
+@app.get("/health/live")
+async def liveness_probe():
+    """Liveness: the worker's event loop answers (restart the worker if this fails)"""
+    return {"status": "alive", "pid": os.getpid()}
+
+
+@app.get("/health/ready")
+async def readiness_probe():
+    """Readiness: 200 once models are warm and the DB pool is open, 503 while starting or draining"""
+    stats = lifecycle.stats()
+    return JSONResponse(status_code=200 if stats["ready"] else 503, content=stats)
+
+
 @app.options("/health")
 async def health_options():
     """Handle CORS preflight for health endpoint"""
     return {}
 
 
-@app.post("/enroll", response_model=EnrollResponse)
+@app.post("/enroll", response_model=EnrollResponse, openapi_extra=json_body_schema(EnrollRequest))
 @limiter.limit(f"{settings.rate_limit_requests}/minute")
 async def enroll_user(
     request: Request,
-    data: EnrollRequest,
+    data: ImageUpload = Depends(read_image_upload),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -246,50 +517,45 @@ async def enroll_user(
     - Extracts face embedding
     - Stores embedding in database
     """
-    logger.info(f"📝 Enrollment request for user: {data.user_id[:10]}...")
+    logger.info("📝 Enrollment request for user: %s...", data.user_id[:10],
+                extra={"event": "enroll.request", "user": data.user_id[:10]})
+    
+    # Users owned by another shard node are enrolled there
+    routed = await shard_router.route(request, data.user_id, body=lambda: image_upload_body(data))
+    if routed is not None:
+        return routed
     
     try:
-        # Decode image
-        image = decode_image(data.image)
-        
-        # Check image quality
-        quality = get_face_quality(image)
+        # Decode, detect, check image quality, embed only the selected face, then encrypt (pipeline.py)
+        async with admission.controller.slot(admission.ENROLL):
+            quality = await lifecycle.track(pipeline.enroll(data.image))
         if not quality.get("valid"):
             raise HTTPException(
                 status_code=400,
                 detail=f"Image quality check failed: {quality.get('reason', 'Unknown')}"
             )
         
-        # Extract embedding
-        embedding, status = extract_embedding(image)
-        
-        if embedding is None:
+        if quality["embedding"] is None:
             raise HTTPException(
                 status_code=400,
-                detail=f"Face extraction failed: {status}"
+                detail=f"Face extraction failed: {quality.get('status', 'Unknown')}"
             )
         
-        # Check if user already exists
-        result = await db.execute(select(User).where(User.id == data.user_id))
-        existing_user = result.scalar_one_or_none()
-        
-        if existing_user:
-            # Update existing enrollment
-            existing_user.set_embedding(embedding)
-            existing_user.enrollment_count += 1
-            existing_user.updated_at = datetime.utcnow()
-            logger.info(f"🔄 Updated enrollment for {data.user_id[:10]}...")
+        # Create or update the enrollment without loading the previous embedding
+        was_enrolled = await repository.save_embedding(
+            db, data.user_id, quality["encrypted_embedding"], face_crop=quality["face_crop"]
+        )
+        if was_enrolled:
+            logger.info("🔄 Updated enrollment for %s...", data.user_id[:10],
+                        extra={"event": "enroll.updated", "user": data.user_id[:10]})
         else:
-            # Create new user
-            new_user = User(
-                id=data.user_id,
-                enrollment_count=1
-            )
-            new_user.set_embedding(embedding)
-            db.add(new_user)
-            logger.info(f"✅ New enrollment for {data.user_id[:10]}...")
+            logger.info("✅ New enrollment for %s...", data.user_id[:10],
+                        extra={"event": "enroll.created", "user": data.user_id[:10]})
         
         await db.commit()
+        verification_cache.invalidate_user(data.user_id)
+        if not was_enrolled:
+            enrolled_filter.add(data.user_id)
         
         return EnrollResponse(
             success=True,
@@ -311,11 +577,42 @@ async def enroll_options():
     return {}
 
 
-@app.post("/verify", response_model=VerifyResponse)
+def issue_permit(user_id: str, similarity: float):
+    """
+    JWT and on-chain voting permit for a verified wallet (runs on the persist stage)
+    Returns (token, signature); signature is None without a signer or for non-wallet ids
+    """
+    token = create_verification_token(user_id, similarity)
+    
+    # Generage on-chain signature
+    signature = None
+    if signer_account:
+        try:
+            # Create hash of the address (exactly as Solidity will do)
+            # Solidity: keccak256(abi.encodePacked(msg.sender))
+            if user_id.startswith("0x") and len(user_id) == 42:
+                addr_bytes = to_bytes(hexstr=user_id)
+                msg_hash = keccak(addr_bytes)
+                
+                # Sign the hash (EIP-191)
+                # This corresponds to .toEthSignedMessageHash() in Solidity
+                # Fix: use primitive for raw bytes
+                signable_message = encode_defunct(primitive=msg_hash)
+                signed_message = signer_account.sign_message(signable_message)
+                signature = "0x" + signed_message.signature.hex()
+                logger.info("✍️  Signed voting permit for %s...", user_id[:10],
+                            extra={"event": "verify.permit", "user": user_id[:10]})
+        except Exception as e:
+            logger.error(f"Signing failed: {e}")
+    
+    return token, signature
+
+
+@app.post("/verify", response_model=VerifyResponse, openapi_extra=json_body_schema(VerifyRequest))
 @limiter.limit(f"{settings.rate_limit_requests}/minute")
 async def verify_user(
     request: Request,
-    data: VerifyRequest,
+    data: ImageUpload = Depends(read_image_upload),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -325,18 +622,46 @@ async def verify_user(
     - Compares face embeddings
     - Returns JWT token if verified (>=70% match)
     """
-    logger.info(f"🔍 Verification request for user: {data.user_id[:10]}...")
+    logger.info("🔍 Verification request for user: %s...", data.user_id[:10],
+                extra={"event": "verify.request", "user": data.user_id[:10]})
+    
+    routed = await shard_router.route(request, data.user_id, body=lambda: image_upload_body(data))
+    if routed is not None:
+        return routed
     
     # Get client info for logging
-    client_ip = get_remote_address(request)
+    client_ip = shard_router.client_address(request)
     user_agent = request.headers.get("user-agent", "unknown")
     
     try:
-        # Check if user is enrolled
-        result = await db.execute(select(User).where(User.id == data.user_id))
-        user = result.scalar_one_or_none()
+        # Wallets the chain would refuse anyway never reach the models
+        refusal = voter_registry.check(data.user_id)
+        if refusal:
+            already_voted = refusal == ALREADY_VOTED
+            log_entry = VerificationLog(
+                user_id=data.user_id,
+                success=False,
+                ip_address=client_ip,
+                user_agent=user_agent[:500] if user_agent else None,
+                failure_reason="Voter already voted" if already_voted else "Voter not registered"
+            )
+            db.add(log_entry)
+            await db.commit()
+            
+            raise HTTPException(
+                status_code=403,
+                detail="This wallet has already voted." if already_voted else "This wallet is not registered to vote."
+            )
+        
+        # Check if user is enrolled (loads only the encrypted embedding)
+        stored_embedding = await repository.get_embedding_blob(db, data.user_id)
         
-        if not user or user.embedding is None:
+        if stored_embedding is None and shard_router.previous_owner(data.user_id):
+            # Moved to this node by a rebalance that has not reached it yet
+            pulled = await shard_router.pull([data.user_id])
+            stored_embedding = pulled.get(data.user_id, {}).get("embedding")
+        
+        if stored_embedding is None:
             # Log failed attempt
             log_entry = VerificationLog(
                 user_id=data.user_id,
@@ -353,40 +678,46 @@ async def verify_user(
                 detail="User not enrolled. Please enroll first."
             )
         
-        # Decode image
-        image = decode_image(data.image)
+        # The body reader already base64-decoded the frame; its digest identifies resubmits
+        image_bytes = data.image
+        check_liveness = settings.enable_liveness and not data.skip_liveness
         
-        # Liveness check (unless skipped for testing)
-        liveness_passed = True
-        if settings.enable_liveness and not data.skip_liveness:
-            liveness_result = detect_liveness(image)
-            liveness_passed = liveness_result.get("is_live", False)
-            
-            if not liveness_passed:
-                # Log failed liveness
-                log_entry = VerificationLog(
-                    user_id=data.user_id,
-                    success=False,
-                    liveness_passed=False,
-                    ip_address=client_ip,
-                    user_agent=user_agent[:500] if user_agent else None,
-                    failure_reason=f"Liveness failed: {liveness_result.get('reason', 'Unknown')}"
-                )
-                db.add(log_entry)
-                await db.commit()
-                
-                return VerifyResponse(
-                    success=True,
-                    verified=False,
-                    similarity_score=0.0,
-                    liveness_passed=False,
-                    message=f"Liveness check failed: {liveness_result.get('reason', 'Please use a real camera')}"
-                )
+        cache_key = verification_cache.make_key(data.user_id, image_bytes, not check_liveness, stored_embedding)
+        outcome = verification_cache.get(cache_key)
+        if outcome is None:
+            # Decode, inference and scoring run on the pipeline stages once admission control grants a slot
+            async with admission.controller.slot(admission.VERIFY):
+                outcome = await lifecycle.track(pipeline.verify(image_bytes, check_liveness, stored_embedding))
+            verification_cache.put(cache_key, outcome)
+        else:
+            logger.info("♻️  Reusing cached verification result for %s...", data.user_id[:10],
+                        extra={"event": "verify.cached", "user": data.user_id[:10]})
         
-        # Extract embedding from verification image
-        embedding, status = extract_embedding(image)
+        liveness_passed = outcome["liveness_passed"]
+        if not liveness_passed:
+            # Log failed liveness
+            log_entry = VerificationLog(
+                user_id=data.user_id,
+                success=False,
+                liveness_passed=False,
+                ip_address=client_ip,
+                user_agent=user_agent[:500] if user_agent else None,
+                failure_reason=f"Liveness failed: {outcome['liveness_reason'] or 'Unknown'}"
+            )
+            db.add(log_entry)
+            await db.commit()
+            
+            return VerifyResponse(
+                success=True,
+                verified=False,
+                similarity_score=0.0,
+                liveness_passed=False,
+                message=f"Liveness check failed: {outcome['liveness_reason'] or 'Please use a real camera'}"
+            )
         
-        if embedding is None:
+        similarity = outcome["similarity"]
+        if similarity is None:
+            status = outcome["embedding_status"]
             log_entry = VerificationLog(
                 user_id=data.user_id,
                 success=False,
@@ -406,20 +737,9 @@ async def verify_user(
                 message=f"Face detection failed: {status}"
             )
         
-        # Compare embeddings
-        stored_embedding = user.get_embedding()
-        similarity = compare_embeddings(embedding, stored_embedding)
-        
         # Check threshold
         verified = similarity >= settings.similarity_threshold
         
-        # Create token if verified
-        token = None
-        expires_in = None
-        if verified:
-            token = create_verification_token(data.user_id, similarity)
-            expires_in = settings.jwt_expiry_minutes * 60
-        
         # Log verification attempt
         log_entry = VerificationLog(
             user_id=data.user_id,
@@ -431,31 +751,24 @@ async def verify_user(
             failure_reason=None if verified else f"Similarity {similarity:.2%} below threshold"
         )
         db.add(log_entry)
-        await db.commit()
+        
+        # Token and on-chain permit are signed on the persist stage while the log row commits
+        token = None
+        signature = None
+        expires_in = None
+        if verified:
+            (token, signature), _ = await asyncio.gather(
+                pipeline.persist.run(issue_permit, data.user_id, similarity), db.commit()
+            )
+            expires_in = settings.jwt_expiry_minutes * 60
+        else:
+            await db.commit()
         
         message = "Verification successful" if verified else f"Face match failed ({similarity:.1%} < {settings.similarity_threshold:.0%} required)"
         
-        logger.info(f"{'✅' if verified else '❌'} Verification for {data.user_id[:10]}...: {similarity:.2%}")
-
-        # Generage on-chain signature if verified
-        signature = None
-        if verified and signer_account:
-            try:
-                # Create hash of the address (exactly as Solidity will do)
-                # Solidity: keccak256(abi.encodePacked(msg.sender))
-                if data.user_id.startswith("0x") and len(data.user_id) == 42:
-                    addr_bytes = to_bytes(hexstr=data.user_id)
-                    msg_hash = keccak(addr_bytes)
-                    
-                    # Sign the hash (EIP-191)
-                    # This corresponds to .toEthSignedMessageHash() in Solidity
-                    # Fix: use primitive for raw bytes
-                    signable_message = encode_defunct(primitive=msg_hash)
-                    signed_message = signer_account.sign_message(signable_message)
-                    signature = "0x" + signed_message.signature.hex()
-                    logger.info(f"✍️  Signed voting permit for {data.user_id[:10]}...")
-            except Exception as e:
-                logger.error(f"Signing failed: {e}")
+        logger.info("%s Verification for %s...: %.2f%%", "✅" if verified else "❌", data.user_id[:10], similarity * 100,
+                    extra={"event": "verify.result", "user": data.user_id[:10], "verified": verified,
+                           "similarity": round(similarity, 4)})
         
         return VerifyResponse(
             success=True,
@@ -481,31 +794,89 @@ async def verify_options():
     return {}
 
 
+async def find_enrolled(db: AsyncSession, user_ids: List[str]) -> dict:
+    """
+    Map enrolled ids among user_ids to their enrollment date
+    Ids the in-memory filter rules out never reach the database; the rest
+    are resolved by primary key, selecting only id and created_at so the
+    embedding blobs are never loaded
+    """
+    candidates = [
+        user_id for user_id in user_ids
+        if enrolled_filter.might_be_enrolled(user_id) or shard_router.previous_owner(user_id)
+    ]
+    
+    enrolled = {}
+    if candidates:
+        enrollments = await repository.get_enrollments(db, candidates)
+        enrolled = {user_id: enrollment.created_at for user_id, enrollment in enrollments.items()}
+    
+    # Ids moving to this node that the rebalance has not brought over yet
+    missing = [user_id for user_id in candidates if user_id not in enrolled and shard_router.previous_owner(user_id)]
+    if missing:
+        for user_id, values in (await shard_router.pull(missing)).items():
+            if values["embedding"] is not None:
+                enrolled[user_id] = values["created_at"]
+    return enrolled
+
+
+def status_response(user_id: str, enrolled: dict) -> UserStatusResponse:
+    if user_id not in enrolled:
+        return UserStatusResponse(enrolled=False, user_id=user_id)
+    created_at = enrolled[user_id]
+    return UserStatusResponse(
+        enrolled=True,
+        user_id=user_id,
+        enrollment_date=created_at.isoformat() if created_at else None
+    )
+
+
 @app.get("/status/{user_id}", response_model=UserStatusResponse)
 async def get_user_status(
     user_id: str,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """Check if a user is enrolled"""
     user_id = user_id.strip().lower()
     
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    routed = await shard_router.route(request, user_id)
+    if routed is not None:
+        return routed
     
-    if user and user.embedding is not None:
-        return UserStatusResponse(
-            enrolled=True,
-            user_id=user_id,
-            enrollment_date=user.created_at.isoformat() if user.created_at else None
-        )
+    async with admission.controller.slot(admission.STATUS, feedback=False):
+        enrolled = await find_enrolled(db, [user_id])
     
-    return UserStatusResponse(
-        enrolled=False,
-        user_id=user_id
+    return status_response(user_id, enrolled)
+
+
+@app.post("/status/batch", response_model=StatusBatchResponse)
+async def get_user_status_batch(
+    data: StatusBatchRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """Enrollment status for many ids (admin voter lists) in one query"""
+    user_ids = [user_id.strip().lower() for user_id in data.user_ids]
+    
+    # Ids owned by other shard nodes are answered by them
+    local_ids, remote = await shard_router.fan_out(request, user_ids, "/status/batch")
+    remote_results = {
+        result["user_id"]: UserStatusResponse(**result)
+        for response in remote for result in response["results"]
+    }
+    
+    async with admission.controller.slot(admission.BATCH, feedback=False):
+        enrolled = await find_enrolled(db, local_ids)
+    
+    results = [remote_results.get(user_id) or status_response(user_id, enrolled) for user_id in user_ids]
+    return StatusBatchResponse(
+        results=results,
+        enrolled_count=sum(1 for result in results if result.enrolled)
     )
 
 
-@app.post("/validate-token")
+@app.post("/validate-token", response_model=TokenValidationResponse)
 async def validate_token(
     authorization: str = Header(None)
 ):
@@ -524,6 +895,15 @@ async def validate_token(
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     
+    if settings.single_use_tokens:
+        try:
+            rejection = await token_store.consume(payload)
+        except token_store.TokenStoreUnavailable as e:
+            logger.error(f"❌ Token store unavailable: {e}")
+            raise HTTPException(status_code=503, detail="Token store unavailable", headers={"Retry-After": "1"})
+        if rejection:
+            raise HTTPException(status_code=401, detail=rejection)
+    
     return {
         "valid": True,
         "user_id": payload.get("sub"),
@@ -536,25 +916,300 @@ async def validate_token(
 @app.delete("/user/{user_id}")
 async def delete_user(
     user_id: str,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """Delete a user's enrollment (for GDPR compliance)"""
     user_id = user_id.strip().lower()
     
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    routed = await shard_router.route(request, user_id)
+    if routed is not None:
+        return routed
     
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    was_enrolled = await repository.delete_user(db, user_id)
+    await db.commit()
     
-    await db.delete(user)
+    # A copy a rebalance has not moved yet would otherwise come back
+    moved_copy = await shard_router.delete_on_previous(user_id)
+    
+    # Logs go even when the row is already gone, so a retry finishes an interrupted delete
+    logs_deleted = await erasure.delete_verification_logs([user_id])
+    
+    # After the logs, so no allowlist build adds the wallet back; the next one drops its leaf
+    await merkle_allowlist.revoke(db, [user_id])
     await db.commit()
     
+    if was_enrolled is None and not moved_copy and not logs_deleted:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    erasure.forget_users({user_id: bool(was_enrolled)})
+    
     logger.info(f"🗑️ Deleted user: {user_id[:10]}...")
     
     return {"success": True, "message": "User data deleted"}
 
 
+# ============== Merkle Allowlist ==============
+
+def require_allowlist():
+    if not settings.allowlist_enabled:
+        raise HTTPException(status_code=404, detail="Merkle allowlist is not enabled")
+
+
+@app.get("/allowlist/proof/{user_id}", response_model=AllowlistProofResponse, dependencies=[Depends(require_allowlist)])
+async def get_allowlist_proof(user_id: str):
+    """Proof for voteWithProof, against the root last published on chain"""
+    user_id = user_id.strip().lower()
+    try:
+        proof = await allowlist.proof(user_id)
+    except AllowlistError as e:
+        logger.error(f"❌ Allowlist proof failed: {e}")
+        raise HTTPException(status_code=503, detail="Allowlist is being rebuilt, try again later")
+    if proof is None:
+        raise HTTPException(status_code=404, detail="Wallet is not in the published allowlist (yet)")
+    return proof
+
+
+@app.get("/admin/allowlist", dependencies=[Depends(require_admin), Depends(require_allowlist)])
+async def allowlist_status():
+    """Leaf count, recent roots and the last build / publish"""
+    return await allowlist.status()
+
+
+@app.post("/admin/allowlist/build", dependencies=[Depends(require_admin), Depends(require_allowlist)])
+async def build_allowlist():
+    """Append wallets verified since the last build"""
+    try:
+        async with admission.controller.slot(admission.BATCH, feedback=False):
+            return await allowlist.sync()
+    except AllowlistError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/admin/allowlist/publish", dependencies=[Depends(require_admin), Depends(require_allowlist)])
+async def publish_allowlist():
+    """Send the current root to the contract with setVerifiedVotersRoot (signed by the verification signer)"""
+    if not (settings.chain_rpc_url and settings.voting_contract_address and signer_account):
+        raise HTTPException(status_code=400, detail="CHAIN_RPC_URL, VOTING_CONTRACT_ADDRESS and a signer key are required")
+    from chain_rpc import ChainRpc, RpcError
+    
+    rpc = ChainRpc(settings.chain_rpc_url)
+    try:
+        return await allowlist.publish(rpc, signer_account, settings.voting_contract_address)
+    except AllowlistError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RpcError as e:
+        raise HTTPException(status_code=502, detail=f"Publishing failed: {e}")
+    finally:
+        await rpc.close()
+
+
+# ============== Analytics ==============
+
+@app.get("/analytics/verification-aggregates")
+async def verification_aggregates(
+    hours: int = Query(24, ge=1, le=24 * 366, description="How many hours back to return")
+):
+    """
+    Hourly verification statistics from the pre-aggregated rollup table
+    Never scans raw verification logs; the current hour appears after the next compaction
+    """
+    until = datetime.utcnow()
+    since = until - timedelta(hours=hours)
+    rows = await retention.get_hourly_aggregates(since, until)
+    
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "hours": rows,
+        "totals": retention.summarize_aggregates(rows)
+    }
+
+
+@app.post("/admin/log-compaction", dependencies=[Depends(require_admin)])
+async def trigger_log_compaction():
+    """Run the verification log rollup and retention purge now"""
+    async with admission.controller.slot(admission.BATCH, feedback=False):
+        return await retention.run_log_compaction()
+
+
+# ============== Admin: Profiling ==============
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """List stored request profiles, newest first"""
+    return {
+        "enabled": profiling.is_enabled(),
+        "profiles": profiling.store.list()
+    }
+
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def download_profile(profile_id: str):
+    """Download one stored profile as JSON"""
+    path = profiling.store.path_for(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    return FileResponse(path, media_type="application/json", filename=f"profile-{profile_id}.json")
+
+
+# ============== Admin: Metrics ==============
+
+@app.get("/admin/metrics", dependencies=[Depends(require_admin)])
+async def pipeline_metrics():
+    """Face pipeline counters and stage latencies since startup"""
+    snapshot = metrics.snapshot()
+    snapshot["detector"] = {
+        "input_sizes": detector_sizes(),
+        "escalation_rate": metrics.ratio("detector.escalations", "detector.requests"),
+    }
+    snapshot["admission"] = admission.controller.stats()
+    snapshot["voter_registry"] = voter_registry.stats()
+    snapshot["token_store"] = token_store.store.stats()
+    snapshot["logging"] = logging_setup.stats()
+    snapshot["lifecycle"] = lifecycle.stats()
+    snapshot["pipeline"] = pipeline.stats()
+    return snapshot
+
+
+# ============== Admin: Models ==============
+
+@app.get("/admin/models", dependencies=[Depends(require_admin)])
+async def model_status():
+    """Serving model pack, readiness and the last reload"""
+    return lifecycle.stats()
+
+
+@app.post("/admin/models/reload", status_code=202, dependencies=[Depends(require_admin)])
+async def reload_models(data: ModelReloadRequest):
+    """Load a model pack in every worker in the background and switch to it once warm (poll GET /admin/models)"""
+    try:
+        return await lifecycle.request_reload(data.model_name, reembed=data.reembed)
+    except LifecycleError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+# ============== Admin: Voting Window ==============
+
+@app.post("/admin/voting-window", dependencies=[Depends(require_admin)])
+async def set_voting_window(data: VotingWindowRequest):
+    """
+    Mark the contract's voting window as open or closed
+    While open, enroll and batch work get a smaller share of inference capacity
+    """
+    admission.controller.set_voting_window(data.active)
+    return admission.controller.stats()
+
+
+# ============== Admin: Background Jobs ==============
+
+@app.post("/admin/erase-jobs", dependencies=[Depends(require_admin)])
+async def create_erase_job(data: EraseJobRequest):
+    """
+    Start a resumable bulk erase of users and their verification logs
+    Runs in the background; poll GET /admin/jobs/{job_id} for progress
+    """
+    return await erasure.create_erase_job(data.user_ids, all_users=data.all_users)
+
+
+@app.post("/admin/jobs", dependencies=[Depends(require_admin)])
+async def create_maintenance_job(data: MaintenanceJobRequest):
+    """
+    Start a key rotation or re-embedding over all users
+    rotate_encryption_key re-encrypts under DB_ENCRYPTION_KEY; reembed_users
+    recomputes embeddings from retained crops with the loaded model
+    """
+    return await maintenance.create_maintenance_job(data.kind)
+
+
+@app.get("/admin/jobs", dependencies=[Depends(require_admin)])
+async def list_jobs(limit: int = Query(50, ge=1, le=500)):
+    """Background jobs, newest first"""
+    return {"jobs": await jobs.list_jobs(limit)}
+
+
+@app.get("/admin/jobs/{job_id}", dependencies=[Depends(require_admin)])
+async def get_job(job_id: str):
+    """One job's status, progress and throughput"""
+    job = await jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/admin/jobs/{job_id}/pause", dependencies=[Depends(require_admin)])
+async def pause_job(job_id: str):
+    """Stop a job at its next checkpoint; resume continues from there"""
+    job = await jobs.pause_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/admin/jobs/{job_id}/resume", dependencies=[Depends(require_admin)])
+async def resume_job(job_id: str):
+    """Continue a paused job"""
+    job = await jobs.resume_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+# ============== Admin: Sharding ==============
+
+@app.get("/admin/shard", dependencies=[Depends(require_admin)])
+async def shard_status():
+    """This node's shard map and forwarding counters"""
+    return shard_router.stats()
+
+
+@app.post("/admin/shard/ring", dependencies=[Depends(require_admin)])
+async def set_shard_ring(data: ShardRingRequest):
+    """
+    Switch this node to a new shard map (adding a node)
+    With `previous`, misses are pulled from the old owners; with `rebalance`,
+    local users now owned elsewhere are moved in a background job
+    """
+    try:
+        shard_router.configure(data.nodes, data.previous)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"🧭 Shard map set to {sorted(data.nodes)}{' (migrating)' if data.previous else ''}")
+    
+    job = await sharding.create_rebalance_job() if data.rebalance else None
+    return {"shard": shard_router.stats(), "job": job}
+
+
+@app.post("/admin/shard/export", dependencies=[Depends(require_admin)])
+async def export_shard_users(data: ShardUsersRequest):
+    """Full rows (encrypted) of the given users, for the node that now owns them"""
+    return {"users": await sharding.export_users(normalize_user_id(user_id) for user_id in data.user_ids)}
+
+
+@app.post("/admin/shard/import", dependencies=[Depends(require_admin)])
+async def import_shard_users(data: ShardImportRequest):
+    """Store users moved from another node (the newer copy of a user wins)"""
+    written = await sharding.import_users(data.users)
+    return {"imported": len(written), "skipped": len(data.users) - len(written)}
+
+
+# ============== Admin: Data Export ==============
+
+@app.get("/admin/users/{user_id}/export", dependencies=[Depends(require_admin)])
+async def export_user(
+    user_id: str,
+    after: int = Query(0, ge=0, description="Resume after this verification log id")
+):
+    """Stream everything stored about a user as NDJSON (data subject access request)"""
+    user_id = user_id.strip().lower()
+    return StreamingResponse(
+        erasure.export_user_ndjson(user_id, after_log_id=after),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="export-{user_id[:12]}.ndjson"'},
+    )
+
+
 # ============== Run Server ==============
 
 if __name__ == "__main__":
@@ -565,5 +1220,7 @@ if __name__ == "__main__":
         host=settings.host,
         port=settings.port,
         reload=False,  # Disabled reload for stability
-        log_level="info"
+        log_level="info",
+        log_config=None,  # uvicorn's loggers propagate to the queue set up above
+        timeout_graceful_shutdown=settings.worker_drain_timeout_seconds
     )
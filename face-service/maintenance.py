@@ -0,0 +1,149 @@
+"""
+Face Verification Service - Maintenance Jobs
+Rewrite every stored template: encryption key rotation and re-embedding
+
+Both jobs page through users by id (MAINTENANCE_CHUNK_SIZE rows at a time),
+do a chunk's CPU work on JOB_WORKERS threads and write it back together
+with the job checkpoint. Each row update is conditional on the stored
+blobs still being the ones that were read, so a user who re-enrolls while
+the job runs keeps the new enrollment.
+"""
+
+import logging
+from typing import Dict, List, Optional, Sequence
+
+from cryptography.fernet import InvalidToken
+from sqlalchemy import func, or_, select, update
+
+import jobs
+from config import settings
+from database import async_session
+from face_processor import decode_face_crop, embed_aligned_crops
+from models import User, decrypt_blob, encrypt_embedding, rotate_blob
+from verification_cache import verification_cache
+
+logger = logging.getLogger(__name__)
+
+ROTATE_KIND = "rotate_encryption_key"
+REEMBED_KIND = "reembed_users"
+
+# Rows each job rewrites
+_TARGETS = {
+    ROTATE_KIND: or_(User.embedding.isnot(None), User.face_crop.isnot(None)),
+    REEMBED_KIND: User.face_crop.isnot(None),
+}
+
+
+async def create_maintenance_job(kind: str) -> Dict:
+    """Queue a key rotation or re-embedding over all matching users"""
+    async with async_session() as db:
+        total = await db.scalar(select(func.count()).select_from(User).where(_TARGETS[kind]))
+    job = await jobs.create_job(kind, {}, total=total)
+    jobs.start_job(job["id"])
+    return job
+
+
+async def _next_rows(kind: str, cursor: Optional[str], *columns) -> List:
+    query = (
+        select(User.id, *columns)
+        .where(_TARGETS[kind])
+        .order_by(User.id)
+        .limit(settings.maintenance_chunk_size)
+    )
+    if cursor is not None:
+        query = query.where(User.id > cursor)
+    async with async_session() as db:
+        return list((await db.execute(query)).all())
+
+
+async def _write_chunk(ctx: "jobs.JobContext", rows: List, changes: List[Optional[Dict]], counter: str) -> List[str]:
+    """
+    Apply per-row changes ({column: (old, new)} or None if unreadable) and
+    checkpoint in one transaction; returns the ids actually rewritten
+    """
+    written, changed = [], 0
+    async with async_session() as db:
+        for row, change in zip(rows, changes):
+            if change is None:
+                continue
+            result = await db.execute(
+                update(User)
+                .where(User.id == row.id, *(getattr(User, name) == old for name, (old, _new) in change.items()))
+                .values({name: new for name, (_old, new) in change.items()})
+            )
+            if result.rowcount == 1:
+                written.append(row.id)
+            else:
+                changed += 1
+
+        await ctx.checkpoint(
+            db, cursor=rows[-1].id, processed=len(rows),
+            **{counter: len(written), "unreadable": changes.count(None), "changed_concurrently": changed},
+        )
+        await db.commit()
+    return written
+
+
+# ---- key rotation ----
+
+def _rotate(blob: Optional[bytes]) -> Optional[bytes]:
+    return rotate_blob(blob) if blob is not None else None
+
+
+def _rotate_rows(rows: Sequence) -> List[Optional[Dict]]:
+    changes = []
+    for row in rows:
+        try:
+            changes.append({
+                "embedding": (row.embedding, _rotate(row.embedding)),
+                "face_crop": (row.face_crop, _rotate(row.face_crop)),
+            })
+        except InvalidToken:
+            logger.warning(f"⚠️ Cannot decrypt data of {row.id[:10]}... with any configured key")
+            changes.append(None)
+    return changes
+
+
+@jobs.register(ROTATE_KIND)
+async def rotate_encryption_key(ctx: "jobs.JobContext"):
+    """Re-encrypt embeddings and crops under DB_ENCRYPTION_KEY (old keys from DB_ENCRYPTION_OLD_KEYS)"""
+    while True:
+        rows = await _next_rows(ROTATE_KIND, ctx.cursor, User.embedding, User.face_crop)
+        if not rows:
+            return
+        changes = await ctx.map(_rotate_rows, rows)
+        await _write_chunk(ctx, rows, changes, "rotated")
+        await ctx.throttle()
+
+
+# ---- re-embedding ----
+
+def _reembed_rows(rows: Sequence) -> List[Optional[Dict]]:
+    crops, readable = [], []
+    for row in rows:
+        try:
+            crops.append(decode_face_crop(decrypt_blob(row.face_crop)))
+            readable.append(True)
+        except (InvalidToken, ValueError):
+            logger.warning(f"⚠️ Unreadable face crop for {row.id[:10]}...")
+            readable.append(False)
+
+    embeddings = iter(embed_aligned_crops(crops) if crops else [])
+    return [
+        {"face_crop": (row.face_crop, row.face_crop), "embedding": (row.embedding, encrypt_embedding(next(embeddings)))}
+        if ok else None
+        for row, ok in zip(rows, readable)
+    ]
+
+
+@jobs.register(REEMBED_KIND)
+async def reembed_users(ctx: "jobs.JobContext"):
+    """Recompute embeddings from retained enrollment crops with the currently loaded model"""
+    while True:
+        rows = await _next_rows(REEMBED_KIND, ctx.cursor, User.embedding, User.face_crop)
+        if not rows:
+            return
+        changes = await ctx.map(_reembed_rows, rows)
+        for user_id in await _write_chunk(ctx, rows, changes, "reembedded"):
+            verification_cache.invalidate_user(user_id)
+        await ctx.throttle()
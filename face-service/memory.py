@@ -0,0 +1,184 @@
+"""
+Face Verification Service - Memory Management
+Bounded memory for long-running inference workers
+
+Worker RSS grows for two reasons. ONNX Runtime's CPU arena keeps the peak
+it reached for the largest input it has seen, and with memory patterns it
+also keeps a planned buffer set per input shape; both are configurable
+here (ORT_CPU_MEM_ARENA, ORT_MEM_PATTERN, ORT_ARENA_SHRINKAGE) and applied
+to every session the service creates. And each worker holds its own copy
+of the model weights unless they were loaded before the fork: serve.py
+does that, so the workers share the weight pages copy-on-write.
+
+What is left is caught by the watchdog: above WORKER_MAX_RSS_MB a worker
+marks itself draining and sends itself SIGTERM, which makes uvicorn stop
+accepting, finish the requests in flight and exit. The process supervisor
+(serve.py, uvicorn --workers, or the platform) starts a fresh worker.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+from typing import Callable, Dict, Optional
+
+from config import settings
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# /proc/self/smaps_rollup fields reported by process_memory(), in kB
+SMAPS_FIELDS = {
+    "Rss": "rss_mb",
+    "Pss": "pss_mb",
+    "Shared_Clean": "shared_mb",
+    "Shared_Dirty": "shared_mb",
+    "Private_Clean": "private_mb",
+    "Private_Dirty": "private_mb",
+}
+
+
+def session_options():
+    """onnxruntime.SessionOptions for every model session the service creates"""
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.enable_cpu_mem_arena = settings.ort_cpu_mem_arena
+    options.enable_mem_pattern = settings.ort_mem_pattern
+    if settings.ort_intra_op_threads > 0:
+        options.intra_op_num_threads = settings.ort_intra_op_threads
+    return options
+
+
+def _run_options():
+    import onnxruntime
+
+    options = onnxruntime.RunOptions()
+    options.add_run_config_entry("memory.enable_memory_arena_shrinkage", "cpu:0")
+    return options
+
+
+def bound_session(session):
+    """With ORT_ARENA_SHRINKAGE, make every run of `session` release its arena growth"""
+    if not (settings.ort_arena_shrinkage and settings.ort_cpu_mem_arena):
+        return session
+    if getattr(session.run, "shrinks_arena", False):
+        return session
+
+    run, options = session.run, _run_options()
+
+    def shrinking_run(output_names, input_feed, run_options=None):
+        return run(output_names, input_feed, run_options or options)
+
+    shrinking_run.shrinks_arena = True
+    session.run = shrinking_run
+    return session
+
+
+def bound_analyzer(analyzer):
+    """Apply bound_session to the sessions of every model of a FaceAnalysis"""
+    import onnxruntime
+
+    for model in analyzer.models.values():
+        for value in vars(model).values():
+            sessions = value.values() if isinstance(value, dict) else [value]
+            for session in sessions:
+                if isinstance(session, onnxruntime.InferenceSession):
+                    bound_session(session)
+    return analyzer
+
+
+def process_memory() -> Dict[str, Optional[float]]:
+    """
+    Memory of this process in MB
+
+    rss_mb counts shared pages (such as preloaded weights) in every worker
+    that maps them; pss_mb splits them between the workers, private_mb is
+    what this worker alone holds. The last three are Linux-only.
+    """
+    stats = {"rss_mb": None, "pss_mb": None, "shared_mb": None, "private_mb": None}
+    try:
+        totals = dict.fromkeys(set(SMAPS_FIELDS.values()), 0)
+        with open("/proc/self/smaps_rollup") as smaps:
+            for line in smaps:
+                key, _, value = line.partition(":")
+                if key in SMAPS_FIELDS:
+                    totals[SMAPS_FIELDS[key]] += int(value.split()[0])
+        return {key: round(value / 1024, 1) for key, value in totals.items()}
+    except (OSError, ValueError):
+        pass
+
+    try:
+        import psutil
+        stats["rss_mb"] = round(psutil.Process().memory_info().rss / MB, 1)
+    except ImportError:
+        logger.debug("psutil not installed; only Linux reports worker memory")
+    return stats
+
+
+class MemoryWatchdog:
+    """Recycles this worker once its RSS passes a threshold"""
+
+    def __init__(self, max_rss_mb: int = 0, interval_seconds: float = 30.0,
+                 on_recycle: Optional[Callable[[], None]] = None):
+        self.max_rss_mb = max_rss_mb
+        self.interval_seconds = interval_seconds
+        self.on_recycle = on_recycle or self._terminate
+        self.draining = False
+        self.peak_rss_mb = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "MemoryWatchdog":
+        return cls(settings.worker_max_rss_mb, settings.memory_check_interval_seconds)
+
+    @staticmethod
+    def _terminate():
+        # uvicorn handles SIGTERM as a graceful shutdown: no new connections,
+        # in-flight requests finish (up to its graceful shutdown timeout)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def check(self) -> bool:
+        """Sample RSS once; returns True if this call started a recycle"""
+        rss = process_memory()["rss_mb"]
+        if rss is None:
+            return False
+        self.peak_rss_mb = max(self.peak_rss_mb, rss)
+        if self.draining or not self.max_rss_mb or rss <= self.max_rss_mb:
+            return False
+
+        self.draining = True
+        metrics.increment("memory.recycles")
+        logger.warning(
+            f"♻️ Worker {os.getpid()} at {rss:.0f} MB RSS (limit {self.max_rss_mb} MB), "
+            "draining in-flight requests before it is replaced"
+        )
+        self.on_recycle()
+        return True
+
+    async def run(self):
+        """Check periodically until the worker starts draining"""
+        while not self.draining:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                self.check()
+            except Exception as e:
+                logger.warning(f"⚠️ Memory check failed: {e}")
+
+    def stats(self) -> Dict:
+        memory = process_memory()
+        if memory["rss_mb"] is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb, memory["rss_mb"])
+        return {
+            "pid": os.getpid(),
+            "worker_id": os.environ.get("WORKER_ID"),
+            **memory,
+            "peak_rss_mb": self.peak_rss_mb or None,
+            "max_rss_mb": self.max_rss_mb or None,
+            "draining": self.draining,
+        }
+
+
+# Global instance
+watchdog = MemoryWatchdog.from_settings()
@@ -0,0 +1,533 @@
+"""
+Face Verification Service - Merkle Allowlist
+Batch-mode voting permits: one Merkle root over every face-verified wallet
+
+Besides the per-voter ECDSA permit /verify signs, Voting.sol accepts
+voteWithProof(candidate, proof) against a root the service publishes with
+setVerifiedVotersRoot. Leaves are keccak256(abi.encodePacked(address)),
+the hash the signed permits cover, and pairs are hashed in sorted order
+like OpenZeppelin's MerkleProof, so a proof is just the sibling list.
+
+The tree is append-only, in the order wallets were first verified, and
+kept as one flat file of 32-byte nodes per level under ALLOWLIST_DIR.
+Appending b leaves writes them plus the O(b + log n) ancestors that
+changed; a lone last node is promoted to the next level unhashed. A node
+whose leaves are all present never changes again, so a proof against the
+published root (n leaves) can still be read from a tree that has since
+grown: one sibling read per level, with only the right edge of the n-leaf
+tree recomputed.
+
+Builds pick up successful verifications from verification_logs after the
+cursor kept in allowlist_roots, so /verify does no extra work. Leaf
+positions are committed after the level files are written and synced; if
+a build dies in between, the next one truncates the files back to the
+committed count. One process builds and publishes at a time (a lock file
+next to the levels); any worker serves proofs. Log compaction
+(retention.py) never deletes logs past the build cursor.
+
+Erasing a user (DELETE /user, erase jobs) deletes its entry, so no proof
+is served for the wallet any more. The next build sees the gap in the
+positions and compacts: the remaining entries are renumbered in their
+original order and the level files rewritten, and the new root (without
+the erased leaves) is published like any other, which also invalidates
+proofs handed out against the old one. Until then, proofs for the other
+wallets are refused (503) because the files no longer match the published
+root. A later successful verification of an erased wallet appends it as a
+new leaf.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from eth_utils import keccak
+from sqlalchemy import delete, func, select
+
+from config import settings
+from database import async_session
+from metrics import metrics
+from models import AllowlistEntry, AllowlistRoot, VerificationLog
+
+try:
+    import fcntl
+except ImportError:  # Windows: run a single builder process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ADDRESS_RE = re.compile(r"^0x[0-9a-f]{40}$")
+
+NODE = 32
+EMPTY_ROOT = b"\x00" * NODE
+SET_ROOT_SIGNATURE = "setVerifiedVotersRoot(bytes32,uint256)"
+
+# Smaller runs of nodes are hashed in-process even with several build workers
+PARALLEL_MIN_NODES = 1 << 16
+
+
+class AllowlistError(RuntimeError):
+    """The allowlist cannot be built, published or read as asked"""
+
+
+def leaf_hash(address: str) -> bytes:
+    """keccak256(abi.encodePacked(address))"""
+    return keccak(bytes.fromhex(address[2:]))
+
+
+def hash_pair(a: bytes, b: bytes) -> bytes:
+    """Commutative pair hash (OpenZeppelin MerkleProof)"""
+    return keccak(a + b) if a < b else keccak(b + a)
+
+
+def verify_proof(proof: Sequence[bytes], root: bytes, leaf: bytes) -> bool:
+    """What MerkleProof.verify does on chain"""
+    computed = leaf
+    for sibling in proof:
+        computed = hash_pair(computed, sibling)
+    return computed == root
+
+
+def hash_leaves(addresses: Sequence[str]) -> bytes:
+    return b"".join(leaf_hash(address) for address in addresses)
+
+
+def parent_level(children: bytes) -> bytes:
+    """Parents of a run of nodes that starts at an even index (a lone last node is promoted)"""
+    parents = bytearray()
+    paired = len(children) - len(children) % (2 * NODE)
+    for i in range(0, paired, 2 * NODE):
+        parents += hash_pair(children[i:i + NODE], children[i + NODE:i + 2 * NODE])
+    parents += children[paired:]
+    return bytes(parents)
+
+
+def level_size(count: int, level: int) -> int:
+    """Nodes on `level` of a tree with `count` leaves"""
+    return ((count - 1) >> level) + 1 if count else 0
+
+
+class MerkleStore:
+    """Append-only Merkle tree, one file of nodes per level"""
+
+    def __init__(self, directory: str, workers: int = 1):
+        self.directory = directory
+        self.workers = workers
+        self._files: Dict[int, object] = {}
+        self._lock = threading.Lock()
+
+    # ---- files ----
+
+    def _path(self, level: int) -> str:
+        return os.path.join(self.directory, f"level-{level:02d}.bin")
+
+    def _file(self, level: int):
+        f = self._files.get(level)
+        if f is None:
+            path = self._path(level)
+            if not os.path.exists(path):
+                os.makedirs(self.directory, exist_ok=True)
+                open(path, "ab").close()
+            # Unbuffered, so other processes' appends are seen on the next read
+            f = self._files[level] = open(path, "r+b", buffering=0)
+        return f
+
+    def size(self, level: int = 0) -> int:
+        """Nodes on disk for `level` (level 0: leaves)"""
+        path = self._path(level)
+        return os.path.getsize(path) // NODE if os.path.exists(path) else 0
+
+    def read(self, level: int, index: int, count: int = 1) -> bytes:
+        with self._lock:
+            f = self._file(level)
+            f.seek(index * NODE)
+            data = f.read(count * NODE)
+        if len(data) != count * NODE:
+            raise AllowlistError(f"Level {level} has no node {index + len(data) // NODE}; rebuild the allowlist")
+        return data
+
+    def _write(self, level: int, index: int, data: bytes):
+        with self._lock:
+            f = self._file(level)
+            f.seek(index * NODE)
+            f.write(data)
+
+    def _truncate(self, level: int, nodes: int):
+        with self._lock:
+            self._file(level).truncate(nodes * NODE)
+
+    def flush(self):
+        """fsync every level, before positions are committed to the database"""
+        with self._lock:
+            for f in self._files.values():
+                os.fsync(f.fileno())
+
+    def close(self):
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+
+    @contextmanager
+    def locked(self):
+        """Exclusive builder lock across processes; yields False when another process holds it"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "a+") as f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+            try:
+                yield True
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    # ---- updates ----
+
+    @contextmanager
+    def _pool(self, nodes: int):
+        if self.workers > 1 and nodes >= PARALLEL_MIN_NODES:
+            with ProcessPoolExecutor(self.workers) as pool:
+                yield pool
+        else:
+            yield None
+
+    def _map(self, pool, fn, items, align: int = 1) -> bytes:
+        """fn over slices of items (each slice `align`-aligned), on the pool if there is one"""
+        if pool is None:
+            return fn(items)
+        size = -(-len(items) // self.workers)
+        size += -size % align
+        return b"".join(pool.map(fn, [items[i:i + size] for i in range(0, len(items), size)]))
+
+    def append_addresses(self, addresses: Sequence[str]) -> int:
+        """Append the leaves of `addresses`; returns the new leaf count"""
+        with self._pool(len(addresses)) as pool:
+            return self._append(self._map(pool, hash_leaves, list(addresses)), pool)
+
+    def append(self, leaves: bytes) -> int:
+        """Append leaf hashes (concatenated); returns the new leaf count"""
+        with self._pool(len(leaves) // NODE) as pool:
+            return self._append(leaves, pool)
+
+    def _append(self, leaves: bytes, pool) -> int:
+        start = self.size(0)
+        if leaves:
+            self._write(0, start, leaves)
+            self._update_ancestors(start, leaves, pool)
+        return start + len(leaves) // NODE
+
+    def _update_ancestors(self, start: int, changed: bytes, pool=None):
+        """Recompute every ancestor of leaves [start, end), where `changed` runs to the last leaf"""
+        level, size = 0, start + len(changed) // NODE
+        while size > 1:
+            if start % 2:
+                changed = self.read(level, start - 1) + changed
+                start -= 1
+            changed = self._map(pool, parent_level, changed, align=2 * NODE)
+            level, start, size = level + 1, start // 2, (size + 1) // 2
+            self._write(level, start, changed)
+
+    def truncate(self, count: int):
+        """Cut the tree back to its first `count` leaves"""
+        top = (count - 1).bit_length() if count else -1
+        level = 0
+        while os.path.exists(self._path(level)):
+            self._truncate(level, level_size(count, level) if level <= top else 0)
+            level += 1
+        if count:
+            self._update_ancestors(count - 1, self.read(0, count - 1))
+
+    # ---- reads (against any leaf count up to what is on disk) ----
+
+    def node(self, level: int, index: int, count: int) -> bytes:
+        """Node of the tree over the first `count` leaves"""
+        if (index + 1) << level <= count:
+            return self.read(level, index)  # complete subtree, final on disk
+        left = self.node(level - 1, 2 * index, count)
+        if (2 * index + 1) << (level - 1) >= count:
+            return left  # promoted
+        return hash_pair(left, self.node(level - 1, 2 * index + 1, count))
+
+    def root(self, count: int) -> bytes:
+        if count == 0:
+            return EMPTY_ROOT
+        return self.node((count - 1).bit_length(), 0, count)
+
+    def proof(self, index: int, count: int) -> List[bytes]:
+        """Siblings from leaf `index` up to the root of the first `count` leaves"""
+        if not 0 <= index < count:
+            raise AllowlistError(f"Leaf {index} is not in a tree of {count}")
+        proof, level = [], 0
+        while level_size(count, level) > 1:
+            sibling = index ^ 1
+            if sibling << level < count:
+                proof.append(self.node(level, sibling, count))
+            index, level = index // 2, level + 1
+        return proof
+
+
+class Allowlist:
+    """Verified wallets, their leaf positions, and the roots built and published over them"""
+
+    def __init__(self, directory: str, workers: int = 1):
+        self.store = MerkleStore(directory, workers)
+        self.last_build: Optional[Dict] = None
+        self.last_publish: Optional[Dict] = None
+        self._build_lock = threading.Lock()
+
+    async def _committed_count(self, db) -> int:
+        last = await db.scalar(select(func.max(AllowlistEntry.position)))
+        return last + 1 if last is not None else 0
+
+    async def _latest(self, db, published: bool = False) -> Optional[AllowlistRoot]:
+        query = select(AllowlistRoot)
+        if published:
+            query = query.where(AllowlistRoot.published_at.is_not(None))
+        return await db.scalar(query.order_by(AllowlistRoot.id.desc()).limit(1))
+
+    async def _restore(self, db, count: int):
+        """Bring the level files in line with the committed positions"""
+        on_disk = self.store.size(0)
+        if on_disk == count:
+            return
+        if on_disk > count:
+            logger.warning(f"⚠️ Allowlist files are {on_disk - count} leaves ahead of the database; truncating")
+            await asyncio.to_thread(self.store.truncate, count)
+            return
+
+        logger.warning(f"⚠️ Allowlist files hold {on_disk} of {count} leaves; rebuilding from the database")
+        await asyncio.to_thread(self.store.truncate, 0)
+        batch = max(settings.allowlist_batch_size, 10_000)
+        for offset in range(0, count, batch):
+            addresses = (await db.execute(
+                select(AllowlistEntry.address)
+                .where(AllowlistEntry.position >= offset, AllowlistEntry.position < offset + batch)
+                .order_by(AllowlistEntry.position)
+            )).scalars().all()
+            await asyncio.to_thread(self.store.append_addresses, addresses)
+        await asyncio.to_thread(self.store.flush)
+
+    async def _compact(self, db) -> int:
+        """Renumber entries without the gaps erased wallets left and rewrite the level files; returns the leaf count"""
+        rows = (await db.execute(
+            select(AllowlistEntry.address, AllowlistEntry.added_at).order_by(AllowlistEntry.position)
+        )).all()
+        # Files first: if the commit below never happens, the gaps are still there and the next build redoes this
+        await asyncio.to_thread(self.store.truncate, 0)
+        batch = max(settings.allowlist_batch_size, 10_000)
+        for offset in range(0, len(rows), batch):
+            await asyncio.to_thread(self.store.append_addresses, [address for address, _ in rows[offset:offset + batch]])
+        await asyncio.to_thread(self.store.flush)
+
+        await db.execute(delete(AllowlistEntry))
+        db.add_all(
+            AllowlistEntry(address=address, position=i, added_at=added_at) for i, (address, added_at) in enumerate(rows)
+        )
+        await db.commit()
+        return len(rows)
+
+    @contextmanager
+    def _exclusive(self):
+        if not self._build_lock.acquire(blocking=False):
+            raise AllowlistError("Another allowlist build or publish is running")
+        try:
+            with self.store.locked() as acquired:
+                if not acquired:
+                    raise AllowlistError("Another process is building or publishing the allowlist")
+                yield
+        finally:
+            self._build_lock.release()
+
+    async def sync(self) -> Dict:
+        """Append wallets verified since the last build; returns counts and the new root"""
+        started = time.perf_counter()
+        added = scanned = 0
+        with self._exclusive():
+            async with async_session() as db:
+                count = await self._committed_count(db)
+                entries = await db.scalar(select(func.count()).select_from(AllowlistEntry))
+                previous = await self._latest(db)
+                # Only builds add entries, so anything below the last build's count was erased
+                removed = max(0, (previous.leaf_count or 0) - entries) if previous else 0
+                if entries < count:
+                    # Erased wallets left gaps: drop their leaves before appending
+                    count = await self._compact(db)
+                    logger.info(f"🌳 Allowlist: tree rewritten without erased wallets, {count} leaves")
+                await self._restore(db, count)
+                metrics.increment("allowlist.removed", removed)
+                snapshot = await self._latest(db)
+                cursor = snapshot.log_cursor if snapshot else 0
+                if snapshot is None or snapshot.published_at is not None:
+                    snapshot = AllowlistRoot(leaf_count=count, log_cursor=cursor)
+                    db.add(snapshot)
+
+                while True:
+                    rows = (await db.execute(
+                        select(VerificationLog.id, VerificationLog.user_id)
+                        .where(VerificationLog.id > cursor, VerificationLog.success.is_(True))
+                        .order_by(VerificationLog.id)
+                        .limit(settings.allowlist_batch_size)
+                    )).all()
+                    if not rows:
+                        break
+                    scanned += len(rows)
+                    cursor = rows[-1][0]
+
+                    candidates = list(dict.fromkeys(user_id for _, user_id in rows if ADDRESS_RE.match(user_id or "")))
+                    known = set((await db.execute(
+                        select(AllowlistEntry.address).where(AllowlistEntry.address.in_(candidates))
+                    )).scalars().all()) if candidates else set()
+                    fresh = [address for address in candidates if address not in known]
+                    if fresh:
+                        await asyncio.to_thread(self.store.append_addresses, fresh)
+                        await asyncio.to_thread(self.store.flush)
+                        db.add_all(AllowlistEntry(address=address, position=count + i) for i, address in enumerate(fresh))
+                        count += len(fresh)
+                        added += len(fresh)
+
+                    snapshot.log_cursor = cursor
+                    snapshot.leaf_count = count
+                    snapshot.root = "0x" + (await asyncio.to_thread(self.store.root, count)).hex()
+                    await db.commit()
+                    if len(rows) < settings.allowlist_batch_size:
+                        break
+
+                root = "0x" + (await asyncio.to_thread(self.store.root, count)).hex()
+                if snapshot.root != root or snapshot.leaf_count != count:
+                    snapshot.root, snapshot.leaf_count = root, count
+                    await db.commit()
+
+        metrics.increment("allowlist.added", added)
+        self.last_build = {
+            "added": added,
+            "removed": removed,
+            "scanned_logs": scanned,
+            "leaf_count": count,
+            "root": snapshot.root,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        if added:
+            logger.info(f"🌳 Allowlist: +{added} wallets, {count} leaves, root {snapshot.root[:10]}...")
+        return self.last_build
+
+    async def publish(self, rpc, account, contract: str) -> Dict:
+        """
+        Send the current root to the contract (setVerifiedVotersRoot) and wait for it
+        `account` pays the gas and must be the contract's verification signer
+        or an admin. A root that is already published is not sent again. Once
+        every wallet is erased the zero root is sent, which turns
+        voteWithProof off.
+        """
+        with self._exclusive():
+            async with async_session() as db:
+                count = await self._committed_count(db)
+                published = await self._latest(db, published=True)
+                if count == 0 and published is None:
+                    raise AllowlistError("The allowlist is empty; build it first")
+                root = "0x" + (await asyncio.to_thread(self.store.root, count)).hex()
+                if published is not None and published.root == root:
+                    return {**published.to_dict(), "unchanged": True}
+
+                snapshot = await self._latest(db)
+                if snapshot is None or snapshot.published_at is not None:
+                    snapshot = AllowlistRoot(log_cursor=snapshot.log_cursor if snapshot else 0)
+                    db.add(snapshot)
+                snapshot.root, snapshot.leaf_count = root, count
+
+                snapshot.tx_hash = await rpc.send_transaction(account, contract, SET_ROOT_SIGNATURE, bytes.fromhex(root[2:]), count)
+                await db.commit()
+                receipt = await rpc.wait_for_receipt(snapshot.tx_hash, timeout=settings.allowlist_publish_timeout_seconds)
+                if int(receipt.get("status", "0x1"), 16) != 1:
+                    raise AllowlistError(f"setVerifiedVotersRoot reverted in {snapshot.tx_hash}")
+                snapshot.published_at = datetime.utcnow()
+                await db.commit()
+                self.last_publish = snapshot.to_dict()
+
+        metrics.increment("allowlist.published")
+        logger.info(f"📣 Published allowlist root {root[:10]}... over {count} wallets in {snapshot.tx_hash}")
+        return self.last_publish
+
+    async def proof(self, address: str) -> Optional[Dict]:
+        """Proof of `address` against the last published root; None if it is not covered by it"""
+        async with async_session() as db:
+            published = await self._latest(db, published=True)
+            position = await db.scalar(select(AllowlistEntry.position).where(AllowlistEntry.address == address))
+        if published is None or position is None or position >= published.leaf_count:
+            return None
+
+        proof = await asyncio.to_thread(self.store.proof, position, published.leaf_count)
+        leaf = leaf_hash(address)
+        if not verify_proof(proof, bytes.fromhex(published.root[2:]), leaf):
+            metrics.increment("allowlist.proof_mismatch")
+            # Expected between compacting out erased wallets and publishing the new root
+            raise AllowlistError("Allowlist files do not match the published root; publish or rebuild them")
+        metrics.increment("allowlist.proofs")
+        return {
+            "address": address,
+            "leaf": "0x" + leaf.hex(),
+            "index": position,
+            "proof": ["0x" + node.hex() for node in proof],
+            "root": published.root,
+            "leaf_count": published.leaf_count,
+            "tx_hash": published.tx_hash,
+        }
+
+    async def status(self) -> Dict:
+        async with async_session() as db:
+            count = await self._committed_count(db)
+            roots = (await db.execute(
+                select(AllowlistRoot).order_by(AllowlistRoot.id.desc()).limit(10)
+            )).scalars().all()
+        return {
+            "leaf_count": count,
+            "leaves_on_disk": self.store.size(0),
+            "roots": [row.to_dict() for row in roots],
+            "last_build": self.last_build,
+            "last_publish": self.last_publish,
+        }
+
+
+async def revoke(db, addresses: Optional[Sequence[str]] = None) -> int:
+    """
+    Delete the entries of erased wallets (all of them when `addresses` is None)
+    Runs in the caller's transaction; the next build drops their leaves and
+    produces a root without them. Returns the entries deleted.
+    """
+    query = delete(AllowlistEntry)
+    if addresses is not None:
+        query = query.where(AllowlistEntry.address.in_(list(addresses)))
+    result = await db.execute(query)
+    return result.rowcount
+
+
+async def build_loop(account=None):
+    """Background task: build every ALLOWLIST_BUILD_INTERVAL_SECONDS, publishing new roots if enabled"""
+    from chain_rpc import ChainRpc
+
+    while True:
+        await asyncio.sleep(settings.allowlist_build_interval_seconds)
+        try:
+            result = await allowlist.sync()
+            # A build that only removed wallets still needs its (possibly zero) root published
+            if settings.allowlist_publish and account is not None and (result["leaf_count"] or result["removed"]):
+                rpc = ChainRpc(settings.chain_rpc_url)
+                try:
+                    await allowlist.publish(rpc, account, settings.voting_contract_address)
+                finally:
+                    await rpc.close()
+        except Exception as e:
+            logger.error(f"❌ Allowlist build failed: {e}")
+
+
+# Global instance
+allowlist = Allowlist(settings.allowlist_dir, settings.allowlist_build_workers)
@@ -0,0 +1,84 @@
+"""
+Face Verification Service - Pipeline Metrics
+In-process counters and latency summaries for the face pipeline
+
+Counters are incremented once per request by the stage that handled it
+(e.g. detector.escalations), so ratios between them give per-request rates.
+Timings keep a bounded window of recent samples for percentiles.
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Optional
+
+
+class Metrics:
+    """Thread-safe counters and timing windows, keyed by dotted names"""
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._timings: Dict[str, deque] = {}
+        self._timing_counts = defaultdict(int)
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def observe(self, name: str, value_ms: float):
+        with self._lock:
+            samples = self._timings.get(name)
+            if samples is None:
+                samples = self._timings[name] = deque(maxlen=self.window)
+            samples.append((time.monotonic(), value_ms))
+            self._timing_counts[name] += 1
+
+    def counter(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def ratio(self, numerator: str, denominator: str) -> float:
+        with self._lock:
+            total = self._counters.get(denominator, 0)
+            return round(self._counters.get(numerator, 0) / total, 4) if total else 0.0
+
+    def percentile(self, name: str, q: float, within_seconds: Optional[float] = None) -> Optional[float]:
+        """q-quantile of a timing's window (optionally only recent samples); None without samples"""
+        since = time.monotonic() - within_seconds if within_seconds is not None else None
+        with self._lock:
+            samples = self._timings.get(name, ())
+            values = sorted(value for at, value in samples if since is None or at >= since)
+        if not values:
+            return None
+        return values[min(int(len(values) * q), len(values) - 1)]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {
+                name: ([value for _at, value in samples], self._timing_counts[name])
+                for name, samples in self._timings.items()
+            }
+
+        summary = {}
+        for name, (samples, count) in sorted(timings.items()):
+            ordered = sorted(samples)
+            summary[name] = {
+                "count": count,
+                "mean_ms": round(sum(ordered) / len(ordered), 3),
+                "p50_ms": round(ordered[len(ordered) // 2], 3),
+                "p95_ms": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 3),
+            }
+        return {"counters": dict(sorted(counters.items())), "timings": summary}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+            self._timing_counts.clear()
+
+
+# Global instance
+metrics = Metrics()
@@ -3,84 +3,111 @@ Face Verification Service - Database Models
 SQLAlchemy models for storing user face embeddings securely
 """
 
-from sqlalchemy import Column, String, DateTime, LargeBinary, Float, Boolean, Integer, Text
+from sqlalchemy import Column, String, DateTime, LargeBinary, Float, Boolean, Integer, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+import base64
 import json
+import os
 
 Base = declarative_base()
 
 
+def _embedding_cipher():
+    """
+    Fernet keyring for embeddings: DB_ENCRYPTION_KEY encrypts, and
+    DB_ENCRYPTION_OLD_KEYS (comma-separated) still decrypt during a rotation
+    """
+    # In PROD: This must be in .env. Here we fallback for demo.
+    encryption_key = os.getenv("DB_ENCRYPTION_KEY")
+    if not encryption_key:
+        # Deterministic panic fallback (Do not use in real prod!)
+        # We need a 32 url-safe base64-encoded bytes
+        # We'll generate a consistent one from a hardcoded secret for this demo
+        # to prevent data loss on restart if env is missing.
+        secret = b"VotEthSecretKeyForDemoMustBe32B!" # 32 bytes
+        encryption_key = base64.urlsafe_b64encode(secret).decode()
+    old_keys = tuple(key.strip() for key in os.getenv("DB_ENCRYPTION_OLD_KEYS", "").split(",") if key.strip())
+    return _cipher_for_keys((encryption_key,) + old_keys)
+
+
+@lru_cache(maxsize=4)
+def _cipher_for_keys(encryption_keys: tuple):
+    from cryptography.fernet import Fernet, MultiFernet
+    return MultiFernet([Fernet(key) for key in encryption_keys])
+
+
+def encrypt_blob(data: bytes) -> bytes:
+    """Encrypt arbitrary bytes (embeddings, retained face crops) with the current key"""
+    return _embedding_cipher().encrypt(data)
+
+
+def decrypt_blob(blob: bytes) -> bytes:
+    """Decrypt with the current or any old key; raises cryptography's InvalidToken"""
+    return _embedding_cipher().decrypt(blob)
+
+
+def rotate_blob(blob: bytes) -> bytes:
+    """Re-encrypt a stored value under the current key"""
+    return _embedding_cipher().rotate(blob)
+
+
+def encrypt_embedding(embedding_array) -> bytes:
+    """Encrypt a numpy embedding into the users.embedding storage format"""
+    import numpy as np
+    
+    raw_bytes = embedding_array.astype(np.float32).tobytes()
+    return encrypt_blob(raw_bytes)
+
+
+def decrypt_embedding(blob: Optional[bytes]):
+    """Decrypt a users.embedding value back to a numpy array (None if missing or unreadable)"""
+    import numpy as np
+    
+    if blob is None:
+        return None
+    
+    try:
+        decrypted_bytes = decrypt_blob(blob)
+        return np.frombuffer(decrypted_bytes, dtype=np.float32)
+    except Exception as e:
+        print(f"Decryption error: {e}")
+        return None
+
+
 class User(Base):
     """User model with face embeddings"""
     __tablename__ = "users"
     
     id = Column(String(255), primary_key=True, index=True)  # Wallet address or unique ID
     created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), index=True)
     is_active = Column(Boolean, default=True)
     enrollment_count = Column(Integer, default=0)
     
     # Store embedding as encrypted binary (in production, use proper encryption)
     # Embedding is a 128-dimensional vector from OpenFace model
-    embedding = Column(LargeBinary, nullable=True)
+    # Deferred: only loaded when accessed; lookups go through repository.py projections
+    embedding = deferred(Column(LargeBinary, nullable=True))
+    
+    # Aligned 112x112 face from the last enrollment (encrypted PNG), kept only
+    # when RETAIN_ENROLLMENT_CROPS is on so embeddings can be recomputed with a new model
+    face_crop = deferred(Column(LargeBinary, nullable=True))
     
     # Metadata
-    metadata_json = Column(Text, default="{}")
+    metadata_json = deferred(Column(Text, default="{}"))
     
     def set_embedding(self, embedding_array):
         """Convert numpy array to bytes and encrypt for storage"""
-        import numpy as np
-        from cryptography.fernet import Fernet
-        import os
-        import base64
-
-        # 1. Convert to bytes
-        raw_bytes = embedding_array.astype(np.float32).tobytes()
-
-        # 2. Get Encryption Key (Or generate one securely)
-        # In PROD: This must be in .env. Here we fallback for demo.
-        encryption_key = os.getenv("DB_ENCRYPTION_KEY")
-        if not encryption_key:
-            # Deterministic panic fallback (Do not use in real prod!)
-            # We need a 32 url-safe base64-encoded bytes
-            # We'll generate a consistent one from a hardcoded secret for this demo
-            # to prevent data loss on restart if env is missing.
-            secret = b"VotEthSecretKeyForDemoMustBe32B!" # 32 bytes
-            encryption_key = base64.urlsafe_b64encode(secret).decode()
-
-        f = Fernet(encryption_key)
-        
-        # 3. Encrypt
-        self.embedding = f.encrypt(raw_bytes)
+        self.embedding = encrypt_embedding(embedding_array)
     
     def get_embedding(self):
         """Decrypt stored bytes and convert back to numpy array"""
-        import numpy as np
-        from cryptography.fernet import Fernet
-        import os
-        import base64
-
-        if self.embedding is None:
-            return None
-            
-        # 1. Get Key
-        encryption_key = os.getenv("DB_ENCRYPTION_KEY")
-        if not encryption_key:
-            secret = b"VotEthSecretKeyForDemoMustBe32B!"
-            encryption_key = base64.urlsafe_b64encode(secret).decode()
-            
-        f = Fernet(encryption_key)
-
-        try:
-            # 2. Decrypt
-            decrypted_bytes = f.decrypt(self.embedding)
-            # 3. Convert back
-            return np.frombuffer(decrypted_bytes, dtype=np.float32)
-        except Exception as e:
-            print(f"Decryption error: {e}")
-            return None
+        return decrypt_embedding(self.embedding)
     
     def set_metadata(self, data: dict):
         """Store metadata as JSON"""
@@ -97,7 +124,7 @@ class VerificationLog(Base):
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(String(255), index=True)
-    timestamp = Column(DateTime, default=func.now())
+    timestamp = Column(DateTime, default=func.now(), index=True)  # retention and time-range queries
     success = Column(Boolean)
     similarity_score = Column(Float, nullable=True)
     liveness_passed = Column(Boolean, nullable=True)
@@ -106,6 +133,194 @@ class VerificationLog(Base):
     failure_reason = Column(String(255), nullable=True)
 
 
+class VerificationHourlyAggregate(Base):
+    """Hourly rollup of verification_logs, kept after raw rows are purged"""
+    __tablename__ = "verification_hourly_aggregates"
+    
+    hour = Column(DateTime, primary_key=True)  # UTC, truncated to the hour
+    attempts = Column(Integer, default=0)
+    successes = Column(Integer, default=0)
+    liveness_failures = Column(Integer, default=0)
+    
+    # JSON: 10 buckets of similarity score (0.0-0.1, ..., 0.9-1.0)
+    similarity_histogram = Column(Text, default="[]")
+    # JSON: failure category -> count
+    failure_reasons = Column(Text, default="{}")
+    # JSON: failed liveness check -> count
+    liveness_reasons = Column(Text, default="{}")
+    
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    def to_dict(self) -> dict:
+        return {
+            "hour": self.hour.isoformat(),
+            "attempts": self.attempts,
+            "successes": self.successes,
+            "success_rate": round(self.successes / self.attempts, 4) if self.attempts else 0.0,
+            "liveness_failures": self.liveness_failures,
+            "similarity_histogram": json.loads(self.similarity_histogram or "[]"),
+            "failure_reasons": json.loads(self.failure_reasons or "{}"),
+            "liveness_reasons": json.loads(self.liveness_reasons or "{}"),
+        }
+
+
+class BackgroundJob(Base):
+    """Persistent state of a long-running admin job, so it can resume after a crash"""
+    __tablename__ = "background_jobs"
+    
+    id = Column(String(32), primary_key=True)
+    kind = Column(String(50), index=True)  # e.g. "erase_users"
+    status = Column(String(20), index=True, default="pending")  # pending, running, completed, failed
+    params = deferred(Column(Text, default="{}"))  # JSON; may hold large id lists
+    cursor = Column(Text, nullable=True)  # handler-defined resume point, committed with each chunk
+    total = Column(Integer, nullable=True)
+    processed = Column(Integer, default=0)
+    counters = Column(Text, default="{}")  # JSON: handler-defined counts
+    active_seconds = Column(Float, default=0.0)  # time spent running, across resumes
+    error = Column(Text, nullable=True)
+    
+    # Lease: the worker that owns a running job refreshes heartbeat_at at every checkpoint
+    owner = Column(String(64), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    def to_dict(self) -> dict:
+        processed = self.processed or 0
+        active = self.active_seconds or 0.0
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "processed": processed,
+            "progress": round(processed / self.total, 4) if self.total else None,
+            "items_per_second": round(processed / active, 2) if active > 0 else None,
+            "active_seconds": round(active, 3),
+            "counters": json.loads(self.counters or "{}"),
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class ChainState(Base):
+    """Chain indexer key/value state (last indexed block, voting window, paused)"""
+    __tablename__ = "chain_state"
+    
+    key = Column(String(50), primary_key=True)
+    value = Column(Text)
+
+
+class ModelGeneration(Base):
+    """
+    One POST /admin/models/reload; every worker polls for the newest row
+    and switches to its pack, so a reload reaches all of them
+    """
+    __tablename__ = "model_generations"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)  # the generation
+    model_name = Column(String(100))
+    configured_model = Column(String(100))  # FACE_MODEL_NAME of the worker that took the request
+    requested_at = Column(DateTime, default=func.now())
+
+
+class ChainIndexerLease(Base):
+    """Single-writer lease on the chain index tables; other processes only read them"""
+    __tablename__ = "chain_indexer_lease"
+    
+    name = Column(String(50), primary_key=True)
+    owner = Column(String(64), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+
+class ChainBlock(Base):
+    """Hashes of recently indexed blocks, compared against the node to detect reorgs"""
+    __tablename__ = "chain_blocks"
+    
+    number = Column(Integer, primary_key=True, autoincrement=False)
+    hash = Column(String(66))
+
+
+class ChainEvent(Base):
+    """Journal of events applied from blocks that may still be reorged out"""
+    __tablename__ = "chain_events"
+    # An event is journaled (and so applied) at most once
+    __table_args__ = (Index("ix_chain_events_position", "block_number", "log_index", unique=True),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    block_number = Column(Integer, index=True)
+    log_index = Column(Integer)
+    kind = Column(String(30))
+    payload = Column(Text)  # JSON: decoded event fields + values needed to undo it
+
+
+class CandidateTally(Base):
+    """Indexed vote count per candidate"""
+    __tablename__ = "candidate_tallies"
+    
+    candidate_index = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(255), nullable=True)
+    votes = Column(Integer, default=0)
+
+
+class VoteInterval(Base):
+    """Indexed votes per candidate per time bucket (INDEXER_INTERVAL_SECONDS)"""
+    __tablename__ = "vote_intervals"
+    
+    interval_start = Column(Integer, primary_key=True, autoincrement=False)  # unix seconds
+    candidate_index = Column(Integer, primary_key=True, autoincrement=False)
+    votes = Column(Integer, default=0)
+
+
+class ChainVoter(Base):
+    """Registration and voted flags per wallet, as seen in contract events"""
+    __tablename__ = "chain_voters"
+    
+    address = Column(String(42), primary_key=True)  # lowercase
+    registered = Column(Boolean, default=False)
+    has_voted = Column(Boolean, default=False)
+    updated_block = Column(Integer, nullable=True, index=True)  # the voter registry reloads rows changed since its last sync
+
+
+class AllowlistEntry(Base):
+    """Face-verified wallet and its leaf position in the Merkle allowlist"""
+    __tablename__ = "allowlist_entries"
+    
+    address = Column(String(42), primary_key=True)  # lowercase
+    position = Column(Integer, unique=True, index=True)  # leaf index, in order of first verification
+    added_at = Column(DateTime, default=func.now())
+
+
+class AllowlistRoot(Base):
+    """
+    Merkle root over the first leaf_count allowlist entries
+    The latest row is updated by each build until it is published; the
+    next build then starts a new row.
+    """
+    __tablename__ = "allowlist_roots"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    root = Column(String(66))
+    leaf_count = Column(Integer)
+    log_cursor = Column(Integer, default=0)  # last verification_logs id the build looked at
+    tx_hash = Column(String(66), nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    published_at = Column(DateTime, nullable=True)  # set once the transaction succeeded
+    
+    def to_dict(self) -> dict:
+        return {
+            "root": self.root,
+            "leaf_count": self.leaf_count,
+            "tx_hash": self.tx_hash,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "published_at": self.published_at.isoformat() if self.published_at else None,
+        }
+
+
 class RateLimitEntry(Base):
     """Track rate limiting per IP/user"""
     __tablename__ = "rate_limits"
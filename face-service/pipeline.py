@@ -0,0 +1,295 @@
+"""
+Face Verification Service - Staged Pipeline
+Verify and enroll as CPU stages with their own worker threads and queues
+
+A verification used to run decode, inference, liveness, decryption and
+scoring as one call on the shared default executor, followed by the DB
+commit and the ECDSA signature on the event loop. The work is now split
+into stages, each with a sized thread pool and a bounded queue in front:
+
+    decode   JPEG/PNG -> BGR array (PIL, OpenCV)
+    infer    detection, liveness (heuristics and anti-spoof model) and
+             the embedding of the chosen face, with the analyzer pinned
+    score    Fernet decryption of the stored template and the similarity
+             (verify), Fernet encryption of the new template and crop (enroll)
+    persist  JWT and EIP-191 permit signing for verified wallets; the log
+             row commits on the event loop at the same time
+
+So the next request decodes while the current one is in inference, and
+the infer pool can be sized to the cores the inference backend should use
+(0 = cores / its thread setting) without starving decoding or signing.
+Liveness stays in the infer stage: frames that fail it never reach
+recognition, as before. The anti-spoof model scores the aligned crop in
+this stage too, through antispoof.score_crop, so crops from requests on
+different infer threads share one model run.
+
+A stage whose queue is full sheds the request with 503 (admission control
+normally keeps queues well below PIPELINE_QUEUE_SIZE). Per-stage
+utilization over the last PIPELINE_UTILIZATION_WINDOW_SECONDS, queue
+depth and wait / service times are in /admin/metrics under "pipeline".
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+import numpy as np
+from fastapi import HTTPException
+
+import antispoof
+import backends
+import face_processor
+from config import settings
+from face_processor import (
+    align_face_crop, analyze_face, compare_embeddings, decode_image_bytes, detect_target_face, embed_face,
+    encode_face_crop,
+)
+from liveness import detect_liveness
+from metrics import metrics
+from models import decrypt_embedding, encrypt_blob, encrypt_embedding
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("decode", "infer", "score", "persist")
+
+
+class StageFull(HTTPException):
+    """A stage queue is at PIPELINE_QUEUE_SIZE (503 with Retry-After)"""
+
+    def __init__(self, stage: str):
+        super().__init__(
+            status_code=503,
+            detail=f"Service busy ({stage} queue full) - please retry",
+            headers={"Retry-After": "1"}
+        )
+        self.stage = stage
+
+
+class Stage:
+    """A thread pool with a bounded queue in front of it, and its utilization"""
+
+    def __init__(self, name: str, workers: int, queue_size: int, window_seconds: float = 60.0):
+        self.name = name
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.window_seconds = window_seconds
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix=f"pipeline-{name}")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.created = time.monotonic()
+        self._running: Dict[int, float] = {}  # thread id -> start
+        self._recent = deque()  # (end, seconds) of recent items
+
+    async def run(self, fn: Callable, *args):
+        """fn(*args) on one of this stage's threads, once there is room in its queue"""
+        with self._lock:
+            if self.queued >= self.queue_size:
+                self.rejected += 1
+                metrics.increment(f"pipeline.{self.name}.rejected")
+                raise StageFull(self.name)
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+
+        future = self._executor.submit(self._call, time.perf_counter(), fn, args)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancel():
+                with self._lock:
+                    self.queued -= 1
+            raise
+
+    def _call(self, submitted: float, fn: Callable, args: tuple):
+        started = time.perf_counter()
+        thread = threading.get_ident()
+        with self._lock:
+            self.queued -= 1
+            self._running[thread] = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            seconds = time.perf_counter() - started
+            with self._lock:
+                del self._running[thread]
+                self.completed += 1
+                self._recent.append((time.monotonic(), seconds))
+            metrics.observe(f"pipeline.{self.name}.wait", (started - submitted) * 1000)
+            metrics.observe(f"pipeline.{self.name}.service", seconds * 1000)
+
+    def utilization(self) -> float:
+        """Busy fraction of this stage's threads over the recent window (1.0 = all busy all the time)"""
+        now = time.monotonic()
+        start = max(now - self.window_seconds, self.created)
+        with self._lock:
+            while self._recent and self._recent[0][0] < start:
+                self._recent.popleft()
+            busy = sum(min(seconds, end - start) for end, seconds in self._recent)
+            busy += sum(now - max(begun, start) for begun in self._running.values())
+        elapsed = now - start
+        return round(busy / (self.workers * elapsed), 4) if elapsed > 0 else 0.0
+
+    def stats(self) -> Dict:
+        utilization = self.utilization()
+        with self._lock:
+            stats = {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "queued": self.queued,
+                "peak_queued": self.peak_queued,
+                "active": len(self._running),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "utilization": utilization,
+            }
+        for part in ("wait", "service"):
+            p50 = metrics.percentile(f"pipeline.{self.name}.{part}", 0.5, within_seconds=self.window_seconds)
+            stats[f"{part}_p50_ms"] = round(p50, 3) if p50 is not None else None
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+# ---- Stage work ----
+
+def infer_verification(image: np.ndarray, check_liveness: bool):
+    """
+    Detection, liveness and recognition for one verification frame
+    Returns (outcome, embedding); embedding is None when the cascade stopped early
+    """
+    outcome = {
+        "liveness_passed": True,
+        "liveness_reason": None,
+        "embedding_status": None,
+        "similarity": None
+    }
+
+    with face_processor.pinned_analyzer():
+        # Cascade: detection and geometry first, so rejected frames never reach recognition
+        face, quality = detect_target_face(image)
+
+        if face is None:
+            if check_liveness:
+                outcome["liveness_passed"] = False
+                outcome["liveness_reason"] = quality["reason"]
+            else:
+                outcome["embedding_status"] = quality["status"]
+            return outcome, None
+
+        if not quality["valid"]:
+            outcome["embedding_status"] = quality["reason"]
+            return outcome, None
+
+        # Liveness check on the selected face (unless skipped for testing)
+        if check_liveness:
+            spoof_score = None
+            if antispoof.get_model() is not None:
+                spoof_score = antispoof.score_crop(align_face_crop(image, face))
+            liveness_result = detect_liveness(image, face=face, spoof_score=spoof_score)
+            if not liveness_result.get("is_live", False):
+                outcome["liveness_passed"] = False
+                outcome["liveness_reason"] = liveness_result.get("reason")
+                return outcome, None
+
+        # Align and embed only the selected face
+        embedding = embed_face(image, face)
+
+    outcome["embedding_status"] = "success"
+    return outcome, embedding
+
+
+def score_verification(embedding: np.ndarray, stored_embedding: bytes) -> float:
+    return compare_embeddings(embedding, decrypt_embedding(stored_embedding))
+
+
+def infer_enrollment(image: np.ndarray) -> dict:
+    """
+    The face cascade on one enrollment frame
+    With crop retention on, quality["face_crop"] holds the aligned crop (encrypted by the score stage)
+    """
+    with face_processor.pinned_analyzer():
+        quality = analyze_face(image)
+    quality["face_crop"] = None
+    if settings.retain_enrollment_crops and quality.get("embedding") is not None:
+        quality["face_crop"] = align_face_crop(image, quality["face"])
+    return quality
+
+
+def seal_enrollment(quality: dict) -> dict:
+    """Encrypt the new template (and retained crop) for storage"""
+    quality["encrypted_embedding"] = encrypt_embedding(quality["embedding"])
+    if quality["face_crop"] is not None:
+        quality["face_crop"] = encrypt_blob(encode_face_crop(quality["face_crop"]))
+    return quality
+
+
+class Pipeline:
+    """The four stages verify and enroll go through"""
+
+    def __init__(self, decode_workers: int = 2, infer_workers: int = 1, score_workers: int = 1,
+                 persist_workers: int = 1, queue_size: int = 64, window_seconds: float = 60.0):
+        self.configure(decode_workers, infer_workers, score_workers, persist_workers, queue_size, window_seconds)
+
+    @staticmethod
+    def default_infer_workers() -> int:
+        """One inference per group of the backend's threads (one in total with the engine's default)"""
+        cores = os.cpu_count() or 1
+        return max(1, cores // (backends.configured_threads(settings.inference_backend) or cores))
+
+    @classmethod
+    def settings_kwargs(cls) -> Dict:
+        return {
+            "decode_workers": settings.pipeline_decode_workers,
+            "infer_workers": settings.pipeline_infer_workers or cls.default_infer_workers(),
+            "score_workers": settings.pipeline_score_workers,
+            "persist_workers": settings.pipeline_persist_workers,
+            "queue_size": settings.pipeline_queue_size,
+            "window_seconds": settings.pipeline_utilization_window_seconds,
+        }
+
+    @classmethod
+    def from_settings(cls) -> "Pipeline":
+        return cls(**cls.settings_kwargs())
+
+    def configure(self, decode_workers: int, infer_workers: int, score_workers: int, persist_workers: int,
+                  queue_size: int, window_seconds: float = 60.0):
+        """(Re)create the stages; items already running finish on the old threads"""
+        for stage in getattr(self, "stages", {}).values():
+            stage.shutdown()
+        workers = dict(zip(STAGES, (decode_workers, infer_workers, score_workers, persist_workers)))
+        self.stages = {name: Stage(name, workers[name], queue_size, window_seconds) for name in STAGES}
+        self.decode, self.infer, self.score, self.persist = (self.stages[name] for name in STAGES)
+
+    async def verify(self, image_bytes: bytes, check_liveness: bool, stored_embedding: bytes) -> dict:
+        """Decode, infer and score one verification frame; returns a cacheable outcome"""
+        image = await self.decode.run(decode_image_bytes, image_bytes)
+        outcome, embedding = await self.infer.run(infer_verification, image, check_liveness)
+        if embedding is not None:
+            outcome["similarity"] = await self.score.run(score_verification, embedding, stored_embedding)
+        return outcome
+
+    async def enroll(self, image_bytes: bytes) -> dict:
+        """
+        Decode, infer and seal one enrollment frame
+        Returns the quality dict; for a usable face also "encrypted_embedding" and the encrypted "face_crop"
+        """
+        image = await self.decode.run(decode_image_bytes, image_bytes)
+        quality = await self.infer.run(infer_enrollment, image)
+        if quality.get("embedding") is not None:
+            quality = await self.score.run(seal_enrollment, quality)
+        return quality
+
+    def stats(self) -> Dict:
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+
+# Global instance
+pipeline = Pipeline.from_settings()
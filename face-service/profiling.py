@@ -0,0 +1,315 @@
+"""
+Face Verification Service - Request Profiling
+Opt-in statistical profiler for sampling slow or randomly chosen requests
+
+A single background thread samples the Python stacks of all busy threads
+while at least one profiled request is in flight. Each sample is attributed
+to a category (ONNX, OpenCV, crypto, SQLAlchemy, pydantic, ...) and folded
+into "root;...;leaf" stacks compatible with flamegraph tools. Finished
+profiles are written as JSON into a rotating on-disk ring.
+"""
+
+import asyncio
+import json
+import linecache
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# First match walking from the leaf frame towards the root wins
+CATEGORY_RULES = (
+    ("onnx", ("onnxruntime", "insightface")),
+    ("opencv", ("cv2",)),
+    ("pil", ("PIL",)),
+    ("crypto", ("cryptography", "eth_account", "eth_keys", "eth_utils", "jose", "Crypto")),
+    ("sqlalchemy", ("sqlalchemy", "aiosqlite", "sqlite3")),
+    ("pydantic", ("pydantic", "fastapi/_compat", "fastapi/dependencies")),
+)
+
+# C-extension calls do not appear as frames, so the calling source line is checked too
+SOURCE_LINE_RULES = (
+    ("opencv", "cv2."),
+    ("numpy", "np."),
+)
+
+# A thread whose leaf frame is in one of these files, or on a line blocking
+# in a C-level queue (aiosqlite and executor workers), is waiting, not working
+IDLE_FILES = ("selectors.py", "threading.py", "queue.py", "base_events.py")
+IDLE_SOURCE_MARKERS = ("tx.get()", "work_queue.get(")
+
+MAX_STACK_DEPTH = 64
+MAX_DISTINCT_STACKS = 500
+TOP_STACKS = 200
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]{13}-[0-9a-f]{8}$")
+
+
+def is_enabled() -> bool:
+    """Profiling is on when either trigger is configured"""
+    return settings.profiling_sample_rate > 0 or settings.profiling_slow_threshold_ms > 0
+
+
+def _path_of(frame) -> str:
+    return frame.f_code.co_filename.replace("\\", "/")
+
+
+def categorize(frame) -> str:
+    """Attribute a leaf frame to a library category"""
+    source = linecache.getline(frame.f_code.co_filename, frame.f_lineno)
+    for category, marker in SOURCE_LINE_RULES:
+        if marker in source:
+            return category
+
+    current = frame
+    while current is not None:
+        path = _path_of(current)
+        for category, fragments in CATEGORY_RULES:
+            if any(fragment in path for fragment in fragments):
+                return category
+        current = current.f_back
+    return "other"
+
+
+def fold_stack(frame) -> str:
+    """Render a frame chain as 'module:function;...' from root to leaf"""
+    names = []
+    current = frame
+    while current is not None and len(names) < MAX_STACK_DEPTH:
+        module = os.path.splitext(os.path.basename(current.f_code.co_filename))[0]
+        names.append(f"{module}:{current.f_code.co_name}")
+        current = current.f_back
+    return ";".join(reversed(names))
+
+
+class RequestProfile:
+    """Samples collected for one in-flight request"""
+
+    def __init__(self, method: str, path: str):
+        self.id = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.started_at = datetime.utcnow()
+        self.samples = 0
+        self.dropped = 0
+        self.max_concurrent = 1
+        self.categories: Counter = Counter()
+        self.stacks: Counter = Counter()
+
+    def add(self, entries: List, concurrent: int):
+        if self.samples >= settings.profiling_max_samples:
+            self.dropped += 1
+            return
+        self.samples += 1
+        self.max_concurrent = max(self.max_concurrent, concurrent)
+        if not entries:
+            self.categories["idle"] += 1
+        for category, stack in entries:
+            self.categories[category] += 1
+            if stack in self.stacks or len(self.stacks) < MAX_DISTINCT_STACKS:
+                self.stacks[stack] += 1
+
+    def to_dict(self, status: int, duration_ms: float, reason: str) -> Dict:
+        interval = settings.profiling_interval_ms
+        total = sum(self.categories.values()) or 1
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "reason": reason,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(duration_ms, 2),
+            "interval_ms": interval,
+            "samples": self.samples,
+            "dropped_samples": self.dropped,
+            # Samples are shared by every request profiled at the same time
+            "max_concurrent_profiles": self.max_concurrent,
+            "categories": {
+                name: {"samples": count, "approx_ms": round(count * interval, 1), "share": round(count / total, 3)}
+                for name, count in self.categories.most_common()
+            },
+            "stacks": [{"stack": stack, "count": count} for stack, count in self.stacks.most_common(TOP_STACKS)],
+        }
+
+
+class StackSampler:
+    """Background thread that feeds stack samples to the active profiles"""
+
+    def __init__(self):
+        self._active: Dict[str, RequestProfile] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start_profile(self, method: str, path: str) -> Optional[RequestProfile]:
+        """Register a request, or return None when the concurrency bound is reached"""
+        with self._lock:
+            if len(self._active) >= settings.profiling_max_concurrent:
+                return None
+            profile = RequestProfile(method, path)
+            self._active[profile.id] = profile
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+            self._wake.set()
+        return profile
+
+    def stop_profile(self, profile: RequestProfile):
+        with self._lock:
+            self._active.pop(profile.id, None)
+
+    @staticmethod
+    def _is_idle(frame) -> bool:
+        if os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+            return True
+        source = linecache.getline(frame.f_code.co_filename, frame.f_lineno)
+        return any(marker in source for marker in IDLE_SOURCE_MARKERS)
+
+    def _sample(self) -> List:
+        own_id = threading.get_ident()
+        entries = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or self._is_idle(frame):
+                continue
+            entries.append((categorize(frame), fold_stack(frame)))
+        return entries
+
+    def _run(self):
+        interval = settings.profiling_interval_ms / 1000.0
+        while True:
+            with self._lock:
+                profiles = list(self._active.values())
+                if not profiles:
+                    self._wake.clear()
+            if not profiles:
+                # Sleep until the next profiled request arrives
+                self._wake.wait()
+                continue
+
+            entries = self._sample()
+            for profile in profiles:
+                profile.add(entries, len(profiles))
+            time.sleep(interval)
+
+
+class ProfileStore:
+    """Rotating ring of profile JSON files"""
+
+    def __init__(self, directory: str, max_profiles: int):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def _files(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def save(self, record: Dict):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{record['id']}.json")
+            with open(path, "w") as f:
+                json.dump(record, f)
+
+            # File names start with a millisecond timestamp, so sorting is chronological
+            files = self._files()
+            for name in files[:max(0, len(files) - self.max_profiles)]:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def list(self) -> List[Dict]:
+        """Summaries of the stored profiles, newest first"""
+        summaries = []
+        for name in reversed(self._files()):
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            summaries.append({
+                key: record.get(key)
+                for key in ("id", "method", "path", "status", "reason", "started_at", "duration_ms", "samples")
+            })
+        return summaries
+
+    def path_for(self, profile_id: str) -> Optional[str]:
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.json")
+        return path if os.path.exists(path) else None
+
+
+sampler = StackSampler()
+store = ProfileStore(settings.profiling_dir, settings.profiling_max_profiles)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles a fraction of requests
+
+    A request is profiled when it is randomly sampled, or (if a slow
+    threshold is set) always, keeping the result only when it turns out
+    slower than the threshold. Only installed when profiling is enabled.
+
+    Slowness is only known once a request finishes, so the threshold mode
+    has to start a profile for every request; past profiling_max_concurrent
+    in flight, requests run unprofiled and a slow one among them leaves no
+    profile. Under load it catches slow requests by chance, not all of them.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/admin/profiles"):
+            await self.app(scope, receive, send)
+            return
+
+        sampled = random.random() < settings.profiling_sample_rate
+        if not sampled and settings.profiling_slow_threshold_ms <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        profile = sampler.start_profile(scope["method"], scope["path"])
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop_profile(profile)
+            duration_ms = (time.perf_counter() - start) * 1000
+
+            slow = 0 < settings.profiling_slow_threshold_ms <= duration_ms
+            if sampled or slow:
+                record = profile.to_dict(status, duration_ms, "slow" if slow else "sampled")
+                try:
+                    await asyncio.to_thread(store.save, record)
+                    logger.info(f"🔬 Profiled {scope['method']} {scope['path']} ({duration_ms:.0f} ms): {profile.id}")
+                except OSError as e:
+                    logger.warning(f"Failed to store profile: {e}")
@@ -0,0 +1,147 @@
+"""
+Face Verification Service - Data Access
+Column-projected queries for the users table
+
+Each lookup selects only the columns its caller needs: status reads id and
+created_at, verify reads the embedding blob and nothing else, and deletes
+go straight to DELETE ... WHERE without loading the row. Every query has a
+bulk variant taking a list of ids. Callers own the session and commit.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User
+
+# Keeps IN (...) lists well under SQLite's bound-parameter limit
+QUERY_CHUNK = 500
+
+
+class Enrollment(NamedTuple):
+    user_id: str
+    created_at: Optional[datetime]
+
+
+def _chunks(user_ids: Iterable[str]):
+    ids = list(dict.fromkeys(user_ids))
+    for start in range(0, len(ids), QUERY_CHUNK):
+        yield ids[start:start + QUERY_CHUNK]
+
+
+# ---- status ----
+
+async def get_enrollments(db: AsyncSession, user_ids: Iterable[str]) -> Dict[str, Enrollment]:
+    """Enrolled ids among user_ids (users without an embedding are not enrolled)"""
+    enrollments = {}
+    for chunk in _chunks(user_ids):
+        result = await db.execute(
+            select(User.id, User.created_at).where(User.id.in_(chunk), User.embedding.isnot(None))
+        )
+        for user_id, created_at in result:
+            enrollments[user_id] = Enrollment(user_id, created_at)
+    return enrollments
+
+
+async def get_enrollments_since(db: AsyncSession, since: datetime) -> Dict[str, Enrollment]:
+    """Enrolled ids whose row changed at or after `since` (a range scan of the updated_at index)"""
+    result = await db.execute(
+        select(User.id, User.created_at).where(User.updated_at >= since, User.embedding.isnot(None))
+    )
+    return {user_id: Enrollment(user_id, created_at) for user_id, created_at in result}
+
+
+async def get_enrollment(db: AsyncSession, user_id: str) -> Optional[Enrollment]:
+    return (await get_enrollments(db, [user_id])).get(user_id)
+
+
+# ---- embeddings ----
+
+async def get_embedding_blobs(db: AsyncSession, user_ids: Iterable[str]) -> Dict[str, bytes]:
+    """Encrypted embeddings of enrolled ids among user_ids"""
+    blobs = {}
+    for chunk in _chunks(user_ids):
+        result = await db.execute(
+            select(User.id, User.embedding).where(User.id.in_(chunk), User.embedding.isnot(None))
+        )
+        for user_id, blob in result:
+            blobs[user_id] = blob
+    return blobs
+
+
+async def get_embedding_blob(db: AsyncSession, user_id: str) -> Optional[bytes]:
+    return await db.scalar(select(User.embedding).where(User.id == user_id))
+
+
+async def save_embedding(db: AsyncSession, user_id: str, blob: bytes, face_crop: Optional[bytes] = None) -> bool:
+    """
+    Store an encrypted embedding, creating the user if needed
+    face_crop replaces any retained crop (None clears it, so a crop never
+    outlives the enrollment it came from).
+    Returns whether the user was already enrolled; the old blob is never read
+    """
+    existing = (await db.execute(
+        select(User.id, User.embedding.isnot(None)).where(User.id == user_id)
+    )).first()
+
+    if existing is None:
+        db.add(User(id=user_id, enrollment_count=1, embedding=blob, face_crop=face_crop))
+        return False
+
+    await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            embedding=blob, face_crop=face_crop,
+            enrollment_count=User.enrollment_count + 1, updated_at=datetime.utcnow(),
+        )
+    )
+    return bool(existing[1])
+
+
+# ---- whole rows (users moving between shard nodes) ----
+
+ROW_COLUMNS = (
+    User.id, User.created_at, User.updated_at, User.is_active, User.enrollment_count,
+    User.embedding, User.face_crop, User.metadata_json,
+)
+
+
+async def get_user_rows(db: AsyncSession, user_ids: Iterable[str]) -> List:
+    """Every column of the given users, deferred blobs included"""
+    rows = []
+    for chunk in _chunks(user_ids):
+        rows.extend((await db.execute(select(*ROW_COLUMNS).where(User.id.in_(chunk)))).all())
+    return rows
+
+
+async def get_updated_at(db: AsyncSession, user_ids: Iterable[str]) -> Dict[str, Optional[datetime]]:
+    """updated_at of the given users that exist"""
+    versions = {}
+    for chunk in _chunks(user_ids):
+        versions.update((await db.execute(select(User.id, User.updated_at).where(User.id.in_(chunk)))).all())
+    return versions
+
+
+# ---- deletes ----
+
+async def delete_users(db: AsyncSession, user_ids: Iterable[str]) -> Dict[str, bool]:
+    """Delete users by id; returns {deleted id: was enrolled}"""
+    deleted = {}
+    for chunk in _chunks(user_ids):
+        result = await db.execute(
+            delete(User)
+            .where(User.id.in_(chunk))
+            .returning(User.id, User.embedding.isnot(None))
+            .execution_options(synchronize_session=False)
+        )
+        for user_id, was_enrolled in result:
+            deleted[user_id] = bool(was_enrolled)
+    return deleted
+
+
+async def delete_user(db: AsyncSession, user_id: str) -> Optional[bool]:
+    """Delete one user; returns None if it did not exist, else whether it was enrolled"""
+    return (await delete_users(db, [user_id])).get(user_id)
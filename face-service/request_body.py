@@ -0,0 +1,312 @@
+"""
+Face Verification Service - Streaming Request Bodies
+Incremental JSON + base64 reader for the large image payloads
+
+/enroll and /verify bodies are small flat JSON objects around one large
+base64 "image" string (100 KB - 1 MB). Instead of buffering the body,
+parsing it into a Python str and base64-decoding a copy, the reader walks
+the body chunk by chunk as it arrives, keeps the small fields, and decodes
+the image straight into a preallocated buffer. Size limits are enforced
+from Content-Length before anything is read, and again while streaming.
+"""
+
+import binascii
+import json
+import sys
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+# Non-image values (user_id, skip_liveness, ...) are tiny
+MAX_FIELD_BYTES = 4096
+
+# Data URL prefixes ("data:image/jpeg;base64,") are looked for in this window
+MAX_PREFIX_BYTES = 256
+
+BASE64_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+NON_BASE64 = bytes(c for c in range(256) if c not in BASE64_ALPHABET)
+WHITESPACE = b" \t\r\n"
+
+# a2b_base64(strict_mode=True) is Python 3.11+; earlier versions always take the filtering path
+STRICT_BASE64 = sys.version_info >= (3, 11)
+
+# Parser states
+EXPECT_OBJECT, EXPECT_KEY, IN_KEY, EXPECT_COLON, EXPECT_VALUE, IN_STRING, IN_IMAGE, IN_SCALAR, EXPECT_NEXT, DONE = range(10)
+
+
+class PayloadError(ValueError):
+    """Malformed or oversized request body"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ImagePayloadParser:
+    """
+    Push parser for {"user_id": "...", "image": "<base64>", ...} bodies
+
+    feed() accepts arbitrary chunk boundaries. The image string is decoded
+    in 4-character groups into a buffer sized from the expected body length,
+    so the only full-size copy kept is the decoded image itself.
+    """
+
+    def __init__(self, image_field: str = "image", size_hint: int = 0, max_image_bytes: int = 0):
+        self.image_field = image_field
+        self.max_image_bytes = max_image_bytes
+        self.fields: Dict = {}
+
+        self._state = EXPECT_OBJECT
+        self._token = bytearray()  # current key / small value, raw JSON
+        self._escaped = False
+        self._key: Optional[str] = None
+
+        # Decoded image output
+        self._buffer = bytearray(size_hint * 3 // 4 + 4 if size_hint else 0)
+        self._length = 0
+        self._pending = b""  # base64 characters not yet forming a full group
+        self._prefix = bytearray()  # start of the image string, until the prefix is resolved
+        self._prefix_resolved = False
+        self._image_seen = False
+
+    # ---- image string ----
+
+    def _write(self, data: bytes):
+        end = self._length + len(data)
+        if self.max_image_bytes and end > self.max_image_bytes:
+            raise PayloadError("Image too large", status_code=413)
+        if end > len(self._buffer):
+            self._buffer.extend(bytes(max(end - len(self._buffer), len(self._buffer) // 2)))
+        self._buffer[self._length:end] = data
+        self._length = end
+
+    def _decode(self, chars: bytes, final: bool = False):
+        data = self._pending + chars if self._pending else chars
+        usable = len(data) if final else len(data) - len(data) % 4
+        if usable:
+            decoded = None
+            if STRICT_BASE64:
+                try:
+                    # Fast path: clean base64 (the common case) decodes in strict mode
+                    decoded = binascii.a2b_base64(memoryview(data)[:usable], strict_mode=True)
+                except binascii.Error:
+                    pass
+            if decoded is None:
+                # Drop whitespace and anything else base64.b64decode would also discard
+                data = data.translate(None, NON_BASE64)
+                usable = len(data) if final else len(data) - len(data) % 4
+                try:
+                    decoded = binascii.a2b_base64(data[:usable])
+                except binascii.Error as e:
+                    raise PayloadError(f"Invalid image data: {e}")
+            self._write(decoded)
+        self._pending = data[usable:]
+
+    def _image_chars(self, chars: bytes):
+        if self._prefix_resolved:
+            self._decode(chars)
+            return
+
+        # Mirror decode_base64_image: everything up to the first ',' is a data URL prefix
+        self._prefix.extend(chars)
+        comma = self._prefix.find(b",")
+        if comma >= 0:
+            rest = bytes(self._prefix[comma + 1:])
+        elif len(self._prefix) > MAX_PREFIX_BYTES:
+            rest = bytes(self._prefix)
+        else:
+            return
+        self._prefix_resolved = True
+        self._prefix = bytearray()
+        self._decode(rest)
+
+    def _finish_image(self):
+        if not self._prefix_resolved:
+            self._prefix_resolved = True
+            rest, self._prefix = bytes(self._prefix), bytearray()
+            self._decode(rest)
+        self._decode(b"", final=True)
+        self._image_seen = True
+
+    def _scan_image(self, chunk: bytes, pos: int) -> int:
+        """Consume image characters from chunk[pos:]; return the new position"""
+        end = chunk.find(b'"', pos)
+        segment_end = len(chunk) if end < 0 else end
+
+        if not self._escaped and chunk.find(b"\\", pos, segment_end) < 0:
+            # Fast path: plain base64 without escapes
+            self._image_chars(chunk[pos:segment_end])
+            if end < 0:
+                return len(chunk)
+            self._finish_image()
+            self._state = EXPECT_NEXT
+            return end + 1
+
+        # Slow path: JSON escapes such as "\/" or "\n" inside the string
+        out = bytearray()
+        i = pos
+        while i < len(chunk):
+            c = chunk[i]
+            if self._escaped:
+                self._escaped = False
+                if c == ord("/"):
+                    out.append(c)
+                elif c not in b"nrt":
+                    raise PayloadError("Unsupported escape in image data")
+            elif c == ord("\\"):
+                self._escaped = True
+            elif c == ord('"'):
+                self._image_chars(bytes(out))
+                self._finish_image()
+                self._state = EXPECT_NEXT
+                return i + 1
+            else:
+                out.append(c)
+            i += 1
+        self._image_chars(bytes(out))
+        return i
+
+    # ---- small tokens ----
+
+    def _append_token(self, data):
+        self._token.extend(data)
+        if len(self._token) > MAX_FIELD_BYTES:
+            raise PayloadError("Request field too large", status_code=413)
+
+    def _scan_string(self, chunk: bytes, pos: int) -> Tuple[int, bool]:
+        """Copy a small JSON string into the token buffer; return (position, finished)"""
+        i = pos
+        while i < len(chunk):
+            c = chunk[i]
+            if self._escaped:
+                self._escaped = False
+            elif c == ord("\\"):
+                self._escaped = True
+            elif c == ord('"'):
+                self._append_token(chunk[pos:i + 1])
+                return i + 1, True
+            i += 1
+        self._append_token(chunk[pos:])
+        return len(chunk), False
+
+    def _take_token(self):
+        try:
+            value = json.loads(bytes(self._token))
+        except ValueError:
+            raise PayloadError("Malformed JSON body")
+        self._token = bytearray()
+        return value
+
+    # ---- public API ----
+
+    def feed(self, chunk: bytes):
+        pos = 0
+        n = len(chunk)
+        while pos < n:
+            state = self._state
+
+            if state == IN_IMAGE:
+                pos = self._scan_image(chunk, pos)
+                continue
+
+            if state in (IN_KEY, IN_STRING):
+                pos, finished = self._scan_string(chunk, pos)
+                if finished:
+                    if state == IN_KEY:
+                        self._key = self._take_token()
+                        self._state = EXPECT_COLON
+                    else:
+                        self.fields[self._key] = self._take_token()
+                        self._state = EXPECT_NEXT
+                continue
+
+            c = chunk[pos]
+
+            if state == IN_SCALAR:
+                if c in b",} \t\r\n":
+                    self.fields[self._key] = self._take_token()
+                    self._state = EXPECT_NEXT
+                    continue  # re-read the delimiter in EXPECT_NEXT
+                self._append_token(chunk[pos:pos + 1])
+                pos += 1
+                continue
+
+            pos += 1
+            if c in WHITESPACE:
+                continue
+
+            if state == EXPECT_OBJECT:
+                if c != ord("{"):
+                    raise PayloadError("Request body must be a JSON object")
+                self._state = EXPECT_KEY
+            elif state == EXPECT_KEY:
+                if c == ord('"'):
+                    self._token = bytearray(b'"')
+                    self._state = IN_KEY
+                elif c == ord("}") and not self.fields and not self._image_seen:
+                    self._state = DONE
+                else:
+                    raise PayloadError("Malformed JSON body")
+            elif state == EXPECT_COLON:
+                if c != ord(":"):
+                    raise PayloadError("Malformed JSON body")
+                self._state = EXPECT_VALUE
+            elif state == EXPECT_VALUE:
+                if c == ord('"'):
+                    if self._key == self.image_field:
+                        if self._image_seen:
+                            raise PayloadError("Duplicate image field")
+                        self._state = IN_IMAGE
+                    else:
+                        self._token = bytearray(b'"')
+                        self._state = IN_STRING
+                elif c in b"{[":
+                    raise PayloadError(f"Unexpected nested value for '{self._key}'")
+                else:
+                    self._token = bytearray([c])
+                    self._state = IN_SCALAR
+            elif state == EXPECT_NEXT:
+                if c == ord(","):
+                    self._state = EXPECT_KEY
+                elif c == ord("}"):
+                    self._state = DONE
+                else:
+                    raise PayloadError("Malformed JSON body")
+            elif state == DONE:
+                raise PayloadError("Unexpected data after JSON body")
+
+    def close(self) -> Tuple[Dict, Optional[memoryview]]:
+        """Finish parsing; returns (small fields, decoded image or None)"""
+        if self._state != DONE:
+            raise PayloadError("Incomplete JSON body")
+        if not self._image_seen:
+            return self.fields, None
+        return self.fields, memoryview(self._buffer)[:self._length]
+
+
+async def read_image_payload(request: Request, max_body_bytes: int, image_field: str = "image") -> Tuple[Dict, Optional[memoryview]]:
+    """
+    Stream an image request body through ImagePayloadParser
+    Raises HTTPException 413 for oversized bodies and 400 for malformed ones
+    """
+    content_length = request.headers.get("content-length")
+    size_hint = 0
+    if content_length:
+        try:
+            size_hint = int(content_length)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+        if size_hint > max_body_bytes:
+            raise HTTPException(status_code=413, detail=f"Request body too large (max {max_body_bytes} bytes)")
+
+    parser = ImagePayloadParser(image_field=image_field, size_hint=size_hint, max_image_bytes=max_body_bytes)
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_body_bytes:
+                raise HTTPException(status_code=413, detail=f"Request body too large (max {max_body_bytes} bytes)")
+            parser.feed(chunk)
+        return parser.close()
+    except PayloadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
@@ -0,0 +1,238 @@
+"""
+Face Verification Service - Verification Log Retention
+Rolls verification_logs into hourly aggregates and purges old raw rows
+
+The rollup is incremental: it resumes from the newest aggregated hour
+(recomputing that hour, so it is idempotent) and only aggregates complete
+hours. Raw rows are deleted only once they are older than the retention
+window AND sit in an hour that will never be recomputed AND, with the
+Merkle allowlist on, the allowlist build has scanned them. Deletes run in
+small chunks, each in its own short transaction, so live verifications
+are never blocked for long.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, select
+
+from config import settings
+from database import async_session
+from models import AllowlistRoot, VerificationHourlyAggregate, VerificationLog
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_BUCKETS = 10
+ONE_HOUR = timedelta(hours=1)
+
+
+def floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def classify_failure(reason: Optional[str]):
+    """Map a VerificationLog.failure_reason to (category, [failed liveness checks])"""
+    if not reason:
+        return "other", []
+    if reason.startswith("Liveness failed:"):
+        detail = reason[len("Liveness failed:"):].strip()
+        if detail.startswith("Failed checks:"):
+            checks = [c.strip() for c in detail[len("Failed checks:"):].split(",") if c.strip()]
+        else:
+            checks = [detail or "unknown"]
+        return "liveness", checks
+    if reason.startswith("User not enrolled"):
+        return "not_enrolled", []
+    if reason.startswith("Face extraction failed"):
+        return "face_extraction", []
+    if reason.startswith("Voter already voted"):
+        return "already_voted", []
+    if reason.startswith("Voter not registered"):
+        return "not_registered", []
+    if "below threshold" in reason:
+        return "below_threshold", []
+    return "other", []
+
+
+class HourAccumulator:
+    """Aggregates the raw rows of one hour"""
+
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.liveness_failures = 0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+        self.failure_reasons = Counter()
+        self.liveness_reasons = Counter()
+
+    def add(self, success, similarity, liveness_passed, failure_reason):
+        self.attempts += 1
+        if success:
+            self.successes += 1
+        if liveness_passed is False:
+            self.liveness_failures += 1
+        if similarity is not None:
+            bucket = min(int(similarity * HISTOGRAM_BUCKETS), HISTOGRAM_BUCKETS - 1)
+            self.histogram[max(bucket, 0)] += 1
+        if not success:
+            category, checks = classify_failure(failure_reason)
+            self.failure_reasons[category] += 1
+            self.liveness_reasons.update(checks)
+
+    def to_row(self, hour: datetime) -> VerificationHourlyAggregate:
+        return VerificationHourlyAggregate(
+            hour=hour,
+            attempts=self.attempts,
+            successes=self.successes,
+            liveness_failures=self.liveness_failures,
+            similarity_histogram=json.dumps(self.histogram),
+            failure_reasons=json.dumps(dict(self.failure_reasons)),
+            liveness_reasons=json.dumps(dict(self.liveness_reasons)),
+        )
+
+
+async def rollup_verification_logs(now: Optional[datetime] = None) -> int:
+    """Aggregate every complete hour since the last rollup; returns hours written"""
+    end = floor_hour(now or datetime.utcnow())
+
+    async with async_session() as db:
+        cursor = await db.scalar(select(func.max(VerificationHourlyAggregate.hour)))
+        if cursor is None:
+            cursor = await db.scalar(select(func.min(VerificationLog.timestamp)))
+    if cursor is None:
+        return 0
+    cursor = floor_hour(cursor)
+
+    written = 0
+    while cursor < end:
+        async with async_session() as db:
+            acc = HourAccumulator()
+            result = await db.stream(
+                select(
+                    VerificationLog.success,
+                    VerificationLog.similarity_score,
+                    VerificationLog.liveness_passed,
+                    VerificationLog.failure_reason,
+                )
+                .where(VerificationLog.timestamp >= cursor, VerificationLog.timestamp < cursor + ONE_HOUR)
+                .execution_options(yield_per=1000)
+            )
+            async for row in result:
+                acc.add(*row)
+
+            if acc.attempts:
+                await db.merge(acc.to_row(cursor))
+                await db.commit()
+                written += 1
+
+            # Jump straight to the next hour that has rows
+            next_timestamp = await db.scalar(
+                select(func.min(VerificationLog.timestamp)).where(VerificationLog.timestamp >= cursor + ONE_HOUR)
+            )
+        if next_timestamp is None:
+            break
+        cursor = floor_hour(next_timestamp)
+
+    return written
+
+
+async def purge_verification_logs(
+    retention_days: int,
+    batch_size: int,
+    now: Optional[datetime] = None,
+    pause_seconds: float = 0.01
+) -> int:
+    """Delete aggregated raw rows older than the retention window; returns rows deleted"""
+    if retention_days <= 0:
+        return 0
+
+    async with async_session() as db:
+        watermark = await db.scalar(select(func.max(VerificationHourlyAggregate.hour)))
+        # Successful verifications the allowlist build has not picked up yet stay
+        log_cursor = await db.scalar(select(func.max(AllowlistRoot.log_cursor))) or 0
+    if watermark is None:
+        return 0
+
+    # Rows in the watermark hour may still be recomputed, so keep them
+    cutoff = min((now or datetime.utcnow()) - timedelta(days=retention_days), watermark)
+
+    deleted = 0
+    while True:
+        async with async_session() as db:
+            query = select(VerificationLog.id).where(VerificationLog.timestamp < cutoff)
+            if settings.allowlist_enabled:
+                query = query.where(VerificationLog.id <= log_cursor)
+            ids = (await db.execute(query.limit(batch_size))).scalars().all()
+            if not ids:
+                break
+            await db.execute(delete(VerificationLog).where(VerificationLog.id.in_(ids)))
+            await db.commit()
+        deleted += len(ids)
+
+        # Let live requests get the write lock between batches
+        await asyncio.sleep(pause_seconds)
+
+    return deleted
+
+
+async def run_log_compaction(now: Optional[datetime] = None) -> Dict:
+    """Rollup followed by purge; returns a summary for logging and the admin API"""
+    start = time.perf_counter()
+    hours = await rollup_verification_logs(now)
+    deleted = await purge_verification_logs(settings.log_retention_days, settings.log_compaction_batch_size, now)
+    summary = {
+        "hours_aggregated": hours,
+        "raw_rows_deleted": deleted,
+        "duration_seconds": round(time.perf_counter() - start, 3),
+    }
+    if hours or deleted:
+        logger.info(f"🗜️  Log compaction: {hours} hours aggregated, {deleted} raw rows deleted")
+    return summary
+
+
+async def compaction_loop():
+    """Background task: run compaction every LOG_COMPACTION_INTERVAL_MINUTES"""
+    interval = settings.log_compaction_interval_minutes * 60
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_log_compaction()
+        except Exception as e:
+            logger.error(f"❌ Log compaction failed: {e}")
+
+
+async def get_hourly_aggregates(since: datetime, until: datetime) -> List[Dict]:
+    async with async_session() as db:
+        rows = (await db.execute(
+            select(VerificationHourlyAggregate)
+            .where(VerificationHourlyAggregate.hour >= floor_hour(since), VerificationHourlyAggregate.hour < until)
+            .order_by(VerificationHourlyAggregate.hour)
+        )).scalars().all()
+    return [row.to_dict() for row in rows]
+
+
+def summarize_aggregates(hours: List[Dict]) -> Dict:
+    """Totals across a list of hourly aggregate dicts"""
+    attempts = sum(h["attempts"] for h in hours)
+    successes = sum(h["successes"] for h in hours)
+    histogram = [0] * HISTOGRAM_BUCKETS
+    failures, liveness = Counter(), Counter()
+    for h in hours:
+        for i, count in enumerate(h["similarity_histogram"][:HISTOGRAM_BUCKETS]):
+            histogram[i] += count
+        failures.update(h["failure_reasons"])
+        liveness.update(h["liveness_reasons"])
+    return {
+        "attempts": attempts,
+        "successes": successes,
+        "success_rate": round(successes / attempts, 4) if attempts else 0.0,
+        "liveness_failures": sum(h["liveness_failures"] for h in hours),
+        "similarity_histogram": histogram,
+        "failure_reasons": dict(failures),
+        "liveness_reasons": dict(liveness),
+    }
@@ -0,0 +1,166 @@
+"""
+Face Verification Service - Pre-fork Server
+Loads the models once, then forks the uvicorn workers that serve requests
+
+`uvicorn --workers N` spawns fresh interpreters, so every worker loads its
+own copy of the buffalo_l weights. Here the parent imports the app and
+loads the models before forking: the workers share those pages
+copy-on-write, and a replacement worker starts without loading anything.
+
+All workers accept on one listening socket. The parent only supervises:
+a worker that exits (a memory recycle, see memory.py, or a crash) is
+replaced, and SIGTERM / SIGINT are passed on to the workers, which drain
+their in-flight requests before exiting.
+
+Usage: python serve.py --workers 4 [--host 0.0.0.0] [--port 8000]
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# A worker exiting sooner than this after its start is restarted with a delay
+MIN_WORKER_UPTIME_SECONDS = 5.0
+RESTART_DELAY_SECONDS = 1.0
+
+
+def preload():
+    """Import the app and load every model in the parent, before any fork"""
+    from config import settings
+
+    # Engine thread pools do not survive fork(); workers run one inference
+    # thread each and the worker count provides the parallelism
+    for threads in ("ort_intra_op_threads", "opencv_dnn_threads", "openvino_threads"):
+        if getattr(settings, threads) == 0:
+            setattr(settings, threads, 1)
+
+    import main
+    import antispoof
+    from face_processor import get_face_analyzer
+
+    try:
+        get_face_analyzer()
+        antispoof.get_model()
+    except Exception as e:
+        logger.warning(f"⚠️ Model preload failed (each worker will load its own copy): {e}")
+
+    # Keep the GC from touching (and so copying) every preloaded object in each worker
+    gc.collect()
+    gc.freeze()
+    return main.app
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """Forks `workers` uvicorn servers on one socket and keeps them running"""
+
+    def __init__(self, app, sock: socket.socket, workers: int, log_level: str = "info"):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        self.children: Dict[int, tuple] = {}  # pid -> (worker id, start time)
+        self.stopping = False
+
+    def spawn(self, worker_id: int):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = (worker_id, time.monotonic())
+            return
+
+        # Worker: default signal handling, uvicorn installs its own
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        os.environ["WORKER_ID"] = str(worker_id)
+        code = 0
+        try:
+            self.serve()
+        except BaseException as e:
+            logger.error(f"❌ Worker {worker_id} failed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def serve(self):
+        import uvicorn
+        from config import settings
+
+        config = uvicorn.Config(
+            self.app,
+            log_level=self.log_level,
+            log_config=None,  # uvicorn logs through the queue handler from configure_logging
+            timeout_graceful_shutdown=settings.worker_drain_timeout_seconds,
+        )
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for worker_id in range(self.workers):
+            self.spawn(worker_id)
+        logger.info(f"✅ {self.workers} workers serving on {self.sock.getsockname()}")
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except InterruptedError:
+                continue
+            except ChildProcessError:
+                break
+            worker_id, started = self.children.pop(pid, (None, 0.0))
+            if self.stopping or worker_id is None:
+                continue
+
+            logger.info(f"♻️ Worker {worker_id} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, replacing it")
+            if time.monotonic() - started < MIN_WORKER_UPTIME_SECONDS:
+                time.sleep(RESTART_DELAY_SECONDS)
+            self.spawn(worker_id)
+
+
+def main(argv=None) -> int:
+    from config import settings
+
+    parser = argparse.ArgumentParser(prog="python serve.py", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.host)
+    parser.add_argument("--port", type=int, default=settings.port)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 2)))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    from logging_setup import configure_logging
+
+    configure_logging()
+    settings.web_concurrency = args.workers
+    app = preload()
+    sock = bind(args.host, args.port)
+    Supervisor(app, sock, args.workers, args.log_level).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
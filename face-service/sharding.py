@@ -0,0 +1,462 @@
+"""
+Face Verification Service - Sharding
+Consistent-hash partitioning of the face gallery across service nodes
+
+Each node owns the users whose normalized user_id (wallet address) hashes
+onto its arc of a consistent-hash ring (SHARD_VNODES points per node), and
+keeps them in its own database. A request for a user owned by another node
+is proxied to the owner (SHARD_ROUTING=proxy) or answered with a 307 to it
+(SHARD_ROUTING=redirect); /status/batch is split by owner and fanned out.
+Requests carrying X-Shard-Node came from a peer and are always served
+locally, so a disagreement about the ring can never loop. The header is
+only honoured from a node in the shard map, with an HMAC (X-Shard-Signature)
+over the node, a timestamp, the method and the path under the shared
+ADMIN_API_KEY; only on such requests is X-Forwarded-For trusted, so rate
+limits and verification logs on the owner see the client's address rather
+than the peer's.
+
+Adding a node moves only the users on the arcs it takes over:
+
+1. start the new node with SHARD_NODES = new map and
+   SHARD_PREVIOUS_NODES = old map
+2. POST the same to /admin/shard/ring on every existing node, which starts
+   a rebalance job there: local users now owned elsewhere are pushed to
+   their owner (/admin/shard/import) and deleted locally, chunk by chunk
+3. once every job completed, POST the ring again without `previous`
+   (and update SHARD_NODES / SHARD_PREVIOUS_NODES for restarts)
+
+While a previous map is set, a node that misses a user it now owns pulls
+the row from the previous owner first, so moved voters can enroll and
+verify at any point of the migration. When both copies exist the newer
+updated_at wins. Verification logs stay on the node that wrote them.
+Nodes share DB_ENCRYPTION_KEY and ADMIN_API_KEY.
+"""
+
+import asyncio
+import base64
+import bisect
+import hashlib
+import hmac
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException, Request
+from fastapi.responses import RedirectResponse, Response
+from slowapi.util import get_remote_address
+from sqlalchemy import delete, func, select, update
+
+import erasure
+import jobs
+import repository
+from config import settings
+from database import async_session
+from enrollment_filter import enrolled_filter
+from metrics import metrics
+from models import User
+from verification_cache import verification_cache
+
+logger = logging.getLogger(__name__)
+
+PROXY, REDIRECT = "proxy", "redirect"
+REBALANCE_KIND = "rebalance_shards"
+
+# Set on requests one node sends another, with "<unix time>:<hmac>" in SIGNATURE_HEADER
+FORWARDED_HEADER = "X-Shard-Node"
+SIGNATURE_HEADER = "X-Shard-Signature"
+
+# Client headers passed through to the owner, and owner headers passed back
+_FORWARD_HEADERS = {"authorization", "content-type", "user-agent", "x-admin-key"}
+_RETURN_HEADERS = {"cache-control", "content-type", "etag"}
+
+_BLOB_COLUMNS = ("embedding", "face_crop")
+_TIME_COLUMNS = ("created_at", "updated_at")
+
+
+def parse_nodes(spec: str) -> Dict[str, str]:
+    """'a=http://10.0.0.1:8000,b=http://10.0.0.2:8000' -> {node: base url}"""
+    nodes = {}
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, sep, url = part.partition("=")
+        if not sep or not name.strip() or not url.strip():
+            raise ValueError(f"Invalid shard node '{part}' (expected name=url)")
+        nodes[name.strip()] = url.strip().rstrip("/")
+    return nodes
+
+
+def _sign(key: str, node: str, timestamp: str, method: str, path: str) -> str:
+    message = "\n".join((node, timestamp, method.upper(), path)).encode()
+    return hmac.new(key.encode(), message, hashlib.sha256).hexdigest()
+
+
+def peer_headers(node: str, method: str, path: str, key: Optional[str] = None) -> Dict[str, str]:
+    """Headers marking a request to `path` as sent by shard node `node` (signed with ADMIN_API_KEY)"""
+    key = settings.admin_api_key if key is None else key
+    timestamp = str(int(time.time()))
+    return {FORWARDED_HEADER: node, SIGNATURE_HEADER: f"{timestamp}:{_sign(key, node, timestamp, method, path)}"}
+
+
+def _point(key: str) -> int:
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent-hash ring: each node owns `vnodes` points, a key belongs to the next point clockwise"""
+
+    def __init__(self, nodes: Dict[str, str], vnodes: int = 128):
+        self.nodes = dict(nodes)
+        self.vnodes = vnodes
+        points = sorted((_point(f"{name}#{i}"), name) for name in self.nodes for i in range(vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [name for _, name in points]
+
+    def owner(self, user_id: str) -> str:
+        index = bisect.bisect(self._points, _point(user_id)) % len(self._points)
+        return self._owners[index]
+
+    def url(self, node: str) -> str:
+        return self.nodes[node]
+
+
+# ---- moving rows between nodes ----
+
+def dump_user(row) -> Dict:
+    """JSON-safe copy of a user row (blobs stay encrypted, base64-encoded)"""
+    data = dict(row._mapping)
+    for name in _BLOB_COLUMNS:
+        data[name] = base64.b64encode(data[name]).decode() if data[name] is not None else None
+    for name in _TIME_COLUMNS:
+        data[name] = data[name].isoformat() if data[name] is not None else None
+    return data
+
+
+def _load_user(data: Dict) -> Dict:
+    values = {column.key: data.get(column.key) for column in repository.ROW_COLUMNS}
+    values["id"] = values["id"].strip().lower()
+    for name in _BLOB_COLUMNS:
+        values[name] = base64.b64decode(values[name]) if values[name] is not None else None
+    for name in _TIME_COLUMNS:
+        values[name] = datetime.fromisoformat(values[name]) if values[name] is not None else None
+    return values
+
+
+async def export_users(user_ids: Iterable[str]) -> List[Dict]:
+    """Full rows of the given ids that exist on this node"""
+    async with async_session() as db:
+        rows = await repository.get_user_rows(db, user_ids)
+    return [dump_user(row) for row in rows]
+
+
+async def import_users(users: List[Dict]) -> Dict[str, Dict]:
+    """
+    Upsert rows moved from another node; a row only replaces an existing
+    one with an older updated_at. Returns the rows written, by id
+    """
+    incoming = {values["id"]: values for values in map(_load_user, users)}
+    written = {}
+    async with async_session() as db:
+        existing = await repository.get_updated_at(db, incoming)
+
+        for user_id, values in incoming.items():
+            if user_id not in existing:
+                db.add(User(**values))
+            elif existing[user_id] is None or (values["updated_at"] and values["updated_at"] > existing[user_id]):
+                await db.execute(
+                    update(User).where(User.id == user_id)
+                    .values({name: value for name, value in values.items() if name != "id"})
+                )
+            else:
+                continue
+            written[user_id] = values
+        await db.commit()
+
+    for user_id, values in written.items():
+        verification_cache.invalidate_user(user_id)
+        if values["embedding"] is not None:
+            enrolled_filter.add(user_id)
+    return written
+
+
+# ---- routing ----
+
+class ShardRouter:
+    """This node's view of the shard map, and the forwarding between nodes"""
+
+    def __init__(self, node_id: str = "", nodes: Optional[Dict[str, str]] = None,
+                 previous: Optional[Dict[str, str]] = None, vnodes: int = 128, mode: str = PROXY,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.node_id = node_id
+        self.vnodes = vnodes
+        self.mode = mode
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self.configure(nodes or {}, previous)
+
+    @classmethod
+    def from_settings(cls) -> "ShardRouter":
+        return cls(
+            node_id=settings.shard_node_id,
+            nodes=parse_nodes(settings.shard_nodes),
+            previous=parse_nodes(settings.shard_previous_nodes),
+            vnodes=settings.shard_vnodes,
+            mode=settings.shard_routing,
+        )
+
+    def configure(self, nodes: Dict[str, str], previous: Optional[Dict[str, str]] = None):
+        """Switch to a new shard map; `previous` is the map being migrated away from"""
+        if nodes and self.node_id not in nodes:
+            raise ValueError(f"This node ('{self.node_id}') is not in the shard map")
+        if self.mode not in (PROXY, REDIRECT):
+            raise ValueError(f"Unknown SHARD_ROUTING '{self.mode}' (use '{PROXY}' or '{REDIRECT}')")
+        self.ring = HashRing(nodes, self.vnodes)
+        self.previous = HashRing(previous, self.vnodes) if previous else None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.node_id and self.ring.nodes)
+
+    def is_local(self, user_id: str) -> bool:
+        return not self.enabled or self.ring.owner(user_id) == self.node_id
+
+    def previous_owner(self, user_id: str) -> Optional[str]:
+        """Other node that held a user this node now owns, while a migration is in progress"""
+        if not self.enabled or self.previous is None or not self.is_local(user_id):
+            return None
+        owner = self.previous.owner(user_id)
+        return owner if owner != self.node_id else None
+
+    def _authenticate(self, request: Request) -> str:
+        """The peer node that sent `request`, or "" when it is not a valid peer request"""
+        node = request.headers.get(FORWARDED_HEADER)
+        if not node:
+            return ""
+        peers = set(self.ring.nodes) | set(self.previous.nodes if self.previous else ())
+        timestamp, _, signature = request.headers.get(SIGNATURE_HEADER, "").partition(":")
+        if (
+            node not in peers or not settings.admin_api_key or not timestamp.isdigit()
+            or abs(time.time() - int(timestamp)) > settings.shard_peer_signature_max_age_seconds
+            or not hmac.compare_digest(signature, _sign(settings.admin_api_key, node, timestamp, request.method, request.url.path))
+        ):
+            metrics.increment("shard.unauthenticated_peer")
+            logger.warning(f"⚠️ Ignoring unauthenticated {FORWARDED_HEADER}: {node[:64]}")
+            return ""
+        return node
+
+    def forwarded(self, request: Request) -> bool:
+        """Whether a shard peer sent this request (authenticated once per request)"""
+        peer = getattr(request.state, "shard_peer", None)
+        if peer is None:
+            peer = request.state.shard_peer = self._authenticate(request)
+        return bool(peer)
+
+    def client_address(self, request: Request) -> str:
+        """The client's IP: the one a peer forwarded the request for, else the connecting address"""
+        if self.forwarded(request):
+            forwarded_for = request.headers.get("x-forwarded-for", "").rsplit(",", 1)[-1].strip()
+            if forwarded_for:
+                return forwarded_for
+        return get_remote_address(request)
+
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(transport=self.transport, timeout=settings.shard_forward_timeout_seconds)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def call(self, url: str, method: str, path: str, payload: Optional[Dict] = None) -> Dict:
+        """JSON request to a peer's endpoint (admin endpoints included)"""
+        response = await self.client().request(
+            method, url + path, json=payload,
+            headers={**peer_headers(self.node_id, method, path), "X-Admin-Key": settings.admin_api_key},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def route(self, request: Request, user_id: str, body: Optional[Callable[[], bytes]] = None) -> Optional[Response]:
+        """
+        None when this node serves `user_id`, else the owner's response
+        (proxy) or a redirect to the owner. `body` rebuilds a request body
+        the endpoint already consumed
+        """
+        if self.is_local(user_id) or self.forwarded(request):
+            return None
+
+        node = self.ring.owner(user_id)
+        target = self.ring.url(node) + request.url.path
+        if request.url.query:
+            target += f"?{request.url.query}"
+
+        if self.mode == REDIRECT:
+            metrics.increment("shard.redirected")
+            return RedirectResponse(target, status_code=307)
+
+        headers = {name: value for name, value in request.headers.items() if name in _FORWARD_HEADERS}
+        headers.update(peer_headers(self.node_id, request.method, request.url.path))
+        client_ip = request.client.host if request.client else None
+        headers["X-Forwarded-For"] = ", ".join(filter(None, (request.headers.get("x-forwarded-for"), client_ip)))
+        content = body() if body is not None else await request.body()
+
+        try:
+            upstream = await self.client().request(request.method, target, content=content, headers=headers)
+        except httpx.HTTPError as e:
+            metrics.increment("shard.forward_errors")
+            logger.error(f"❌ Forwarding to shard node '{node}' failed: {e}")
+            raise HTTPException(status_code=502, detail=f"Shard node '{node}' is unavailable")
+
+        metrics.increment("shard.forwarded")
+        return Response(
+            upstream.content, status_code=upstream.status_code,
+            headers={name: value for name, value in upstream.headers.items() if name in _RETURN_HEADERS},
+        )
+
+    async def fan_out(self, request: Request, user_ids: List[str], path: str) -> Tuple[List[str], List[Dict]]:
+        """
+        Split a batch by owner; returns this node's ids and the peers' JSON
+        responses to `path` for theirs
+        """
+        if not self.enabled or self.forwarded(request):
+            return user_ids, []
+
+        groups: Dict[str, List[str]] = {}
+        for user_id in user_ids:
+            groups.setdefault(self.ring.owner(user_id), []).append(user_id)
+        local = groups.pop(self.node_id, [])
+
+        async def ask(node: str, ids: List[str]) -> Dict:
+            try:
+                return await self.call(self.ring.url(node), "POST", path, {"user_ids": ids})
+            except httpx.HTTPError as e:
+                metrics.increment("shard.forward_errors")
+                logger.error(f"❌ Forwarding to shard node '{node}' failed: {e}")
+                raise HTTPException(status_code=502, detail=f"Shard node '{node}' is unavailable")
+
+        metrics.increment("shard.forwarded", len(groups))
+        return local, list(await asyncio.gather(*(ask(node, ids) for node, ids in groups.items())))
+
+    async def pull(self, user_ids: Iterable[str]) -> Dict[str, Dict]:
+        """Copy users this node now owns from their previous owner; returns the rows imported"""
+        groups: Dict[str, List[str]] = {}
+        for user_id in user_ids:
+            node = self.previous_owner(user_id)
+            if node is not None:
+                groups.setdefault(node, []).append(user_id)
+
+        pulled = {}
+        for node, ids in groups.items():
+            try:
+                users = (await self.call(self.previous.url(node), "POST", "/admin/shard/export", {"user_ids": ids}))["users"]
+            except httpx.HTTPError as e:
+                logger.warning(f"⚠️ Could not pull {len(ids)} user(s) from shard node '{node}': {e}")
+                continue
+            if users:
+                pulled.update(await import_users(users))
+        metrics.increment("shard.pulled", len(pulled))
+        return pulled
+
+    async def delete_on_previous(self, user_id: str) -> Optional[bool]:
+        """Delete a user's not-yet-moved copy on its previous owner; None when there is none"""
+        node = self.previous_owner(user_id)
+        if node is None:
+            return None
+        path = f"/user/{user_id}"
+        response = await self.client().delete(
+            self.previous.url(node) + path, headers=peer_headers(self.node_id, "DELETE", path)
+        )
+        if response.status_code not in (200, 404):
+            raise HTTPException(status_code=502, detail=f"Shard node '{node}' could not delete the user")
+        return response.status_code == 200
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "node_id": self.node_id or None,
+            "routing": self.mode,
+            "vnodes": self.vnodes,
+            "nodes": self.ring.nodes,
+            "previous": self.previous.nodes if self.previous else None,
+            "forwarded": metrics.counter("shard.forwarded"),
+            "redirected": metrics.counter("shard.redirected"),
+            "forward_errors": metrics.counter("shard.forward_errors"),
+            "unauthenticated_peer": metrics.counter("shard.unauthenticated_peer"),
+            "pulled": metrics.counter("shard.pulled"),
+            "moved": metrics.counter("shard.moved"),
+        }
+
+
+# ---- rebalancing ----
+
+async def create_rebalance_job() -> Dict:
+    """Queue a move of every local user the current shard map assigns to another node"""
+    if not router.enabled:
+        raise ValueError("Sharding is not configured (SHARD_NODE_ID / SHARD_NODES)")
+    async with async_session() as db:
+        total = await db.scalar(select(func.count()).select_from(User))
+    params = {"node_id": router.node_id, "nodes": router.ring.nodes, "vnodes": router.vnodes}
+    job = await jobs.create_job(REBALANCE_KIND, params, total=total)
+    jobs.start_job(job["id"])
+    return job
+
+
+@jobs.register(REBALANCE_KIND)
+async def rebalance_shards(ctx: "jobs.JobContext"):
+    """Push users owned elsewhere under the job's shard map to their owner, then delete them here"""
+    # The map is part of the job, so a resumed job never follows a different one
+    ring = HashRing(ctx.params["nodes"], ctx.params["vnodes"])
+    node_id = ctx.params["node_id"]
+
+    while True:
+        query = select(*repository.ROW_COLUMNS).order_by(User.id).limit(settings.shard_rebalance_chunk_size)
+        if ctx.cursor is not None:
+            query = query.where(User.id > ctx.cursor)
+        async with async_session() as db:
+            rows = (await db.execute(query)).all()
+        if not rows:
+            return
+
+        outgoing: Dict[str, List] = {}
+        for row in rows:
+            owner = ring.owner(row.id)
+            if owner != node_id:
+                outgoing.setdefault(owner, []).append(row)
+
+        for owner, users in outgoing.items():
+            await router.call(ring.url(owner), "POST", "/admin/shard/import", {"users": [dump_user(row) for row in users]})
+
+        moved, changed = {}, 0
+        async with async_session() as db:
+            for row in (row for users in outgoing.values() for row in users):
+                # Only if untouched since it was copied; a local change is picked up by the next run
+                unchanged = [
+                    column.is_(None) if value is None else column == value
+                    for column, value in ((User.embedding, row.embedding), (User.face_crop, row.face_crop))
+                ]
+                result = await db.execute(
+                    delete(User).where(User.id == row.id, *unchanged).execution_options(synchronize_session=False)
+                )
+                if result.rowcount == 1:
+                    moved[row.id] = row.embedding is not None
+                else:
+                    changed += 1
+
+            await ctx.checkpoint(
+                db, cursor=rows[-1].id, processed=len(rows),
+                moved=len(moved), kept=len(rows) - len(moved) - changed, changed_concurrently=changed,
+            )
+            await db.commit()
+
+        erasure.forget_users(moved)
+        metrics.increment("shard.moved", len(moved))
+        await ctx.throttle()
+
+
+# Global instance
+router = ShardRouter.from_settings()
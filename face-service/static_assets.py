@@ -0,0 +1,240 @@
+"""
+Face Verification Service - Static Assets
+Allowlisted, precompressed and fingerprinted static files (the enroll page)
+
+Only the files in ALLOWLIST are ever served; everything else under the
+service directory (face_data.db, .env, keys) is unreachable over HTTP.
+
+Build step (also run lazily at startup when the output is missing or stale):
+    python static_assets.py
+writes, per asset, a content-fingerprinted copy (enroll.<sha>.css) plus
+gzip and, when the brotli package is installed, brotli variants into
+static_dist/. In pages, href="/static/<name>" and src="/static/<name>"
+references to other assets are rewritten to their fingerprinted URLs
+(url()), so a changed stylesheet or script also changes the page's
+fingerprint. Requests are then answered from those files:
+
+- /static/enroll.<sha>.css (and every other fingerprinted name) is
+  immutable and cached for a year
+- /enroll.html and /static/<name> revalidate (no-cache) against a strong
+  ETag, so a kiosk reload costs a 304 and no body, and the stylesheet and
+  script it references come from the browser cache
+- Accept-Encoding picks br > gzip > identity, with Vary: Accept-Encoding
+- bodies go out through FileResponse, which hands the path to the server
+  (http.response.pathsend) when it supports it
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import re
+from typing import Dict, NamedTuple, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+from metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DIST_DIR = os.path.join(BASE_DIR, "static_dist")
+
+# name -> media type; the only files this service serves. Pages come last:
+# their references point at the fingerprints of the assets built before them.
+ALLOWLIST = {
+    "enroll.css": "text/css; charset=utf-8",
+    "enroll.js": "text/javascript; charset=utf-8",
+    "enroll.html": "text/html; charset=utf-8",
+}
+
+STATIC_REFERENCE = re.compile(r'\b(href|src)="/static/([^"?#]+)"')
+
+# (content-coding, file suffix), in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+class Variant(NamedTuple):
+    path: str
+    stat: os.stat_result
+    etag: str
+
+
+class Asset(NamedTuple):
+    name: str
+    fingerprinted: str
+    media_type: str
+    variants: Dict[str, Variant]  # content-coding ("identity", "gzip", "br") -> file
+
+
+def _compress(coding: str, data: bytes) -> bytes:
+    if coding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _write_atomic(path: str, data: bytes):
+    # Per process: workers starting together build the same files at once.
+    # open() rather than a tempfile keeps the umask's permissions, so a build
+    # run as another user stays readable by the service.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _url(asset: Asset) -> str:
+    return f"/static/{asset.fingerprinted}"
+
+
+def _accepted_codings(header: Optional[str]) -> set:
+    """Content-codings an Accept-Encoding header allows (q > 0)"""
+    accepted, rejected = set(), set()
+    for part in (header or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        (accepted if q > 0 else rejected).add(coding.strip())
+    if "*" in accepted:
+        accepted |= {coding for coding, _ in ENCODINGS} - rejected
+    return accepted
+
+
+class StaticAssets:
+    """Builds the precompressed variants of ALLOWLIST and answers requests for them"""
+
+    def __init__(self, source_dir: str = BASE_DIR, dist_dir: str = DIST_DIR):
+        self.source_dir = source_dir
+        self.dist_dir = dist_dir
+        self._assets: Dict[str, Asset] = {}  # by logical and by fingerprinted name
+
+    # ---- build ----
+
+    def _link(self, data: bytes, assets: Dict[str, Asset]) -> bytes:
+        """Point a page's /static/<name> references at the fingerprinted copies in `assets`"""
+        def fingerprinted(match):
+            asset = assets.get(match.group(2))
+            return f'{match.group(1)}="{_url(asset)}"' if asset else match.group(0)
+
+        return STATIC_REFERENCE.sub(fingerprinted, data.decode("utf-8")).encode("utf-8")
+
+    def _build_asset(self, name: str, media_type: str, assets: Dict[str, Asset]) -> Asset:
+        with open(os.path.join(self.source_dir, name), "rb") as f:
+            data = f.read()
+        if media_type.startswith("text/html"):
+            data = self._link(data, assets)
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        stem, ext = os.path.splitext(name)
+        fingerprinted = f"{stem}.{digest}{ext}"
+
+        os.makedirs(self.dist_dir, exist_ok=True)
+        stale = re.compile(rf"{re.escape(stem)}\.[0-9a-f]{{16}}{re.escape(ext)}(\.gz|\.br)?")
+        for old in os.listdir(self.dist_dir):
+            if stale.fullmatch(old) and not old.startswith(fingerprinted):
+                os.remove(os.path.join(self.dist_dir, old))
+        identity = os.path.join(self.dist_dir, fingerprinted)
+        if not os.path.exists(identity):
+            _write_atomic(identity, data)
+        variants = {"identity": Variant(identity, os.stat(identity), f'"{digest}"')}
+
+        for coding, suffix in ENCODINGS:
+            if coding == "br" and brotli is None:
+                continue
+            path = identity + suffix
+            if not os.path.exists(path):
+                compressed = _compress(coding, data)
+                if len(compressed) >= len(data):
+                    continue
+                _write_atomic(path, compressed)
+            variants[coding] = Variant(path, os.stat(path), f'"{digest}-{coding}"')
+
+        return Asset(name, fingerprinted, media_type, variants)
+
+    def load(self) -> Dict[str, str]:
+        """(Re)build stale variants; returns logical name -> fingerprinted name"""
+        assets = {}
+        for name, media_type in ALLOWLIST.items():
+            try:
+                asset = self._build_asset(name, media_type, assets)
+            except OSError as e:
+                # Read-only deploys still serve the source, uncompressed
+                logger.warning(f"⚠️ Could not precompress {name}, serving it as is: {e}")
+                path = os.path.join(self.source_dir, name)
+                stat = os.stat(path)
+                etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+                asset = Asset(name, name, media_type, {"identity": Variant(path, stat, etag)})
+            assets[name] = asset
+            assets[asset.fingerprinted] = asset
+        self._assets = assets
+        built = {name: assets[name].fingerprinted for name in ALLOWLIST}
+        logger.info(f"📦 Static assets ready: {', '.join(built.values())}")
+        return built
+
+    def url(self, name: str) -> str:
+        """Cache-forever URL of an allowlisted asset (what built pages reference)"""
+        if not self._assets:
+            self.load()
+        return _url(self._assets[name])
+
+    # ---- serve ----
+
+    def response(self, name: str, request: Request) -> Response:
+        if not self._assets:
+            self.load()
+        asset = self._assets.get(name)
+        if asset is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+
+        accepted = _accepted_codings(request.headers.get("accept-encoding"))
+        coding = next((c for c, _ in ENCODINGS if c in accepted and c in asset.variants), "identity")
+        variant = asset.variants[coding]
+
+        headers = {
+            "ETag": variant.etag,
+            "Cache-Control": IMMUTABLE if name == asset.fingerprinted != asset.name else REVALIDATE,
+            "Vary": "Accept-Encoding",
+        }
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+
+        metrics.increment("static.requests")
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if variant.etag in tags or "*" in tags:
+                metrics.increment("static.not_modified")
+                return Response(status_code=304, headers=headers)
+
+        metrics.increment(f"static.encoding.{coding}")
+        return FileResponse(variant.path, media_type=asset.media_type, headers=headers, stat_result=variant.stat)
+
+
+# Global instance
+assets = StaticAssets()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for logical, built in assets.load().items():
+        print(f"{logical} -> static_dist/{built}")
@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+
+from admission import BATCH, ENROLL, STATUS, VERIFY, AdmissionController, AdmissionRejected
+
+
+class TestAdmissionController(unittest.TestCase):
+    def test_01_free_slot_goes_to_the_most_important_waiter(self):
+        async def run():
+            controller = AdmissionController(initial_limit=1, shares=(1.0, 1.0, 1.0, 1.0))
+            await controller.acquire(VERIFY)
+            order = []
+
+            async def wait(priority):
+                await controller.acquire(priority)
+                order.append(priority)
+                controller.release()
+
+            waiters = [asyncio.create_task(wait(p)) for p in (BATCH, STATUS, VERIFY)]
+            await asyncio.sleep(0)
+            controller.release()
+            await asyncio.gather(*waiters)
+            return order
+
+        self.assertEqual(asyncio.run(run()), [VERIFY, STATUS, BATCH])
+
+    def test_02_low_priority_is_capped_and_shed_behind_verify(self):
+        async def run():
+            controller = AdmissionController(initial_limit=4, queue_timeouts_ms=(1000, 1000, 1000, 50))
+            self.assertEqual([controller.capacity(p) for p in range(4)], [4, 4, 2, 1])
+
+            await controller.acquire(ENROLL)
+            await controller.acquire(ENROLL)
+            await controller.acquire(VERIFY)
+            await controller.acquire(VERIFY)
+
+            # Limit reached: verify queues, so new enroll work is shed at once
+            queued = asyncio.create_task(controller.acquire(VERIFY))
+            await asyncio.sleep(0)
+            with self.assertRaises(AdmissionRejected) as ctx:
+                await controller.acquire(ENROLL)
+            self.assertEqual(ctx.exception.status_code, 503)
+            self.assertIn("Retry-After", ctx.exception.headers)
+
+            controller.release()
+            await queued
+
+            # Batch has a share of one slot and times out in the queue
+            with self.assertRaises(AdmissionRejected):
+                await controller.acquire(BATCH)
+
+        asyncio.run(run())
+
+    def test_03_voting_window_shrinks_low_priority_shares(self):
+        controller = AdmissionController(initial_limit=8)
+        self.assertEqual(controller.capacity(ENROLL), 4)
+        controller.set_voting_window(True)
+        self.assertEqual(controller.capacity(ENROLL), 2)
+        self.assertEqual(controller.capacity(BATCH), 1)
+        self.assertEqual(controller.capacity(VERIFY), 8)
+
+    def test_04_aimd_limit_follows_latency(self):
+        controller = AdmissionController(initial_limit=4, target_latency_ms=100)
+
+        # Saturated and fast: additive increase
+        controller.in_flight = 4
+        controller.release(service_ms=10)
+        self.assertAlmostEqual(controller.limit, 4.25)
+
+        # Slow: multiplicative decrease, at most once per target interval
+        controller.in_flight = 2
+        controller.release(service_ms=500)
+        controller.release(service_ms=500)
+        self.assertAlmostEqual(controller.limit, 4.25 * 0.75)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import antispoof
+from antispoof import AntiSpoofModel
+from benchmarks.stub_analyzer import StubAntiSpoofSession, StubModelInput
+
+
+class FixedSession:
+    """Returns the same output row for every crop; records the batches it saw"""
+
+    def __init__(self, row, shape=("batch", 3, 80, 80)):
+        self.row = np.asarray(row, dtype=np.float32)
+        self.shape = list(shape)
+        self.batches = []
+
+    def get_inputs(self):
+        return [StubModelInput("input", self.shape)]
+
+    def run(self, output_names, feeds):
+        batch = feeds["input"]
+        self.batches.append(batch.shape)
+        return [np.tile(self.row, (len(batch), 1))]
+
+
+class TestAntiSpoofModel(unittest.TestCase):
+    def test_01_preprocess_and_batching(self):
+        crops = [np.full((112, 112, 3), value, dtype=np.uint8) for value in (10, 20, 30)]
+
+        dynamic = FixedSession([0.0, 2.0])
+        model = AntiSpoofModel(dynamic, input_scale=1 / 255.0)
+        batch = model.preprocess(crops)
+        self.assertEqual(batch.shape, (3, 3, 80, 80))
+        self.assertEqual(batch.dtype, np.float32)
+        self.assertAlmostEqual(float(batch[1].max()), 20 / 255.0, places=5)
+        model.score(crops)
+        self.assertEqual(dynamic.batches, [(3, 3, 80, 80)])
+
+        # A model exported with a fixed batch of 1 runs once per crop
+        fixed = FixedSession([0.0, 2.0], shape=(1, 3, 80, 80))
+        AntiSpoofModel(fixed).score(crops)
+        self.assertEqual(fixed.batches, [(1, 3, 80, 80)] * 3)
+
+    def test_02_output_conventions(self):
+        crop = [np.zeros((80, 80, 3), dtype=np.uint8)]
+
+        logits = AntiSpoofModel(FixedSession([0.0, 2.0])).score(crop)[0]
+        self.assertAlmostEqual(float(logits), 1 / (1 + np.exp(-2.0)), places=4)
+
+        probabilities = AntiSpoofModel(FixedSession([0.2, 0.1, 0.7]), live_index=0, output="probability").score(crop)[0]
+        self.assertAlmostEqual(float(probabilities), 0.2, places=4)
+
+        single = AntiSpoofModel(FixedSession([0.0]), output="probability").score(crop)[0]
+        self.assertAlmostEqual(float(single), 0.0, places=4)
+        single_logit = AntiSpoofModel(FixedSession([3.0])).score(crop)[0]
+        self.assertAlmostEqual(float(single_logit), 1 / (1 + np.exp(-3.0)), places=4)
+
+        # Logits in [0, 1] are still logits: 0.3 is sigmoid(0.3), not 0.3
+        small_logit = AntiSpoofModel(FixedSession([0.3])).score(crop)[0]
+        self.assertAlmostEqual(float(small_logit), 1 / (1 + np.exp(-0.3)), places=4)
+        with self.assertRaises(ValueError):
+            AntiSpoofModel(FixedSession([0.3]), output="auto")
+
+
+class TestCropBatcher(unittest.TestCase):
+    def test_01_concurrent_crops_share_model_runs(self):
+        session = StubAntiSpoofSession(latency_ms=30.0)
+        model = AntiSpoofModel(session)
+        batcher = antispoof.CropBatcher()
+        rng = np.random.default_rng(3)
+        crops = [rng.integers(0, 255, (80, 80, 3), dtype=np.uint8) for _ in range(8)]
+        expected = model.score(crops)
+        session.runs = 0
+
+        with ThreadPoolExecutor(len(crops)) as pool:
+            scores = list(pool.map(lambda crop: batcher.score(model, crop), crops))
+
+        np.testing.assert_allclose(scores, expected, rtol=1e-5)
+        self.assertLess(session.runs, len(crops))
+
+        failing = AntiSpoofModel(FixedSession([0.0, 1.0], shape=(2, 3, 80, 80)))
+        failing.session.run = lambda names, feeds: 1 / 0
+        with self.assertRaises(ZeroDivisionError):
+            batcher.score(failing, crops[0])
+
+
+class TestLivenessWithModel(unittest.TestCase):
+    def setUp(self):
+        import face_processor
+        from benchmarks.detector import load_frames
+        from benchmarks.stub_analyzer import install_stub_analyzer
+
+        self.saved = face_processor._face_analyzer, antispoof._model, antispoof._load_attempted
+        install_stub_analyzer()
+        self.frame = load_frames(1)[0]
+        self.face, _quality = face_processor.detect_target_face(self.frame)
+
+    def tearDown(self):
+        import face_processor
+        face_processor._face_analyzer, antispoof._model, antispoof._load_attempted = self.saved
+
+    def test_01_model_score_joins_the_checks(self):
+        from liveness import detect_liveness
+
+        antispoof.install_model(None)
+        heuristic = detect_liveness(self.frame, face=self.face)
+        self.assertNotIn("antispoof_score", heuristic["checks"])
+
+        antispoof.install_model(AntiSpoofModel(FixedSession([-2.0, 2.0])))
+        live = detect_liveness(self.frame, face=self.face)
+        self.assertTrue(live["is_live"], live)
+        self.assertGreater(live["checks"]["antispoof_score"], 0.9)
+        self.assertTrue(live["checks"]["antispoof_live"])
+
+        antispoof.install_model(AntiSpoofModel(FixedSession([2.0, -2.0])))
+        spoof = detect_liveness(self.frame, face=self.face)
+        self.assertFalse(spoof["is_live"])
+        self.assertIn("spoof_suspected", spoof["reason"])
+        self.assertLess(spoof["confidence"], live["confidence"])
+
+    def test_02_verify_pipeline_scores_the_crop_in_the_infer_stage(self):
+        from pipeline import infer_verification
+
+        session = FixedSession([2.0, -2.0])
+        antispoof.install_model(AntiSpoofModel(session))
+        outcome, embedding = infer_verification(self.frame, True)
+        self.assertEqual(len(session.batches), 1)
+        self.assertFalse(outcome["liveness_passed"])
+        self.assertIn("spoof_suspected", outcome["liveness_reason"])
+        self.assertIsNone(embedding)
+
+    def test_03_benchmark_reports_added_latency_and_frr(self):
+        from benchmarks.antispoof import recapture, run_antispoof_benchmark
+        from benchmarks.detector import load_frames
+
+        live = load_frames(3)
+        rows = run_antispoof_benchmark(
+            live, [recapture(frame) for frame in live],
+            AntiSpoofModel(StubAntiSpoofSession(latency_ms=2.0)), repeat=1,
+        )
+
+        heuristic, model = rows
+        self.assertEqual((heuristic["mode"], model["mode"]), ("heuristic", "model"))
+        self.assertGreater(model["added_ms"], 0)
+        self.assertEqual(model["frr_change"], 0.0)
+        self.assertEqual(model["spoof_accept_rate"], 0.0)
+        self.assertIn("batch_ms_per_crop", model)
+
+
+if __name__ == '__main__':
+    unittest.main()
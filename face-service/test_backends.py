@@ -0,0 +1,100 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+import backends
+import face_processor
+from benchmarks.engines import SYNTHETIC_PACK, build_synthetic_pack, synthetic_frame
+from benchmarks.stub_analyzer import StubFaceAnalysis
+from config import settings
+
+
+def cosine(a, b) -> float:
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+class TestBackends(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        build_synthetic_pack(cls.root)
+
+    def setUp(self):
+        self.saved = {key: getattr(settings, key) for key in (
+            "face_model_root", "inference_backend", "inference_backend_candidates", "inference_benchmark_runs",
+        )}
+        self.analyzer = face_processor._face_analyzer
+        settings.face_model_root = self.root
+
+    def tearDown(self):
+        for key, value in self.saved.items():
+            setattr(settings, key, value)
+        face_processor._face_analyzer = self.analyzer
+
+    def test_01_engines_produce_conforming_detections_and_embeddings(self):
+        frame = synthetic_frame()
+        reference = backends.load_backend("onnxruntime", SYNTHETIC_PACK, 640)
+        opencv = backends.load_backend("opencv", SYNTHETIC_PACK, 640)
+        self.assertEqual(backends.model_pack_files(backends.model_pack_path(SYNTHETIC_PACK))[0],
+                         reference.det_model.model_file)
+
+        result = backends.conformance(opencv, reference, frame, frame[176:288, 256:368], 640)
+        self.assertTrue(result["conforms"], result)
+        self.assertGreater(result["faces"], 0)
+        self.assertGreater(result["cosine"], 0.9999)
+        self.assertLess(result["max_box_error_px"], 0.01)
+
+        # The whole cascade - detection, target face, alignment, recognition - agrees on both engines
+        embeddings = {}
+        for backend in (reference, opencv):
+            face_processor.install_face_analyzer(backend)
+            embedding, status = face_processor.extract_embedding(frame)
+            self.assertEqual(status, "success")
+            embeddings[backend.name] = embedding
+        self.assertGreater(cosine(embeddings["onnxruntime"], embeddings["opencv"]), 0.9999)
+
+        # A different recognizer is caught, and so is a frame that would not exercise detection
+        stub = StubFaceAnalysis()
+        self.assertFalse(backends.conformance(stub, reference, frame, frame[176:288, 256:368], 640)["conforms"])
+        blank = np.zeros_like(frame)
+        self.assertFalse(backends.conformance(opencv, reference, blank, frame[176:288, 256:368], 640)["conforms"])
+
+    def test_02_auto_picks_the_fastest_conforming_backend_at_load(self):
+        settings.inference_backend = "auto"
+        settings.inference_backend_candidates = "onnxruntime,opencv,openvino,tensorrt"
+        settings.inference_benchmark_runs = 2
+
+        analyzer = face_processor.load_face_analyzer(SYNTHETIC_PACK)
+        candidates = analyzer.selection["candidates"]
+
+        self.assertEqual(list(candidates), ["onnxruntime", "opencv", "openvino", "tensorrt"])
+        self.assertIn("error", candidates["tensorrt"])
+        usable = {name: row for name, row in candidates.items() if "error" not in row}
+        self.assertTrue({"onnxruntime", "opencv"} <= set(usable))
+        self.assertTrue(all(row["conforms"] and row["faces"] > 0 for row in usable.values()))
+        self.assertEqual(analyzer.name, min(usable, key=lambda name: usable[name]["total_ms"]))
+        self.assertEqual(face_processor.install_face_analyzer(analyzer), self.analyzer)
+        self.assertEqual(face_processor.describe_backend()["backend"], analyzer.name)
+
+        settings.inference_backend_candidates = "tensorrt"
+        with self.assertRaises(RuntimeError):
+            face_processor.load_face_analyzer(SYNTHETIC_PACK)
+
+    def test_03_thread_settings_per_engine(self):
+        import cv2
+
+        saved = settings.ort_intra_op_threads, settings.opencv_dnn_threads, settings.openvino_threads
+        opencv_threads = cv2.getNumThreads()
+        try:
+            settings.ort_intra_op_threads, settings.opencv_dnn_threads, settings.openvino_threads = 1, 2, 4
+            self.assertEqual([backends.configured_threads(name) for name in backends.BACKENDS], [1, 1, 2, 4])
+            self.assertEqual(backends.OnnxRuntimeBackend.load(SYNTHETIC_PACK).threads, 1)
+            self.assertEqual(backends.OpenCVBackend.load(SYNTHETIC_PACK).threads, 2)
+        finally:
+            settings.ort_intra_op_threads, settings.opencv_dnn_threads, settings.openvino_threads = saved
+            cv2.setNumThreads(opencv_threads)  # process-wide
+
+
+if __name__ == '__main__':
+    unittest.main()
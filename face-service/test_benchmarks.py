@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+
+from benchmarks import load_test
+from benchmarks.baseline import build_baseline, compare_baselines
+from benchmarks.synthetic import build_image_set
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+    def test_01_percentile(self):
+        values = list(range(1, 101))
+        self.assertAlmostEqual(load_test.percentile(values, 50), 50.5)
+        self.assertAlmostEqual(load_test.percentile(values, 99), 99.01)
+        self.assertEqual(load_test.percentile([], 95), 0.0)
+
+    def test_02_in_process_run_with_stub_analyzer(self):
+        images = build_image_set(3)
+        results = asyncio.run(load_test.run_in_process(
+            images, requests=6, concurrency=2, stub_analyzer=True,
+        ))
+
+        self.assertEqual(set(results), set(load_test.ENDPOINTS))
+        for name, stats in results.items():
+            self.assertEqual(stats["errors"], 0, f"{name} had errors")
+            for key in ("p50_ms", "p95_ms", "p99_ms", "rps", "peak_rss_mb"):
+                self.assertIn(key, stats)
+            self.assertGreater(stats["rps"], 0)
+
+    def test_03_compare_flags_regressions(self):
+        stats = {"p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 30.0, "rps": 100.0}
+        slower = dict(stats, p95_ms=30.0, rps=70.0)
+        old = build_baseline({"verify": stats}, {})
+        new = build_baseline({"verify": slower}, {})
+
+        rows = compare_baselines(old, new, tolerance=0.10)
+        self.assertEqual(rows[0]["regressions"], ["p95_ms", "rps"])
+        self.assertEqual(compare_baselines(old, old)[0]["regressions"], [])
+
+    def test_04_detector_benchmark_with_stub_analyzer(self):
+        import face_processor
+        from benchmarks.detector import load_frames, run_detector_benchmark
+        from benchmarks.stub_analyzer import install_stub_analyzer
+
+        original = face_processor._face_analyzer
+        install_stub_analyzer(latency_ms=4.0)
+        try:
+            rows = run_detector_benchmark(load_frames(3), repeat=1)
+        finally:
+            face_processor._face_analyzer = original
+
+        fixed, adaptive = rows
+        self.assertEqual((fixed["mode"], adaptive["mode"]), ("fixed", "adaptive"))
+        self.assertEqual(adaptive["escalation_rate"], 0.0)
+        self.assertLess(adaptive["mean_ms"], fixed["mean_ms"])
+
+    def test_05_overload_benchmark_keeps_verify_served(self):
+        import face_processor
+        from benchmarks.overload import SCENARIOS, run_overload_benchmark
+
+        original = face_processor._face_analyzer
+        try:
+            results = asyncio.run(run_overload_benchmark(
+                build_image_set(2), verify_requests=6, flood_requests=12,
+                flood_concurrency=4, stub_latency_ms=2.0,
+            ))
+        finally:
+            face_processor._face_analyzer = original
+
+        self.assertEqual(tuple(results), SCENARIOS)
+        for scenario in SCENARIOS:
+            self.assertEqual(results[scenario]["verify"]["errors"], 0)
+        self.assertEqual(results["admission_off"]["enroll_flood"]["errors"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import asyncio
+import glob
+import gzip
+import os
+import tempfile
+import unittest
+
+import capture
+from config import settings
+from conftest import asgi_client
+
+USER = "0x" + "c4" * 20
+UNKNOWN = "0x" + "d5" * 20
+
+
+class TestCaptureFormat(unittest.TestCase):
+    def test_01_pseudonyms_and_outcomes(self):
+        self.assertEqual(capture.pseudonym(USER), capture.pseudonym(" " + USER.upper().replace("0X", "0x")))
+        self.assertNotEqual(capture.pseudonym(USER), capture.pseudonym(UNKNOWN))
+        self.assertNotIn(USER[2:10], capture.pseudonym(USER))
+
+        self.assertEqual(capture.outcome_of("verify", 200, b'{"verified": true, "liveness_passed": true}'), "verified")
+        self.assertEqual(capture.outcome_of("verify", 200, b'{"verified": false, "liveness_passed": false}'),
+                         "rejected:liveness")
+        self.assertEqual(capture.outcome_of("status", 200, b'{"enrolled": false}'), "not_enrolled")
+        self.assertEqual(capture.outcome_of("verify", 404, f'{{"detail": "User {USER} not enrolled"}}'.encode()),
+                         "http_404:User 0x… not enrolled")
+
+        def scope(method, path):
+            return {"method": method, "path": path}
+        self.assertEqual(capture.endpoint_of(scope("POST", "/verify")), "verify")
+        self.assertEqual(capture.endpoint_of(scope("GET", f"/status/{USER}")), "status")
+        self.assertIsNone(capture.endpoint_of(scope("POST", "/status/batch")))
+        self.assertIsNone(capture.endpoint_of(scope("GET", "/health")))
+
+
+class TestCaptureAndReplay(unittest.TestCase):
+    def test_01_capture_then_replay_reproduces_outcomes(self):
+        from benchmarks.load_test import load_app
+        from benchmarks.replay import diff_outcomes, replay
+        from benchmarks.synthetic import build_image_set
+
+        directory = tempfile.mkdtemp()
+        saved_rate, saved_writer = settings.capture_sample_rate, capture.writer
+        capture.writer = capture.TraceWriter(directory, max_file_mb=1)
+        own, other = build_image_set(2)
+
+        async def run():
+            app = await load_app(stub_analyzer=True)
+            # Enabled after `main` is imported, so the app itself has no capture middleware
+            settings.capture_sample_rate = 1.0
+            middleware = capture.CaptureMiddleware(app)
+            async with asgi_client(middleware) as client:
+                await client.post("/enroll", json={"user_id": USER, "image": own})
+                await client.post("/verify", json={"user_id": USER, "image": own, "skip_liveness": True})
+                await client.post("/verify", json={"user_id": USER, "image": other, "skip_liveness": True})
+                await client.get(f"/status/{USER}")
+                await client.get(f"/status/{UNKNOWN}")
+                await client.post("/verify", json={"user_id": UNKNOWN, "image": own, "skip_liveness": True})
+                await client.get("/health")
+            await asyncio.gather(*middleware._pending)
+            capture.writer.flush()
+
+            records = capture.read_trace([directory])
+            async with asgi_client(app, base_url="http://replay") as client:
+                replayed = await replay(client, records, speed=0)
+            return records, replayed
+
+        try:
+            records, result = asyncio.run(run())
+        finally:
+            settings.capture_sample_rate, capture.writer = saved_rate, saved_writer
+
+        self.assertEqual([r["endpoint"] for r in records], ["enroll", "verify", "verify", "status", "status", "verify"])
+        self.assertEqual(
+            [r["outcome"] for r in records],
+            ["enrolled", "verified", "rejected:mismatch", "enrolled", "not_enrolled", records[-1]["outcome"]],
+        )
+        self.assertTrue(records[-1]["outcome"].startswith("http_404"))
+        self.assertEqual(records[0]["image"], {"bytes": records[0]["image"]["bytes"], "w": 640, "h": 480, "format": "JPEG"})
+
+        raw = b"".join(gzip.open(path).read() for path in glob.glob(os.path.join(directory, "*.jsonl.gz")))
+        for secret in (USER[2:], UNKNOWN[2:], own.split(",", 1)[1][:200]):
+            self.assertNotIn(secret.encode(), raw)
+
+        self.assertEqual(result["outcomes"], [r["outcome"] for r in records])
+        self.assertEqual(result["endpoints"]["verify"]["count"], 3)
+        self.assertEqual(diff_outcomes(result["outcomes"], result["outcomes"])["changed"], 0)
+        self.assertEqual(
+            diff_outcomes(result["outcomes"], ["enrolled"] * len(records))["changed"], len(records) - 2
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+import asyncio
+import unittest
+
+from benchmarks.local_chain import LocalChain, Revert
+from chain_indexer import ChainIndexer, get_intervals, get_tallies, get_voter
+from chain_rpc import ChainRpc
+from conftest import asgi_client
+from database import init_db
+from metrics import metrics
+
+VOTERS = [f"0x{i:040x}" for i in range(1, 9)]
+
+
+def make_indexer(chain, **kwargs):
+    rpc = ChainRpc("http://local-chain", transport=chain.transport())
+    return ChainIndexer(rpc, chain.address, start_block=0, interval_seconds=3600, **kwargs)
+
+
+async def fresh_index(chain, **kwargs):
+    await init_db()
+    indexer = make_indexer(chain, **kwargs)
+    await indexer.reset()
+    return indexer
+
+
+class TestChainIndexer(unittest.TestCase):
+    def test_01_incremental_sync_by_block_range(self):
+        chain = LocalChain(["Alice", "Bob", "Carol"], voting_minutes=180)
+        chain.register_voters(VOTERS[:4])
+        chain.vote(VOTERS[0], 0)
+        chain.vote(VOTERS[1], 1)
+        chain.advance_time(3600)
+        chain.vote(VOTERS[2], 1)
+
+        async def run():
+            indexer = await fresh_index(chain, max_block_range=2)
+            first = await indexer.sync_once()
+            caught_up = await indexer.sync()
+            before = await get_tallies()
+
+            chain.vote(VOTERS[3], 2)
+            chain.pause()
+            calls = chain.calls
+            incremental = await indexer.sync()
+            incremental_calls = chain.calls - calls
+            idle = await indexer.sync_once()
+            return first, caught_up, before, incremental, incremental_calls, idle, await get_tallies(), \
+                await get_intervals(), await get_voter(VOTERS[3]), await get_voter(VOTERS[5])
+
+        (first, caught_up, before, incremental, incremental_calls, idle,
+         tallies, intervals, voter, unknown) = asyncio.run(run())
+
+        self.assertEqual(first["last_block"], 1)
+        self.assertEqual(caught_up["last_block"], chain.head - 2)
+        self.assertEqual([c["votes"] for c in before["candidates"]], [1, 2, 0])
+        self.assertEqual([c["name"] for c in before["candidates"]], ["Alice", "Bob", "Carol"])
+
+        self.assertEqual(incremental["events"], 2)
+        self.assertLessEqual(incremental_calls, 6)
+        self.assertEqual(idle["events"], 0)
+        self.assertEqual(tallies["last_block"], chain.head)
+        self.assertEqual(tallies["total_votes"], 4)
+        self.assertEqual([c["votes"] for c in tallies["candidates"]], [1, 2, 1])
+        self.assertTrue(tallies["voting"]["paused"])
+        self.assertFalse(tallies["voting"]["active"])
+        self.assertEqual(tallies["voting"]["start"], chain.blocks[1]["timestamp"])
+
+        self.assertEqual([i["total"] for i in intervals], [2, 2])
+        self.assertEqual(intervals[1]["candidates"], {1: 1, 2: 1})
+        self.assertEqual(voter, {"address": VOTERS[3], "registered": True, "has_voted": True,
+                                 "updated_block": chain.head - 1})
+        self.assertIsNone(unknown)
+
+    def test_02_reorg_is_undone_and_reindexed(self):
+        chain = LocalChain(["Alice", "Bob"])
+        chain.register_voters(VOTERS[:3])
+        chain.vote(VOTERS[0], 0)
+
+        async def run():
+            indexer = await fresh_index(chain, reorg_depth=6)
+            await indexer.sync()
+
+            chain.vote(VOTERS[1], 0)
+            chain.unregister_voter(VOTERS[2])
+            await indexer.sync()
+            before = await get_tallies()
+
+            # Replace the last two blocks with a fork where voter 1 picked Bob
+            chain.reorg(2)
+            chain.vote(VOTERS[1], 1)
+            chain.mine(2)
+            rollbacks = metrics.counter("indexer.reorgs")
+            result = await indexer.sync()
+            rollbacks = metrics.counter("indexer.reorgs") - rollbacks
+            return before, result, rollbacks, await get_tallies(), await get_voter(VOTERS[2])
+
+        before, result, rollbacks, after, voter = asyncio.run(run())
+
+        self.assertEqual([c["votes"] for c in before["candidates"]], [2, 0])
+        self.assertEqual(result["reorged"], 2)
+        self.assertEqual(rollbacks, 1)  # undone from the journal, not a full re-index
+        self.assertEqual([c["votes"] for c in after["candidates"]], [1, 1])
+        self.assertEqual(after["last_block"], chain.head)
+        self.assertTrue(voter["registered"])
+        with self.assertRaises(Revert):
+            chain.vote(VOTERS[1], 0)
+
+    def test_03_deep_reorg_resets_and_reindexes(self):
+        chain = LocalChain(["Alice", "Bob"])
+        chain.vote(VOTERS[0], 0)
+        chain.vote(VOTERS[1], 0)
+
+        async def run():
+            indexer = await fresh_index(chain, reorg_depth=1)
+            await indexer.sync()
+            chain.reorg(2)
+            chain.vote(VOTERS[0], 1)
+            await indexer.sync_once()
+            await indexer.sync()
+            return await get_tallies()
+
+        tallies = asyncio.run(run())
+        self.assertEqual([c["votes"] for c in tallies["candidates"]], [0, 1])
+
+    def test_04_concurrent_indexers_apply_each_range_once(self):
+        chain = LocalChain(["Alice", "Bob"], voting_minutes=180)
+        chain.register_voters(VOTERS[:6])
+        for i, voter in enumerate(VOTERS[:6]):
+            chain.vote(voter, i % 2)
+
+        async def run():
+            first = await fresh_index(chain, max_block_range=2)
+            second = make_indexer(chain, max_block_range=2)
+            conflicts = metrics.counter("indexer.cursor_conflicts")
+            results = await asyncio.gather(first.sync(), second.sync())
+            return results, metrics.counter("indexer.cursor_conflicts") - conflicts, \
+                await get_tallies(), await get_intervals()
+
+        results, conflicts, tallies, intervals = asyncio.run(run())
+        self.assertEqual([r["last_block"] for r in results], [chain.head, chain.head])
+        self.assertGreater(conflicts, 0)  # both read the same cursor at least once
+        self.assertEqual(tallies["total_votes"], 6)
+        self.assertEqual([c["votes"] for c in tallies["candidates"]], [3, 3])
+        self.assertEqual(sum(i["total"] for i in intervals), 6)
+
+    def test_05_single_writer_lease(self):
+        from config import settings
+
+        chain = LocalChain(["Alice", "Bob"])
+        chain.vote(VOTERS[0], 1)
+
+        async def run():
+            first = await fresh_index(chain)
+            second = make_indexer(chain)
+            steps = [await first.step(), await second.step(), await first.step()]
+            saved, settings.indexer_lease_seconds = settings.indexer_lease_seconds, 0
+            try:
+                takeover = await second.step()  # the first stopped heartbeating
+            finally:
+                settings.indexer_lease_seconds = saved
+            after = await first.step()
+            return steps, takeover, after, first.is_writer, second.is_writer, await get_tallies()
+
+        (synced, refused, renewed), takeover, after, first_writer, second_writer, tallies = asyncio.run(run())
+        self.assertEqual(synced["last_block"], chain.head)
+        self.assertIsNone(refused)
+        self.assertIsNotNone(renewed)
+        self.assertIsNotNone(takeover)
+        self.assertIsNone(after)
+        self.assertTrue(first_writer is False and second_writer is True)
+        self.assertEqual([c["votes"] for c in tallies["candidates"]], [0, 1])
+
+
+class TestIndexerApi(unittest.TestCase):
+    def test_01_cached_tallies_with_etag(self):
+        import indexer_main
+
+        chain = LocalChain(["Alice", "Bob"])
+        chain.vote(VOTERS[0], 1)
+
+        async def run():
+            indexer = await fresh_index(chain)
+            await indexer.sync()
+            indexer_main.cache.clear()
+            async with asgi_client(indexer_main.app) as client:
+                first = await client.get("/tallies")
+                misses = indexer_main.cache.misses
+                second = await client.get("/tallies", headers={"If-None-Match": first.headers["etag"]})
+                intervals = await client.get("/tallies/intervals")
+                voter = await client.get(f"/voters/{VOTERS[0].upper().replace('0X', '0x')}")
+                missing = await client.get(f"/voters/{VOTERS[7]}")
+            return first, second, misses, indexer_main.cache.misses, intervals, voter, missing
+
+        first, second, misses_before, misses_after, intervals, voter, missing = asyncio.run(run())
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()["total_votes"], 1)
+        self.assertEqual(first.headers["etag"], f'W/"{chain.head}"')
+        self.assertIn("max-age", first.headers["cache-control"])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(misses_after - misses_before, 1)  # only the intervals query
+        self.assertEqual(intervals.json()["intervals"][0]["candidates"], {"1": 1})
+        self.assertTrue(voter.json()["has_voted"])
+        self.assertEqual(missing.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
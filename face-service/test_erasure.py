@@ -0,0 +1,197 @@
+import asyncio
+import json
+import unittest
+
+import numpy as np
+from sqlalchemy import func, select
+
+import erasure
+import jobs
+import repository
+from config import settings
+from conftest import asgi_client
+from database import async_session, init_db
+from models import User, VerificationLog, encrypt_embedding
+
+
+async def seed(user_ids, logs_per_user):
+    await init_db()
+    async with async_session() as db:
+        for user_id in user_ids:
+            await repository.save_embedding(db, user_id, encrypt_embedding(np.ones(512, dtype=np.float32)))
+            for i in range(logs_per_user):
+                db.add(VerificationLog(user_id=user_id, success=i % 2 == 0, similarity_score=0.5))
+        await db.commit()
+
+
+async def count_rows(user_ids):
+    async with async_session() as db:
+        users = await db.scalar(select(func.count()).select_from(User).where(User.id.in_(user_ids)))
+        logs = await db.scalar(
+            select(func.count()).select_from(VerificationLog).where(VerificationLog.user_id.in_(user_ids))
+        )
+    return users, logs
+
+
+class TestEraseJob(unittest.TestCase):
+    def test_01_erase_resumes_from_checkpoint(self):
+        user_ids = [f"0xerase{i:034x}" for i in range(5)]
+        kept = "0xkeep" + "0" * 36
+        saved = settings.erase_chunk_size, settings.erase_log_batch_size
+        settings.erase_chunk_size, settings.erase_log_batch_size = 2, 3
+
+        original_throttle = jobs.JobContext.throttle
+
+        async def crash_after_first_chunk(ctx):
+            raise asyncio.CancelledError()
+
+        async def run():
+            await seed(user_ids + [kept], logs_per_user=4)
+            job = await jobs.create_job(erasure.ERASE_KIND, {"user_ids": sorted(user_ids)}, total=len(user_ids))
+
+            # First run stops after one chunk as if the process died
+            jobs.JobContext.throttle = crash_after_first_chunk
+            try:
+                with self.assertRaises(asyncio.CancelledError):
+                    await jobs.run_job(job["id"])
+            finally:
+                jobs.JobContext.throttle = original_throttle
+            interrupted = await jobs.get_job(job["id"])
+            after_crash = await count_rows(user_ids)
+
+            await jobs.run_job(job["id"])
+            return interrupted, after_crash, await jobs.get_job(job["id"]), await count_rows(user_ids), await count_rows([kept])
+
+        try:
+            interrupted, after_crash, finished, remaining, kept_rows = asyncio.run(run())
+        finally:
+            settings.erase_chunk_size, settings.erase_log_batch_size = saved
+
+        self.assertEqual(interrupted["status"], jobs.RUNNING)
+        self.assertEqual(interrupted["processed"], 2)
+        self.assertEqual(after_crash, (3, 12))
+
+        self.assertEqual(finished["status"], jobs.COMPLETED)
+        self.assertEqual(finished["processed"], 5)
+        self.assertEqual(finished["progress"], 1.0)
+        self.assertEqual(finished["counters"], {"users_deleted": 5, "logs_deleted": 20})
+        self.assertEqual(remaining, (0, 0))
+        self.assertEqual(kept_rows, (1, 4))
+
+    def test_02_purge_all_sweeps_logs_without_a_user_row(self):
+        user_ids = [f"0xpurge{i:034x}" for i in range(3)]
+        orphan = "0xorphan" + "3" * 34
+        saved = settings.erase_chunk_size, settings.erase_log_batch_size
+        settings.erase_chunk_size, settings.erase_log_batch_size = 2, 3
+
+        async def run():
+            await seed(user_ids + [orphan], logs_per_user=4)
+            # A user deleted earlier whose log purge never ran
+            async with async_session() as db:
+                await repository.delete_users(db, [orphan])
+                await db.commit()
+
+            job = await jobs.create_job(erasure.ERASE_KIND, {"all_users": True})
+            await jobs.run_job(job["id"])
+            async with async_session() as db:
+                users = await db.scalar(select(func.count()).select_from(User))
+                logs = await db.scalar(select(func.count()).select_from(VerificationLog))
+            return await jobs.get_job(job["id"]), users, logs
+
+        try:
+            finished, users, logs = asyncio.run(run())
+        finally:
+            settings.erase_chunk_size, settings.erase_log_batch_size = saved
+
+        self.assertEqual(finished["status"], jobs.COMPLETED)
+        self.assertGreaterEqual(finished["counters"]["logs_deleted"], 16)
+        self.assertEqual((users, logs), (0, 0))
+
+
+class TestEraseAndExportEndpoints(unittest.TestCase):
+    def test_01_erase_job_and_ndjson_export(self):
+        from benchmarks.load_test import load_app
+
+        user_id = "0xexport" + "1" * 34
+        erased = "0xerased" + "2" * 34
+        headers = {"X-Admin-Key": "secret"}
+
+        async def run():
+            app = await load_app(stub_analyzer=True)
+            await seed([user_id, erased], logs_per_user=7)
+            settings.admin_api_key = "secret"
+            saved_page = settings.export_page_size
+            settings.export_page_size = 3
+            try:
+                async with asgi_client(app) as client:
+                    export = await client.get(f"/admin/users/{user_id}/export", headers=headers)
+                    repeated = await client.get(f"/admin/users/{user_id}/export?after=0", headers=headers)
+                    last_line = json.loads(export.text.splitlines()[3])
+                    tail = await client.get(f"/admin/users/{user_id}/export?after={last_line['id']}", headers=headers)
+
+                    invalid = await client.post("/admin/erase-jobs", json={}, headers=headers)
+                    created = await client.post("/admin/erase-jobs", json={"user_ids": [erased.upper().replace("0X", "0x")]}, headers=headers)
+                    job_id = created.json()["id"]
+                    for _ in range(100):
+                        job = (await client.get(f"/admin/jobs/{job_id}", headers=headers)).json()
+                        if job["status"] in (jobs.COMPLETED, jobs.FAILED):
+                            break
+                        await asyncio.sleep(0.02)
+                    listed = await client.get("/admin/jobs", headers=headers)
+                    missing = await client.get("/admin/jobs/nope", headers=headers)
+            finally:
+                settings.admin_api_key = ""
+                settings.export_page_size = saved_page
+            return export, repeated, tail, invalid, job, listed, missing, await count_rows([erased])
+
+        export, repeated, tail, invalid, job, listed, missing, erased_rows = asyncio.run(run())
+
+        self.assertEqual(export.status_code, 200)
+        self.assertTrue(export.headers["content-type"].startswith("application/x-ndjson"))
+        records = [json.loads(line) for line in export.text.splitlines()]
+        self.assertEqual(records[0]["type"], "user")
+        self.assertTrue(records[0]["found"])
+        self.assertEqual(len(records[0]["embedding"]), 512)
+        logs = [r for r in records if r["type"] == "verification_log"]
+        self.assertEqual(len(logs), 7)
+        self.assertEqual([r["id"] for r in logs], sorted(r["id"] for r in logs))
+        self.assertEqual(records[-1]["type"], "summary")
+        self.assertEqual(records[-1]["log_rows"], 7)
+        self.assertEqual(records[-1]["last_log_id"], logs[-1]["id"])
+        self.assertEqual(export.text.splitlines()[:-1], repeated.text.splitlines()[:-1])
+
+        tail_records = [json.loads(line) for line in tail.text.splitlines()]
+        self.assertEqual(tail_records[0]["type"], "verification_log")
+        self.assertEqual(tail_records[-1]["log_rows"], 4)
+
+        self.assertEqual(invalid.status_code, 422)
+        self.assertEqual(job["status"], jobs.COMPLETED)
+        self.assertEqual(job["counters"], {"users_deleted": 1, "logs_deleted": 7})
+        self.assertIn(job["id"], [j["id"] for j in listed.json()["jobs"]])
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(erased_rows, (0, 0))
+
+    def test_02_delete_user_purges_logs_left_by_an_interrupted_delete(self):
+        from benchmarks.load_test import load_app
+
+        user_id = "0xretry" + "4" * 35
+
+        async def run():
+            app = await load_app(stub_analyzer=True)
+            await seed([user_id], logs_per_user=3)
+            async with async_session() as db:
+                await repository.delete_users(db, [user_id])
+                await db.commit()
+            async with asgi_client(app) as client:
+                retried = await client.delete(f"/user/{user_id}")
+                again = await client.delete(f"/user/{user_id}")
+            return retried, again, await count_rows([user_id])
+
+        retried, again, rows = asyncio.run(run())
+        self.assertEqual(retried.status_code, 200)
+        self.assertEqual(rows, (0, 0))
+        self.assertEqual(again.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
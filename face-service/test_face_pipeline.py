@@ -0,0 +1,96 @@
+import unittest
+
+import numpy as np
+
+import face_processor
+from benchmarks.stub_analyzer import install_stub_analyzer
+from config import settings
+from metrics import metrics
+
+
+def kps_for(x1, y1, x2, y2):
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    return np.array([[cx - 5, cy - 5], [cx + 5, cy - 5], [cx, cy], [cx - 5, cy + 5], [cx + 5, cy + 5]], dtype=np.float32)
+
+
+class TestCascadedPipeline(unittest.TestCase):
+    def setUp(self):
+        self.image = np.zeros((480, 640, 3), dtype=np.uint8)
+        self.stub = install_stub_analyzer()
+        self.recognizer = self.stub.models["recognition"]
+
+    def tearDown(self):
+        face_processor._face_analyzer = None
+
+    def use_detections(self, boxes):
+        """boxes: [(x1, y1, x2, y2, score), ...]"""
+        def detect(img, input_size=None, max_num=0, metric='default'):
+            bboxes = np.array(boxes, dtype=np.float32).reshape(-1, 5)
+            return bboxes, np.array([kps_for(*b[:4]) for b in boxes], dtype=np.float32).reshape(-1, 5, 2)
+        self.stub.det_model.detect = detect
+
+    def test_01_crowded_frame_embeds_only_the_largest_face(self):
+        self.use_detections([
+            (10, 10, 110, 110, 0.9),
+            (200, 100, 440, 380, 0.9),
+            (500, 10, 600, 110, 0.9),
+        ])
+
+        result = face_processor.analyze_face(self.image)
+
+        self.assertTrue(result["valid"])
+        self.assertEqual(result["face_count"], 3)
+        self.assertEqual(result["bbox"], [200, 100, 440, 380])
+        self.assertIsNotNone(result["embedding"])
+        self.assertEqual(self.recognizer.calls, 1)
+
+    def test_02_small_face_costs_only_detection(self):
+        self.use_detections([(300, 200, 340, 240, 0.9)])
+
+        result = face_processor.analyze_face(self.image)
+
+        self.assertFalse(result["valid"])
+        self.assertEqual(result["reason"], "Face too small - move closer to camera")
+        self.assertIsNone(result["embedding"])
+        self.assertEqual(self.recognizer.calls, 0)
+
+    def test_03_low_confidence_detections_are_ignored(self):
+        # The large face is a low-score false positive; the real face is smaller
+        self.use_detections([(0, 0, 640, 480, 0.2), (200, 100, 440, 380, 0.9)])
+
+        face, quality = face_processor.detect_target_face(self.image)
+        self.assertEqual(quality["face_count"], 1)
+        self.assertEqual(quality["bbox"], [200, 100, 440, 380])
+
+        self.use_detections([(0, 0, 640, 480, 0.2)])
+        face, quality = face_processor.detect_target_face(self.image)
+        self.assertIsNone(face)
+        self.assertEqual(quality["status"], "no_face")
+        self.assertEqual(self.recognizer.calls, 0)
+
+    def test_04_escalates_to_full_size_only_without_a_confident_face(self):
+        sizes = []
+
+        def detect(img, input_size=None, max_num=0, metric='default'):
+            sizes.append(input_size[0])
+            score = 0.9 if input_size[0] == settings.detector_input_size else 0.3
+            return np.array([[200, 100, 440, 380, score]], dtype=np.float32), kps_for(200, 100, 440, 380)[np.newaxis]
+        self.stub.det_model.detect = detect
+        metrics.reset()
+
+        face, quality = face_processor.detect_target_face(self.image)
+        self.assertEqual(sizes, [320, 640])
+        self.assertEqual(quality["det_input_size"], 640)
+
+        # A confident face at the small size is accepted without a second pass
+        sizes.clear()
+        self.use_detections([(200, 100, 440, 380, 0.9)])
+        face, quality = face_processor.detect_target_face(self.image)
+        self.assertEqual(quality["det_input_size"], 320)
+
+        self.assertEqual(metrics.counter("detector.requests"), 2)
+        self.assertEqual(metrics.ratio("detector.escalations", "detector.requests"), 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
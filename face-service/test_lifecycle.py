@@ -0,0 +1,250 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from fastapi import HTTPException
+
+import face_processor
+import jobs
+from benchmarks.stub_analyzer import StubFaceAnalysis
+from config import settings
+from conftest import asgi_client
+from lifecycle import READY, STARTING, Lifecycle, LifecycleError, lifecycle as service
+from metrics import metrics
+from verification_cache import verification_cache
+
+
+class TestWarmUpAndDrain(unittest.TestCase):
+    def setUp(self):
+        self.saved = face_processor._face_analyzer
+
+    def tearDown(self):
+        face_processor._face_analyzer = self.saved
+
+    def test_01_ready_only_after_models_and_db_pool_are_warm(self):
+        stub = StubFaceAnalysis()
+        attempts = []
+
+        def flaky_loader(model_name):
+            attempts.append(model_name)
+            if len(attempts) == 1:
+                raise RuntimeError("model files not downloaded yet")
+            return stub
+
+        face_processor._face_analyzer = None
+        state = Lifecycle(loader=flaky_loader, db_connections=3, retry_seconds=0.01)
+        failures = metrics.counter("lifecycle.warm_up_failures")
+
+        async def run():
+            before = (state.ready, state.stats())
+            await state.warm_up()
+            return before
+
+        (ready_before, stats_before) = asyncio.run(run())
+
+        self.assertFalse(ready_before)
+        self.assertEqual((stats_before["state"], stats_before["models_ready"]), (STARTING, False))
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(metrics.counter("lifecycle.warm_up_failures") - failures, 1)
+        self.assertTrue(state.ready)
+        self.assertTrue(state.models_ready and state.db_ready)
+        self.assertIsNone(state.error)
+        self.assertIs(face_processor.get_face_analyzer(), stub)
+
+    def test_02_drain_waits_for_running_inference_then_refuses(self):
+        state = Lifecycle()
+        state.state = READY
+        done = []
+
+        def infer(seconds):
+            time.sleep(seconds)
+            done.append(seconds)
+            return seconds
+
+        async def run():
+            slow = asyncio.create_task(state.track(asyncio.to_thread(infer, 0.2)))
+            abandoned = asyncio.create_task(state.track(asyncio.to_thread(infer, 0.3)))
+            await asyncio.sleep(0.05)
+            abandoned.cancel()  # the client went away; its thread still runs
+            in_flight = state.in_flight
+            drained = await state.drain(timeout=5.0)
+            with self.assertRaises(HTTPException) as refused:
+                await state.track(asyncio.to_thread(infer, 0.0))
+            return in_flight, drained, await slow, refused.exception
+
+        in_flight, drained, result, refused = asyncio.run(run())
+
+        self.assertEqual(in_flight, 2)
+        self.assertTrue(drained)
+        self.assertEqual(result, 0.2)
+        self.assertEqual(sorted(done), [0.2, 0.3])
+        self.assertEqual(state.in_flight, 0)
+        self.assertEqual(refused.status_code, 503)
+        self.assertFalse(state.ready)
+
+        stuck = Lifecycle()
+
+        async def run_stuck():
+            task = asyncio.create_task(stuck.track(asyncio.to_thread(infer, 0.3)))
+            await asyncio.sleep(0.05)
+            drained = await stuck.drain(timeout=0.05)
+            await task
+            return drained
+
+        self.assertFalse(asyncio.run(run_stuck()))
+
+
+class TestModelReload(unittest.TestCase):
+    def test_01_pinned_thread_keeps_its_analyzer_across_a_swap(self):
+        old, new = StubFaceAnalysis(), StubFaceAnalysis()
+        saved = face_processor.install_face_analyzer(old)
+        pinned, release, seen = threading.Event(), threading.Event(), []
+
+        def request():
+            with face_processor.pinned_analyzer():
+                seen.append(face_processor.get_face_analyzer())
+                pinned.set()
+                release.wait(5)
+                seen.append(face_processor.get_face_analyzer())
+
+        thread = threading.Thread(target=request)
+        try:
+            thread.start()
+            pinned.wait(5)
+            self.assertIs(face_processor.install_face_analyzer(new), old)
+            self.assertIs(face_processor.get_face_analyzer(), new)
+            release.set()
+            thread.join(5)
+        finally:
+            face_processor._face_analyzer = saved
+
+        self.assertEqual(seen, [old, old])
+
+    def test_02_reload_under_load_drops_no_request(self):
+        from benchmarks.load_test import load_app
+        from benchmarks.synthetic import build_image_set
+
+        user_id = "0x" + "4e" * 20
+        images = build_image_set(13)
+        saved = face_processor._face_analyzer, service.state, service.loader, service.model_name, service.reload
+
+        async def run():
+            app = await load_app(stub_analyzer=True)
+            old = face_processor._face_analyzer
+            old.latency_ms = 50.0
+            new = StubFaceAnalysis(latency_ms=50.0)
+            new.models["recognition"].seed_salt = 1  # a different recognition model
+
+            def slow_loader(model_name):
+                time.sleep(0.15)
+                return new
+
+            service.state, service.loader = READY, slow_loader
+            async with asgi_client(app) as client:
+                enrolled = await client.post("/enroll", json={"user_id": user_id, "image": images[0]})
+                self.assertEqual(enrolled.status_code, 200, enrolled.text)
+                ready = await client.get("/health/ready")
+
+                async def verify(image):
+                    return await client.post("/verify", json={"user_id": user_id, "image": image, "skip_liveness": True})
+
+                requests = [asyncio.create_task(verify(image)) for image in images[1:]]
+                await asyncio.sleep(0.01)
+                reload = service.start_reload("buffalo_s")
+                with self.assertRaises(LifecycleError):
+                    service.start_reload()
+                responses = await asyncio.gather(*requests)
+                await reload
+                after = await verify(images[0])
+                status = service.stats()
+                refused = await client.post(
+                    "/admin/models/reload", json={"model_name": "buffalo_l"}, headers={"X-Admin-Key": "secret"}
+                )
+            return old, new, ready, responses, after, status, refused
+
+        settings.admin_api_key, saved_key = "secret", settings.admin_api_key
+        try:
+            old, new, ready, responses, after, status, refused = asyncio.run(run())
+        finally:
+            (face_processor._face_analyzer, service.state, service.loader, service.model_name, service.reload) = saved
+            settings.admin_api_key = saved_key
+            verification_cache.clear()
+
+        self.assertEqual(ready.status_code, 200)
+        self.assertEqual([response.status_code for response in responses], [200] * 12)
+        # Every frame was detected and embedded by one model set, never a mix
+        for stub in (old, new):
+            self.assertEqual(stub.det_model.calls, stub.models["recognition"].calls)
+        self.assertEqual(old.models["recognition"].calls - 1 + new.models["recognition"].calls, 13)
+        self.assertGreater(new.models["recognition"].calls, 0)
+        self.assertEqual((status["model_name"], status["reload"]["state"]), ("buffalo_s", "done"))
+        # Switching packs back without re-embedding would strand every stored template
+        self.assertEqual(refused.status_code, 409)
+        self.assertIn("reembed", refused.json()["detail"])
+        # The enrollment came from the old recognition model, so the new one no longer matches it
+        self.assertFalse(after.json()["verified"])
+
+    def test_03_every_worker_follows_the_reload_generation(self):
+        from benchmarks.load_test import load_app
+
+        saved = face_processor._face_analyzer, settings.face_model_name
+
+        async def run():
+            await load_app(stub_analyzer=True)
+            stub = face_processor._face_analyzer
+
+            def worker():
+                state = Lifecycle(loader=lambda model_name: stub)
+                state.state = READY
+                return state
+
+            first, second = worker(), worker()
+            await first.request_reload()
+            await first._reload_task
+            second.generation = first.generation
+
+            with self.assertRaises(LifecycleError):
+                await first.request_reload("buffalo_s")
+            accepted = await first.request_reload("buffalo_s", reembed=True)
+            await first._reload_task
+            for _ in range(200):
+                job = await jobs.get_job(first.reload["reembed_job"])
+                if job["status"] in (jobs.COMPLETED, jobs.FAILED):
+                    break
+                await asyncio.sleep(0.02)
+
+            followed = await second.check_generation()
+            await second._reload_task
+            again = await second.check_generation()
+
+            # Started after the reload: same FACE_MODEL_NAME adopts it, a changed one wins over it
+            newcomer = worker()
+            adopted = await newcomer.check_generation()
+            await newcomer._reload_task
+            settings.face_model_name = "antelopev2"
+            restarted = worker()
+            kept = await restarted.check_generation()
+            return first, second, accepted, job, followed, again, newcomer, adopted, restarted, kept
+
+        try:
+            first, second, accepted, job, followed, again, newcomer, adopted, restarted, kept = asyncio.run(run())
+        finally:
+            face_processor._face_analyzer, settings.face_model_name = saved
+            verification_cache.clear()
+
+        self.assertIn("reembed_users", accepted["reload"]["warning"])
+        self.assertEqual(accepted["generation"], first.generation)
+        self.assertEqual(job["status"], jobs.COMPLETED)
+        self.assertTrue(followed)
+        self.assertFalse(again)
+        self.assertEqual((second.model_name, second.generation), ("buffalo_s", first.generation))
+        self.assertNotIn("reembed_job", second.reload)
+        self.assertTrue(adopted)
+        self.assertEqual((newcomer.model_name, newcomer.generation), ("buffalo_s", first.generation))
+        self.assertFalse(kept)
+        self.assertEqual((restarted.model_name, restarted.generation), ("antelopev2", first.generation))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import queue
+import tempfile
+import unittest
+
+import logging_setup
+from config import settings
+from logging_setup import DroppingQueueHandler, JsonFormatter, SamplingFilter, parse_sample_rates
+from metrics import metrics
+
+
+def make_record(level=logging.INFO, msg="Verification for %s...", args=("0xabc",), name="main", **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestLoggingParts(unittest.TestCase):
+    def test_01_queue_drops_instead_of_blocking_and_formats_lazily(self):
+        handler = DroppingQueueHandler(queue.Queue(2))
+        dropped = metrics.counter("logging.dropped")
+        for _ in range(5):
+            handler.handle(make_record(event="verify.request", user="0xabc"))
+        self.assertEqual(handler.queue.qsize(), 2)
+        self.assertEqual(metrics.counter("logging.dropped") - dropped, 3)
+
+        record = handler.queue.get_nowait()
+        self.assertEqual(record.args, ("0xabc",))  # still unformatted when queued
+        line = json.loads(JsonFormatter().format(record))
+        self.assertEqual(line["msg"], "Verification for 0xabc...")
+        self.assertEqual((line["level"], line["event"], line["user"]), ("INFO", "verify.request", "0xabc"))
+        self.assertNotIn("args", line)
+
+    def test_02_sampling_only_thins_events_at_listed_levels(self):
+        self.assertEqual(parse_sample_rates(" info=0.25, DEBUG=0 "), {logging.INFO: 0.25, logging.DEBUG: 0.0})
+        with self.assertRaises(ValueError):
+            parse_sample_rates("LOUD=1")
+
+        draws = iter([0.1, 0.9, 0.2, 0.8])
+        sampler = SamplingFilter({logging.INFO: 0.5, logging.DEBUG: 0.0}, rng=lambda: next(draws))
+        events = [sampler.filter(make_record(event="verify.result")) for _ in range(2)]
+        access = [sampler.filter(make_record(name="uvicorn.access")) for _ in range(2)]
+        self.assertEqual(events + access, [True, False, True, False])
+        self.assertTrue(sampler.filter(make_record(msg="✅ Face models loaded", args=())))
+        self.assertTrue(sampler.filter(make_record(level=logging.WARNING, event="token.invalid")))
+        self.assertFalse(sampler.filter(make_record(level=logging.DEBUG, event="face.detail")))
+
+
+class TestConfigureLogging(unittest.TestCase):
+    def test_01_writer_thread_writes_json_lines(self):
+        root = logging.getLogger()
+        saved = root.handlers[:], root.level, settings.log_file, settings.log_sample_rates
+        path = os.path.join(tempfile.mkdtemp(), "service.log")
+        settings.log_file, settings.log_sample_rates = path, "INFO=0"
+        try:
+            self.assertTrue(logging_setup.configure_logging(force=True))
+            self.assertFalse(logging_setup.configure_logging())
+            logger = logging.getLogger("test_logging_setup")
+            logger.info("✅ New enrollment for %s...", "0x1234", extra={"event": "enroll.created", "user": "0x1234"})
+            logger.info("🚀 Starting Face Verification Service...")
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                logger.exception("❌ Verification error")
+            stats = logging_setup.stats()
+            logging_setup.stop_logging()
+        finally:
+            for handler in root.handlers[:]:
+                root.removeHandler(handler)
+            root.handlers[:], level, settings.log_file, settings.log_sample_rates = saved
+            root.setLevel(level)
+
+        with open(path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["msg"] for line in lines], ["🚀 Starting Face Verification Service...", "❌ Verification error"])
+        self.assertIn("ValueError: boom", lines[1]["exc"])
+        self.assertEqual(lines[0]["logger"], "test_logging_setup")
+        self.assertEqual(stats["capacity"], settings.log_queue_size)
+        self.assertGreaterEqual(stats["sampled_out"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import asyncio
+import base64
+import os
+import unittest
+
+import numpy as np
+from cryptography.fernet import Fernet
+from sqlalchemy import select
+
+import jobs
+import maintenance
+import repository
+from config import settings
+from conftest import asgi_client
+from database import async_session, init_db
+from metrics import metrics
+from models import BackgroundJob, User, decrypt_blob, decrypt_embedding, encrypt_embedding
+
+# The key models.py falls back to when DB_ENCRYPTION_KEY is unset (as in these tests)
+DEMO_KEY = base64.urlsafe_b64encode(b"VotEthSecretKeyForDemoMustBe32B!").decode()
+
+
+def set_keys(current, old=""):
+    os.environ["DB_ENCRYPTION_KEY"] = current
+    os.environ["DB_ENCRYPTION_OLD_KEYS"] = old
+
+
+async def wait_for(job_id, statuses=(jobs.COMPLETED, jobs.FAILED, jobs.PAUSED)):
+    for _ in range(200):
+        job = await jobs.get_job(job_id)
+        if job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.02)
+    return job
+
+
+async def stored_blobs(user_ids):
+    async with async_session() as db:
+        rows = await db.execute(select(User.id, User.embedding, User.face_crop).where(User.id.in_(user_ids)))
+        return {row.id: row for row in rows}
+
+
+class TestJobThrottle(unittest.TestCase):
+    def test_01_pause_follows_live_verify_latency(self):
+        saved = settings.job_pause_ms, settings.job_max_pause_ms, settings.job_throttle_latency_ms
+        settings.job_pause_ms, settings.job_max_pause_ms, settings.job_throttle_latency_ms = 0.0, 4.0, 100.0
+        ctx = jobs.JobContext(BackgroundJob(id="throttle", kind="test", processed=0, counters="{}"), {})
+
+        async def run():
+            metrics.reset()
+            await ctx.throttle()
+            idle = ctx.delay_ms
+            metrics.observe("admission.verify.service", 900.0)
+            delays = []
+            for _ in range(4):
+                await ctx.throttle()
+                delays.append(ctx.delay_ms)
+            metrics.reset()
+            await ctx.throttle()
+            return idle, delays, ctx.delay_ms
+
+        try:
+            idle, delays, recovered = asyncio.run(run())
+        finally:
+            settings.job_pause_ms, settings.job_max_pause_ms, settings.job_throttle_latency_ms = saved
+            metrics.reset()
+
+        self.assertEqual(idle, 0.0)
+        self.assertEqual(delays, [2.0, 4.0, 4.0, 4.0])
+        self.assertEqual(recovered, 2.0)
+
+
+class TestKeyRotation(unittest.TestCase):
+    def test_01_rotate_to_new_key_and_back(self):
+        new_key = Fernet.generate_key().decode()
+        user_ids = [f"0xrotate{i:034x}" for i in range(3)]
+        foreign = "0xrotateforeign" + "0" * 27
+        embedding = np.linspace(-1, 1, 512, dtype=np.float32)
+
+        async def rotate():
+            job = await maintenance.create_maintenance_job(maintenance.ROTATE_KIND)
+            return await wait_for(job["id"])
+
+        async def run():
+            await init_db()
+            async with async_session() as db:
+                for user_id in user_ids:
+                    await repository.save_embedding(db, user_id, encrypt_embedding(embedding))
+                # Encrypted under a key this service never had
+                db.add(User(id=foreign, embedding=Fernet(Fernet.generate_key()).encrypt(b"\0" * 2048)))
+                await db.commit()
+
+            set_keys(new_key, old=DEMO_KEY)
+            forward = await rotate()
+            set_keys(new_key)
+            under_new_key = [decrypt_embedding(row.embedding) for row in (await stored_blobs(user_ids)).values()]
+
+            # Rotate back so the rest of the suite keeps reading the shared DB
+            set_keys(DEMO_KEY, old=new_key)
+            backward = await rotate()
+
+            async with async_session() as db:
+                await repository.delete_user(db, foreign)
+                await db.commit()
+            return forward, under_new_key, backward
+
+        try:
+            forward, under_new_key, backward = asyncio.run(run())
+        finally:
+            os.environ.pop("DB_ENCRYPTION_KEY", None)
+            os.environ.pop("DB_ENCRYPTION_OLD_KEYS", None)
+
+        self.assertEqual(forward["status"], jobs.COMPLETED, forward)
+        self.assertEqual(forward["processed"], forward["total"])
+        self.assertEqual(forward["counters"]["unreadable"], 1)
+        self.assertEqual(forward["counters"]["rotated"], forward["total"] - 1)
+        for decrypted in under_new_key:
+            np.testing.assert_array_equal(decrypted, embedding)
+        self.assertEqual(backward["status"], jobs.COMPLETED, backward)
+        self.assertEqual(backward["counters"]["unreadable"], 1)
+
+
+class TestReembedding(unittest.TestCase):
+    def test_01_reembed_from_retained_crops_with_pause_and_resume(self):
+        from benchmarks.load_test import load_app
+        from benchmarks.synthetic import build_image_set
+        from face_processor import decode_face_crop, embed_aligned_crops
+
+        user_ids = [f"0xreembed{i:033x}" for i in range(3)]
+        saved = settings.retain_enrollment_crops, settings.maintenance_chunk_size
+        settings.retain_enrollment_crops, settings.maintenance_chunk_size = True, 1
+        original_throttle = jobs.JobContext.throttle
+
+        async def pause_after_first_chunk(ctx):
+            await jobs.pause_job(ctx.job_id)
+
+        async def run():
+            app = await load_app(stub_analyzer=True)
+            import face_processor
+            async with asgi_client(app) as client:
+                for user_id, image in zip(user_ids, build_image_set(3)):
+                    response = await client.post("/enroll", json={"user_id": user_id, "image": image})
+                    self.assertEqual(response.status_code, 200, response.text)
+            before = await stored_blobs(user_ids)
+
+            # Switch to a "different model"
+            face_processor._face_analyzer.models["recognition"].seed_salt = 1
+            jobs.JobContext.throttle = pause_after_first_chunk
+            try:
+                job = await maintenance.create_maintenance_job(maintenance.REEMBED_KIND)
+                paused = await wait_for(job["id"], statuses=(jobs.PAUSED, jobs.COMPLETED, jobs.FAILED))
+            finally:
+                jobs.JobContext.throttle = original_throttle
+            await jobs.resume_job(job["id"])
+            finished = await wait_for(job["id"], statuses=(jobs.COMPLETED, jobs.FAILED))
+
+            after = await stored_blobs(user_ids)
+            expected = {
+                user_id: embed_aligned_crops([decode_face_crop(decrypt_blob(row.face_crop))])[0]
+                for user_id, row in after.items()
+            }
+            return before, paused, finished, after, expected
+
+        try:
+            before, paused, finished, after, expected = asyncio.run(run())
+        finally:
+            settings.retain_enrollment_crops, settings.maintenance_chunk_size = saved
+
+        self.assertTrue(all(row.face_crop is not None for row in before.values()))
+        crop = decode_face_crop(decrypt_blob(before[user_ids[0]].face_crop))
+        self.assertEqual(crop.shape, (112, 112, 3))
+
+        self.assertEqual(paused["status"], jobs.PAUSED)
+        self.assertEqual(paused["processed"], 1)
+        self.assertEqual(finished["status"], jobs.COMPLETED, finished)
+        self.assertEqual(finished["processed"], 3)
+        self.assertEqual(finished["counters"]["reembedded"], 3)
+
+        for user_id in user_ids:
+            self.assertNotEqual(after[user_id].embedding, before[user_id].embedding)
+            np.testing.assert_array_equal(decrypt_embedding(after[user_id].embedding), expected[user_id])
+
+
+if __name__ == '__main__':
+    unittest.main()
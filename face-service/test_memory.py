@@ -0,0 +1,166 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import httpx
+import numpy as np
+
+import memory
+from config import settings
+from conftest import asgi_client
+from metrics import metrics
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PREFORK_SCRIPT = """
+import sys
+from benchmarks.load_test import prepare_environment
+prepare_environment()
+from benchmarks.stub_analyzer import install_stub_analyzer
+install_stub_analyzer()
+import serve
+serve.main(['--host', '127.0.0.1', '--port', sys.argv[1], '--workers', '2', '--log-level', 'warning'])
+"""
+
+
+def identity_model_path() -> str:
+    import onnx
+    from onnx import TensorProto, helper
+
+    graph = helper.make_graph(
+        [helper.make_node("Relu", ["x"], ["y"])], "relu",
+        [helper.make_tensor_value_info("x", TensorProto.FLOAT, ["n", 4])],
+        [helper.make_tensor_value_info("y", TensorProto.FLOAT, ["n", 4])],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    path = os.path.join(tempfile.mkdtemp(), "relu.onnx")
+    onnx.save(model, path)
+    return path
+
+
+class TestSessionSettings(unittest.TestCase):
+    def setUp(self):
+        self.saved = {key: getattr(settings, key) for key in (
+            "ort_cpu_mem_arena", "ort_mem_pattern", "ort_arena_shrinkage", "ort_intra_op_threads",
+        )}
+
+    def tearDown(self):
+        for key, value in self.saved.items():
+            setattr(settings, key, value)
+
+    def test_01_options_and_arena_shrinkage(self):
+        import onnxruntime
+
+        settings.ort_cpu_mem_arena, settings.ort_mem_pattern, settings.ort_intra_op_threads = True, False, 1
+        settings.ort_arena_shrinkage = True
+        options = memory.session_options()
+        self.assertTrue(options.enable_cpu_mem_arena)
+        self.assertFalse(options.enable_mem_pattern)
+        self.assertEqual(options.intra_op_num_threads, 1)
+
+        session = onnxruntime.InferenceSession(identity_model_path(), sess_options=options,
+                                               providers=["CPUExecutionProvider"])
+        memory.bound_session(session)
+        self.assertTrue(session.run.shrinks_arena)
+        # Large and small inputs both run with the shrinking run options
+        for rows in (4096, 1):
+            x = np.linspace(-1, 1, rows * 4, dtype=np.float32).reshape(rows, 4)
+            np.testing.assert_array_equal(session.run(None, {"x": x})[0], np.maximum(x, 0))
+
+        settings.ort_arena_shrinkage = False
+        plain = onnxruntime.InferenceSession(identity_model_path(), providers=["CPUExecutionProvider"])
+        self.assertFalse(hasattr(memory.bound_session(plain).run, "shrinks_arena"))
+
+
+class TestWatchdog(unittest.TestCase):
+    def test_01_process_memory(self):
+        stats = memory.process_memory()
+        self.assertGreater(stats["rss_mb"], 10)
+        if os.path.exists("/proc/self/smaps_rollup"):
+            self.assertLessEqual(stats["pss_mb"], stats["rss_mb"])
+            self.assertAlmostEqual(stats["shared_mb"] + stats["private_mb"], stats["rss_mb"], delta=1.0)
+
+    def test_02_recycle_once_and_report_in_health(self):
+        from benchmarks.load_test import load_app
+
+        recycles = []
+        watchdog = memory.MemoryWatchdog(max_rss_mb=100000, on_recycle=lambda: recycles.append(True))
+        self.assertFalse(watchdog.check())
+        watchdog.max_rss_mb = 1
+        before = metrics.counter("memory.recycles")
+        self.assertTrue(watchdog.check())
+        self.assertFalse(watchdog.check())
+        self.assertEqual(recycles, [True])
+        self.assertEqual(metrics.counter("memory.recycles") - before, 1)
+
+        async def health():
+            app = await load_app(stub_analyzer=True)
+            async with asgi_client(app) as client:
+                return (await client.get("/health")).json()
+
+        saved = memory.watchdog
+        memory.watchdog = watchdog
+        try:
+            body = asyncio.run(health())
+        finally:
+            memory.watchdog = saved
+
+        self.assertEqual(body["status"], "draining")
+        self.assertEqual(body["worker"]["pid"], os.getpid())
+        self.assertTrue(body["worker"]["draining"])
+        self.assertGreater(body["worker"]["rss_mb"], 0)
+
+
+class TestPreforkServer(unittest.TestCase):
+    def test_01_workers_are_recycled_without_failed_requests(self):
+        from benchmarks.shard_cluster import free_port
+
+        port = free_port()
+        env = dict(
+            os.environ,
+            WORKER_MAX_RSS_MB="1",  # every worker is over the limit at its first check
+            MEMORY_CHECK_INTERVAL_SECONDS="0.5",
+            ENROLLED_FILTER_REFRESH_SECONDS="0",
+            LOG_COMPACTION_INTERVAL_MINUTES="0",
+        )
+        env.pop("DATABASE_URL", None)
+        process = subprocess.Popen(
+            [sys.executable, "-c", PREFORK_SCRIPT, str(port)],
+            cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+        workers = []
+        try:
+            deadline = time.monotonic() + 30
+            with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=10) as client:
+                while time.monotonic() < deadline:
+                    try:
+                        response = client.get("/health")
+                    except httpx.TransportError:
+                        if workers:
+                            raise
+                        time.sleep(0.1)
+                        continue
+                    self.assertEqual(response.status_code, 200)
+                    workers.append(response.json()["worker"])
+                    if len({worker["pid"] for worker in workers}) > 3:
+                        break
+                    time.sleep(0.1)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            exit_code = process.wait(timeout=30)
+
+        self.assertGreater(len({worker["pid"] for worker in workers}), 3)
+        self.assertLessEqual({worker["worker_id"] for worker in workers}, {"0", "1"})
+        self.assertNotIn(process.pid, {worker["pid"] for worker in workers})
+        self.assertEqual(exit_code, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from eth_account import Account
+
+from benchmarks.local_chain import LocalChain, Revert
+from chain_rpc import ChainRpc, RpcError
+from database import async_session, init_db
+from merkle_allowlist import EMPTY_ROOT, Allowlist, AllowlistError, MerkleStore, hash_pair, leaf_hash, verify_proof
+from models import VerificationLog
+
+
+def full_root(leaves):
+    """Root recomputed from scratch, level by level"""
+    level = list(leaves)
+    if not level:
+        return EMPTY_ROOT
+    while len(level) > 1:
+        level = [hash_pair(level[i], level[i + 1]) if i + 1 < len(level) else level[i] for i in range(0, len(level), 2)]
+    return level[0]
+
+
+def proof_bytes(result):
+    return [bytes.fromhex(node[2:]) for node in result["proof"]]
+
+
+class TestMerkleStore(unittest.TestCase):
+    def test_01_incremental_appends_match_a_full_rebuild(self):
+        rng = random.Random(7)
+        addresses = [f"0x{rng.getrandbits(160):040x}" for _ in range(200)]
+        leaves = [leaf_hash(address) for address in addresses]
+        store = MerkleStore(tempfile.mkdtemp())
+
+        count = 0
+        for size in (1, 1, 2, 3, 5, 8, 13, 21, 34, 57):
+            store.append_addresses(addresses[count:count + size])
+            count += size
+            # Every earlier root, and every proof against it, is still served from the grown tree
+            for earlier in range(1, count + 1):
+                root = full_root(leaves[:earlier])
+                self.assertEqual(store.root(earlier), root)
+                for index in range(0, earlier, 7):
+                    self.assertTrue(verify_proof(store.proof(index, earlier), root, leaves[index]))
+        self.assertEqual(len(store.proof(0, 145)), 8)
+
+        # A build that died before committing leaves extra leaves on disk
+        store.truncate(100)
+        self.assertEqual(store.size(0), 100)
+        self.assertEqual(store.root(100), full_root(leaves[:100]))
+        store.append_addresses(addresses[100:])
+        self.assertEqual(store.root(200), full_root(leaves))
+
+
+class TestAllowlistOnLocalChain(unittest.TestCase):
+    def test_01_build_publish_and_vote_with_proofs(self):
+        chain = LocalChain(["Alice", "Bob"], voting_minutes=180)
+        signer = Account.create()
+        chain.set_verification_signer(signer.address)
+        voters = [Account.create() for _ in range(5)]
+        wallets = [voter.address.lower() for voter in voters]
+        allowlist = Allowlist(tempfile.mkdtemp())
+        rpc = ChainRpc("http://local-chain", transport=chain.transport())
+
+        async def verified(*rows):
+            async with async_session() as db:
+                db.add_all(VerificationLog(user_id=user_id, success=success) for user_id, success in rows)
+                await db.commit()
+
+        async def run():
+            await init_db()
+            baseline = await allowlist.sync()  # rows other tests left behind
+            await verified((wallets[0], True), (wallets[1], True), (wallets[0], True),
+                           (wallets[2], True), (wallets[3], False), ("not-a-wallet", True))
+            first = await allowlist.sync()
+            published = await allowlist.publish(rpc, signer, chain.address)
+            unchanged = await allowlist.publish(rpc, signer, chain.address)
+            on_chain = await rpc.call(chain.address, "verifiedVotersRoot()", returns=("bytes32",))
+
+            proof0 = await allowlist.proof(wallets[0])
+            await rpc.send_transaction(voters[0], chain.address, "voteWithProof(uint256,bytes32[])", 1, proof_bytes(proof0))
+            with self.assertRaises(RpcError):
+                await rpc.send_transaction(voters[3], chain.address, "voteWithProof(uint256,bytes32[])", 1, proof_bytes(proof0))
+            refused = await allowlist.proof(wallets[3])
+
+            # New verifications grow the tree; proofs keep matching the published root until the next publish
+            await verified((wallets[3], True), (wallets[4], True))
+            second = await allowlist.sync()
+            proof1 = await allowlist.proof(wallets[1])
+            chain.vote_with_proof(wallets[1], 0, proof_bytes(proof1))
+            not_yet = await allowlist.proof(wallets[4])
+            republished = await allowlist.publish(rpc, signer, chain.address)
+            proof4 = await allowlist.proof(wallets[4])
+            with self.assertRaises(Revert):
+                chain.vote_with_proof(wallets[2], 0, proof_bytes(proof1))  # proof against the replaced root
+
+            # Leaves written by a build that never committed are dropped by the next one
+            allowlist.store.append_addresses(["0x" + "ee" * 20] * 3)
+            recovered = await allowlist.sync()
+            status = await allowlist.status()
+            proof2 = await allowlist.proof(wallets[2])
+            return (baseline, first, published, unchanged, on_chain, proof0, refused, second, proof1, not_yet,
+                    republished, proof4, recovered, status, proof2)
+
+        (baseline, first, published, unchanged, on_chain, proof0, refused, second, proof1, not_yet,
+         republished, proof4, recovered, status, proof2) = asyncio.run(run())
+        offset = baseline["leaf_count"]
+
+        self.assertEqual(first["added"], 3)
+        self.assertEqual(published["leaf_count"], offset + 3)
+        self.assertTrue(unchanged["unchanged"])
+        self.assertEqual("0x" + on_chain.hex(), published["root"])
+        self.assertEqual(proof0["index"], offset)
+        self.assertEqual(proof0["leaf"], "0x" + leaf_hash(wallets[0]).hex())
+        self.assertIn(wallets[0], chain.state["voted"])
+        self.assertNotIn(wallets[3], chain.state["voted"])
+        self.assertIsNone(refused)
+
+        self.assertEqual(second["added"], 2)
+        self.assertEqual(proof1["root"], published["root"])
+        self.assertIsNone(not_yet)
+        self.assertEqual(republished["leaf_count"], offset + 5)
+        self.assertEqual(chain.state["voters_root"].hex(), republished["root"][2:])
+        chain.vote_with_proof(wallets[4], 1, proof_bytes(proof4))
+
+        self.assertEqual(recovered["added"], 0)
+        self.assertEqual(status["leaves_on_disk"], offset + 5)
+        self.assertEqual(proof2["root"], republished["root"])
+        chain.vote_with_proof(wallets[2], 0, proof_bytes(proof2))
+        self.assertEqual(chain.state["total_votes"], 4)
+
+    def test_02_benchmark_reports_build_append_and_proofs(self):
+        from benchmarks.merkle import run_merkle_benchmark
+
+        results = run_merkle_benchmark(leaves=3000, batch=10, batches=5, proofs=50)
+
+        self.assertEqual(results["build"]["leaves"], 3000)
+        self.assertGreater(results["build"]["leaves_per_second"], 0)
+        self.assertEqual(results["proof"]["verified"], 50)
+        self.assertTrue(results["proof"]["old_root_stable"])
+        self.assertGreaterEqual(results["proof"]["nodes"], 11)
+
+    def test_03_erased_wallets_leave_the_next_root(self):
+        import erasure
+        import jobs
+
+        chain = LocalChain(["Alice", "Bob"], voting_minutes=180)
+        signer = Account.create()
+        chain.set_verification_signer(signer.address)
+        wallet, keeper = (Account.create().address.lower() for _ in range(2))
+        allowlist = Allowlist(tempfile.mkdtemp())
+        rpc = ChainRpc("http://local-chain", transport=chain.transport())
+
+        async def verified(*wallets):
+            async with async_session() as db:
+                db.add_all(VerificationLog(user_id=address, success=True) for address in wallets)
+                db.add(VerificationLog(user_id="not-a-wallet", success=False))  # keeps the newest log id in use
+                await db.commit()
+
+        async def run():
+            await init_db()
+            await verified(wallet, keeper)
+            await allowlist.sync()
+            published = await allowlist.publish(rpc, signer, chain.address)
+            before = await allowlist.proof(wallet)
+
+            job = await jobs.create_job(erasure.ERASE_KIND, {"user_ids": [wallet]}, total=1)
+            await jobs.run_job(job["id"])
+            erased = await allowlist.proof(wallet)
+
+            compacted = await allowlist.sync()
+            with self.assertRaises(AllowlistError):
+                await allowlist.proof(keeper)  # the new root is not published yet
+            republished = await allowlist.publish(rpc, signer, chain.address)
+            kept = await allowlist.proof(keeper)
+
+            await verified(wallet)
+            again = await allowlist.sync()
+            return published, before, erased, compacted, republished, kept, again
+
+        published, before, erased, compacted, republished, kept, again = asyncio.run(run())
+        self.assertIsNotNone(before)
+        self.assertIsNone(erased)
+        self.assertEqual(compacted["removed"], 1)
+        self.assertEqual(republished["leaf_count"], published["leaf_count"] - 1)
+        self.assertNotEqual(republished["root"], published["root"])
+
+        # The proof handed out before the erase no longer admits the wallet on chain
+        with self.assertRaises(Revert):
+            chain.vote_with_proof(wallet, 0, proof_bytes(before))
+        self.assertEqual(kept["root"], republished["root"])
+        chain.vote_with_proof(keeper, 1, proof_bytes(kept))
+
+        # Verified again, the wallet comes back as a new leaf
+        self.assertEqual(again["added"], 1)
+        self.assertEqual(again["leaf_count"], published["leaf_count"])
+
+    def test_04_contract_test_fixture_matches_the_builder(self):
+        # test/Voting.js checks these proofs against Voting.sol
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test", "fixtures", "allowlist-odd.json")
+        with open(path) as f:
+            fixture = json.load(f)
+        addresses = list(fixture["proofs"])
+        store = MerkleStore(tempfile.mkdtemp())
+        store.append_addresses(addresses)
+
+        self.assertEqual(fixture["leafCount"] % 2, 1)
+        self.assertEqual("0x" + store.root(len(addresses)).hex(), fixture["root"])
+        for i, address in enumerate(addresses):
+            self.assertEqual(["0x" + node.hex() for node in store.proof(i, len(addresses))], fixture["proofs"][address])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import unittest
+
+from config import settings
+from conftest import asgi_client
+from pipeline import Stage, StageFull
+
+
+class TestStage(unittest.TestCase):
+    def test_01_bounded_queue_sheds_and_utilization_tracks_busy_threads(self):
+        stage = Stage("test", workers=1, queue_size=1, window_seconds=60.0)
+        release = threading.Event()
+
+        def work(value):
+            release.wait(5)
+            return value
+
+        async def run():
+            running = asyncio.ensure_future(stage.run(work, 1))
+            await asyncio.sleep(0.05)
+            waiting = asyncio.ensure_future(stage.run(work, 2))
+            await asyncio.sleep(0.01)
+            with self.assertRaises(StageFull) as shed:
+                await stage.run(work, 3)
+            busy = stage.stats()
+            await asyncio.sleep(0.1)
+            release.set()
+            return busy, await asyncio.gather(running, waiting), shed.exception
+
+        try:
+            busy, results, shed = asyncio.run(run())
+        finally:
+            release.set()
+            stage.shutdown()
+
+        self.assertEqual(results, [1, 2])
+        self.assertEqual(shed.status_code, 503)
+        self.assertEqual((busy["active"], busy["queued"], busy["rejected"]), (1, 1, 1))
+        stats = stage.stats()
+        self.assertEqual((stats["completed"], stats["queued"], stats["active"], stats["peak_queued"]), (2, 0, 0, 1))
+        self.assertGreater(stats["utilization"], 0.7)
+        self.assertGreater(stats["wait_p50_ms"], 50.0)
+
+
+class TestStagedEndpoints(unittest.TestCase):
+    def test_01_verify_and_enroll_report_every_stage(self):
+        from benchmarks.load_test import load_app
+        from benchmarks.synthetic import build_image_set
+
+        user_id = "0x" + "5a" * 20
+        image = build_image_set(1)[0]
+        headers = {"X-Admin-Key": "secret"}
+
+        async def run():
+            app = await load_app(stub_analyzer=True)
+            settings.admin_api_key = "secret"
+            async with asgi_client(app) as client:
+                before = (await client.get("/admin/metrics", headers=headers)).json()["pipeline"]
+                enrolled = await client.post("/enroll", json={"user_id": user_id, "image": image})
+                verified = await client.post("/verify", json={"user_id": user_id, "image": image, "skip_liveness": True})
+                after = (await client.get("/admin/metrics", headers=headers)).json()["pipeline"]
+            return enrolled, verified, before, after
+
+        try:
+            enrolled, verified, before, after = asyncio.run(run())
+        finally:
+            settings.admin_api_key = ""
+
+        self.assertEqual(enrolled.status_code, 200, enrolled.text)
+        body = verified.json()
+        self.assertTrue(body["verified"], body)
+        self.assertTrue(body["token"])
+        self.assertTrue(body["signature"].startswith("0x"))
+        self.assertEqual(list(after), ["decode", "infer", "score", "persist"])
+        # enroll + verify each decode, infer and score once; only the verified request signs
+        completed = {name: after[name]["completed"] - before[name]["completed"] for name in after}
+        self.assertEqual(completed, {"decode": 2, "infer": 2, "score": 2, "persist": 1})
+        self.assertGreaterEqual(after["infer"]["workers"], 1)
+
+    def test_02_benchmark_compares_worker_allocations(self):
+        from benchmarks.stages import format_stage_results, run_stage_benchmark
+        from benchmarks.synthetic import build_image_set
+
+        results = asyncio.run(run_stage_benchmark(
+            build_image_set(2), requests=12, concurrency=4, allocations=("1,1,1,1", "1,2,1,1"), stub_latency_ms=5.0,
+        ))
+
+        self.assertEqual(list(results), ["1,1,1,1", "1,2,1,1"])
+        for spec, row in results.items():
+            self.assertEqual(row["verify"]["errors"], 0)
+            self.assertEqual(row["stages"]["infer"]["completed"], 12)
+            self.assertGreater(row["stages"]["infer"]["utilization"], row["stages"]["score"]["utilization"])
+        self.assertEqual(results["1,2,1,1"]["stages"]["infer"]["workers"], 2)
+        self.assertIn("infer util/wait", format_stage_results(results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import asyncio
+import tempfile
+import time
+import unittest
+
+from fastapi import FastAPI
+
+import profiling
+from config import settings
+from conftest import asgi_client
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.saved = (settings.profiling_sample_rate, settings.profiling_slow_threshold_ms, profiling.store)
+        profiling.store = profiling.ProfileStore(tempfile.mkdtemp(), max_profiles=3)
+
+        app = FastAPI()
+
+        @app.get("/fast")
+        async def fast():
+            return {}
+
+        @app.get("/slow")
+        async def slow():
+            busy_wait(0.05)
+            return {}
+
+        app.add_middleware(profiling.ProfilingMiddleware)
+        self.app = app
+
+    def tearDown(self):
+        settings.profiling_sample_rate, settings.profiling_slow_threshold_ms, profiling.store = self.saved
+
+    def request(self, *paths):
+        async def run():
+            async with asgi_client(self.app) as client:
+                for path in paths:
+                    await client.get(path)
+        asyncio.run(run())
+
+    def test_01_slow_threshold_keeps_only_slow_requests(self):
+        settings.profiling_sample_rate = 0.0
+        settings.profiling_slow_threshold_ms = 30.0
+
+        self.request("/fast", "/slow")
+
+        profiles = profiling.store.list()
+        self.assertEqual([p["path"] for p in profiles], ["/slow"])
+        self.assertEqual(profiles[0]["reason"], "slow")
+
+        with open(profiling.store.path_for(profiles[0]["id"])) as f:
+            record = f.read()
+        self.assertIn("busy_wait", record)
+
+    def test_02_ring_rotates(self):
+        settings.profiling_sample_rate = 1.0
+        settings.profiling_slow_threshold_ms = 0.0
+
+        self.request(*["/fast"] * 5)
+
+        self.assertEqual(len(profiling.store.list()), 3)
+
+    def test_03_path_for_rejects_traversal(self):
+        self.assertIsNone(profiling.store.path_for("../config"))
+
+    def test_04_admin_endpoints_require_key(self):
+        import main
+
+        async def run():
+            async with asgi_client(main.app) as client:
+                disabled = await client.get("/admin/profiles")
+                settings.admin_api_key = "secret"
+                try:
+                    wrong = await client.get("/admin/profiles", headers={"X-Admin-Key": "nope"})
+                    ok = await client.get("/admin/profiles", headers={"X-Admin-Key": "secret"})
+                finally:
+                    settings.admin_api_key = ""
+                return disabled, wrong, ok
+
+        disabled, wrong, ok = asyncio.run(run())
+        self.assertEqual(disabled.status_code, 403)
+        self.assertEqual(wrong.status_code, 401)
+        self.assertEqual(ok.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import asyncio
+import unittest
+
+import numpy as np
+from sqlalchemy import event
+
+import repository
+from database import async_session, engine, init_db
+from models import decrypt_embedding, encrypt_embedding
+
+
+class TestRepository(unittest.TestCase):
+    def test_01_projected_queries_and_bulk_variants(self):
+        ids = [f"0xrepo{i:036x}" for i in range(3)]
+        embedding = np.arange(512, dtype=np.float32)
+        statements = []
+
+        def capture(conn, cursor, statement, *args):
+            statements.append(" ".join(statement.split()))
+
+        async def run():
+            await init_db()
+            async with async_session() as db:
+                first = [await repository.save_embedding(db, user_id, encrypt_embedding(embedding)) for user_id in ids]
+                await db.commit()
+                again = await repository.save_embedding(db, ids[0], encrypt_embedding(embedding * 2))
+                await db.commit()
+
+            event.listen(engine.sync_engine, "before_cursor_execute", capture)
+            try:
+                async with async_session() as db:
+                    enrollments = await repository.get_enrollments(db, ids + ["0xmissing"])
+                    status_sql = statements[-1]
+                    blob = await repository.get_embedding_blob(db, ids[0])
+                    verify_sql = statements[-1]
+                    blobs = await repository.get_embedding_blobs(db, ids)
+                    deleted = await repository.delete_users(db, ids[1:] + ["0xmissing"])
+                    delete_sql = statements[-1]
+                    missing = await repository.delete_user(db, "0xmissing")
+                    await db.commit()
+                    remaining = await repository.get_enrollments(db, ids)
+            finally:
+                event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+            return first, again, enrollments, status_sql, blob, verify_sql, blobs, deleted, delete_sql, missing, remaining
+
+        (first, again, enrollments, status_sql, blob, verify_sql,
+         blobs, deleted, delete_sql, missing, remaining) = asyncio.run(run())
+
+        self.assertEqual(first, [False, False, False])
+        self.assertTrue(again)
+
+        self.assertEqual(sorted(enrollments), sorted(ids))
+        self.assertIsNotNone(enrollments[ids[0]].created_at)
+        self.assertTrue(status_sql.startswith("SELECT users.id, users.created_at FROM users"))
+
+        self.assertTrue(verify_sql.startswith("SELECT users.embedding FROM users"))
+        np.testing.assert_array_equal(decrypt_embedding(blob), embedding * 2)
+        self.assertEqual(len(blobs), 3)
+
+        self.assertEqual(deleted, {ids[1]: True, ids[2]: True})
+        self.assertTrue(delete_sql.startswith("DELETE FROM users WHERE"))
+        self.assertIsNone(missing)
+        self.assertEqual(list(remaining), [ids[0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import base64
+import json
+import os
+import random
+import unittest
+
+import request_body
+from conftest import asgi_client
+from request_body import ImagePayloadParser, PayloadError
+
+
+def parse(body: bytes, chunk_sizes=None):
+    parser = ImagePayloadParser(size_hint=len(body))
+    pos = 0
+    rng = random.Random(7)
+    while pos < len(body):
+        size = rng.choice(chunk_sizes) if chunk_sizes else len(body)
+        parser.feed(body[pos:pos + size])
+        pos += size
+    return parser.close()
+
+
+class TestImagePayloadParser(unittest.TestCase):
+    def setUp(self):
+        self.raw = os.urandom(30000)
+        self.b64 = base64.b64encode(self.raw).decode()
+
+    def test_01_matches_json_and_b64decode_for_any_chunking(self):
+        body = json.dumps({
+            "user_id": "0xABCé",
+            "image": "data:image/jpeg;base64," + self.b64,
+            "skip_liveness": True,
+            "extra": None,
+        }).encode()
+
+        for chunks in (None, [1, 2, 3, 5], [4096, 65536]):
+            fields, image = parse(body, chunks)
+            self.assertEqual(bytes(image), self.raw)
+            self.assertEqual(fields, {"user_id": "0xABCé", "skip_liveness": True, "extra": None})
+
+    def test_02_raw_base64_and_json_escapes(self):
+        escaped = self.b64.replace("/", "\\/")
+        escaped = escaped[:100] + "\\n" + escaped[100:]
+        body = ('{"image": "' + escaped + '", "user_id": "abc"}').encode()
+
+        fields, image = parse(body, [1, 7, 64])
+        self.assertEqual(bytes(image), self.raw)
+        self.assertEqual(fields["user_id"], "abc")
+
+    def test_03_rejects_malformed_bodies(self):
+        for body in (b'[1, 2]', b'{"user_id": "abc",}', b'{"image": {"a": 1}}', b'{"user_id": "abc"'):
+            with self.assertRaises(PayloadError):
+                parse(body)
+
+    def test_04_enforces_image_limit(self):
+        parser = ImagePayloadParser(max_image_bytes=1000)
+        with self.assertRaises(PayloadError) as ctx:
+            parser.feed(('{"image": "' + self.b64 + '"}').encode())
+        self.assertEqual(ctx.exception.status_code, 413)
+
+    def test_05_filtering_path_without_strict_mode(self):
+        # What Python < 3.11 runs: no strict_mode, every chunk is filtered before decoding
+        saved, request_body.STRICT_BASE64 = request_body.STRICT_BASE64, False
+        try:
+            wrapped = "\\n".join(self.b64[i:i + 76] for i in range(0, len(self.b64), 76))
+            for encoded in (self.b64, wrapped):
+                fields, image = parse(('{"image": "' + encoded + '", "user_id": "abc"}').encode(), [1, 7, 64, 4096])
+                self.assertEqual(bytes(image), self.raw)
+            with self.assertRaises(PayloadError):
+                parse(b'{"image": "abcde"}')
+        finally:
+            request_body.STRICT_BASE64 = saved
+
+
+class TestStreamingEndpoints(unittest.TestCase):
+    def post(self, path, **kwargs):
+        from benchmarks.load_test import load_app
+
+        async def run():
+            app = await load_app(stub_analyzer=True)
+            async with asgi_client(app) as client:
+                return await client.post(path, **kwargs)
+        return asyncio.run(run())
+
+    def test_01_oversized_content_length_is_rejected_before_reading(self):
+        from config import settings
+
+        body = b'{"user_id": "abc", "image": "' + b"A" * 2000 + b'"}'
+        original = settings.max_request_body_bytes
+        settings.max_request_body_bytes = 1000
+        try:
+            response = self.post("/enroll", content=body, headers={"Content-Type": "application/json"})
+        finally:
+            settings.max_request_body_bytes = original
+        self.assertEqual(response.status_code, 413)
+
+    def test_02_validation_errors_keep_fastapi_shape(self):
+        response = self.post("/verify", json={"user_id": "ab", "image": "QUJD"})
+        self.assertEqual(response.status_code, 422)
+        locations = [tuple(err["loc"]) for err in response.json()["detail"]]
+        self.assertIn(("body", "user_id"), locations)
+        self.assertIn(("body", "image"), locations)
+
+    def test_03_enroll_with_streamed_body(self):
+        from benchmarks.synthetic import build_image_set
+
+        response = self.post("/enroll", json={"user_id": "0x" + "d" * 40, "image": build_image_set(1)[0]})
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertTrue(response.json()["success"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, inspect, select
+
+import retention
+from config import settings
+from database import async_session, engine, init_db
+from models import AllowlistRoot, VerificationLog
+
+# Far in the past, so rows written by other test modules never fall in range
+DAY = datetime(2020, 1, 1)
+
+
+class TestLogRetention(unittest.TestCase):
+    def test_01_classify_failure(self):
+        self.assertEqual(
+            retention.classify_failure("Liveness failed: Failed checks: image_blurry, face_size"),
+            ("liveness", ["image_blurry", "face_size"])
+        )
+        self.assertEqual(retention.classify_failure("Similarity 40.00% below threshold"), ("below_threshold", []))
+
+    def test_02_rollup_then_purge(self):
+        async def run():
+            await init_db()
+            async with async_session() as db:
+                for hour, count in ((1, 3), (2, 2), (30, 1)):
+                    for i in range(count):
+                        db.add(VerificationLog(
+                            user_id="retention-user",
+                            timestamp=DAY + timedelta(hours=hour, minutes=i),
+                            success=i == 0,
+                            similarity_score=0.95 if i == 0 else 0.35,
+                            liveness_passed=i != 1,
+                            failure_reason=None if i == 0 else (
+                                "Liveness failed: Failed checks: image_blurry" if i == 1 else "Similarity 35.00% below threshold"
+                            ),
+                        ))
+                await db.commit()
+
+            original = settings.log_retention_days
+            settings.log_retention_days = 1
+            try:
+                summary = await retention.run_log_compaction(now=DAY + timedelta(days=2))
+            finally:
+                settings.log_retention_days = original
+
+            rows = await retention.get_hourly_aggregates(DAY, DAY + timedelta(days=2))
+            async with async_session() as db:
+                remaining = await db.scalar(
+                    select(func.count()).select_from(VerificationLog).where(VerificationLog.user_id == "retention-user")
+                )
+            async with engine.connect() as conn:
+                indexes = await conn.run_sync(lambda c: inspect(c).get_indexes("verification_logs"))
+            return summary, rows, remaining, indexes
+
+        summary, rows, remaining, indexes = asyncio.run(run())
+
+        self.assertEqual(summary["hours_aggregated"], 3)
+        self.assertEqual([r["attempts"] for r in rows], [3, 2, 1])
+        first = rows[0]
+        self.assertEqual(first["successes"], 1)
+        self.assertEqual(first["liveness_failures"], 1)
+        self.assertEqual(first["similarity_histogram"][9], 1)
+        self.assertEqual(first["failure_reasons"], {"liveness": 1, "below_threshold": 1})
+        self.assertEqual(first["liveness_reasons"], {"image_blurry": 1})
+
+        # Hours 1 and 2 are past retention; hour 30 is the watermark and is kept
+        self.assertEqual(summary["raw_rows_deleted"], 5)
+        self.assertEqual(remaining, 1)
+        self.assertIn(["timestamp"], [index["column_names"] for index in indexes])
+
+        totals = retention.summarize_aggregates(rows)
+        self.assertEqual(totals["attempts"], 6)
+
+    def test_03_purge_keeps_logs_the_allowlist_has_not_scanned(self):
+        user_id = "retention-allowlist"
+
+        async def run():
+            await init_db()
+            async with async_session() as db:
+                logs = [
+                    VerificationLog(user_id=user_id, timestamp=DAY + timedelta(hours=hour, minutes=i), success=True)
+                    for hour, i in ((40, 0), (40, 1), (41, 0), (70, 0))
+                ]
+                db.add_all(logs)
+                await db.flush()
+                cursor = AllowlistRoot(leaf_count=0, log_cursor=logs[0].id)
+                db.add(cursor)
+                await db.commit()
+
+            saved = settings.log_retention_days, settings.allowlist_enabled
+            settings.log_retention_days, settings.allowlist_enabled = 1, True
+            try:
+                await retention.run_log_compaction(now=DAY + timedelta(days=5))
+            finally:
+                settings.log_retention_days, settings.allowlist_enabled = saved
+                async with async_session() as db:
+                    await db.delete(await db.get(AllowlistRoot, cursor.id))
+                    await db.commit()
+
+            async with async_session() as db:
+                return (await db.execute(
+                    select(VerificationLog.id).where(VerificationLog.user_id == user_id).order_by(VerificationLog.id)
+                )).scalars().all(), [log.id for log in logs]
+
+        remaining, ids = asyncio.run(run())
+        # Only the row at or before the allowlist cursor went; the rest wait for the next build
+        self.assertEqual(remaining, ids[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import asyncio
+import time
+import unittest
+from collections import Counter
+
+import httpx
+
+import sharding
+from conftest import asgi_client
+from sharding import HashRing, parse_nodes
+
+USERS = [f"0x{i:040x}" for i in range(0x5100, 0x5100 + 24)]
+
+
+class TestHashRing(unittest.TestCase):
+    def test_01_balance_and_minimal_movement(self):
+        ids = [f"0x{i:040x}" for i in range(3000)]
+        before = HashRing({"a": "", "b": "", "c": ""}, vnodes=128)
+        after = HashRing({"a": "", "b": "", "c": "", "d": ""}, vnodes=128)
+
+        shares = Counter(before.owner(user_id) for user_id in ids)
+        for node in "abc":
+            self.assertGreater(shares[node] / len(ids), 0.25)
+            self.assertLess(shares[node] / len(ids), 0.42)
+
+        moved = [user_id for user_id in ids if before.owner(user_id) != after.owner(user_id)]
+        self.assertTrue(all(after.owner(user_id) == "d" for user_id in moved))
+        self.assertGreater(len(moved) / len(ids), 0.15)
+        self.assertLess(len(moved) / len(ids), 0.35)
+
+    def test_02_parse_nodes(self):
+        self.assertEqual(parse_nodes(" a=http://x:1/ , b=http://y:2"), {"a": "http://x:1", "b": "http://y:2"})
+        self.assertEqual(parse_nodes(""), {})
+        with self.assertRaises(ValueError):
+            parse_nodes("a")
+
+
+class TestShardRouting(unittest.TestCase):
+    def test_01_redirect_to_owner(self):
+        from benchmarks.load_test import load_app
+        from benchmarks.synthetic import build_image_set
+
+        from config import settings
+
+        router = sharding.router
+        saved = router.node_id, router.mode, router.ring.nodes, router.previous, settings.admin_api_key
+        router.node_id, router.mode, settings.admin_api_key = "a", sharding.REDIRECT, "secret"
+        router.configure({"a": "http://node-a", "b": "http://node-b:8000"})
+        remote = next(user_id for user_id in USERS if router.ring.owner(user_id) == "b")
+        image = build_image_set(1)[0]
+
+        async def run():
+            app = await load_app(stub_analyzer=True)
+            async with asgi_client(app) as client:
+                verify = await client.post("/verify", json={"user_id": remote, "image": image})
+                status = await client.get(f"/status/{remote.upper().replace('0X', '0x')}")
+                path = f"/status/{remote}"
+                peer = await client.get(path, headers=sharding.peer_headers("b", "GET", path))
+                unsigned = await client.get(path, headers={sharding.FORWARDED_HEADER: "b"})
+                wrong_key = await client.get(path, headers=sharding.peer_headers("b", "GET", path, key="guess"))
+                stranger = await client.get(path, headers=sharding.peer_headers("x", "GET", path))
+            return verify, status, peer, unsigned, wrong_key, stranger
+
+        try:
+            verify, status, peer, unsigned, wrong_key, stranger = asyncio.run(run())
+        finally:
+            router.node_id, router.mode, settings.admin_api_key = saved[0], saved[1], saved[4]
+            router.configure(saved[2], saved[3].nodes if saved[3] else None)
+
+        self.assertEqual(verify.status_code, 307)
+        self.assertEqual(verify.headers["location"], "http://node-b:8000/verify")
+        self.assertEqual(status.status_code, 307)
+        self.assertTrue(status.headers["location"].startswith("http://node-b:8000/status/"))
+        # Requests from a peer are always served locally; a bare or forged X-Shard-Node is ignored
+        self.assertEqual(peer.status_code, 200)
+        self.assertFalse(peer.json()["enrolled"])
+        self.assertEqual([r.status_code for r in (unsigned, wrong_key, stranger)], [307, 307, 307])
+
+    def test_02_forwarded_for_is_trusted_from_peers_only(self):
+        from starlette.requests import Request
+
+        from config import settings
+
+        router = sharding.ShardRouter("a", {"a": "http://node-a", "b": "http://node-b"})
+        saved, settings.admin_api_key = settings.admin_api_key, "secret"
+
+        def request(headers):
+            headers = dict(headers, **{"X-Forwarded-For": "198.51.100.9, 203.0.113.7"})
+            return Request({
+                "type": "http", "method": "POST", "path": "/verify", "query_string": b"",
+                "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+                "client": ("10.0.0.2", 4000),
+            })
+
+        try:
+            peer = router.client_address(request(sharding.peer_headers("b", "POST", "/verify")))
+            client = router.client_address(request({}))
+            forged = router.client_address(request({sharding.FORWARDED_HEADER: "b"}))
+            other_path = router.client_address(request(sharding.peer_headers("b", "POST", "/enroll")))
+        finally:
+            settings.admin_api_key = saved
+
+        self.assertEqual(peer, "203.0.113.7")  # the address peer b saw
+        self.assertEqual([client, forged, other_path], ["10.0.0.2"] * 3)
+
+
+class TestLocalCluster(unittest.TestCase):
+    def test_01_route_join_and_rebalance(self):
+        from benchmarks.shard_cluster import LocalCluster
+        from benchmarks.synthetic import build_image_set
+
+        cluster = LocalCluster()
+        old = {"a": cluster.free_url(), "b": cluster.free_url()}
+        new = dict(old, c=cluster.free_url())
+        old_ring, new_ring = HashRing(old), HashRing(new)
+        images = dict(zip(USERS, build_image_set(len(USERS))))
+        headers = cluster.admin_headers()
+
+        def peer_headers(method, path):
+            return sharding.peer_headers("a", method, path, key=cluster.admin_key)
+
+        def verify(client, url, user_id):
+            return client.post(f"{url}/verify", json={"user_id": user_id, "image": images[user_id], "skip_liveness": True})
+
+        def local_users(client, node):
+            # X-Shard-Node makes the node answer from its own database
+            response = client.post(
+                f"{new[node]}/status/batch", json={"user_ids": USERS}, headers=peer_headers("POST", "/status/batch")
+            )
+            return {result["user_id"] for result in response.json()["results"] if result["enrolled"]}
+
+        try:
+            cluster.start(old)
+            with httpx.Client(timeout=30) as client:
+                # Everything goes through node a; b's users are proxied to b
+                for user_id in USERS:
+                    response = client.post(f"{old['a']}/enroll", json={"user_id": user_id, "image": images[user_id]})
+                    self.assertEqual(response.status_code, 200, response.text)
+                self.assertEqual(local_users(client, "b"), {u for u in USERS if old_ring.owner(u) == "b"})
+                via_b = [verify(client, old["b"], user_id).json()["verified"] for user_id in USERS[:6]]
+                batch = client.post(f"{old['b']}/status/batch", json={"user_ids": USERS}).json()
+
+                # Node c joins; a and b learn the new map but have not moved anything yet
+                cluster.start(new, previous=old, only=["c"])
+                moving = [user_id for user_id in USERS if new_ring.owner(user_id) == "c"]
+                for node in ("a", "b"):
+                    response = client.post(
+                        f"{new[node]}/admin/shard/ring",
+                        json={"nodes": new, "previous": old, "rebalance": False}, headers=headers,
+                    )
+                    self.assertEqual(response.status_code, 200, response.text)
+                pulled = verify(client, new["a"], moving[0])
+
+                rebalance = {
+                    node: client.post(f"{new[node]}/admin/shard/ring", json={"nodes": new, "previous": old},
+                                      headers=headers).json()["job"]["id"]
+                    for node in ("a", "b")
+                }
+                for node, job_id in rebalance.items():
+                    deadline = time.monotonic() + 30
+                    while True:
+                        job = client.get(f"{new[node]}/admin/jobs/{job_id}", headers=headers).json()
+                        if job["status"] in ("completed", "failed") or time.monotonic() > deadline:
+                            break
+                        time.sleep(0.1)
+                    self.assertEqual(job["status"], "completed", job)
+
+                placement = {node: local_users(client, node) for node in new}
+                after = [verify(client, new["b"], user_id).json()["verified"] for user_id in USERS]
+                deleted = client.delete(f"{new['a']}/user/{moving[-1]}")
+                path = f"/status/{moving[-1]}"
+                gone = client.get(new["c"] + path, headers=peer_headers("GET", path))
+                shard = client.get(f"{new['c']}/admin/shard", headers=headers).json()
+        finally:
+            cluster.stop()
+
+        self.assertEqual(via_b, [True] * 6)
+        self.assertEqual(batch["enrolled_count"], len(USERS))
+        self.assertEqual([r["user_id"] for r in batch["results"]], USERS)
+
+        self.assertTrue(moving)
+        self.assertEqual(pulled.status_code, 200, pulled.text)
+        self.assertTrue(pulled.json()["verified"])
+
+        for node in new:
+            self.assertEqual(placement[node], {u for u in USERS if new_ring.owner(u) == node}, node)
+        self.assertEqual(after, [True] * len(USERS))
+        self.assertEqual(deleted.status_code, 200)
+        self.assertFalse(gone.json()["enrolled"])
+        self.assertGreaterEqual(shard["pulled"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import static_assets
+from conftest import asgi_client
+
+
+class TestStaticAssets(unittest.TestCase):
+    def setUp(self):
+        self.saved = static_assets.assets
+        self.dist_dir = tempfile.mkdtemp()
+        static_assets.assets = static_assets.StaticAssets(dist_dir=self.dist_dir)
+
+    def tearDown(self):
+        static_assets.assets = self.saved
+
+    def test_01_accepted_codings(self):
+        self.assertEqual(static_assets._accepted_codings("gzip, deflate, br;q=0.8"), {"gzip", "deflate", "br"})
+        self.assertEqual(static_assets._accepted_codings("br;q=0, *"), {"*", "gzip"})
+        self.assertEqual(static_assets._accepted_codings(None), set())
+
+    def test_02_allowlist_compression_and_caching(self):
+        from benchmarks.load_test import load_app
+
+        with open(os.path.join(static_assets.BASE_DIR, "enroll.html"), "rb") as f:
+            source = f.read()
+        with open(os.path.join(static_assets.BASE_DIR, "enroll.js"), "rb") as f:
+            script_source = f.read()
+
+        async def run():
+            app = await load_app(stub_analyzer=True)
+            async with asgi_client(app) as client:
+                blocked = [
+                    (await client.get(f"/static/{name}")).status_code
+                    for name in ("face_data.db", "main.py", ".env.example", "..%2Fmain.py")
+                ]
+                page = await client.get("/enroll.html", headers={"Accept-Encoding": "gzip"})
+                plain = await client.get("/static/enroll.html", headers={"Accept-Encoding": "identity"})
+                revalidated = await client.get(
+                    "/enroll.html", headers={"Accept-Encoding": "gzip", "If-None-Match": page.headers["etag"]}
+                )
+                changed_coding = await client.get(
+                    "/enroll.html", headers={"Accept-Encoding": "identity", "If-None-Match": page.headers["etag"]}
+                )
+                url = static_assets.assets.url("enroll.html")
+                fingerprinted = await client.get(url, headers={"Accept-Encoding": "gzip"})
+                head = await client.head(url, headers={"Accept-Encoding": "identity"})
+                urls = {name: static_assets.assets.url(name) for name in ("enroll.css", "enroll.js")}
+                script = await client.get(urls["enroll.js"], headers={"Accept-Encoding": "gzip"})
+            return blocked, page, plain, revalidated, changed_coding, url, fingerprinted, head, urls, script
+
+        (blocked, page, plain, revalidated, changed_coding, url, fingerprinted, head, urls,
+         script) = asyncio.run(run())
+        # What the page is served as: its references point at the fingerprinted stylesheet and script
+        linked = source.replace(b'"/static/enroll.css"', f'"{urls["enroll.css"]}"'.encode())
+        linked = linked.replace(b'"/static/enroll.js"', f'"{urls["enroll.js"]}"'.encode())
+
+        self.assertEqual(blocked, [404, 404, 404, 404])
+
+        self.assertEqual(page.status_code, 200)
+        self.assertEqual(page.headers["content-encoding"], "gzip")
+        self.assertLess(int(page.headers["content-length"]), len(source))
+        self.assertEqual(page.content, linked)
+        self.assertEqual(page.headers["cache-control"], "no-cache")
+        self.assertIn("Accept-Encoding", page.headers["vary"])
+        self.assertTrue(page.headers["content-type"].startswith("text/html"))
+
+        self.assertNotIn("content-encoding", plain.headers)
+        self.assertEqual(plain.content, linked)
+        self.assertNotEqual(plain.headers["etag"], page.headers["etag"])
+
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b"")
+        self.assertEqual(changed_coding.status_code, 200)
+
+        self.assertRegex(url, r"^/static/enroll\.[0-9a-f]{16}\.html$")
+        self.assertEqual(fingerprinted.headers["cache-control"], static_assets.IMMUTABLE)
+        self.assertEqual(fingerprinted.content, linked)
+        self.assertEqual(head.status_code, 200)
+        self.assertEqual(int(head.headers["content-length"]), len(linked))
+        self.assertEqual(head.content, b"")
+
+        self.assertRegex(urls["enroll.css"], r"^/static/enroll\.[0-9a-f]{16}\.css$")
+        self.assertNotEqual(linked, source)
+        self.assertEqual(script.headers["cache-control"], static_assets.IMMUTABLE)
+        self.assertEqual(script.headers["content-encoding"], "gzip")
+        self.assertTrue(script.headers["content-type"].startswith("text/javascript"))
+        self.assertEqual(script.content, script_source)
+
+    def test_03_rebuild_prunes_stale_fingerprints(self):
+        source_dir = tempfile.mkdtemp()
+        sources = {
+            "enroll.css": "body { color: #111; }\n" * 40,
+            "enroll.js": "console.log('v1');\n" * 40,
+            "enroll.html": '<html><link rel="stylesheet" href="/static/enroll.css">' + "v1 " * 200 + "</html>",
+        }
+        for name, text in sources.items():
+            with open(os.path.join(source_dir, name), "w") as f:
+                f.write(text)
+        assets = static_assets.StaticAssets(source_dir=source_dir, dist_dir=self.dist_dir)
+        first = assets.load()
+
+        # Only the stylesheet changes; the page referencing it gets a new fingerprint as well
+        with open(os.path.join(source_dir, "enroll.css"), "w") as f:
+            f.write("body { color: #222; }\n" * 40)
+        second = assets.load()
+
+        self.assertNotEqual(first["enroll.css"], second["enroll.css"])
+        self.assertNotEqual(first["enroll.html"], second["enroll.html"])
+        self.assertEqual(first["enroll.js"], second["enroll.js"])
+        with open(os.path.join(self.dist_dir, second["enroll.html"])) as f:
+            self.assertIn(f'href="/static/{second["enroll.css"]}"', f.read())
+        suffixes = ["", ".gz"] + ([".br"] if static_assets.brotli else [])
+        self.assertEqual(sorted(os.listdir(self.dist_dir)), sorted(
+            built + suffix for built in second.values() for suffix in suffixes
+        ))
+    def test_04_writes_go_through_a_temp_file_of_their_own(self):
+        path = os.path.join(self.dist_dir, "enroll.0123456789abcdef.js")
+        # Another worker building the same file, part way through its temp file
+        theirs = f"{path}.tmp"
+        with open(theirs, "wb") as f:
+            f.write(b"partial")
+
+        static_assets._write_atomic(path, b"ours")
+
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"ours")
+        with open(theirs, "rb") as f:
+            self.assertEqual(f.read(), b"partial")
+        self.assertEqual(sorted(os.listdir(self.dist_dir)), sorted([os.path.basename(path), os.path.basename(theirs)]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+
+from sqlalchemy import event
+
+from conftest import asgi_client
+from enrollment_filter import CountingBloomFilter
+
+
+class TestCountingBloomFilter(unittest.TestCase):
+    def test_01_no_false_negatives_and_removal(self):
+        bloom = CountingBloomFilter(capacity=1000, error_rate=0.01)
+        ids = [f"0x{i:040x}" for i in range(1000)]
+        for user_id in ids:
+            bloom.add(user_id)
+
+        self.assertTrue(all(user_id in bloom for user_id in ids))
+        false_positives = sum(f"0xff{i:038x}" in bloom for i in range(5000))
+        self.assertLess(false_positives / 5000, 0.03)
+
+        bloom.remove(ids[0])
+        self.assertNotIn(ids[0], bloom)
+        self.assertIn(ids[1], bloom)
+        self.assertEqual(bloom.count, 999)
+
+
+class TestStatusBatchEndpoint(unittest.TestCase):
+    def test_01_batch_status_and_filter_short_circuit(self):
+        from benchmarks.load_test import load_app
+        from benchmarks.synthetic import build_image_set
+        from database import engine
+        from enrollment_filter import enrolled_filter
+
+        enrolled = ["0x" + "e" * 40, "0x" + "f" * 40]
+        unknown = "0x" + "0" * 39 + "9"
+        elsewhere = "0x" + "0" * 39 + "8"
+        statements = []
+
+        def count_statement(conn, cursor, statement, *args):
+            if "FROM users" in statement:
+                statements.append(statement)
+
+        async def run():
+            app = await load_app(stub_analyzer=True)
+            async with asgi_client(app) as client:
+                for user_id, image in zip(enrolled, build_image_set(2)):
+                    response = await client.post("/enroll", json={"user_id": user_id, "image": image})
+                    self.assertEqual(response.status_code, 200, response.text)
+                await enrolled_filter.rebuild()
+
+                event.listen(engine.sync_engine, "before_cursor_execute", count_statement)
+                try:
+                    batch = await client.post("/status/batch", json={
+                        "user_ids": [enrolled[0].upper().replace("0X", "0x"), unknown, enrolled[1]]
+                    })
+                    queries_for_batch = len(statements)
+
+                    negative = await client.get(f"/status/{unknown}")
+                    queries_for_negative = len(statements) - queries_for_batch
+                finally:
+                    event.remove(engine.sync_engine, "before_cursor_execute", count_statement)
+
+                # Enrolled through another worker: this worker's filter never saw it
+                import repository
+                from database import async_session
+                async with async_session() as db:
+                    await repository.save_embedding(db, elsewhere, b"blob")
+                    await db.commit()
+                stale = await client.get(f"/status/{elsewhere}")
+                added = await enrolled_filter.catch_up()
+                other_worker = await client.get(f"/status/{elsewhere}")
+
+                await client.delete(f"/user/{enrolled[1]}")
+                after_delete = await client.post("/status/batch", json={"user_ids": enrolled})
+                empty_batch = await client.post("/status/batch", json={"user_ids": []})
+
+            return batch, queries_for_batch, negative, queries_for_negative, stale, added, other_worker, \
+                after_delete, empty_batch
+
+        (batch, queries_for_batch, negative, queries_for_negative, stale, added, other_worker,
+         after_delete, empty_batch) = asyncio.run(run())
+
+        body = batch.json()
+        self.assertEqual([r["enrolled"] for r in body["results"]], [True, False, True])
+        self.assertEqual(body["results"][0]["user_id"], enrolled[0])
+        self.assertIsNotNone(body["results"][0]["enrollment_date"])
+        self.assertEqual(body["enrolled_count"], 2)
+        # One primary-key lookup for the candidates; the unknown id never reaches the DB
+        self.assertEqual(queries_for_batch, 1)
+        self.assertNotIn("embedding,", statements[0])
+
+        self.assertFalse(negative.json()["enrolled"])
+        self.assertEqual(queries_for_negative, 0)
+
+        # Another worker's enroll is missed until the next catch-up
+        self.assertFalse(stale.json()["enrolled"])
+        self.assertEqual(added, 1)
+        self.assertTrue(other_worker.json()["enrolled"])
+
+        self.assertEqual([r["enrolled"] for r in after_delete.json()["results"]], [True, False])
+        self.assertEqual(empty_batch.status_code, 422)
+
+
+if __name__ == '__main__':
+    unittest.main()
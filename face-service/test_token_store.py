@@ -0,0 +1,97 @@
+import asyncio
+import importlib.util
+import unittest
+
+import token_store
+from auth import create_verification_token, verify_token
+from config import settings
+from conftest import asgi_client
+from token_store import MemoryTokenStore
+
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestMemoryTokenStore(unittest.TestCase):
+    def test_01_single_use_and_bucket_expiry(self):
+        clock = FakeClock(1_000_000.0)
+        store = MemoryTokenStore(bucket_seconds=60, clock=clock)
+
+        async def run():
+            first = await store.consume("a", clock.now + 600)
+            again = await store.consume("a", clock.now + 600)
+            other = await store.consume("b", clock.now + 30)
+            expired = await store.consume("c", clock.now - 1)
+            return first, again, other, expired
+
+        self.assertEqual(asyncio.run(run()), (True, False, True, False))
+        self.assertEqual(store.stats()["tracked_ids"], 2)
+
+        # Once b's expiry minute has passed its whole bucket is dropped
+        clock.now += 120
+        self.assertEqual(store.stats(), {"backend": "memory", "buckets": 1, "tracked_ids": 1})
+        clock.now += 600
+        self.assertEqual(store.stats()["tracked_ids"], 0)
+
+    def test_02_tokens_carry_unique_ids(self):
+        first = verify_token(create_verification_token("0x" + "1" * 40, 0.9))
+        second = verify_token(create_verification_token("0x" + "1" * 40, 0.9))
+        self.assertTrue(first["jti"])
+        self.assertNotEqual(first["jti"], second["jti"])
+
+    def test_03_startup_refuses_unshared_single_use(self):
+        self.assertIsInstance(token_store.create_store(single_use=True, workers=1), MemoryTokenStore)
+        self.assertIsInstance(token_store.create_store(single_use=False, workers=4), MemoryTokenStore)
+        with self.assertRaises(RuntimeError):
+            token_store.create_store(single_use=True, workers=4)
+        if importlib.util.find_spec("redis") is None:
+            with self.assertRaises(RuntimeError):
+                token_store.create_store("redis://localhost:6379/0")
+
+
+class TestValidateTokenEndpoint(unittest.TestCase):
+    def test_01_single_use_rejects_replays(self):
+        from benchmarks.load_test import load_app
+
+        saved = settings.single_use_tokens, token_store.store
+        token_store.store = MemoryTokenStore()
+
+        async def run():
+            app = await load_app()
+            statuses = {}
+            async with asgi_client(app) as client:
+                for single_use in (False, True):
+                    settings.single_use_tokens = single_use
+                    headers = {"Authorization": f"Bearer {create_verification_token('0x' + '2' * 40, 0.9)}"}
+                    responses = [await client.post("/validate-token", headers=headers) for _ in range(2)]
+                    statuses[single_use] = [(r.status_code, r.json().get("detail")) for r in responses]
+            return statuses
+
+        try:
+            statuses = asyncio.run(run())
+        finally:
+            settings.single_use_tokens, token_store.store = saved
+
+        self.assertEqual(statuses[False], [(200, None), (200, None)])
+        self.assertEqual(statuses[True], [(200, None), (401, "Token already used")])
+
+    def test_02_benchmark_reports_both_scenarios(self):
+        from benchmarks.tokens import SCENARIOS, run_token_benchmark
+
+        results = asyncio.run(run_token_benchmark(requests=40, concurrency=4, rounds=1))
+
+        for scenario in SCENARIOS:
+            self.assertEqual(results[scenario]["errors"], 0)
+            self.assertGreater(results[scenario]["rps"], 0)
+        self.assertEqual(results["single_use"]["replays_refused"], results["single_use"]["replays_sent"])
+        self.assertEqual(results["store"]["backend"], "memory")
+        self.assertFalse(settings.single_use_tokens)
+
+
+if __name__ == '__main__':
+    unittest.main()
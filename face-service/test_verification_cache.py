@@ -0,0 +1,74 @@
+import asyncio
+import time
+import unittest
+
+from sqlalchemy import func, select
+
+from conftest import asgi_client
+from verification_cache import VerificationCache
+
+
+class TestVerificationCache(unittest.TestCase):
+    def test_01_keys_are_scoped_to_user(self):
+        cache = VerificationCache(ttl_seconds=60, max_entries=10)
+        key_a = cache.make_key("0xaaa", b"frame", False, b"enrolled")
+        key_b = cache.make_key("0xbbb", b"frame", False, b"enrolled")
+        cache.put(key_a, {"similarity": 0.9})
+
+        self.assertEqual(cache.get(key_a)["similarity"], 0.9)
+        self.assertIsNone(cache.get(key_b))
+
+    def test_02_reenrollment_changes_key(self):
+        cache = VerificationCache(ttl_seconds=60, max_entries=10)
+        cache.put(cache.make_key("0xaaa", b"frame", False, b"old"), {"similarity": 0.9})
+        self.assertIsNone(cache.get(cache.make_key("0xaaa", b"frame", False, b"new")))
+
+    def test_03_ttl_and_memory_bound(self):
+        cache = VerificationCache(ttl_seconds=0.05, max_entries=2)
+        keys = [cache.make_key("0xaaa", bytes([i]), False, b"e") for i in range(3)]
+        for key in keys:
+            cache.put(key, {"similarity": 0.5})
+
+        self.assertIsNone(cache.get(keys[0]))  # evicted by the bound
+        self.assertIsNotNone(cache.get(keys[2]))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get(keys[2]))  # expired
+
+    def test_04_resubmitted_frame_skips_inference_but_is_logged(self):
+        from benchmarks.load_test import load_app
+        from benchmarks.synthetic import build_image_set
+        from database import async_session
+        from models import VerificationLog
+
+        image = build_image_set(1)[0]
+        user_id = "0x" + "c" * 40
+
+        async def run():
+            app = await load_app(stub_analyzer=True)
+            import face_processor
+            detector = face_processor._face_analyzer.det_model
+
+            async with asgi_client(app) as client:
+                await client.post("/enroll", json={"user_id": user_id, "image": image})
+                first = await client.post("/verify", json={"user_id": user_id, "image": image})
+                calls_after_first = detector.calls
+                second = await client.post("/verify", json={"user_id": user_id, "image": image})
+
+            async with async_session() as db:
+                logged = await db.scalar(
+                    select(func.count()).select_from(VerificationLog).where(VerificationLog.user_id == user_id)
+                )
+            return first.json(), second.json(), calls_after_first, detector.calls, logged
+
+        first, second, calls_after_first, calls_total, logged = asyncio.run(run())
+
+        self.assertTrue(first["verified"])
+        self.assertTrue(second["verified"])
+        self.assertEqual(first["similarity_score"], second["similarity_score"])
+        self.assertIsNotNone(second["token"])
+        self.assertEqual(calls_after_first, calls_total)
+        self.assertEqual(logged, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import asyncio
+import time
+import unittest
+
+import admission
+from benchmarks.local_chain import LocalChain
+from chain_indexer import ChainIndexer
+from chain_rpc import ChainRpc
+from config import settings
+from conftest import asgi_client
+from metrics import metrics
+from voter_registry import ALREADY_VOTED, NOT_REGISTERED, registry
+
+VOTERS = [f"0x{i:040x}" for i in range(0x3901, 0x3905)]
+
+
+class TestVoterRegistry(unittest.TestCase):
+    def setUp(self):
+        self.saved_registry = dict(vars(registry))
+        self.saved_window = admission.controller.voting_window_active
+        self.saved_settings = settings.voter_registry_enabled, settings.voter_registry_max_staleness_seconds
+        settings.voter_registry_enabled = True
+        settings.voter_registry_max_staleness_seconds = 60
+
+    def tearDown(self):
+        vars(registry).clear()
+        vars(registry).update(self.saved_registry)
+        admission.controller.set_voting_window(self.saved_window)
+        settings.voter_registry_enabled, settings.voter_registry_max_staleness_seconds = self.saved_settings
+
+    def test_01_voted_and_unregistered_wallets_skip_inference(self):
+        from benchmarks.load_test import load_app
+        from benchmarks.synthetic import build_image_set
+
+        registered, voted, outsider, _ = VOTERS
+        chain = LocalChain(["Alice", "Bob"], voting_minutes=180)
+        chain.register_voters([registered, voted])
+        chain.vote(voted, 1)
+
+        async def run():
+            app = await load_app(stub_analyzer=True)
+            from face_processor import get_face_analyzer
+            detector = get_face_analyzer().det_model
+
+            indexer = ChainIndexer(ChainRpc("http://local-chain", transport=chain.transport()), chain.address,
+                                   start_block=0, interval_seconds=3600)
+            await indexer.reset()
+            await indexer.sync()
+            await registry.refresh(indexer, full=True)
+
+            image = build_image_set(1)[0]
+            async with asgi_client(app) as client:
+                for user_id in (registered, voted):
+                    response = await client.post("/enroll", json={"user_id": user_id, "image": image})
+                    self.assertEqual(response.status_code, 200, response.text)
+
+                async def verify(user_id):
+                    calls = detector.calls
+                    response = await client.post(
+                        "/verify", json={"user_id": user_id, "image": image, "skip_liveness": True}
+                    )
+                    return response, detector.calls - calls
+
+                rejected = metrics.counter(f"voter_registry.rejected.{ALREADY_VOTED}")
+                already_voted = await verify(voted.upper().replace("0X", "0x"))
+                rejected = metrics.counter(f"voter_registry.rejected.{ALREADY_VOTED}") - rejected
+                allowed = await verify(registered)
+                open_outsider = await verify(outsider)
+
+                # Registration switched on after the last refresh: picked up by the next one
+                chain.set_registration_required(True)
+                await indexer.sync()
+                await registry.refresh(indexer)
+                closed_outsider = await verify(outsider)
+                still_allowed = await verify(registered)
+
+                settings.admin_api_key, saved_key = "secret", settings.admin_api_key
+                try:
+                    stats = (await client.get("/admin/metrics", headers={"X-Admin-Key": "secret"})).json()
+                finally:
+                    settings.admin_api_key = saved_key
+            return already_voted, rejected, allowed, open_outsider, closed_outsider, still_allowed, stats
+
+        already_voted, rejected, allowed, open_outsider, closed_outsider, still_allowed, stats = asyncio.run(run())
+
+        self.assertEqual(already_voted[0].status_code, 403)
+        self.assertEqual(already_voted[1], 0)  # no model ran
+        self.assertEqual(rejected, 1)
+        self.assertEqual(allowed[0].status_code, 200, allowed[0].text)
+        self.assertTrue(allowed[0].json()["verified"])
+        self.assertGreater(allowed[1], 0)
+        self.assertEqual(open_outsider[0].status_code, 404)  # not enrolled, but not refused by the chain
+
+        self.assertEqual(closed_outsider[0].status_code, 403)
+        self.assertEqual(closed_outsider[1], 0)
+        self.assertEqual(still_allowed[0].status_code, 200)
+
+        self.assertTrue(stats["voter_registry"]["fresh"])
+        self.assertEqual(stats["voter_registry"]["last_block"], chain.head)
+        self.assertTrue(stats["voter_registry"]["registration_required"])
+        self.assertGreaterEqual(stats["voter_registry"]["rejected"][NOT_REGISTERED], 1)
+        self.assertIsNotNone(stats["voter_registry"]["inference_ms_saved_estimate"])
+        self.assertTrue(admission.controller.voting_window_active)
+
+    def test_02_stale_view_fails_open(self):
+        registry.voters = {VOTERS[3]: (True, True)}
+        registry.registration_required = True
+        registry._synced_at = time.monotonic()
+        self.assertEqual(registry.check(VOTERS[3]), ALREADY_VOTED)
+        self.assertEqual(registry.check(VOTERS[0]), NOT_REGISTERED)
+        self.assertIsNone(registry.check("not-a-wallet"))
+
+        stale = metrics.counter("voter_registry.stale")
+        registry._synced_at = time.monotonic() - 61
+        self.assertIsNone(registry.check(VOTERS[3]))
+        self.assertEqual(metrics.counter("voter_registry.stale") - stale, 1)
+
+        registry._synced_at = time.monotonic()
+        settings.voter_registry_enabled = False
+        self.assertIsNone(registry.check(VOTERS[3]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Face Verification Service - Consumed Token Store
+Remembers which verification tokens were already validated, until they expire
+
+With SINGLE_USE_TOKENS on, /validate-token accepts each token id (jti)
+once. A consumed id only has to be remembered until its token's exp, after
+which the signature check rejects the token anyway, so ids are kept in a
+ring of per-minute sets keyed by the token's expiry minute: the ring spans
+at most JWT_EXPIRY_MINUTES + 1 buckets, and expired buckets are dropped
+whole instead of being swept entry by entry. Validation stays a set lookup
+with no database round trip. (Exact sets rather than Bloom filters: a false
+positive would reject a legitimate first use.)
+
+The in-memory store is per process. Several workers or instances must
+share a store (TOKEN_STORE_URL=redis://...), where a consume is one atomic
+SET NX with the remaining lifetime as TTL. Startup fails rather than
+quietly enforcing single use per process: when TOKEN_STORE_URL is set but
+the redis package is missing, or when SINGLE_USE_TOKENS is on with more
+than one worker (WEB_CONCURRENCY) and no shared store.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Set
+
+from config import settings
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenStoreUnavailable(Exception):
+    """The shared store could not be reached (single-use cannot be enforced)"""
+
+
+class MemoryTokenStore:
+    """Ring of per-bucket sets of consumed ids, keyed by expiry bucket"""
+
+    backend = "memory"
+
+    def __init__(self, bucket_seconds: int = 60, clock: Callable[[], float] = time.time):
+        self.bucket_seconds = bucket_seconds
+        self.clock = clock
+        self._buckets: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, current: int):
+        for bucket in [b for b in self._buckets if b < current]:
+            del self._buckets[bucket]
+
+    async def consume(self, jti: str, exp: float) -> bool:
+        """Record `jti` as used; False if it was already used (or has expired)"""
+        now = self.clock()
+        if exp <= now:
+            return False
+        bucket = int(exp // self.bucket_seconds)
+        with self._lock:
+            self._expire(int(now // self.bucket_seconds))
+            ids = self._buckets.setdefault(bucket, set())
+            if jti in ids:
+                return False
+            ids.add(jti)
+            return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._expire(int(self.clock() // self.bucket_seconds))
+            return {
+                "backend": self.backend,
+                "buckets": len(self._buckets),
+                "tracked_ids": sum(len(ids) for ids in self._buckets.values()),
+            }
+
+    async def aclose(self):
+        pass
+
+
+class RedisTokenStore:
+    """Consumed ids shared through Redis; each key expires with its token"""
+
+    backend = "redis"
+
+    def __init__(self, url: str, prefix: str = "faceservice:jti:", clock: Callable[[], float] = time.time):
+        import redis.asyncio
+
+        self.client = redis.asyncio.from_url(url)
+        self.prefix = prefix
+        self.clock = clock
+
+    async def consume(self, jti: str, exp: float) -> bool:
+        ttl = int(exp - self.clock()) + 1
+        if ttl <= 1:
+            return False
+        try:
+            return bool(await self.client.set(self.prefix + jti, 1, nx=True, ex=ttl))
+        except Exception as e:
+            raise TokenStoreUnavailable(str(e)) from e
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend}
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def create_store(url: str = "", bucket_seconds: int = 60, single_use: bool = False, workers: int = 1):
+    """Redis store for a redis:// URL, in-memory store otherwise"""
+    if url:
+        try:
+            return RedisTokenStore(url)
+        except ImportError as e:
+            raise RuntimeError("TOKEN_STORE_URL is set but the redis package is not installed (pip install redis)") from e
+    if single_use and workers > 1:
+        raise RuntimeError(
+            f"SINGLE_USE_TOKENS with {workers} workers needs a shared TOKEN_STORE_URL; "
+            "a per-process store would accept a token once in every worker"
+        )
+    return MemoryTokenStore(bucket_seconds)
+
+
+async def consume(payload: Dict) -> Optional[str]:
+    """
+    Mark a validated token as used
+    Returns a rejection reason, or None when this is the token's first use
+    """
+    jti = payload.get("jti")
+    if not jti:
+        return "Token has no id and cannot be used once"
+    if not await store.consume(jti, float(payload["exp"])):
+        metrics.increment("tokens.replayed")
+        logger.warning(f"🚫 Replayed verification token for user {str(payload.get('sub'))[:10]}...")
+        return "Token already used"
+    return None
+
+
+# Global instance
+store = create_store(
+    settings.token_store_url, settings.token_store_bucket_seconds,
+    single_use=settings.single_use_tokens, workers=settings.web_concurrency,
+)
@@ -0,0 +1,95 @@
+"""
+Face Verification Service - Verification Result Cache
+Short-lived cache of model results for resubmitted verification frames
+
+Flaky mobile networks make clients resend the exact same frame. The cache
+maps (user_id, image digest, liveness mode, enrolled embedding digest) to
+the liveness/similarity outcome so a resubmit skips decode and inference.
+Tokens, signatures and audit log rows are still produced per request.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from config import settings
+
+CacheKey = Tuple[str, str, bool, str]
+
+
+class VerificationCache:
+    """
+    TTL + LRU bounded cache of verification outcomes
+
+    Keys always start with the user_id, so an entry can never be served to
+    a different user. The enrolled embedding digest is part of the key, so a
+    re-enrollment (on any instance) makes old entries unreachable.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(user_id: str, image_bytes: bytes, skip_liveness: bool, stored_embedding: bytes) -> CacheKey:
+        image_digest = hashlib.sha256(image_bytes).hexdigest()
+        embedding_digest = hashlib.sha256(stored_embedding or b"").hexdigest()[:16]
+        return (user_id, image_digest, skip_liveness, embedding_digest)
+
+    def get(self, key: CacheKey) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, outcome = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(outcome)
+
+    def put(self, key: CacheKey, outcome: Dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, dict(outcome))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: str):
+        """Drop every entry for a user (after re-enrollment or deletion)"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+verification_cache = VerificationCache(
+    ttl_seconds=settings.verify_cache_ttl_seconds,
+    max_entries=settings.verify_cache_max_entries if settings.verify_cache_enabled else 0,
+)
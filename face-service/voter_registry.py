@@ -0,0 +1,157 @@
+"""
+Face Verification Service - Voter Registry
+Local view of on-chain registration and voted flags, checked before inference
+
+The chain indexer (chain_indexer.py) writes ChainVoter rows from
+VoterRegistered / VoterUnregistered / VoteCast events, in whichever
+process holds its writer lease; every INDEXER_POLL_SECONDS the registry
+reads the rows that changed into memory, so /verify can turn away wallets
+that already voted (or are not registered while the contract requires
+registration) without decoding the image or running any model. The
+registry itself never writes the index.
+
+The view is only trusted while it is fresh: if the writer last caught up
+with the head more than VOTER_REGISTRY_MAX_STALENESS_SECONDS ago (RPC
+down, indexer behind or not running) every request goes through to
+inference, and the contract still enforces both rules at vote time.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+
+import admission
+from chain_indexer import ChainIndexer, voting_window
+from config import settings
+from database import async_session
+from metrics import metrics
+from models import ChainState, ChainVoter
+
+logger = logging.getLogger(__name__)
+
+ADDRESS_RE = re.compile(r"^0x[0-9a-f]{40}$")
+
+ALREADY_VOTED = "already_voted"
+NOT_REGISTERED = "not_registered"
+
+
+class VoterRegistry:
+    """address -> (registered, has_voted), refreshed after each indexer sync"""
+
+    def __init__(self):
+        self.voters: Dict[str, Tuple[bool, bool]] = {}
+        self.registration_required = False
+        self.last_block: Optional[int] = None
+        self._seen_block = -1  # highest ChainVoter.updated_block loaded
+        self._generation = None  # index generation loaded; the writer bumps it when it undoes rows
+        self._synced_at: Optional[float] = None
+
+    # ---- checks ----
+
+    def age_seconds(self) -> Optional[float]:
+        return time.monotonic() - self._synced_at if self._synced_at is not None else None
+
+    def is_fresh(self) -> bool:
+        age = self.age_seconds()
+        return age is not None and age <= settings.voter_registry_max_staleness_seconds
+
+    def check(self, user_id: str) -> Optional[str]:
+        """Reason to refuse this wallet before inference (ALREADY_VOTED / NOT_REGISTERED), or None"""
+        if not settings.voter_registry_enabled or not ADDRESS_RE.match(user_id):
+            return None
+
+        metrics.increment("voter_registry.checks")
+        if not self.is_fresh():
+            metrics.increment("voter_registry.stale")
+            return None
+
+        registered, has_voted = self.voters.get(user_id, (False, False))
+        if has_voted:
+            reason = ALREADY_VOTED
+        elif self.registration_required and not registered:
+            reason = NOT_REGISTERED
+        else:
+            return None
+        metrics.increment(f"voter_registry.rejected.{reason}")
+        return reason
+
+    # ---- refresh ----
+
+    async def refresh(self, indexer: ChainIndexer, full: bool = False):
+        """
+        Load voter rows changed since the last refresh (all rows when `full`, or after a reorg or reset)
+        The view is as fresh as the indexer's last catch-up with the head
+        """
+        async with async_session() as db:
+            state = {row.key: json.loads(row.value) for row in (await db.execute(select(ChainState))).scalars()}
+            generation = state.get("generation", 0)
+            full = full or generation != self._generation
+            since = -1 if full else self._seen_block
+            rows = (await db.execute(
+                select(ChainVoter.address, ChainVoter.registered, ChainVoter.has_voted, ChainVoter.updated_block)
+                .where(ChainVoter.updated_block > since)
+            )).all()
+
+        if full:
+            self.voters = {}
+            self._seen_block = -1
+        self._generation = generation
+        for address, registered, has_voted, updated_block in rows:
+            self.voters[address] = (bool(registered), bool(has_voted))
+            self._seen_block = max(self._seen_block, updated_block or -1)
+
+        # No event announces enableVoterRegistration(), so read the flag itself
+        self.registration_required = await indexer.rpc.call(
+            indexer.address, "voterRegistrationRequired()", returns=("bool",)
+        )
+
+        self.last_block = state.get("last_block")
+        window = voting_window(state)
+        if window["start"] is not None:
+            admission.controller.set_voting_window(window["active"])
+
+        caught_up_at = state.get("caught_up_at")
+        if caught_up_at is not None:
+            self._synced_at = time.monotonic() - max(0.0, time.time() - caught_up_at)
+
+    async def follow(self, indexer: ChainIndexer):
+        """Refresh from the index every INDEXER_POLL_SECONDS (reads only; the indexer loop writes)"""
+        logger.info(f"🗳️  Voter registry following {indexer.address} via {indexer.rpc.url}")
+        while True:
+            try:
+                await self.refresh(indexer)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Voter registry sync failed: {e}")
+            await asyncio.sleep(settings.indexer_poll_seconds)
+
+    def stats(self) -> Dict:
+        rejected = sum(metrics.counter(f"voter_registry.rejected.{reason}") for reason in (ALREADY_VOTED, NOT_REGISTERED))
+        typical_inference_ms = metrics.percentile("admission.verify.service", 0.5)
+        age = self.age_seconds()
+        return {
+            "enabled": settings.voter_registry_enabled,
+            "fresh": self.is_fresh(),
+            "age_seconds": round(age, 1) if age is not None else None,
+            "last_block": self.last_block,
+            "voters": len(self.voters),
+            "registration_required": self.registration_required,
+            "checks": metrics.counter("voter_registry.checks"),
+            "stale_checks": metrics.counter("voter_registry.stale"),
+            "rejected": {
+                ALREADY_VOTED: metrics.counter(f"voter_registry.rejected.{ALREADY_VOTED}"),
+                NOT_REGISTERED: metrics.counter(f"voter_registry.rejected.{NOT_REGISTERED}"),
+            },
+            # Inference skipped, priced at the median verify model time
+            "inference_ms_saved_estimate": round(rejected * typical_inference_ms, 1) if typical_inference_ms else None,
+        }
+
+
+# Global instance
+registry = VoterRegistry()
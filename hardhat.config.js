@@ -15,7 +15,7 @@ module.exports = {
       hardhat: {},
       sepolia: {
          url: API_URL,
-         accounts: [`0x${PRIVATE_KEY}`]
+         accounts: PRIVATE_KEY ? [`0x${PRIVATE_KEY}`] : []
       }
    },
 }
@@ -0,0 +1,135 @@
+const { loadFixture } = require("@nomicfoundation/hardhat-toolbox/network-helpers");
+require("@nomicfoundation/hardhat-chai-matchers");
+const { expect } = require("chai");
+
+// Root and proofs built by face-service/merkle_allowlist.py over accounts #3-#7
+const allowlist = require("./fixtures/allowlist-odd.json");
+
+describe("Voting", function () {
+  async function deployVotingFixture() {
+    const [admin, signer, stranger, ...rest] = await ethers.getSigners();
+    const voters = rest.slice(0, allowlist.leafCount);
+
+    const Voting = await ethers.getContractFactory("Voting");
+    const voting = await Voting.deploy(["Alice", "Bob"], 60);
+    await voting.deployed();
+    await voting.setVerificationSigner(signer.address);
+
+    return { voting, admin, signer, stranger, voters };
+  }
+
+  async function publishedRootFixture() {
+    const fixture = await deployVotingFixture();
+    await fixture.voting
+      .connect(fixture.signer)
+      .setVerifiedVotersRoot(allowlist.root, allowlist.leafCount);
+    return fixture;
+  }
+
+  function proofOf(voter) {
+    return allowlist.proofs[voter.address.toLowerCase()];
+  }
+
+  // What the face service signs after a successful /verify
+  async function permit(signer, voter) {
+    const message = ethers.utils.solidityKeccak256(["address"], [voter.address]);
+    return signer.signMessage(ethers.utils.arrayify(message));
+  }
+
+  describe("setVerifiedVotersRoot", function () {
+    it("Should accept the root from the verification signer or an admin", async function () {
+      const { voting, admin, signer } = await loadFixture(deployVotingFixture);
+
+      await expect(voting.connect(signer).setVerifiedVotersRoot(allowlist.root, allowlist.leafCount))
+        .to.emit(voting, "VerifiedVotersRootUpdated");
+      expect(await voting.verifiedVotersRoot()).to.equal(allowlist.root);
+
+      await voting.connect(admin).setVerifiedVotersRoot(ethers.constants.HashZero, 0);
+      expect(await voting.verifiedVotersRoot()).to.equal(ethers.constants.HashZero);
+    });
+
+    it("Should refuse anyone else", async function () {
+      const { voting, stranger } = await loadFixture(deployVotingFixture);
+
+      await expect(
+        voting.connect(stranger).setVerifiedVotersRoot(allowlist.root, allowlist.leafCount)
+      ).to.be.revertedWith("Caller cannot publish the voters root");
+    });
+  });
+
+  describe("voteWithProof", function () {
+    it("Should count a vote with a valid proof", async function () {
+      const { voting, voters } = await loadFixture(publishedRootFixture);
+
+      await expect(voting.connect(voters[0]).voteWithProof(1, proofOf(voters[0])))
+        .to.emit(voting, "VoteCast");
+      expect(await voting.voters(voters[0].address)).to.equal(true);
+      expect((await voting.candidates(1)).voteCount).to.equal(1);
+      expect(await voting.totalVotes()).to.equal(1);
+    });
+
+    it("Should accept the promoted last leaf of an odd-sized tree", async function () {
+      const { voting, voters } = await loadFixture(publishedRootFixture);
+      const last = voters[allowlist.leafCount - 1];
+
+      expect(proofOf(last)).to.have.length(1);
+      await voting.connect(last).voteWithProof(0, proofOf(last));
+      expect(await voting.voters(last.address)).to.equal(true);
+    });
+
+    it("Should refuse a wrong or empty proof", async function () {
+      const { voting, voters, stranger } = await loadFixture(publishedRootFixture);
+
+      await expect(
+        voting.connect(voters[0]).voteWithProof(0, proofOf(voters[1]))
+      ).to.be.revertedWith("Invalid allowlist proof");
+      await expect(
+        voting.connect(voters[0]).voteWithProof(0, [])
+      ).to.be.revertedWith("Invalid allowlist proof");
+      // Not in the tree at all
+      await expect(
+        voting.connect(stranger).voteWithProof(0, proofOf(voters[0]))
+      ).to.be.revertedWith("Invalid allowlist proof");
+    });
+
+    it("Should refuse votes until a root is published", async function () {
+      const { voting, voters } = await loadFixture(deployVotingFixture);
+
+      await expect(
+        voting.connect(voters[0]).voteWithProof(0, proofOf(voters[0]))
+      ).to.be.revertedWith("Voters root not published");
+    });
+  });
+
+  describe("Double voting", function () {
+    it("Should refuse a proof vote after a signed vote", async function () {
+      const { voting, signer, voters } = await loadFixture(publishedRootFixture);
+
+      await voting.connect(voters[0]).vote(0, await permit(signer, voters[0]));
+      await expect(
+        voting.connect(voters[0]).voteWithProof(1, proofOf(voters[0]))
+      ).to.be.revertedWith("You have already voted");
+    });
+
+    it("Should refuse a signed vote after a proof vote", async function () {
+      const { voting, signer, voters } = await loadFixture(publishedRootFixture);
+
+      await voting.connect(voters[1]).voteWithProof(0, proofOf(voters[1]));
+      await expect(
+        voting.connect(voters[1]).vote(1, await permit(signer, voters[1]))
+      ).to.be.revertedWith("You have already voted");
+      await expect(
+        voting.connect(voters[1]).voteWithProof(1, proofOf(voters[1]))
+      ).to.be.revertedWith("You have already voted");
+      expect(await voting.totalVotes()).to.equal(1);
+    });
+
+    it("Should still refuse a signed vote without a valid permit", async function () {
+      const { voting, stranger, voters } = await loadFixture(publishedRootFixture);
+
+      await expect(
+        voting.connect(voters[0]).vote(0, await permit(stranger, voters[0]))
+      ).to.be.revertedWith("Invalid face verification signature");
+    });
+  });
+});